@@ -9,6 +9,7 @@ import numpy as np
 from ARAX_response import ARAXResponse
 from ARAX_messenger import ARAXMessenger
 from ARAX_expander import ARAXExpander
+from connect_path_search import ConnectPathSearch, FORWARD
 import traceback
 from collections import Counter
 from collections.abc import Hashable
@@ -18,6 +19,8 @@ import copy
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../UI/OpenAPI/python-flask-server/")
 from openapi_server.models.q_edge import QEdge
 from openapi_server.models.q_node import QNode
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/Expand/")
+import expand_utilities as eu
 
 class ARAXConnect:
 
@@ -199,6 +202,94 @@ connect_nodes adds paths between nodes in the query graph and then preforms the
             self.response = self.report_response_stats(self.response)
         return self.response
 
+    def _get_new_qnode_key(self) -> str:
+        new_qnode_key = f'arax_connect_node_{self.node_n}'
+        self.node_n += 1
+        # make new names until we find a node key not in the query graph
+        while new_qnode_key in self.response.envelope.message.query_graph.nodes:
+            new_qnode_key = f'arax_connect_node_{self.node_n}'
+            self.node_n += 1
+        return new_qnode_key
+
+    def _get_new_qedge_key(self) -> str:
+        new_qedge_key = f'connected_edge_{self.edge_n}'
+        self.edge_n += 1
+        # make new names until we find an edge key not in the query graph
+        while new_qedge_key in self.response.envelope.message.query_graph.edges:
+            new_qedge_key = f'arax_connect_edge_{self.edge_n}'
+            self.edge_n += 1
+        return new_qedge_key
+
+    def _expand_connect_hop(self, node_ids, direction, expander, expand_params, mode, input_curie_map):
+        """
+        Expands the one-hop neighborhood of the given nodes (used by ConnectPathSearch). Returns the KG nodes and edges
+        found, with nodes renamed to the curies used in the query graph, or None if the expansion failed.
+        """
+        hop_response = ARAXResponse()
+        ARAXMessenger().create_envelope(hop_response)
+        # Hops are oriented the way the connecting qedges will be: from the first qnode of a pair toward the second
+        query_graph = hop_response.envelope.message.query_graph
+        query_graph.nodes = {'arax_connect_frontier': QNode(ids=list(node_ids)), 'arax_connect_neighbor': QNode(is_set=True)}
+        if direction == FORWARD:
+            query_graph.edges = {'arax_connect_hop': QEdge(subject='arax_connect_frontier', object='arax_connect_neighbor')}
+        else:
+            query_graph.edges = {'arax_connect_hop': QEdge(subject='arax_connect_neighbor', object='arax_connect_frontier')}
+        hop_response = expander.apply(hop_response, dict(expand_params, edge_key=['arax_connect_hop']), mode=mode)
+        if hop_response.status != 'OK':
+            self.response.warning(f"Could not expand the neighborhood of {len(node_ids)} nodes while connecting qnodes: "
+                                  f"{hop_response.message}")
+            return None
+        self.response.merge(hop_response)
+        knowledge_graph = hop_response.envelope.message.knowledge_graph
+        nodes = {input_curie_map.get(node_id, node_id): node for node_id, node in knowledge_graph.nodes.items()}
+        for edge in knowledge_graph.edges.values():
+            edge.subject = input_curie_map.get(edge.subject, edge.subject)
+            edge.object = input_curie_map.get(edge.object, edge.object)
+        return nodes, knowledge_graph.edges
+
+    def _add_connection(self, qnode_pair, position_nodes, hop_edges, path_search, messenger):
+        """
+        Adds a chain of qnodes/qedges connecting the given qnode pair to the query graph, along with the knowledge graph
+        nodes/edges found for it by ConnectPathSearch.
+        """
+        path_qnode_keys = [qnode_pair[0]]
+        for i in range(len(position_nodes) - 2):
+            new_qnode_key = self._get_new_qnode_key()
+            messenger.add_qnode(self.response, {'is_set': 'true', 'key': new_qnode_key})
+            path_qnode_keys.append(new_qnode_key)
+        path_qnode_keys.append(qnode_pair[1])
+        path_qedge_keys = []
+        for subject_qnode_key, object_qnode_key in zip(path_qnode_keys, path_qnode_keys[1:]):
+            new_qedge_key = self._get_new_qedge_key()
+            messenger.add_qedge(self.response, {'key': new_qedge_key, 'subject': subject_qnode_key, 'object': object_qnode_key})
+            path_qedge_keys.append(new_qedge_key)
+
+        knowledge_graph = self.response.envelope.message.knowledge_graph
+        if knowledge_graph.nodes is None:
+            knowledge_graph.nodes = dict()
+        if knowledge_graph.edges is None:
+            knowledge_graph.edges = dict()
+        for qnode_key, node_ids in zip(path_qnode_keys, position_nodes):
+            for node_id in node_ids:
+                if node_id in knowledge_graph.nodes:
+                    knode = knowledge_graph.nodes[node_id]
+                    if qnode_key not in (knode.qnode_keys or []):
+                        knode.qnode_keys = (knode.qnode_keys or []) + [qnode_key]
+                else:
+                    knode = copy.copy(path_search.nodes[node_id])
+                    knode.qnode_keys = [qnode_key]
+                    knowledge_graph.nodes[node_id] = knode
+        for qedge_key, edge_keys in zip(path_qedge_keys, hop_edges):
+            for edge_key in edge_keys:
+                if edge_key in knowledge_graph.edges:
+                    kedge = knowledge_graph.edges[edge_key]
+                    if qedge_key not in (kedge.qedge_keys or []):
+                        kedge.qedge_keys = (kedge.qedge_keys or []) + [qedge_key]
+                else:
+                    kedge = copy.copy(path_search.edges[edge_key])
+                    kedge.qedge_keys = [qedge_key]
+                    knowledge_graph.edges[edge_key] = kedge
+
     def __connect_nodes(self, describe=False):
         """
         Connects qnodes and runs expand.
@@ -280,8 +371,43 @@ connect_nodes adds paths between nodes in the query graph and then preforms the
         prune_threshold = 500
 
         qnode_key_pairs = [[x[0],x[1],False] for x in combinations(self.parameters['qnode_keys'], 2)]
-        edge_n = 1
-        node_n = 1
+        self.edge_n = 1
+        self.node_n = 1
+
+        # Pairs of qnodes that both have curies are connected by growing frontiers out from both ends and joining them in
+        # the middle (see connect_path_search.py); each hop is expanded only once, across all path lengths and pairs
+        query_graph_nodes = self.response.envelope.message.query_graph.nodes
+        pinned_qnode_keys = {qnode_key for qnode_key in self.parameters['qnode_keys'] if query_graph_nodes[qnode_key].ids}
+        if any(qnode_pair[0] in pinned_qnode_keys and qnode_pair[1] in pinned_qnode_keys for qnode_pair in qnode_key_pairs):
+            # Expand reports nodes by the curies used in the query graph, rather than their canonical curies (#1622)
+            input_curies = [curie for qnode_key in pinned_qnode_keys for curie in query_graph_nodes[qnode_key].ids]
+            input_curie_map = {canonical_info['preferred_curie']: input_curie
+                               for input_curie, canonical_info in eu.get_canonical_curies_dict(input_curies, self.response).items()
+                               if canonical_info and canonical_info['preferred_curie'] != input_curie}
+            expand_params = {
+                'prune_threshold':prune_threshold,
+                'kp_timeout':timeout
+            }
+            path_search = ConnectPathSearch(lambda node_ids, direction: self._expand_connect_hop(node_ids, direction, expander, expand_params, mode, input_curie_map),
+                                            max_frontier_size=prune_threshold)
+            for qnode_pair in qnode_key_pairs:
+                if qnode_pair[0] not in pinned_qnode_keys or qnode_pair[1] not in pinned_qnode_keys:
+                    continue
+                added_connection = False
+                for path_length in range(1, self.parameters['max_path_length'] + 1):
+                    paths = path_search.find_paths(query_graph_nodes[qnode_pair[0]].ids, query_graph_nodes[qnode_pair[1]].ids, path_length)
+                    if paths:
+                        self.response.info(f"Connected {qnode_pair[0]} and {qnode_pair[1]} with paths of length {path_length}")
+                        self._add_connection(qnode_pair, paths[0], paths[1], path_search, messenger)
+                        added_connection = True
+                        if self.parameters['shortest_path']:
+                            break
+                if not added_connection:
+                    self.response.warning(f"Could not connect the nodes {qnode_pair[0]} and {qnode_pair[1]} with a max path length of {self.parameters['max_path_length']}.")
+                # These pairs don't need to go through the path queries below
+                qnode_pair[2] = True
+            self.response.debug(f"Connecting qnodes took {path_search.num_hops_expanded} one-hop expansions")
+
         # FW: old way, try running all pairs through at once
         # for qnode_pair in qnode_key_pairs:
         #     added_connection = False
@@ -347,7 +473,10 @@ connect_nodes adds paths between nodes in the query graph and then preforms the
         #         #FW: may want to change this to an error
         #         self.response.warning(f"Could not connect the nodes {qnode_pair[0]} and {qnode_pair[1]} with a max path length of {self.parameters['max_path_length']}.")        
         # FW: New way
+        # Any other pairs are connected by expanding query graphs with paths of increasing length between them
         for n_new_nodes in range(self.parameters['max_path_length']):
+            if all(qnode_pair[2] for qnode_pair in qnode_key_pairs):
+                break
             added_connection = False
             for qnode_pair in qnode_key_pairs:
                 if qnode_pair[2]:
@@ -358,12 +487,7 @@ connect_nodes adds paths between nodes in the query graph and then preforms the
                 qedge_keys = []
                 node_pair_list = [qnode_pair[0]]
                 for i in range(n_new_nodes):
-                    new_qnode_key = f'arax_connect_node_{node_n}'
-                    node_n += 1
-                    # make new names until we find a node key not in the query graph
-                    while new_qnode_key in self.response.envelope.message.query_graph.nodes:
-                        new_qnode_key = f'arax_connect_node_{node_n}'
-                        node_n += 1
+                    new_qnode_key = self._get_new_qnode_key()
                     node_pair_list.append(new_qnode_key)
                     add_qnode_params = {
                         'is_set' : 'true',
@@ -376,12 +500,7 @@ connect_nodes adds paths between nodes in the query graph and then preforms the
                 # E.G. [1,2,3,4,5] -> [(1,2),(2,3),(3,4),(4,5)]
                 new_qnode_key_pairs = list(zip(node_pair_list,node_pair_list[1:]))
                 for new_qnode_pair in new_qnode_key_pairs:
-                    new_qedge_key = f'connected_edge_{edge_n}'
-                    edge_n += 1
-                    # make new names until we find an edge key not in the query graph
-                    while new_qedge_key in self.response.envelope.message.query_graph.edges:
-                        new_qedge_key = f'arax_connect_edge_{edge_n}'
-                        edge_n += 1
+                    new_qedge_key = self._get_new_qedge_key()
                     qedge_keys.append(new_qedge_key)
                     add_qedge_params = {
                         'key' : new_qedge_key,
@@ -330,6 +330,45 @@ class ARAXDatabaseManager:
                     print(f"{database_name} not present or older than {max_days} days. Updating file...")
                 self.download_database(remote_location=self.remote_locations[database_name], local_path=local_path, remote_path=self.docker_paths[database_name], debug=debug)
 
+    def build_kg2c_property_store(self, debug=False):
+        # The decorator's memory-mapped property store is derived from the local kg2c.sqlite, so it's built here
+        from ARAX_decorator import ARAXDecorator
+        if not os.path.exists(self.local_paths['kg2c_sqlite']):
+            print(f"kg2c_sqlite not present locally; can't build the KG2c property store") if debug else None
+            return
+        print(f"Building KG2c property store from {self.local_paths['kg2c_sqlite']}...") if debug else None
+        ARAXDecorator().build_property_store()
+
+    def build_curie_to_pmids_store(self, debug=False):
+        # NGD's memory-mapped PMID store is derived from the local curie_to_pmids.sqlite, so it's built here
+        sys.path.append(os.path.sep.join([*pathlist[:(RTXindex + 1)], 'code', 'ARAX', 'ARAXQuery', 'Overlay', 'ngd']))
+        from curie_to_pmids_store import build_curie_to_pmids_store, get_curie_to_pmids_store_path
+        sqlite_path = self.local_paths['curie_to_pmids']
+        if not os.path.exists(sqlite_path):
+            print(f"curie_to_pmids not present locally; can't build the curie->PMIDs store") if debug else None
+            return
+        print(f"Building curie->PMIDs store from {sqlite_path}...") if debug else None
+        build_curie_to_pmids_store(sqlite_path, get_curie_to_pmids_store_path(sqlite_path))
+
+    def build_cohd_pair_store(self, debug=False):
+        # The clinical info overlay's memory-mapped COHD pair store is derived from the local COHD database, so it's built here
+        sys.path.append(os.path.sep.join([*pathlist[:(RTXindex + 1)], 'code', 'ARAX', 'KnowledgeSources', 'COHD_local', 'scripts']))
+        from cohd_pair_store import build_cohd_pair_store, get_cohd_pair_store_path
+        database_path = self.local_paths['cohd_database']
+        if not os.path.exists(database_path):
+            print(f"cohd_database not present locally; can't build the COHD pair store") if debug else None
+            return
+        print(f"Building COHD pair store from {database_path}...") if debug else None
+        build_cohd_pair_store(database_path, get_cohd_pair_store_path(database_path))
+
+    def get_local_versions(self):
+        # The versions of the databases installed here (as recorded when they were last updated by check_versions/update_databases)
+        if not os.path.exists(versions_path):
+            return {}
+        with open(versions_path, "r") as fid:
+            local_versions = json.load(fid)
+        return {database_name: database_info.get('version') for database_name, database_info in local_versions.items()}
+
     def write_db_versions_file(self, debug=False):
         print(f"saving new version file to {versions_path}") if debug else None
         with open(versions_path, "w") as fid:
@@ -343,6 +382,9 @@ def main():
     parser.add_argument("-m", "--mnt", action='store_true', help="Download all database files to /mnt")
     parser.add_argument("-s", "--slim", action='store_true')
     parser.add_argument("-g", "--generate-versions-file", action='store_true', dest="generate_versions_file", required=False, help="just generate the db_versions.json file and do nothing else (ONLY USED IN TESTING/DEBUGGING)")
+    parser.add_argument("-p", "--property-store", action='store_true', dest="property_store", required=False, help="(re)build the KG2c property store used by the decorator after updating databases")
+    parser.add_argument("-n", "--ngd-store", action='store_true', dest="ngd_store", required=False, help="(re)build the curie->PMIDs store used by NGD after updating databases")
+    parser.add_argument("-o", "--cohd-store", action='store_true', dest="cohd_store", required=False, help="(re)build the COHD pair store used by the clinical info overlay after updating databases")
     parser.add_argument("-e", "--skip-if-exists", action='store_true', dest='skip_if_exists', required=False, help="for -m mode only, do not download a file if it already exists under /mnt/data/orangeboard/databases/KG2.X.X")
     arguments = parser.parse_args()
     DBManager = ARAXDatabaseManager()
@@ -359,6 +401,12 @@ def main():
         DBManager.write_db_versions_file(debug=True)
     else:
         DBManager.update_databases(debug=True)
+    if arguments.property_store:
+        DBManager.build_kg2c_property_store(debug=True)
+    if arguments.ngd_store:
+        DBManager.build_curie_to_pmids_store(debug=True)
+    if arguments.cohd_store:
+        DBManager.build_cohd_pair_store(debug=True)
 
 if __name__ == "__main__":
     main()
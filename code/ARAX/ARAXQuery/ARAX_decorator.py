@@ -1,10 +1,9 @@
 #!/bin/env python3
-import copy
 import os
 import sqlite3
 import sys
 from collections import defaultdict
-from typing import List, Dict, Optional, Tuple, Union
+from typing import Dict, Optional, Set
 
 import ujson
 
@@ -14,6 +13,8 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../")  # code di
 from RTXConfiguration import RTXConfiguration
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../UI/OpenAPI/python-flask-server/")
 from openapi_server.models.attribute import Attribute
+from kg2c_property_store import build_kg2c_property_store, get_kg2c_property_store, \
+    load_kg2c_property, merge_kg2c_properties
 
 
 def eprint(*args, **kwargs): print(*args, file=sys.stderr, **kwargs)
@@ -57,32 +58,17 @@ class ARAXDecorator:
         message = response.envelope.message
         response.debug(f"Decorating nodes with metadata from KG2c")
 
-        # Get connected to the local KG2c sqlite database
-        connection, cursor = self._connect_to_kg2c_sqlite()
-
-        # Extract the KG2c nodes from sqlite
-        response.debug(f"Looking up corresponding KG2c nodes in sqlite")
-        node_attributes_ordered = list(self.node_attributes)
-        node_cols_str = ", ".join([f"N.{property_name}" for property_name in node_attributes_ordered])
-        node_keys = set(node_key.replace("'", "''") for node_key in message.knowledge_graph.nodes)  # Escape quotes
-        node_keys_str = "','".join(node_keys)  # SQL wants ('node1', 'node2') format for string lists
-        sql_query = f"SELECT N.id, {node_cols_str} " \
-                    f"FROM nodes AS N " \
-                    f"WHERE N.id IN ('{node_keys_str}')"
-        cursor.execute(sql_query)
-        rows = cursor.fetchall()
-        cursor.close()
-        connection.close()
+        # Extract the KG2c nodes (from the property store if it's available, otherwise from sqlite)
+        node_properties_map = self._get_kg2c_properties("nodes", set(message.knowledge_graph.nodes), response)
 
         # Decorate nodes in the KG with info in these KG2c nodes
         response.debug(f"Adding attributes to nodes in the KG")
-        for row in rows:
+        for node_id, node_properties in node_properties_map.items():
             # First create the attributes for this KG2c node
-            node_id = row[0]
             trapi_node = message.knowledge_graph.nodes[node_id]
             kg2c_node_attributes = []
-            for index, property_name in enumerate(node_attributes_ordered):
-                value = self._load_property(property_name, row[index + 1])  # Add one to account for 'id' column
+            for property_name in self.node_attributes:
+                value = node_properties.get(property_name)
                 if value:
                     kg2c_node_attributes.append(self.create_attribute(property_name, value))
 
@@ -141,45 +127,16 @@ class ARAXDecorator:
                 search_key_to_edge_keys_map[search_key].add(edge_key)
             search_key_column = "triple"
 
-        # Extract the proper entries from sqlite
-        connection, cursor = self._connect_to_kg2c_sqlite()
-        response.debug(f"Looking up EPC edge info in KG2c sqlite")
-        edge_attributes_ordered = list(self.edge_attributes)
-        edge_cols_str = ", ".join([f"E.{property_name}" for property_name in edge_attributes_ordered])
-        search_keys_set = set(search_key.replace("'", "''") for search_key in set(search_key_to_edge_keys_map))  # Escape quotes
-        search_keys_str = "','".join(search_keys_set)  # SQL wants ('node1', 'node2') format for string lists
-        sql_query = f"SELECT E.{search_key_column}, {edge_cols_str} " \
-                    f"FROM edges AS E " \
-                    f"WHERE E.{search_key_column} IN ('{search_keys_str}')"
-        cursor.execute(sql_query)
-        rows = cursor.fetchall()
-        cursor.close()
-        connection.close()
-        response.debug(f"Got {len(rows)} rows back from KG2c sqlite")
+        # Extract the joined properties of the KG2c edges matching each search key
+        response.debug(f"Looking up EPC edge info in KG2c")
+        search_key_to_properties_map = self._get_kg2c_properties(search_key_column, set(search_key_to_edge_keys_map),
+                                                                 response)
+        response.debug(f"Found KG2c edge info for {len(search_key_to_properties_map)} search keys")
 
         response.debug(f"Adding attributes to edges in the KG")
-        # Create a helper lookup map for easy access to returned rows
-        search_key_to_kg2c_edge_tuples_map = defaultdict(list)
-        for row in rows:
-            search_key = row[0]
-            search_key_to_kg2c_edge_tuples_map[search_key].append(row)
-
-        attribute_type_id_map = {property_name: self.create_attribute(property_name, "something").attribute_type_id
+        attribute_type_id_map = {property_name: self.attribute_shells[property_name].attribute_type_id
                                  for property_name in set(self.edge_attributes).difference({"knowledge_source"})}
-        for search_key, kg2c_edge_tuples in search_key_to_kg2c_edge_tuples_map.items():
-            # Join the property values found for all edges matching the given search key
-            merged_kg2c_properties = {property_name: None for property_name in edge_attributes_ordered}
-            for kg2c_edge_tuple in kg2c_edge_tuples:
-                for index, property_name in enumerate(edge_attributes_ordered):
-                    raw_value = kg2c_edge_tuple[index + 1]
-                    if raw_value:  # Skip empty attributes
-                        value = self._load_property(property_name, raw_value)
-                        if not merged_kg2c_properties.get(property_name):
-                            merged_kg2c_properties[property_name] = set() if isinstance(value, list) else dict()
-                        if isinstance(value, list):
-                            merged_kg2c_properties[property_name].update(set(value))
-                        else:
-                            merged_kg2c_properties[property_name].update(value)
+        for search_key, merged_kg2c_properties in search_key_to_properties_map.items():
             joined_knowledge_sources = list(merged_kg2c_properties["knowledge_source"]) if merged_kg2c_properties.get("knowledge_source") else set()
             knowledge_source = joined_knowledge_sources[0] if len(joined_knowledge_sources) == 1 else None
             joined_kg2_ids = list(merged_kg2c_properties["kg2_ids"]) if merged_kg2c_properties.get("kg2_ids") else set()
@@ -217,8 +174,12 @@ class ARAXDecorator:
         if attribute_short_name not in self.attribute_shells:
             log.error(f"{attribute_short_name} is not a recognized short name for an attribute. Options are: "
                       f"{set(self.attribute_shells)}", error_code="UnrecognizedInput")
-        attribute = copy.deepcopy(self.attribute_shells[attribute_short_name])
-        attribute.value = value
+        # Build the attribute from its shell directly; deep-copying shells is slow when decorating large KGs
+        shell = self.attribute_shells[attribute_short_name]
+        attribute = Attribute(attribute_type_id=shell.attribute_type_id,
+                              value_type_id=shell.value_type_id,
+                              description=shell.description,
+                              value=value)
         if isinstance(value, str):
             if value.startswith("http"):
                 attribute.value_url = value
@@ -226,27 +187,62 @@ class ARAXDecorator:
             attribute.attribute_source = attribute_source
         return attribute
 
+    def build_property_store(self):
+        """
+        Builds the memory-mapped KG2c property store (from kg2c.sqlite) that decorate_nodes() and decorate_edges()
+        use when it's available.
+        """
+        sqlite_path = self._get_kg2c_sqlite_path()
+        build_kg2c_property_store(sqlite_path, self._get_kg2c_property_store_path(sqlite_path),
+                                  self.node_attributes, self.edge_attributes)
+
+    def _get_kg2c_properties(self, key_type: str, keys: Set[str], log: ARAXResponse) -> Dict[str, Dict[str, any]]:
+        """
+        Returns the decoded KG2c properties for the given node IDs (key_type "nodes") or edge search keys (key_type
+        "triple" or "node_pair"); properties of edges sharing a search key are joined. Keys not in KG2c are left out.
+        """
+        sqlite_path = self._get_kg2c_sqlite_path()
+        property_store = get_kg2c_property_store(self._get_kg2c_property_store_path(sqlite_path))
+        if property_store and property_store.is_current(sqlite_path, list(self.node_attributes), list(self.edge_attributes)):
+            return property_store.get_many(key_type, keys)
+        log.debug(f"No current KG2c property store is available; will look up {key_type} in KG2c sqlite")
+        connection = sqlite3.connect(sqlite_path)
+        cursor = connection.cursor()
+        if key_type == "nodes":
+            property_types = self.node_attributes
+            sql_query = f"SELECT N.id, {', '.join(f'N.{property_name}' for property_name in property_types)} " \
+                        f"FROM nodes AS N " \
+                        f"WHERE N.id IN (SELECT value FROM json_each(?))"
+        else:
+            property_types = self.edge_attributes
+            sql_query = f"SELECT E.{key_type}, {', '.join(f'E.{property_name}' for property_name in property_types)} " \
+                        f"FROM edges AS E " \
+                        f"WHERE E.{key_type} IN (SELECT value FROM json_each(?))"
+        cursor.execute(sql_query, (ujson.dumps(list(keys)),))
+        rows = cursor.fetchall()
+        cursor.close()
+        connection.close()
+        log.debug(f"Got {len(rows)} rows back from KG2c sqlite")
+
+        property_dicts_map = defaultdict(list)
+        for row in rows:
+            property_dicts_map[row[0]].append({property_name: load_kg2c_property(property_type, raw_value)
+                                               for (property_name, property_type), raw_value
+                                               in zip(property_types.items(), row[1:])})
+        return {key: merge_kg2c_properties(property_dicts) for key, property_dicts in property_dicts_map.items()}
+
     @staticmethod
-    def _connect_to_kg2c_sqlite() -> Tuple[sqlite3.Connection, sqlite3.Cursor]:
+    def _get_kg2c_sqlite_path() -> str:
         path_list = os.path.realpath(__file__).split(os.path.sep)
         rtx_index = path_list.index("RTX")
         rtxc = RTXConfiguration()
         sqlite_dir_path = os.path.sep.join([*path_list[:(rtx_index + 1)], 'code', 'ARAX', 'KnowledgeSources', 'KG2c'])
         sqlite_name = rtxc.kg2c_sqlite_path.split('/')[-1]
-        sqlite_file_path = f"{sqlite_dir_path}{os.path.sep}{sqlite_name}"
-        connection = sqlite3.connect(sqlite_file_path)
-        cursor = connection.cursor()
-        return connection, cursor
-
-    def _load_property(self, property_name: str, raw_value: str) -> Union[str, List[str], Dict[str, any], None]:
-        attributes_info_lookup = self.node_attributes if property_name in self.node_attributes else self.edge_attributes
-        ultimate_value_type = attributes_info_lookup[property_name]
-        if ultimate_value_type is list:
-            return [item for item in raw_value.split(self.array_delimiter_char) if item]
-        elif ultimate_value_type is dict:
-            return ujson.loads(raw_value)
-        else:
-            return raw_value
+        return f"{sqlite_dir_path}{os.path.sep}{sqlite_name}"
+
+    @staticmethod
+    def _get_kg2c_property_store_path(sqlite_path: str) -> str:
+        return f"{os.path.splitext(sqlite_path)[0]}_properties.store"
 
     @staticmethod
     def _get_attribute_triple(attribute: Attribute) -> str:
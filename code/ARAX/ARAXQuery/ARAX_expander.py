@@ -22,6 +22,7 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/Expand/")
 import expand_utilities as eu
 from expand_utilities import QGOrganizedKnowledgeGraph
 from kp_selector import KPSelector
+from kp_http_client import get_expand_event_loop
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../UI/OpenAPI/python-flask-server/")
 from openapi_server.models.knowledge_graph import KnowledgeGraph
 from openapi_server.models.query_graph import QueryGraph
@@ -341,15 +342,13 @@ class ARAXExpander:
                     if use_asyncio:
                         kps_to_query = eu.sort_kps_for_asyncio(kps_to_query, log)
                         log.debug(f"Will use asyncio to run KP queries concurrently")
-                        loop = asyncio.new_event_loop()  # Need to create NEW event loop for threaded environments
-                        asyncio.set_event_loop(loop)
+                        loop = get_expand_event_loop()  # Persistent per-thread loop (KP connections are pooled)
                         tasks = [self._expand_edge_async(one_hop_qg, kp_to_use, input_parameters, user_specified_kp,
                                                          kp_timeout, force_local,
                                                          kp_selector, log, multiple_kps=True)
                                  for kp_to_use in kps_to_query]
                         task_group = asyncio.gather(*tasks)
                         kp_answers = loop.run_until_complete(task_group)
-                        loop.close()
                     else:
                         # Use multiprocessing (which forks behind the scenes) TODO: Delete once fully commit to asyncio
                         log.debug(f"Will use multiprocessing to run KP queries in parallel")
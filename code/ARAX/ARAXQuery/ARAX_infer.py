@@ -311,8 +311,8 @@ drug_treatment_graph_expansion predicts drug treatments for a given node curie a
         # top_drugs = dtd.predict_top_N_drugs(self.parameters['n_drugs'])
         # top_paths = dtd.predict_top_M_paths(self.parameters['n_paths'])
         try:
-            top_drugs = self.EDTD.get_top_drugs_for_disease(disease_ids=self.parameters['node_curie'])
-            top_paths = self.EDTD.get_top_paths_for_disease(disease_ids=self.parameters['node_curie'])
+            top_drugs = self.EDTD.get_top_drugs_for_disease(disease_ids=self.parameters['node_curie'], top_n_drugs=self.parameters['n_drugs'])
+            top_paths = self.EDTD.get_top_paths_for_disease(disease_ids=self.parameters['node_curie'], top_n_drugs=self.parameters['n_drugs'], top_n_paths=self.parameters['n_paths'])
         except:
             self.response.error(f"Could not get top drugs and paths for disease {self.parameters['node_curie']}", error_code="ValueError")
             return self.response
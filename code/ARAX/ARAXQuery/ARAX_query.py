@@ -18,6 +18,7 @@ import uuid
 import requests
 import gc
 import contextlib
+import copy
 import connexion
 
 from ARAX_response import ARAXResponse
@@ -31,6 +32,7 @@ from ARAX_messenger import ARAXMessenger
 from ARAX_ranker import ARAXRanker
 from operation_to_ARAXi import WorkflowToARAXi
 from ARAX_query_tracker import ARAXQueryTracker
+from query_result_cache import get_query_result_cache, get_query_key, get_canonical_curies_from_synonymizer, has_failed_kp_queries, is_too_large_to_cache
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../UI/OpenAPI/python-flask-server/")
 from openapi_server.models.response import Response
@@ -52,6 +54,7 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../reasoningtool
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../ResponseCache")
 from response_cache import ResponseCache
+from response_storage import wait_for_pending_writes, write_in_background
 
 from ARAX_database_manager import ARAXDatabaseManager
 from reasoner_validator import validate
@@ -495,6 +498,50 @@ class ARAXQuery:
 
 
 
+    ############################################################################################
+    #### Return the key for the result of this query in the query result cache, or None if it can't be cached
+    def get_query_result_cache_key(self, query_result_cache, operations, message, actions, mode):
+
+        response = self.response
+        if not query_result_cache.enabled:
+            return None
+
+        #### Only queries that start from just a query graph can be cached; anything with knowledge graph or results is left alone
+        if operations.message_uris is not None or operations.messages is not None:
+            return None
+        if message.results or (message.knowledge_graph is not None and (message.knowledge_graph.nodes or message.knowledge_graph.edges)):
+            return None
+
+        query_graph = message.query_graph.to_dict() if message.query_graph is not None else None
+        try:
+            return get_query_key(query_graph, actions, response.envelope.query_options, mode, get_canonical_curies_from_synonymizer)
+        except Exception as error:
+            response.debug(f"Unable to compute a query result cache key for this query, so it will not be cached: {error}")
+            return None
+
+
+    ############################################################################################
+    #### Put a cached result into the response in place of running the actions
+    def apply_cached_result(self, cached_result, incoming_message):
+
+        response = self.response
+        message = ARAXMessenger().from_dict(cached_result['message'])
+
+        #### The cached result may have come from a query that used synonyms of this query's curies, so show the curies as given
+        if incoming_message.query_graph is not None and message.query_graph is not None:
+            for qnode_key, qnode in incoming_message.query_graph.nodes.items():
+                if qnode_key in message.query_graph.nodes:
+                    message.query_graph.nodes[qnode_key].ids = qnode.ids
+                    message.query_graph.nodes[qnode_key].name = qnode.name
+
+        response.envelope.message = message
+        response.query_plan = cached_result['query_plan']
+        if cached_result.get('total_results_count') is not None:
+            response.total_results_count = cached_result['total_results_count']
+        self.message = message
+        return message
+
+
     ############################################################################################
     #### Given an input query with a processing plan, execute that processing plan on the input
     def execute_processing_plan(self,input_operations_dict, mode='ARAX'):
@@ -688,14 +735,32 @@ class ARAXQuery:
                 query_tracker.alter_tracker_entry(self.response.tracker_id, attributes)
 
 
+            #### If an identical query was answered recently, reuse its result rather than running the actions again
+            query_result_cache = get_query_result_cache(dict(self.DBManager.get_local_versions(), code_version=self.rtxConfig.version))
+            query_key = self.get_query_result_cache_key(query_result_cache, operations, message, result.data['actions'], mode)
+            cached_result = None
+            if query_key is not None:
+                if str(input_operations_dict.get('bypass_cache')).lower() == 'true':
+                    response.debug(f"bypass_cache is set, so not looking for a cached result for this query")
+                else:
+                    cached_result = query_result_cache.get(query_key)
+                    if cached_result is None:
+                        response.debug(f"Query result cache miss for query {query_key}")
+            if cached_result is not None:
+                response.info(f"Query result cache hit: reusing the result of an identical recent query ({query_key}) instead of processing its actions")
+                message = self.apply_cached_result(cached_result, message)
+
             #### If there is already a KG with edges, recompute the qg_keys
-            if message.knowledge_graph is not None and len(message.knowledge_graph.edges) > 0:
+            elif message.knowledge_graph is not None and len(message.knowledge_graph.edges) > 0:
                 resultifier.recompute_qg_keys(response)
 
-            #### Process each action in order
+            #### Process each action in order (a cached result covers everything up to the return action)
             action_stats = { }
             actions = result.data['actions']
             action = None
+            if cached_result is not None:
+                action = next((cached_action for cached_action in actions if cached_action['command'] == 'return'), None)
+                actions = []
             for action in actions:
                 response.info(f"Processing action '{action['command']}' with parameters {action['parameters']}")
                 nonstandard_result = False
@@ -811,6 +876,23 @@ class ARAXQuery:
                             self.send_to_callback(callback, response)
                         return response
 
+            #### Cache the result of the actions so identical queries can reuse it, unless some KPs failed to answer
+            if query_key is not None and cached_result is None:
+                result_message = response.envelope.message
+                knowledge_graph = result_message.knowledge_graph
+                if has_failed_kp_queries(response.query_plan):
+                    response.debug(f"Not caching the result of this query, since some KP queries timed out or failed")
+                elif is_too_large_to_cache(len(result_message.results or []), len(knowledge_graph.nodes or {}) if knowledge_graph else 0,
+                                           len(knowledge_graph.edges or {}) if knowledge_graph else 0):
+                    response.debug(f"Not caching the result of this query, since it is too large")
+                else:
+                    #### The message is still changed below, so it is copied here; compressing and writing it happen in the background
+                    try:
+                        write_in_background(query_result_cache.put, query_key, { 'message': result_message.to_dict(), 'query_plan': copy.deepcopy(response.query_plan),
+                                                                                 'total_results_count': getattr(response, 'total_results_count', None) })
+                    except Exception as error:
+                        response.debug(f"Unable to cache the result of this query: {error}")
+
             #### At the end, process the explicit return() action, or implicitly perform one
             return_action = { 'command': 'return', 'parameters': { 'response': 'true', 'store': 'true' } }
             if action is not None and action['command'] == 'return':
@@ -872,6 +954,10 @@ class ARAXQuery:
             if response.message == 'Normal completion':
                 response.message = f"Normal completion with {n_results} results."
 
+            #### Report any trouble writing the stored response, if its write has finished by now
+            if response_id is not None:
+                response_cache.report_stored_response(response)
+
             #### If asking for the full message back
             if return_action['parameters']['response'] == 'true':
                 if mode == 'asynchronous':
@@ -911,6 +997,7 @@ class ARAXQuery:
         except:
             response.error(f"Unable to make a connection to URL {callback} at all. Work is lost", error_code="UnreachableCallback")
         self.track_query_finish()
+        wait_for_pending_writes()
         os._exit(0)
 
 
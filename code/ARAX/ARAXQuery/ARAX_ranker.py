@@ -1,5 +1,6 @@
 #!/bin/env python3
 import math
+import multiprocessing
 import os
 import networkx as nx
 import numpy as np
@@ -9,7 +10,7 @@ import json
 import ast
 import re
 
-from typing import Set, Union, Dict, List, Callable
+from typing import Set, Union, Dict, List, Tuple
 from ARAX_response import ARAXResponse
 from query_graph_info import QueryGraphInfo
 
@@ -37,54 +38,6 @@ def _get_query_graph_networkx_from_query_graph(query_graph: QueryGraph) -> nx.Mu
     return query_graph_nx
 
 
-def _get_weighted_graph_networkx_from_result_graph(kg_edge_id_to_edge: Dict[str, Edge],
-                                                   qg_nx: Union[nx.MultiDiGraph, nx.MultiGraph],
-                                                   result: Result) -> Union[nx.MultiDiGraph,
-                                                                            nx.MultiGraph]:
-    res_graph = qg_nx.copy()
-    qg_edge_tuples = tuple(qg_nx.edges(keys=True, data=True))
-    qg_edge_key_to_edge_tuple = {edge_tuple[2]: edge_tuple for edge_tuple in qg_edge_tuples}
-    for key, edge_binding_list in result.edge_bindings.items():
-        for edge_binding in edge_binding_list:
-            kg_edge = kg_edge_id_to_edge[edge_binding.id]
-            kg_edge_conf = kg_edge.confidence
-            #kg_edge_conf = kg_edge_attributes["confidence"]
-            qedge_keys = kg_edge.qedge_keys
-            for qedge_key in qedge_keys:
-                qedge_tuple = qg_edge_key_to_edge_tuple[qedge_key]
-                res_graph[qedge_tuple[0]][qedge_tuple[1]][qedge_key]['weight'] += kg_edge_conf
-    return res_graph
-
-
-def _get_weighted_graphs_networkx_from_result_graphs(kg_edge_id_to_edge: Dict[str, Edge],
-                                                     qg_nx: Union[nx.MultiDiGraph, nx.MultiGraph],
-                                                     results: List[Result]) -> List[Union[nx.MultiDiGraph,
-                                                                                          nx.MultiGraph]]:
-    res_list = []
-    for result in results:
-        res_list.append(_get_weighted_graph_networkx_from_result_graph(kg_edge_id_to_edge,
-                                                                       qg_nx,
-                                                                       result))
-    return res_list
-
-
-# credit: StackOverflow:15590812
-def _collapse_nx_multigraph_to_weighted_graph(graph_nx: Union[nx.MultiDiGraph,
-                                                              nx.MultiGraph]) -> Union[nx.DiGraph,
-                                                                                       nx.Graph]:
-    if type(graph_nx) == nx.MultiGraph:
-        ret_graph = nx.Graph()
-    elif type(graph_nx) == nx.MultiDiGraph:
-        ret_graph = nx.DiGraph()
-    for u, v, data in graph_nx.edges(data=True):
-        w = data['weight'] if 'weight' in data else 1.0
-        if ret_graph.has_edge(u, v):
-            ret_graph[u][v]['weight'] += w
-        else:
-            ret_graph.add_edge(u, v, weight=w)
-    return ret_graph
-
-
 # computes quantile ranks in *ascending* order (so a higher x entry has a higher
 # "rank"), where ties have the same (average) rank (the reason for using scipy.stats
 # here is specifically in order to handle ties correctly)
@@ -93,72 +46,118 @@ def _quantile_rank_list(x: List[float]) -> np.array:
     return y/len(y)
 
 
-def _score_networkx_graphs_by_max_flow(result_graphs_nx: List[Union[nx.MultiDiGraph,
-                                                                    nx.MultiGraph]]) -> List[float]:
-    max_flow_values = []
-    for result_graph_nx in result_graphs_nx:
-        if len(result_graph_nx) > 1:
-            apsp_dict = dict(nx.algorithms.shortest_paths.unweighted.all_pairs_shortest_path_length(result_graph_nx))
-            path_len_with_pairs_list = [(node_i, node_j, path_len) for node_i, node_i_dict in apsp_dict.items() for node_j, path_len in node_i_dict.items()]
-            max_path_len = max([path_len_with_pair_list_item[2] for path_len_with_pair_list_item in
-                                path_len_with_pairs_list])
-            pairs_with_max_path_len = [path_len_with_pair_list_item[0:2] for path_len_with_pair_list_item in path_len_with_pairs_list if
-                                       path_len_with_pair_list_item[2] == max_path_len]
-            max_flow_values_for_node_pairs = []
-            result_graph_collapsed_nx = _collapse_nx_multigraph_to_weighted_graph(result_graph_nx)
-            for source_node_id, target_node_id in pairs_with_max_path_len:
-                max_flow_values_for_node_pairs.append(nx.algorithms.flow.maximum_flow_value(result_graph_collapsed_nx,
-                                                                                            source_node_id,
-                                                                                            target_node_id,
-                                                                                            capacity="weight"))
-            max_flow_value = 0.0
-            if len(max_flow_values_for_node_pairs) > 0:
-                max_flow_value = sum(max_flow_values_for_node_pairs)/float(len(max_flow_values_for_node_pairs))
-        else:
-            max_flow_value = 1.0
-        max_flow_values.append(max_flow_value)
-    return max_flow_values
-
-
-def _score_networkx_graphs_by_longest_path(result_graphs_nx: List[Union[nx.MultiDiGraph,
-                                                                        nx.MultiGraph]]) -> List[float]:
-    result_scores = []
-    for result_graph_nx in result_graphs_nx:
-        apsp_dict = dict(nx.algorithms.shortest_paths.unweighted.all_pairs_shortest_path_length(result_graph_nx))
-        path_len_with_pairs_list = [(node_i, node_j, path_len) for node_i, node_i_dict in apsp_dict.items() for node_j, path_len in node_i_dict.items()]
-        max_path_len = max([path_len_with_pair_list_item[2] for path_len_with_pair_list_item in
-                            path_len_with_pairs_list])
-        pairs_with_max_path_len = [path_len_with_pair_list_item[0:2] for path_len_with_pair_list_item in path_len_with_pairs_list if
-                                   path_len_with_pair_list_item[2] == max_path_len]
-        map_node_name_to_index = {node_id: node_index for node_index, node_id in enumerate(result_graph_nx.nodes)}
-        adj_matrix = nx.to_numpy_matrix(result_graph_nx)
-        adj_matrix_power = np.linalg.matrix_power(adj_matrix, max_path_len)/math.factorial(max_path_len)
-        score_list = [adj_matrix_power[map_node_name_to_index[node_i],
-                                       map_node_name_to_index[node_j]] for node_i, node_j in pairs_with_max_path_len]
-        result_score = np.mean(score_list)
-        result_scores.append(result_score)
-    return result_scores
-
-
-def _score_networkx_graphs_by_frobenius_norm(result_graphs_nx: List[Union[nx.MultiDiGraph,
-                                                                          nx.MultiGraph]]) -> List[float]:
-    result_scores = []
-    for result_graph_nx in result_graphs_nx:
-        adj_matrix = nx.to_numpy_matrix(result_graph_nx)
-        result_score = np.linalg.norm(adj_matrix, ord='fro')
-        result_scores.append(result_score)
-    return result_scores
-
-
-def _score_result_graphs_by_networkx_graph_scorer(kg_edge_id_to_edge: Dict[str, Edge],
-                                                  qg_nx: Union[nx.MultiDiGraph, nx.MultiGraph],
-                                                  results: List[Result],
-                                                  nx_graph_scorer: Callable[[List[Union[nx.MultiDiGraph,
-                                                                                        nx.MultiGraph]]], np.array]) -> List[float]:
-    result_graphs_nx = _get_weighted_graphs_networkx_from_result_graphs(kg_edge_id_to_edge,
-                                                                        qg_nx,
-                                                                        results)
-    return nx_graph_scorer(result_graphs_nx)
+# The scoring of each result graph only depends on the query graph's structure and on the summed confidences of the
+# KG edges bound to each qedge, so everything structural (node order, the node pairs with the longest shortest path,
+# the collapsed edges used for max flow) is worked out once per query graph; a result then just becomes a vector of
+# qedge weights, from which one small dense adjacency array is built and all three scores are computed.
+RESULT_SCORING_BATCH_SIZE = 500
+MIN_RESULTS_FOR_PARALLEL_SCORING = 2000  # Below this, forking a pool costs more than it saves
+MAX_RESULT_SCORING_PROCESSES = 8
+
+
+def _get_result_graph_scoring_plan(qg_nx: Union[nx.MultiDiGraph, nx.MultiGraph]) -> Dict[str, any]:
+    node_ids = list(qg_nx.nodes)
+    map_node_name_to_index = {node_id: node_index for node_index, node_id in enumerate(node_ids)}
+    qg_edge_tuples = list(qg_nx.edges(keys=True))  # Weights are added into the adjacency array in this (networkx) order
+    apsp_dict = dict(nx.algorithms.shortest_paths.unweighted.all_pairs_shortest_path_length(qg_nx))
+    path_len_with_pairs_list = [(node_i, node_j, path_len) for node_i, node_i_dict in apsp_dict.items() for node_j, path_len in node_i_dict.items()]
+    max_path_len = max([path_len_with_pair_list_item[2] for path_len_with_pair_list_item in path_len_with_pairs_list])
+    pairs_with_max_path_len = [path_len_with_pair_list_item[0:2] for path_len_with_pair_list_item in path_len_with_pairs_list if
+                               path_len_with_pair_list_item[2] == max_path_len]
+    # Parallel qedges are collapsed into one weighted edge (with their weights summed in edge order) for max flow
+    collapsed_edges = dict()
+    for edge_index, (node_u, node_v, _) in enumerate(qg_edge_tuples):
+        collapsed_edges.setdefault((node_u, node_v), []).append(edge_index)
+    return {'num_nodes': len(node_ids),
+            'qedge_key_to_index': {edge_tuple[2]: edge_index for edge_index, edge_tuple in enumerate(qg_edge_tuples)},
+            'edge_node_indexes': [(map_node_name_to_index[node_u], map_node_name_to_index[node_v]) for node_u, node_v, _ in qg_edge_tuples],
+            'collapsed_edges': list(collapsed_edges.items()),
+            'max_path_len': max_path_len,
+            'pairs_with_max_path_len': pairs_with_max_path_len,
+            'index_pairs_with_max_path_len': [(map_node_name_to_index[node_i], map_node_name_to_index[node_j]) for node_i, node_j in pairs_with_max_path_len]}
+
+
+def _get_result_graph_weights(kg_edge_id_to_edge: Dict[str, Edge],
+                              scoring_plan: Dict[str, any],
+                              result: Result) -> List[float]:
+    weights = [0.0] * len(scoring_plan['edge_node_indexes'])
+    qedge_key_to_index = scoring_plan['qedge_key_to_index']
+    for key, edge_binding_list in result.edge_bindings.items():
+        for edge_binding in edge_binding_list:
+            kg_edge = kg_edge_id_to_edge[edge_binding.id]
+            kg_edge_conf = kg_edge.confidence
+            for qedge_key in kg_edge.qedge_keys:
+                weights[qedge_key_to_index[qedge_key]] += kg_edge_conf
+    return weights
+
+
+def _score_result_graph_weights(scoring_plan: Dict[str, any], weights: List[float]) -> Tuple[float, float, float]:
+    """
+    Returns the max flow, longest path, and Frobenius norm scores for a result graph with the given qedge weights.
+    """
+    # Accumulate the same way networkx's to_numpy_matrix() does for multigraphs (NaN weights are skipped)
+    adj_matrix = np.zeros((scoring_plan['num_nodes'], scoring_plan['num_nodes']))
+    for (node_index_i, node_index_j), weight in zip(scoring_plan['edge_node_indexes'], weights):
+        adj_matrix[node_index_i, node_index_j] = (0.0 if math.isnan(weight) else weight) + adj_matrix[node_index_i, node_index_j]
+
+    if scoring_plan['num_nodes'] > 1:
+        result_graph_collapsed_nx = nx.DiGraph()
+        for (node_u, node_v), edge_indexes in scoring_plan['collapsed_edges']:
+            collapsed_weight = weights[edge_indexes[0]]
+            for edge_index in edge_indexes[1:]:
+                collapsed_weight += weights[edge_index]
+            result_graph_collapsed_nx.add_edge(node_u, node_v, weight=collapsed_weight)
+        max_flow_values_for_node_pairs = [nx.algorithms.flow.maximum_flow_value(result_graph_collapsed_nx,
+                                                                                 source_node_id,
+                                                                                 target_node_id,
+                                                                                 capacity="weight")
+                                          for source_node_id, target_node_id in scoring_plan['pairs_with_max_path_len']]
+        max_flow_value = 0.0
+        if len(max_flow_values_for_node_pairs) > 0:
+            max_flow_value = sum(max_flow_values_for_node_pairs)/float(len(max_flow_values_for_node_pairs))
+    else:
+        max_flow_value = 1.0
+
+    max_path_len = scoring_plan['max_path_len']
+    adj_matrix_power = np.linalg.matrix_power(adj_matrix, max_path_len)/math.factorial(max_path_len)
+    longest_path_score = np.mean([adj_matrix_power[node_index_i, node_index_j]
+                                  for node_index_i, node_index_j in scoring_plan['index_pairs_with_max_path_len']])
+
+    frobenius_norm_score = np.linalg.norm(adj_matrix, ord='fro')
+    return max_flow_value, longest_path_score, frobenius_norm_score
+
+
+def _score_result_graph_weights_batch(scoring_plan: Dict[str, any],
+                                      weights_batch: List[List[float]]) -> List[Tuple[float, float, float]]:
+    return [_score_result_graph_weights(scoring_plan, weights) for weights in weights_batch]
+
+
+def _score_result_graphs(kg_edge_id_to_edge: Dict[str, Edge],
+                         qg_nx: Union[nx.MultiDiGraph, nx.MultiGraph],
+                         results: List[Result],
+                         log: ARAXResponse) -> List[List[float]]:
+    """
+    Returns the max flow, longest path, and Frobenius norm scores for each result (as three lists, in result order).
+    Large result sets are scored in batches across a pool of worker processes.
+    """
+    scoring_plan = _get_result_graph_scoring_plan(qg_nx)
+    weights_list = [_get_result_graph_weights(kg_edge_id_to_edge, scoring_plan, result) for result in results]
+    weights_batches = [weights_list[start:start + RESULT_SCORING_BATCH_SIZE]
+                       for start in range(0, len(weights_list), RESULT_SCORING_BATCH_SIZE)]
+    num_processes = min(os.cpu_count() or 1, MAX_RESULT_SCORING_PROCESSES, len(weights_batches))
+    scored_batches = None
+    if len(results) >= MIN_RESULTS_FOR_PARALLEL_SCORING and num_processes > 1:
+        log.debug(f"Scoring {len(results)} results in {len(weights_batches)} batches using {num_processes} processes")
+        try:
+            with multiprocessing.Pool(num_processes) as pool:
+                scored_batches = pool.starmap(_score_result_graph_weights_batch,
+                                              [(scoring_plan, weights_batch) for weights_batch in weights_batches])
+        except (AssertionError, OSError) as e:  # Daemonic processes can't have children, or we're out of resources
+            log.debug(f"Couldn't score results in parallel ({e}); will score them serially instead")
+    if scored_batches is None:
+        scored_batches = [_score_result_graph_weights_batch(scoring_plan, weights_batch) for weights_batch in weights_batches]
+    scores = [result_scores for scored_batch in scored_batches for result_scores in scored_batch]
+    return [[result_scores[scorer_index] for result_scores in scores] for scorer_index in range(3)]
 
 
 class ARAXRanker:
@@ -611,14 +610,7 @@ and [frobenius norm](https://en.wikipedia.org/wiki/Matrix_norm#Frobenius_norm).
         qg_nx = _get_query_graph_networkx_from_query_graph(message.query_graph)
         kg_edge_id_to_edge = self.kg_edge_id_to_edge
         results = message.results
-        ranks_list = list(map(_quantile_rank_list,
-                              map(lambda scorer_func: _score_result_graphs_by_networkx_graph_scorer(kg_edge_id_to_edge,
-                                                                                                    qg_nx,
-                                                                                                    results,
-                                                                                                    scorer_func),
-                                  [_score_networkx_graphs_by_max_flow,
-                                   _score_networkx_graphs_by_longest_path,
-                                   _score_networkx_graphs_by_frobenius_norm])))
+        ranks_list = list(map(_quantile_rank_list, _score_result_graphs(kg_edge_id_to_edge, qg_nx, results, response)))
         #print(ranks_list)
         #print(float(len(ranks_list)))
         result_scores = sum(ranks_list)/float(len(ranks_list))
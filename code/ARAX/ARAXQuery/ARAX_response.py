@@ -215,7 +215,7 @@ class ARAXResponse:
 
 
     #### Add a query_plan element
-    def update_query_plan(self, qedge_key, provider, status, description, query=None):
+    def update_query_plan(self, qedge_key, provider, status, description, query=None, connection_stats=None):
         """Method to add or update an element of the query_plan.
 
         :param edge_key: query_graph qedge key (e.g. 'e00').
@@ -228,6 +228,8 @@ class ARAXResponse:
         :type code: str
         :param query: Optional query dict that is sent to the referenced KP.
         :type code: dict
+        :param connection_stats: Optional dict of connection reuse/latency stats for the requests sent to the referenced KP for this query.
+        :type code: dict
         """
 
         """
@@ -253,6 +255,8 @@ class ARAXResponse:
                 self.query_plan['qedge_keys'][qedge_key][provider]['description'] = description
                 if query is not None:
                     self.query_plan['qedge_keys'][qedge_key][provider]['query'] = query
+            if connection_stats is not None:
+                self.query_plan['qedge_keys'][qedge_key][provider]['connection_stats'] = connection_stats
         self.query_plan['counter'] += 1
 
 
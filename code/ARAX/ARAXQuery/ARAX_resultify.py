@@ -637,7 +637,7 @@ def _get_results_for_kg_by_qg(kg: KnowledgeGraph,              # all nodes *must
             result_graphs_for_option_group = _create_result_graphs(kg, option_group_qg, kg_node_keys_by_qg_key,
                                                                    edge_keys_by_subject, edge_keys_by_object,
                                                                    edge_keys_by_node_pair, ignore_edge_direction, log,
-                                                                   base_result_graphs=copy.deepcopy(result_graphs_required))
+                                                                   base_result_graphs=result_graphs_required)
             log.debug(f"Created {len(result_graphs_for_option_group)} option group {option_group_id} result graphs")
             option_group_results_dict[option_group_id] = result_graphs_for_option_group
 
@@ -819,7 +819,8 @@ def _get_kg_node_adj_map_by_qg_key(kg_node_keys_by_qg_key: Dict[str, Set[str]],
         node_pair_key = _get_edge_node_pair_key(edge)
         if node_pair_key not in node_pair_to_qedge_key_map:
             node_pair_to_qedge_key_map[node_pair_key] = set()
-        node_pair_to_qedge_key_map[node_pair_key] = node_pair_to_qedge_key_map[node_pair_key].union(set(edge.qedge_keys))
+        node_pair_to_qedge_key_map[node_pair_key].update(edge.qedge_keys)
+    parallel_qedge_keys_map = {qedge_key: _get_parallel_qedge_keys(qedge, query_graph) for qedge_key, qedge in query_graph.edges.items()}
 
     # Fill out which KG nodes are connected to which
     for edge in knowledge_graph.edges.values():
@@ -828,7 +829,7 @@ def _get_kg_node_adj_map_by_qg_key(kg_node_keys_by_qg_key: Dict[str, Set[str]],
             if qedge_key in query_graph.edges:
                 qedge = query_graph.edges[qedge_key]
                 # Make sure ALL qedges between these two nodes have been fulfilled before marking them as 'connected'
-                parallel_qedge_keys = _get_parallel_qedge_keys(qedge, query_graph)
+                parallel_qedge_keys = parallel_qedge_keys_map[qedge_key]
                 if parallel_qedge_keys.issubset(node_pair_to_qedge_key_map[_get_edge_node_pair_key(edge)]):
                     qnode_key_1 = qedge.subject
                     qnode_key_2 = qedge.object
@@ -900,40 +901,101 @@ def _extract_sub_qg_adj_map(qg_adj_map: Dict[str, Set[str]], allowed_qnode_keys:
             for qnode_key, neighbor_qnode_keys in qg_adj_map.items() if qnode_key in allowed_qnode_keys}
 
 
-def _clean_up_dead_ends(result_graph: Dict[str, Dict[str, Set[str]]],
-                        sub_qg_adj_map: Dict[str, Set[str]],
-                        kg_node_adj_map_by_qg_key: Dict[str, Dict[str, Dict[str, Set[str]]]]) -> Dict[str, Dict[str, Set[str]]]:
+def _get_qnode_join_order(qg: QueryGraph,
+                          qnode_keys_already_handled: Set[str],
+                          kg_node_keys_by_qg_key: Dict[str, Set[str]]) -> List[Tuple[str, Set[str]]]:
     """
-    This function iteratively removes "dead ends" from a result graph until no more dead ends can be found. Dead ends
-    can be thought of as intermediate nodes (typically for is_set=True qnodes) that connect to only a subset of the
-    nodes they should be connected to according to the query graph. Only the part of the result graph that has been
-    "fulfilled" so far during the result construction process is evaluated here: the sub_qg_adj_map must contain only
-    info for qnodes fulfilled thus far.
+    This function decides the order in which the remaining qnodes will be filled in during result graph construction.
+    Each qnode must connect to the part of the QG handled before it; among those, the most selective qnode (the one
+    that will fan result graphs out the least) is chosen first. Returns (qnode key, connected prior qnode keys) tuples.
     """
-    fulfilled_qnode_keys = set(sub_qg_adj_map)
-    found_dead_ends = True
-    while found_dead_ends:
-        found_dead_ends = False
-        nodes_to_remove = dict()
-        # Go through each qnode "role" in our result graph, and check the nodes corresponding to that qnode
-        for qnode_key in fulfilled_qnode_keys:
-            corresponding_node_keys = result_graph["nodes"][qnode_key]
-            required_neighbor_qnode_keys = sub_qg_adj_map[qnode_key]
-            # Make sure each node for this qnode ID is connected to at LEAST one node fulfilling each neighbor qnode ID
-            for corresponding_node_key in corresponding_node_keys:
-                for neighbor_qnode_key in required_neighbor_qnode_keys:
-                    # Look for at least one node in the result graph in this neighbor spot that this node is linked to
-                    neighbors_in_kg = kg_node_adj_map_by_qg_key[qnode_key][corresponding_node_key][neighbor_qnode_key]
-                    if not neighbors_in_kg.intersection(result_graph["nodes"][neighbor_qnode_key]):
-                        # Mark this node for removal from this result graph since it's lacking a neighbor here
-                        found_dead_ends = True
-                        if qnode_key not in nodes_to_remove:
-                            nodes_to_remove[qnode_key] = set()
-                        nodes_to_remove[qnode_key].add(corresponding_node_key)
-        # Actually go through and remove our nodes marked for removal
-        for qnode_key, node_keys in nodes_to_remove.items():
-            result_graph["nodes"][qnode_key] = result_graph["nodes"][qnode_key].difference(node_keys)
-    return result_graph
+    qg_adj_map = _get_qg_adj_map_undirected(qg)
+    qnode_keys_handled = set(qnode_keys_already_handled)
+    qnode_keys_remaining = set(qg.nodes).difference(qnode_keys_handled)
+    join_order = []
+    while qnode_keys_remaining:
+        if qnode_keys_handled:
+            candidate_qnode_keys = {qnode_key for qnode_key in qnode_keys_remaining
+                                    if qg_adj_map[qnode_key].intersection(qnode_keys_handled)}
+        else:
+            candidate_qnode_keys = qnode_keys_remaining
+        if not candidate_qnode_keys:
+            break
+        # is_set qnodes don't multiply result graphs, so they count as a single candidate
+        current_qnode_key = min(candidate_qnode_keys,
+                                key=lambda qnode_key: (1 if qg.nodes[qnode_key].is_set else len(kg_node_keys_by_qg_key.get(qnode_key, set())),
+                                                       qnode_key))
+        join_order.append((current_qnode_key, qg_adj_map[current_qnode_key].intersection(qnode_keys_handled)))
+        qnode_keys_remaining.remove(current_qnode_key)
+        qnode_keys_handled.add(current_qnode_key)
+    return join_order
+
+
+def _prune_dead_ends(result_nodes: Dict[str, Set[str]],
+                     qnode_pairs_to_check: Iterable[Tuple[str, str]],
+                     sub_qg_adj_map: Dict[str, Set[str]],
+                     kg_node_adj_map_by_qg_key: Dict[str, Dict[str, Dict[str, Set[str]]]]):
+    """
+    This function removes "dead ends" from the nodes of a result graph: nodes that aren't connected to at least one
+    node in each neighboring qnode slot (per the sub_qg_adj_map, which covers only qnodes fulfilled thus far). It only
+    re-checks qnode slots whose neighbors have changed, starting from the given (qnode, neighbor qnode) pairs, and
+    stops once nothing more can be removed. Node sets may be shared between result graphs, so they are replaced
+    rather than modified in place.
+    """
+    pairs_to_check = collections.deque(qnode_pairs_to_check)
+    pairs_queued = set(pairs_to_check)
+    while pairs_to_check:
+        qnode_pair = pairs_to_check.popleft()
+        pairs_queued.remove(qnode_pair)
+        qnode_key, neighbor_qnode_key = qnode_pair
+        neighbor_node_keys = result_nodes[neighbor_qnode_key]
+        node_adj_map = kg_node_adj_map_by_qg_key[qnode_key]
+        dead_end_node_keys = {node_key for node_key in result_nodes[qnode_key]
+                              if node_adj_map[node_key][neighbor_qnode_key].isdisjoint(neighbor_node_keys)}
+        if dead_end_node_keys:
+            result_nodes[qnode_key] = result_nodes[qnode_key].difference(dead_end_node_keys)
+            # Nodes in neighboring slots may have lost their only connection into this slot
+            for other_qnode_key in sub_qg_adj_map[qnode_key]:
+                other_qnode_pair = (other_qnode_key, qnode_key)
+                if other_qnode_pair not in pairs_queued:
+                    pairs_to_check.append(other_qnode_pair)
+                    pairs_queued.add(other_qnode_pair)
+
+
+def _enumerate_result_graph_nodes(result_nodes: Dict[str, Set[str]],
+                                  join_plan: List[Tuple[str, Set[str], Dict[str, Set[str]], bool]],
+                                  step: int,
+                                  qg: QueryGraph,
+                                  kg_node_adj_map_by_qg_key: Dict[str, Dict[str, Dict[str, Set[str]]]]) -> Iterable[Dict[str, Set[str]]]:
+    """
+    This generator does a depth-first join over the qnodes in the join plan, lazily yielding the node portion of each
+    completed result graph. Result graphs branching off the same partial result share its (unmodified) node sets.
+    """
+    if step == len(join_plan):
+        yield result_nodes
+        return
+    current_qnode_key, prior_qnode_connections, sub_qg_adj_map, check_all_qnode_pairs = join_plan[step]
+    # Figure out which KG nodes could fulfill the current qnode; they must link to KG nodes in ALL prior connected qnode roles
+    current_kg_node_possibilities = [_get_all_adjacent_nodes(result_nodes[prior_qnode_key], prior_qnode_key, current_qnode_key, kg_node_adj_map_by_qg_key)
+                                     for prior_qnode_key in prior_qnode_connections]
+    final_connected_kg_nodes = set.intersection(*current_kg_node_possibilities)
+    if not final_connected_kg_nodes:
+        return
+    if check_all_qnode_pairs:
+        qnode_pairs_to_check = [(qnode_key, neighbor_qnode_key) for qnode_key, neighbor_qnode_keys in sub_qg_adj_map.items()
+                                for neighbor_qnode_key in neighbor_qnode_keys]
+    else:
+        qnode_pairs_to_check = [(prior_qnode_key, current_qnode_key) for prior_qnode_key in prior_qnode_connections]
+    # Put all valid connections under this qnode if it's is_set=True, otherwise branch for each valid connected node
+    if qg.nodes[current_qnode_key].is_set:
+        node_sets_for_current_qnode = [final_connected_kg_nodes]
+    else:
+        node_sets_for_current_qnode = [{connected_node_key} for connected_node_key in final_connected_kg_nodes]
+    for node_set in node_sets_for_current_qnode:
+        new_result_nodes = dict(result_nodes)
+        new_result_nodes[current_qnode_key] = node_set
+        _prune_dead_ends(new_result_nodes, qnode_pairs_to_check, sub_qg_adj_map, kg_node_adj_map_by_qg_key)
+        yield from _enumerate_result_graph_nodes(new_result_nodes, join_plan, step + 1, qg, kg_node_adj_map_by_qg_key)
 
 
 def _create_result_graphs(kg: KnowledgeGraph,
@@ -948,113 +1010,86 @@ def _create_result_graphs(kg: KnowledgeGraph,
     kg_node_adj_map_by_qg_key = _get_kg_node_adj_map_by_qg_key(kg_node_keys_by_qg_key, kg, qg)
     qg_adj_map = _get_qg_adj_map_undirected(qg)
 
-    # Iteratively construct "result graphs" (initially containing only nodes, not edges) by walking through all qnodes
-    log.debug(f"Constructing result graphs qnode by qnode")
+    # Plan the order in which we'll join qnodes into our result graphs
     if base_result_graphs:
-        # We'll build off of the 'base' result graphs rather than start anew
-        result_graphs = base_result_graphs
-        qnode_keys_already_handled = set(result_graphs[0]["nodes"])
-        qnode_keys_remaining = set(qg.nodes).difference(qnode_keys_already_handled)
+        # We'll build off of the 'base' result graphs (which are left unmodified) rather than start anew
+        qnode_keys_already_handled = set(base_result_graphs[0]["nodes"])
     else:
-        result_graphs = []
         qnode_keys_already_handled = set()
-        qnode_keys_remaining = set(qg.nodes)
-    while qnode_keys_remaining:
-        # Start with a random qnode if this is our first iteration
-        if not qnode_keys_already_handled:
-            current_qnode_key = list(qnode_keys_remaining)[0]
-            prior_qnode_connections = set()
-        # Otherwise find a yet unhandled qnode ID that connects somehow to the part of the QG we've already handled
-        else:
-            current_qnode_key, prior_qnode_connections = _find_qnode_connected_to_sub_qg(qnode_keys_already_handled, qnode_keys_remaining, qg)
-        current_qnode = qg.nodes[current_qnode_key]
-
-        # Initialize our result graphs if this is our first iteration
-        if not result_graphs:
-            log.debug(f"Initiating result graphs with nodes for {current_qnode_key} (is_set={current_qnode.is_set})")
-            all_node_keys_in_kg_for_this_qnode_key = kg_node_keys_by_qg_key.get(current_qnode_key)
-            # We'll start with one result graph with ALL corresponding nodes in the KG in this spot if is_set=True
-            if current_qnode.is_set:
-                log.debug(f"Starting with one result graph because is_set=True for {current_qnode_key}")
-                new_result_graph = _create_new_empty_result_graph()
-                new_result_graph["nodes"][current_qnode_key] = all_node_keys_in_kg_for_this_qnode_key
-                result_graphs.append(new_result_graph)
-            # Otherwise, we'll start with a result graph for EACH corresponding node in the KG
-            else:
-                for node_key in all_node_keys_in_kg_for_this_qnode_key:
-                    new_result_graph = _create_new_empty_result_graph()
-                    new_result_graph["nodes"][current_qnode_key] = {node_key}
-                    result_graphs.append(new_result_graph)
-        # Otherwise fan out our existing result graphs, filling out this qnode spot in them based on prior contents
+    join_order = _get_qnode_join_order(qg, qnode_keys_already_handled, kg_node_keys_by_qg_key)
+    log.debug(f"Constructing result graphs by joining qnodes in this order: {[qnode_key for qnode_key, _ in join_order]}")
+    join_plan = []
+    qnode_keys_handled = set(qnode_keys_already_handled)
+    for qnode_key, prior_qnode_connections in join_order:
+        qnode_keys_handled.add(qnode_key)
+        # Base result graphs were pruned using the required QG's adjacency, so re-check them fully at the first join
+        check_all_qnode_pairs = bool(base_result_graphs) and len(join_plan) == 0
+        join_plan.append((qnode_key, prior_qnode_connections, _extract_sub_qg_adj_map(qg_adj_map, qnode_keys_handled),
+                          check_all_qnode_pairs))
+
+    # Set up the partial result graphs that the join starts from
+    if base_result_graphs:
+        starting_points = [(dict(result_graph["nodes"]), result_graph["edges"]) for result_graph in base_result_graphs]
+        first_step = 0
+    elif join_plan:
+        first_qnode_key = join_plan[0][0]
+        log.debug(f"Initiating result graphs with nodes for {first_qnode_key} (is_set={qg.nodes[first_qnode_key].is_set})")
+        all_node_keys_in_kg_for_this_qnode_key = kg_node_keys_by_qg_key.get(first_qnode_key)
+        # We'll start with one result graph with ALL corresponding nodes in the KG in this spot if is_set=True
+        if qg.nodes[first_qnode_key].is_set:
+            starting_points = [({first_qnode_key: all_node_keys_in_kg_for_this_qnode_key}, dict())]
+        # Otherwise, we'll start with a result graph for EACH corresponding node in the KG
         else:
-            log.debug(f"Adding a layer to each result graph for qnode {current_qnode_key} (is_set={current_qnode.is_set})")
-            new_result_graphs = []
-            sub_qg_adj_map = _extract_sub_qg_adj_map(qg_adj_map, qnode_keys_already_handled.union({current_qnode_key}))
-            for result_graph in result_graphs:
-                # Figure out which KG nodes could fulfill the current qnode in this result
-                prior_qnodes_kg_nodes = {prior_qnode_key: result_graph["nodes"][prior_qnode_key] for prior_qnode_key in prior_qnode_connections}
-                current_kg_node_possibilities = [_get_all_adjacent_nodes(corresponding_kg_nodes, prior_qnode_key, current_qnode_key, kg_node_adj_map_by_qg_key)
-                                                 for prior_qnode_key, corresponding_kg_nodes in prior_qnodes_kg_nodes.items()]
-                # Only keep connections that have links to KG nodes in ALL prior connected qnode roles
-                final_connected_kg_nodes = set.intersection(*current_kg_node_possibilities)
-                if final_connected_kg_nodes:
-                    if current_qnode.is_set:
-                        # Replace this result graph with a new one with all valid connections listed under this qnode
-                        new_result_graph = _copy_result_graph(result_graph)
-                        new_result_graph["nodes"][current_qnode_key] = final_connected_kg_nodes
-                        pruned_result_graph = _clean_up_dead_ends(result_graph=new_result_graph,
-                                                                  sub_qg_adj_map=sub_qg_adj_map,
-                                                                  kg_node_adj_map_by_qg_key=kg_node_adj_map_by_qg_key)
-                        new_result_graphs.append(pruned_result_graph)
-                    else:
-                        # Create a new result graph for each new valid connected node
-                        for connected_node_key in final_connected_kg_nodes:
-                            new_result_graph = _copy_result_graph(result_graph)
-                            new_result_graph["nodes"][current_qnode_key] = {connected_node_key}
-                            pruned_result_graph = _clean_up_dead_ends(result_graph=new_result_graph,
-                                                                      sub_qg_adj_map=sub_qg_adj_map,
-                                                                      kg_node_adj_map_by_qg_key=kg_node_adj_map_by_qg_key)
-                            new_result_graphs.append(pruned_result_graph)
-            result_graphs = new_result_graphs
-        log.debug(f"Current count of result graphs is {len(result_graphs)}")
-
-        # Update our records about which qnodes we've already processed
-        qnode_keys_remaining.remove(current_qnode_key)
-        qnode_keys_already_handled.add(current_qnode_key)
-    log.debug(f"Done assigning nodes to result graphs")
-
-    # Then add edges to our result graphs as appropriate
-    log.debug(f"Adding edges to result graphs")
-    for result_graph in result_graphs:
-        qedge_keys = set(qg.edges)
-        for qedge_key in qedge_keys:
-            qedge = qg.edges[qedge_key]
-            qedge_source_node_ids = result_graph['nodes'][qedge.subject]
-            qedge_target_node_ids = result_graph['nodes'][qedge.object]
-            # Pick the more efficient method for edge-finding depending on the number of nodes for this result/qedge
-            if len(qedge_source_node_ids) < 10 or len(qedge_target_node_ids) < 10:
-                possible_node_pairs = {f"{node_1}--{node_2}" for node_1 in qedge_source_node_ids
-                                       for node_2 in qedge_target_node_ids}
-                for node_pair in possible_node_pairs:
-                    ids_of_matching_edges = edge_keys_by_node_pair[qedge_key].get(node_pair, set())
-                    result_graph['edges'][qedge_key].update(ids_of_matching_edges)
-            else:
-                # This technique is more efficient when there are large numbers of both subject and object nodes
-                edges_with_matching_subject = {edge_key for source_node in qedge_source_node_ids
-                                               for edge_key in edge_keys_by_subject[qedge_key][source_node]}
-                edges_with_matching_object = {edge_key for target_node in qedge_target_node_ids
-                                              for edge_key in edge_keys_by_object[qedge_key][target_node]}
-                result_graph['edges'][qedge_key] = edges_with_matching_subject.intersection(edges_with_matching_object)
-                if ignore_edge_direction:
-                    edges_with_reverse_subject = {edge_key for target_node in qedge_target_node_ids
-                                                  for edge_key in edge_keys_by_subject[qedge_key][target_node]}
-                    edges_with_reverse_object = {edge_key for source_node in qedge_source_node_ids
-                                                 for edge_key in edge_keys_by_object[qedge_key][source_node]}
-                    result_graph['edges'][qedge_key].update(edges_with_reverse_subject.intersection(edges_with_reverse_object))
+            starting_points = [({first_qnode_key: {node_key}}, dict()) for node_key in all_node_keys_in_kg_for_this_qnode_key]
+        first_step = 1
+    else:
+        starting_points = []
+        first_step = 0
+
+    # Join in the remaining qnodes, adding edges to each result graph as it's completed
+    result_graphs = []
+    for starting_nodes, starting_edges in starting_points:
+        for result_nodes in _enumerate_result_graph_nodes(starting_nodes, join_plan, first_step, qg, kg_node_adj_map_by_qg_key):
+            result_graph = {'nodes': collections.defaultdict(set, result_nodes),
+                            'edges': collections.defaultdict(set, starting_edges)}
+            _add_edges_to_result_graph(result_graph, qg, edge_keys_by_subject, edge_keys_by_object,
+                                       edge_keys_by_node_pair, ignore_edge_direction)
+            result_graphs.append(result_graph)
+    log.debug(f"Done constructing {len(result_graphs)} result graphs")
 
     final_result_graphs = [result_graph for result_graph in result_graphs if _result_graph_is_fulfilled(result_graph, qg)]
     return final_result_graphs
 
 
-
-
+def _add_edges_to_result_graph(result_graph: Dict[str, Dict[str, Set[str]]],
+                               qg: QueryGraph,
+                               edge_keys_by_subject: DefaultDict[str, DefaultDict[str, set]],
+                               edge_keys_by_object: DefaultDict[str, DefaultDict[str, set]],
+                               edge_keys_by_node_pair: DefaultDict[str, DefaultDict[str, set]],
+                               ignore_edge_direction: bool = True):
+    # Edge sets may be shared with a base result graph, so we always build new ones
+    for qedge_key, qedge in qg.edges.items():
+        qedge_source_node_ids = result_graph['nodes'][qedge.subject]
+        qedge_target_node_ids = result_graph['nodes'][qedge.object]
+        # Pick the more efficient method for edge-finding depending on the number of nodes for this result/qedge
+        if len(qedge_source_node_ids) < 10 or len(qedge_target_node_ids) < 10:
+            qedge_edge_keys = set(result_graph['edges'][qedge_key])
+            possible_node_pairs = {f"{node_1}--{node_2}" for node_1 in qedge_source_node_ids
+                                   for node_2 in qedge_target_node_ids}
+            for node_pair in possible_node_pairs:
+                ids_of_matching_edges = edge_keys_by_node_pair[qedge_key].get(node_pair, set())
+                qedge_edge_keys.update(ids_of_matching_edges)
+        else:
+            # This technique is more efficient when there are large numbers of both subject and object nodes
+            edges_with_matching_subject = {edge_key for source_node in qedge_source_node_ids
+                                           for edge_key in edge_keys_by_subject[qedge_key][source_node]}
+            edges_with_matching_object = {edge_key for target_node in qedge_target_node_ids
+                                          for edge_key in edge_keys_by_object[qedge_key][target_node]}
+            qedge_edge_keys = edges_with_matching_subject.intersection(edges_with_matching_object)
+            if ignore_edge_direction:
+                edges_with_reverse_subject = {edge_key for target_node in qedge_target_node_ids
+                                              for edge_key in edge_keys_by_subject[qedge_key][target_node]}
+                edges_with_reverse_object = {edge_key for source_node in qedge_source_node_ids
+                                             for edge_key in edge_keys_by_object[qedge_key][source_node]}
+                qedge_edge_keys.update(edges_with_reverse_subject.intersection(edges_with_reverse_object))
+        result_graph['edges'][qedge_key] = qedge_edge_keys
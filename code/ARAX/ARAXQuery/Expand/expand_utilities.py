@@ -4,6 +4,7 @@ import copy
 import sys
 import os
 import traceback
+from functools import lru_cache
 from typing import List, Dict, Union, Set, Tuple, Optional
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../../UI/OpenAPI/python-flask-server/")
@@ -14,6 +15,7 @@ from openapi_server.models.q_edge import QEdge
 from openapi_server.models.node import Node
 from openapi_server.models.edge import Edge
 from openapi_server.models.attribute import Attribute
+from openapi_server.models.sub_attribute import SubAttribute
 from openapi_server.models.message import Message
 from openapi_server.models.response import Response
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../")  # ARAXQuery directory
@@ -33,15 +35,107 @@ from RTXConfiguration import RTXConfiguration
 RTXConfig = RTXConfiguration()
 
 
+class KGAttribute:
+    """
+    Lightweight stand-in for a TRAPI Attribute, used internally by Expand. Instances returned by
+    get_shared_attribute() are shared between many edges, so they should be treated as read-only.
+    """
+    __slots__ = ("attribute_type_id", "original_attribute_name", "value", "value_type_id", "attribute_source",
+                 "value_url", "description", "attributes")
+
+    def __init__(self, attribute_type_id: Optional[str] = None, original_attribute_name: Optional[str] = None,
+                 value: any = None, value_type_id: Optional[str] = None, attribute_source: Optional[str] = None,
+                 value_url: Optional[str] = None, description: Optional[str] = None,
+                 attributes: Optional[List[dict]] = None):
+        self.attribute_type_id = attribute_type_id
+        self.original_attribute_name = original_attribute_name
+        self.value = value
+        self.value_type_id = value_type_id
+        self.attribute_source = attribute_source
+        self.value_url = value_url
+        self.description = description
+        self.attributes = attributes  # Any sub-attributes are left in their raw (dict) form
+
+    @classmethod
+    def from_dict(cls, attribute_dict: dict) -> 'KGAttribute':
+        return cls(**{slot: attribute_dict.get(slot) for slot in cls.__slots__})
+
+    def to_trapi(self) -> Attribute:
+        return Attribute(attribute_type_id=self.attribute_type_id,
+                         original_attribute_name=self.original_attribute_name,
+                         value=self.value,
+                         value_type_id=self.value_type_id,
+                         attribute_source=self.attribute_source,
+                         value_url=self.value_url,
+                         description=self.description,
+                         attributes=[SubAttribute.from_dict(sub_attribute) for sub_attribute in self.attributes]
+                         if self.attributes else None)
+
+
+class KGNode:
+    """
+    Lightweight stand-in for a TRAPI Node, used internally by Expand. Queriers can load their answers into these
+    rather than into the (much heavier) TRAPI models; they're converted to TRAPI in
+    convert_qg_organized_kg_to_standard_kg().
+    """
+    __slots__ = ("name", "categories", "attributes", "qnode_keys")
+
+    def __init__(self, name: Optional[str] = None, categories: Optional[List[str]] = None,
+                 attributes: Optional[List[Union[KGAttribute, Attribute]]] = None):
+        self.name = name
+        self.categories = categories
+        self.attributes = attributes
+        self.qnode_keys = None
+
+    @classmethod
+    def from_dict(cls, node_dict: dict) -> 'KGNode':
+        return cls(name=node_dict.get("name"),
+                   categories=convert_to_list(node_dict["categories"]) if node_dict.get("categories") is not None else None,
+                   attributes=[KGAttribute.from_dict(attribute) for attribute in node_dict["attributes"]]
+                   if node_dict.get("attributes") else None)
+
+    def to_trapi(self, attribute_cache: Dict[int, Attribute]) -> Node:
+        return Node(name=self.name, categories=self.categories,
+                    attributes=convert_attributes_to_trapi(self.attributes, attribute_cache))
+
+
+class KGEdge:
+    """
+    Lightweight stand-in for a TRAPI Edge, used internally by Expand. (See KGNode.)
+    """
+    __slots__ = ("subject", "object", "predicate", "attributes", "qedge_keys")
+
+    def __init__(self, subject: Optional[str] = None, object: Optional[str] = None, predicate: Optional[str] = None,
+                 attributes: Optional[List[Union[KGAttribute, Attribute]]] = None):
+        self.subject = subject
+        self.object = object
+        self.predicate = predicate
+        self.attributes = attributes
+        self.qedge_keys = None
+
+    @classmethod
+    def from_dict(cls, edge_dict: dict) -> 'KGEdge':
+        return cls(subject=edge_dict.get("subject"),
+                   object=edge_dict.get("object"),
+                   predicate=edge_dict.get("predicate"),
+                   attributes=[KGAttribute.from_dict(attribute) for attribute in edge_dict["attributes"]]
+                   if edge_dict.get("attributes") else None)
+
+    def to_trapi(self, attribute_cache: Dict[int, Attribute]) -> Edge:
+        return Edge(subject=self.subject, object=self.object, predicate=self.predicate,
+                    attributes=convert_attributes_to_trapi(self.attributes, attribute_cache))
+
+
 class QGOrganizedKnowledgeGraph:
-    def __init__(self, nodes: Dict[str, Dict[str, Node]] = None, edges: Dict[str, Dict[str, Edge]] = None):
+    def __init__(self, nodes: Dict[str, Dict[str, Union[Node, KGNode]]] = None,
+                 edges: Dict[str, Dict[str, Union[Edge, KGEdge]]] = None):
         self.nodes_by_qg_id = nodes if nodes else dict()
         self.edges_by_qg_id = edges if edges else dict()
 
     def __str__(self):
         return f"nodes_by_qg_id:\n{self.nodes_by_qg_id}\nedges_by_qg_id:\n{self.edges_by_qg_id}"
 
-    def add_node(self, node_key: str, node: Node, qnode_key: str):
+    def add_node(self, node_key: str, node: Union[Node, KGNode], qnode_key: str):
         if qnode_key not in self.nodes_by_qg_id:
             self.nodes_by_qg_id[qnode_key] = dict()
         # Merge attributes if this node already exists
@@ -58,7 +152,7 @@ class QGOrganizedKnowledgeGraph:
         else:
             self.nodes_by_qg_id[qnode_key][node_key] = node
 
-    def add_edge(self, edge_key: str, edge: Edge, qedge_key: str):
+    def add_edge(self, edge_key: str, edge: Union[Edge, KGEdge], qedge_key: str):
         if qedge_key not in self.edges_by_qg_id:
             self.edges_by_qg_id[qedge_key] = dict()
         self.edges_by_qg_id[qedge_key][edge_key] = edge
@@ -117,7 +211,7 @@ def get_curie_local_id(curie: str) -> str:
         return curie
 
 
-def get_attribute_triple(attribute: Attribute) -> str:
+def get_attribute_triple(attribute: Union[Attribute, KGAttribute]) -> str:
     return f"{attribute.attribute_type_id}--{attribute.value}--{attribute.attribute_source}"
 
 
@@ -238,12 +332,18 @@ def convert_standard_kg_to_qg_organized_kg(standard_kg: KnowledgeGraph) -> QGOrg
 
 
 def convert_qg_organized_kg_to_standard_kg(organized_kg: QGOrganizedKnowledgeGraph) -> KnowledgeGraph:
+    # Note: We check for to_trapi() rather than using isinstance() because this module is imported under two names
     standard_kg = KnowledgeGraph(nodes=dict(), edges=dict())
+    attribute_cache = dict()  # Lets us convert each shared attribute to TRAPI only once
     for qnode_key, nodes_for_this_qnode_key in organized_kg.nodes_by_qg_id.items():
         for node_key, node in nodes_for_this_qnode_key.items():
             if node_key in standard_kg.nodes:
                 standard_kg.nodes[node_key].qnode_keys.append(qnode_key)
             else:
+                if hasattr(node, "to_trapi"):
+                    node = node.to_trapi(attribute_cache)
+                elif node.attributes:
+                    node.attributes = convert_attributes_to_trapi(node.attributes, attribute_cache)
                 node.qnode_keys = [qnode_key]
                 standard_kg.nodes[node_key] = node
     for qedge_key, edges_for_this_qedge_key in organized_kg.edges_by_qg_id.items():
@@ -251,11 +351,41 @@ def convert_qg_organized_kg_to_standard_kg(organized_kg: QGOrganizedKnowledgeGra
             if edge_key in standard_kg.edges:
                 standard_kg.edges[edge_key].qedge_keys.append(qedge_key)
             else:
+                if hasattr(edge, "to_trapi"):
+                    edge = edge.to_trapi(attribute_cache)
+                elif edge.attributes:
+                    edge.attributes = convert_attributes_to_trapi(edge.attributes, attribute_cache)
                 edge.qedge_keys = [qedge_key]
                 standard_kg.edges[edge_key] = edge
     return standard_kg
 
 
+def convert_attributes_to_trapi(attributes: Optional[List[Union[KGAttribute, Attribute]]],
+                                attribute_cache: Dict[int, Attribute]) -> Optional[List[Attribute]]:
+    if attributes is None:
+        return None
+    trapi_attributes = []
+    for attribute in attributes:
+        if hasattr(attribute, "to_trapi"):
+            if id(attribute) not in attribute_cache:
+                attribute_cache[id(attribute)] = attribute.to_trapi()
+            trapi_attributes.append(attribute_cache[id(attribute)])
+        else:
+            trapi_attributes.append(attribute)
+    return trapi_attributes
+
+
+@lru_cache(maxsize=100000)
+def get_shared_attribute(attribute_type_id: str, value: any, value_type_id: Optional[str] = None,
+                         attribute_source: Optional[str] = None, description: Optional[str] = None) -> KGAttribute:
+    # Returns one (read-only) attribute instance per distinct set of inputs, so repeated attributes aren't duplicated
+    return KGAttribute(attribute_type_id=attribute_type_id,
+                       value=value,
+                       value_type_id=value_type_id,
+                       attribute_source=attribute_source,
+                       description=description)
+
+
 def get_curie_synonyms(curie: Union[str, List[str]], log: Optional[ARAXResponse] = ARAXResponse()) -> List[str]:
     curies = convert_to_list(curie)
     try:
@@ -493,33 +623,33 @@ def check_for_canonical_predicates(kg: QGOrganizedKnowledgeGraph, kp_name: str,
     return kg
 
 
-def get_arax_source_attribute() -> Attribute:
+def get_arax_source_attribute() -> KGAttribute:
     arax_infores_curie = "infores:arax"
-    return Attribute(attribute_type_id="biolink:aggregator_knowledge_source",
-                     value=arax_infores_curie,
-                     value_type_id="biolink:InformationResource",
-                     attribute_source=arax_infores_curie)
+    return get_shared_attribute(attribute_type_id="biolink:aggregator_knowledge_source",
+                                value=arax_infores_curie,
+                                value_type_id="biolink:InformationResource",
+                                attribute_source=arax_infores_curie)
 
 
-def get_kp_source_attribute(kp_name: str, arax_kp: bool = False, description: Optional[str] = None) -> Attribute:
+def get_kp_source_attribute(kp_name: str, arax_kp: bool = False, description: Optional[str] = None) -> KGAttribute:
     if not arax_kp and not description:
         description = f"ARAX inserted this attribute because the KP ({kp_name}) did not seem to provide such " \
                       f"an attribute (indicating that this edge came from them)."
-    return Attribute(attribute_type_id="biolink:knowledge_source",
-                     value=kp_name,
-                     value_type_id="biolink:InformationResource",
-                     description=description,
-                     attribute_source="infores:arax")
+    return get_shared_attribute(attribute_type_id="biolink:knowledge_source",
+                                value=kp_name,
+                                value_type_id="biolink:InformationResource",
+                                description=description,
+                                attribute_source="infores:arax")
 
 
-def get_computed_value_attribute() -> Attribute:
+def get_computed_value_attribute() -> KGAttribute:
     arax_infores_curie = "infores:arax"
-    return Attribute(attribute_type_id="biolink:computed_value",
-                     value=True,
-                     value_type_id="metatype:Boolean",
-                     attribute_source=arax_infores_curie,
-                     description="This edge is a container for a computed value between two nodes that is not "
-                                 "directly attachable to other edges.")
+    return get_shared_attribute(attribute_type_id="biolink:computed_value",
+                                value=True,
+                                value_type_id="metatype:Boolean",
+                                attribute_source=arax_infores_curie,
+                                description="This edge is a container for a computed value between two nodes that "
+                                            "is not directly attachable to other edges.")
 
 
 def get_kp_endpoint_url(kp_name: str) -> Union[str, None]:
@@ -1,16 +1,20 @@
 #!/bin/env python3
+import copy
 import random
 import sys
 import os
+import threading
 import time
 from collections import defaultdict
-from typing import Dict, Tuple, Union, Set
+from concurrent.futures import Future, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Dict, List, Tuple, Union, Set
 
 import requests
+from requests.adapters import HTTPAdapter
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 import expand_utilities as eu
-from expand_utilities import QGOrganizedKnowledgeGraph
+from expand_utilities import QGOrganizedKnowledgeGraph, KGNode, KGEdge, KGAttribute
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../")  # ARAXQuery directory
 from ARAX_response import ARAXResponse
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../")  # ARAX directory
@@ -18,12 +22,27 @@ from biolink_helper import BiolinkHelper
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../../")  # code directory
 from RTXConfiguration import RTXConfiguration
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../UI/OpenAPI/python-flask-server/")
-from openapi_server.models.node import Node
-from openapi_server.models.edge import Edge
 from openapi_server.models.attribute import Attribute
 from openapi_server.models.query_graph import QueryGraph
 
 
+_plover_session = None
+_plover_session_pid = None
+_plover_session_lock = threading.Lock()
+
+
+def _get_plover_session() -> requests.Session:
+    # One keep-alive session per process, shared by all KG2Querier batches (and queries) in that process
+    global _plover_session, _plover_session_pid
+    with _plover_session_lock:
+        if _plover_session is None or _plover_session_pid != os.getpid():
+            _plover_session = requests.Session()
+            _plover_session.mount("http://", HTTPAdapter(pool_maxsize=16))
+            _plover_session.mount("https://", HTTPAdapter(pool_maxsize=16))
+            _plover_session_pid = os.getpid()
+        return _plover_session
+
+
 class KG2Querier:
 
     def __init__(self, response_object: ARAXResponse):
@@ -32,7 +51,13 @@ class KG2Querier:
         self.kg2_infores_curie = "infores:rtx-kg2"
         self.max_allowed_edges = 1000000
         self.max_edges_per_input_curie = 1000
-        self.curie_batch_size = 100
+        self.curie_batch_size = 100  # Starting batch size; adapted based on how Plover responds
+        self.min_curie_batch_size = 20
+        self.max_curie_batch_size = 1000
+        self.max_batches_in_flight = 4
+        self.target_batch_seconds = 5
+        self.target_batch_edges = 100000
+        self.plover_url = RTXConfiguration().plover_url
 
     def answer_one_hop_query(self, query_graph: QueryGraph) -> QGOrganizedKnowledgeGraph:
         """
@@ -63,41 +88,62 @@ class KG2Querier:
             qnode.ids = canonical_curies
             qnode.categories = None  # Important to clear this, otherwise results are limited (#889)
 
-        # Send the query to plover in batches of input curies
+        # Send the query to plover in batches of input curies (several batches are kept in flight at once)
         qedge_key = next(qedge_key for qedge_key in query_graph.edges)
         input_qnode_key = self._get_input_qnode_key(query_graph)
         input_curies = query_graph.nodes[input_qnode_key].ids
         input_curie_set = set(input_curies)
-        curie_batches = [input_curies[i:i+self.curie_batch_size] for i in range(0, len(input_curies), self.curie_batch_size)]
-        log.debug(f"Split {len(input_curies)} input curies into {len(curie_batches)} batches to send to Plover")
+        log.debug(f"Sending {len(input_curies)} input curies to Plover in batches (starting batch size is "
+                  f"{self.curie_batch_size}, max in flight is {self.max_batches_in_flight})")
         log.info(f"Max edges allowed per input curie for this query is: {self.max_edges_per_input_curie}")
-        batch_num = 1
-        for curie_batch in curie_batches:
-            log.debug(f"Sending batch {batch_num} to Plover (has {len(curie_batch)} input curies)")
-            query_graph.nodes[input_qnode_key].ids = curie_batch
-            plover_answer, response_status = self._answer_query_using_plover(query_graph, log)
-            if response_status == 200:
-                batch_kg = self._load_plover_answer_into_object_model(plover_answer, log)
-                final_kg = eu.merge_two_kgs(batch_kg, final_kg)
-                # Prune down highly-connected input curies if we're over the max number of allowed edges
-                if final_kg.edges_by_qg_id.get(qedge_key):
-                    if len(final_kg.edges_by_qg_id[qedge_key]) > self.max_allowed_edges:
-                        log.debug(f"Have exceeded max num allowed edges ({self.max_allowed_edges}); will attempt to "
-                                  f"reduce the number of edges by pruning down highly connected nodes")
-                        final_kg = self._prune_highly_connected_nodes(final_kg, qedge_key, input_curie_set,
-                                                                      input_qnode_key, self.max_edges_per_input_curie,
-                                                                      log)
-                    # Error out if this pruning wasn't sufficient to bring down the edge count
-                    if len(final_kg.edges_by_qg_id[qedge_key]) > self.max_allowed_edges:
-                        log.error(f"Query for qedge {qedge_key} produced more than {self.max_allowed_edges} edges, "
-                                  f"which is too much for the system to handle. You must somehow make your query "
-                                  f"smaller (specify fewer input curies or use more specific predicates/categories).",
-                                  error_code="QueryTooLarge")
+        next_curie_index = 0
+        batch_size = self.curie_batch_size
+        batch_num = 0
+        in_flight = dict()
+        with ThreadPoolExecutor(max_workers=self.max_batches_in_flight) as executor:
+            while next_curie_index < len(input_curies) or in_flight:
+                # Top up the in-flight window with new batches
+                while next_curie_index < len(input_curies) and len(in_flight) < self.max_batches_in_flight:
+                    curie_batch = input_curies[next_curie_index:next_curie_index + batch_size]
+                    next_curie_index += len(curie_batch)
+                    batch_num += 1
+                    log.debug(f"Sending batch {batch_num} to Plover (has {len(curie_batch)} input curies)")
+                    batch_qg = copy.deepcopy(query_graph)
+                    batch_qg.nodes[input_qnode_key].ids = curie_batch
+                    future = executor.submit(self._answer_query_using_plover, batch_qg, log)
+                    in_flight[future] = (batch_num, len(curie_batch), time.time())
+
+                # Merge in whichever batches have finished
+                done_futures, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done_futures:
+                    batch_num_done, num_batch_curies, batch_start = in_flight.pop(future)
+                    plover_answer, response_status = future.result()
+                    if response_status != 200:
+                        log.error(f"Plover returned response of {response_status}. Answer was: {plover_answer}",
+                                  error_code="RequestFailed")
+                        self._cancel_pending_batches(in_flight)
                         return final_kg
-            else:
-                log.error(f"Plover returned response of {response_status}. Answer was: {plover_answer}", error_code="RequestFailed")
-                return final_kg
-            batch_num += 1
+                    batch_kg = self._load_plover_answer_into_object_model(plover_answer, log)
+                    final_kg = eu.merge_two_kgs(batch_kg, final_kg)
+                    batch_size = self._get_adapted_batch_size(batch_size, num_batch_curies, time.time() - batch_start,
+                                                              len(batch_kg.edges_by_qg_id.get(qedge_key, dict())))
+                    log.debug(f"Merged batch {batch_num_done} from Plover; next batch size is {batch_size}")
+                    # Prune down highly-connected input curies if we're over the max number of allowed edges
+                    if final_kg.edges_by_qg_id.get(qedge_key):
+                        if len(final_kg.edges_by_qg_id[qedge_key]) > self.max_allowed_edges:
+                            log.debug(f"Have exceeded max num allowed edges ({self.max_allowed_edges}); will attempt to "
+                                      f"reduce the number of edges by pruning down highly connected nodes")
+                            final_kg = self._prune_highly_connected_nodes(final_kg, qedge_key, input_curie_set,
+                                                                          input_qnode_key, self.max_edges_per_input_curie,
+                                                                          log)
+                        # Error out if this pruning wasn't sufficient to bring down the edge count
+                        if len(final_kg.edges_by_qg_id[qedge_key]) > self.max_allowed_edges:
+                            log.error(f"Query for qedge {qedge_key} produced more than {self.max_allowed_edges} edges, "
+                                      f"which is too much for the system to handle. You must somehow make your query "
+                                      f"smaller (specify fewer input curies or use more specific predicates/categories).",
+                                      error_code="QueryTooLarge")
+                            self._cancel_pending_batches(in_flight)
+                            return final_kg
 
         return final_kg
 
@@ -166,9 +212,25 @@ class KG2Querier:
                     del kg.nodes_by_qg_id[qnode_key][orphan_node_key]
         return kg
 
+    def _get_adapted_batch_size(self, batch_size: int, num_batch_curies: int, batch_seconds: float,
+                                num_batch_edges: int) -> int:
+        # Scale the batch size so batches take roughly our target time and return a manageable number of edges
+        if num_batch_curies < batch_size or not num_batch_curies:
+            return batch_size  # A final, partial batch doesn't tell us much
+        scale_factors = [self.target_batch_seconds / max(batch_seconds, 0.1)]
+        if num_batch_edges:
+            scale_factors.append(self.target_batch_edges / num_batch_edges)
+        new_batch_size = int(batch_size * min(scale_factors))
+        new_batch_size = min(new_batch_size, batch_size * 2)  # Grow gradually
+        return max(self.min_curie_batch_size, min(self.max_curie_batch_size, new_batch_size))
+
     @staticmethod
-    def _answer_query_using_plover(qg: QueryGraph, log: ARAXResponse) -> Tuple[Dict[str, Dict[str, Union[set, dict]]], int]:
-        rtxc = RTXConfiguration()
+    def _cancel_pending_batches(in_flight: Dict[Future, tuple]):
+        for future in in_flight:
+            future.cancel()
+
+    def _answer_query_using_plover(self, qg: QueryGraph, log: ARAXResponse) -> Tuple[Dict[str, Dict[str, Union[set, dict]]], int]:
+        plover_url = self.plover_url
         # First prep the query graph (requires some minor additions for Plover)
         dict_qg = qg.to_dict()
         dict_qg["include_metadata"] = True  # Ask plover to return node/edge objects (not just IDs)
@@ -179,9 +241,9 @@ class KG2Querier:
                 if "allow_subclasses" not in qnode or qnode["allow_subclasses"] is None:
                     qnode["allow_subclasses"] = True
         # Then send the actual query
-        log.debug(f"Sending query to {rtxc.plover_url}")
-        response = requests.post(f"{rtxc.plover_url}/query", json=dict_qg, timeout=60,
-                                 headers={'accept': 'application/json'})
+        log.debug(f"Sending query to {plover_url}")
+        response = _get_plover_session().post(f"{plover_url}/query", json=dict_qg, timeout=60,
+                                              headers={'accept': 'application/json'})
         if response.status_code == 200:
             log.debug(f"Got response back from Plover")
             return response.json(), response.status_code
@@ -192,49 +254,65 @@ class KG2Querier:
     def _load_plover_answer_into_object_model(self, plover_answer: Dict[str, Dict[str, Union[set, dict]]],
                                               log: ARAXResponse) -> QGOrganizedKnowledgeGraph:
         answer_kg = QGOrganizedKnowledgeGraph()
-        # Load returned nodes into TRAPI object model
+        # Load returned nodes into our object model (in bulk, column-wise)
         for qnode_key, nodes in plover_answer["nodes"].items():
             num_nodes = len(nodes)
-            log.debug(f"Loading {num_nodes} {qnode_key} nodes into TRAPI object model")
+            log.debug(f"Loading {num_nodes} {qnode_key} nodes into object model")
             start = time.time()
-            for node_key, node_tuple in nodes.items():
-                node = self._convert_kg2c_plover_node_to_trapi_node(node_tuple)
-                answer_kg.add_node(node_key, node, qnode_key)
-            log.debug(f"Loading {num_nodes} {qnode_key} nodes into TRAPI object model took "
+            answer_kg.nodes_by_qg_id[qnode_key] = self._load_plover_nodes(nodes)
+            log.debug(f"Loading {num_nodes} {qnode_key} nodes into object model took "
                       f"{round(time.time() - start, 2)} seconds")
-        # Load returned edges into TRAPI object model
+        # Load returned edges into our object model (in bulk, column-wise)
         for qedge_key, edges in plover_answer["edges"].items():
             num_edges = len(edges)
-            log.debug(f"Loading {num_edges} edges into TRAPI object model")
+            log.debug(f"Loading {num_edges} edges into object model")
             start = time.time()
-            for edge_key, edge_tuple in edges.items():
-                edge = self._convert_kg2c_plover_edge_to_trapi_edge(edge_tuple)
-                answer_kg.add_edge(edge_key, edge, qedge_key)
-            log.debug(f"Loading {num_edges} {qedge_key} edges into TRAPI object model took "
+            answer_kg.edges_by_qg_id[qedge_key] = self._load_plover_edges(edges)
+            log.debug(f"Loading {num_edges} {qedge_key} edges into object model took "
                       f"{round(time.time() - start, 2)} seconds")
         return answer_kg
 
     @staticmethod
-    def _convert_kg2c_plover_node_to_trapi_node(node_tuple: list) -> Node:
-        node = Node(name=node_tuple[0], categories=eu.convert_to_list(node_tuple[1]))
-        return node
+    def _load_plover_nodes(nodes: Dict[str, list]) -> Dict[str, KGNode]:
+        # Plover node tuples look like: [name, categories]
+        if not nodes:
+            return dict()
+        names, categories_column = list(zip(*nodes.values()))[:2]
+        categories_column = [[categories] if isinstance(categories, str) else categories
+                             for categories in categories_column]
+        return dict(zip(nodes.keys(), map(KGNode, names, categories_column)))
+
+    def _load_plover_edges(self, edges: Dict[str, list]) -> Dict[str, KGEdge]:
+        # Plover edge tuples look like: [subject, object, predicate, knowledge_sources]
+        if not edges:
+            return dict()
+        subjects, objects, predicates, knowledge_sources_column = list(zip(*edges.values()))[:4]
+        # The same few combinations of knowledge sources repeat across huge numbers of edges, so we build the
+        # attributes for each combination only once and share them (each edge still gets its own list)
+        attribute_templates = dict()
+        attribute_lists = []
+        for knowledge_sources in knowledge_sources_column:
+            sources_key = tuple(knowledge_sources)
+            template = attribute_templates.get(sources_key)
+            if template is None:
+                template = self._get_kg2c_edge_attributes(sources_key)
+                attribute_templates[sources_key] = template
+            attribute_lists.append(list(template))
+        return dict(zip(edges.keys(), map(KGEdge, subjects, objects, predicates, attribute_lists)))
 
-    def _convert_kg2c_plover_edge_to_trapi_edge(self, edge_tuple: list) -> Edge:
-        edge = Edge(subject=edge_tuple[0], object=edge_tuple[1], predicate=edge_tuple[2], attributes=[])
-        knowledge_sources = edge_tuple[3]
+    def _get_kg2c_edge_attributes(self, knowledge_sources: Tuple[str, ...]) -> List[KGAttribute]:
         # Indicate that this edge came from the KG2 KP
-        edge.attributes.append(Attribute(attribute_type_id="biolink:aggregator_knowledge_source",
-                                         value=self.kg2_infores_curie,
-                                         value_type_id="biolink:InformationResource",
-                                         attribute_source=self.kg2_infores_curie))
+        attributes = [eu.get_shared_attribute(attribute_type_id="biolink:aggregator_knowledge_source",
+                                              value=self.kg2_infores_curie,
+                                              value_type_id="biolink:InformationResource",
+                                              attribute_source=self.kg2_infores_curie)]
         # Create knowledge source attributes for each of this edge's knowledge sources
-        knowledge_source_attributes = [Attribute(attribute_type_id="biolink:knowledge_source",
-                                                 value=infores_curie,
-                                                 value_type_id="biolink:InformationResource",
-                                                 attribute_source=self.kg2_infores_curie)
-                                       for infores_curie in knowledge_sources]
-        edge.attributes += knowledge_source_attributes
-        return edge
+        attributes += [eu.get_shared_attribute(attribute_type_id="biolink:knowledge_source",
+                                               value=infores_curie,
+                                               value_type_id="biolink:InformationResource",
+                                               attribute_source=self.kg2_infores_curie)
+                       for infores_curie in knowledge_sources]
+        return attributes
 
     @staticmethod
     def _get_input_qnode_key(one_hop_qg: QueryGraph) -> str:
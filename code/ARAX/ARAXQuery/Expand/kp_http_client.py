@@ -0,0 +1,192 @@
+#!/bin/env python3
+# This file contains the shared HTTP client Expand uses to talk to KPs' TRAPI APIs. It keeps one pooled, keep-alive
+# aiohttp session per worker process (running on its own background event loop), so that connections to a given KP
+# host are reused across KP queries, qedges, and queries handled by the same worker.
+import asyncio
+import atexit
+import os
+import tempfile
+import threading
+import time
+from typing import Dict, IO, Optional, Tuple
+
+import aiohttp
+
+MAX_CONNECTIONS_TOTAL = 100
+MAX_CONNECTIONS_PER_HOST = 10  # Caps how many requests we'll have in flight to any one KP host at a time
+KEEPALIVE_TIMEOUT = 60  # Seconds to hold an idle connection open for reuse
+RESPONSE_CHUNK_SIZE = 2 ** 16
+SPOOL_MAX_MEMORY = 2 ** 25  # Response bodies bigger than this (32 MB) are spooled to a temp file instead of held in RAM
+
+
+class KPConnectionStats:
+    def __init__(self):
+        self.num_requests = 0
+        self.num_new_connections = 0
+        self.num_reused_connections = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def record(self, reused_connection: Optional[bool], latency: float):
+        self.num_requests += 1
+        if reused_connection is True:
+            self.num_reused_connections += 1
+        elif reused_connection is False:
+            self.num_new_connections += 1
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+
+    def to_dict(self) -> Dict[str, any]:
+        return {"requests": self.num_requests,
+                "new_connections": self.num_new_connections,
+                "reused_connections": self.num_reused_connections,
+                "mean_latency": round(self.total_latency / self.num_requests, 3) if self.num_requests else None,
+                "max_latency": round(self.max_latency, 3)}
+
+
+class _RequestTrace:
+    # Passed along as the aiohttp trace_request_ctx so our trace hooks can tell us how this request got its connection
+    def __init__(self):
+        self.reused_connection = None
+
+
+class KPHTTPClient:
+    """
+    Process-wide client for sending queries to KPs. All HTTP I/O runs on a single background event loop that owns
+    one pooled aiohttp session; callers running on their own event loops await the results of that I/O. Use
+    get_kp_http_client() to grab the instance for the current process.
+    """
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.stats_by_kp: Dict[str, KPConnectionStats] = dict()
+        self._stats_lock = threading.Lock()
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._io_loop = asyncio.new_event_loop()
+        self._io_thread = threading.Thread(target=self._run_io_loop, name="kp-http-client", daemon=True)
+        self._io_thread.start()
+
+    def _run_io_loop(self):
+        asyncio.set_event_loop(self._io_loop)
+        self._io_loop.run_forever()
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        # Only ever called from the background I/O loop, so no locking is needed here
+        if not self._session or self._session.closed:
+            trace_config = aiohttp.TraceConfig()
+            trace_config.on_connection_create_end.append(self._on_connection_create_end)
+            trace_config.on_connection_reuseconn.append(self._on_connection_reuseconn)
+            connector = aiohttp.TCPConnector(ssl=False,
+                                             limit=MAX_CONNECTIONS_TOTAL,
+                                             limit_per_host=MAX_CONNECTIONS_PER_HOST,
+                                             keepalive_timeout=KEEPALIVE_TIMEOUT)
+            self._session = aiohttp.ClientSession(connector=connector, trace_configs=[trace_config])
+        return self._session
+
+    @staticmethod
+    async def _on_connection_create_end(session, trace_config_ctx, params):
+        if isinstance(trace_config_ctx.trace_request_ctx, _RequestTrace):
+            trace_config_ctx.trace_request_ctx.reused_connection = False
+
+    @staticmethod
+    async def _on_connection_reuseconn(session, trace_config_ctx, params):
+        if isinstance(trace_config_ctx.trace_request_ctx, _RequestTrace):
+            trace_config_ctx.trace_request_ctx.reused_connection = True
+
+    async def _post_on_io_loop(self, url: str, json_body: dict, timeout: int) -> Tuple[int, IO[bytes], Optional[bool]]:
+        trace = _RequestTrace()
+        async with self._get_session().post(url,
+                                            json=json_body,
+                                            headers={'accept': 'application/json'},
+                                            timeout=aiohttp.ClientTimeout(total=timeout),
+                                            trace_request_ctx=trace) as response:
+            body = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+            if response.status == 200:
+                async for chunk in response.content.iter_chunked(RESPONSE_CHUNK_SIZE):
+                    body.write(chunk)
+                body.seek(0)
+            return response.status, body, trace.reused_connection
+
+    async def post(self, kp_name: str, url: str, json_body: dict, timeout: int,
+                   query_stats: Optional[KPConnectionStats] = None) -> Tuple[int, IO[bytes]]:
+        """
+        Sends a POST request to the given KP URL using the shared connection pool. Can be awaited from any event
+        loop. Returns the HTTP status code and a binary file-like object containing the raw response body (which is
+        spooled to disk if it's large); callers are responsible for closing it. The request is counted in this
+        process's running totals for the KP and, if given, in query_stats (which callers use to report on the
+        requests made for just one query).
+        """
+        start = time.time()
+        io_future = asyncio.run_coroutine_threadsafe(self._post_on_io_loop(url, json_body, timeout), self._io_loop)
+        status, body, reused_connection = await asyncio.wrap_future(io_future)
+        self._record_request(kp_name, reused_connection, time.time() - start, query_stats)
+        return status, body
+
+    def _record_request(self, kp_name: str, reused_connection: Optional[bool], latency: float,
+                        query_stats: Optional[KPConnectionStats]):
+        with self._stats_lock:
+            if kp_name not in self.stats_by_kp:
+                self.stats_by_kp[kp_name] = KPConnectionStats()
+            self.stats_by_kp[kp_name].record(reused_connection, latency)
+            if query_stats is not None:
+                query_stats.record(reused_connection, latency)
+
+    def get_kp_stats(self, kp_name: str) -> Dict[str, any]:
+        # These are running totals over every request this process has sent to the KP, across all queries
+        with self._stats_lock:
+            return self.stats_by_kp[kp_name].to_dict() if kp_name in self.stats_by_kp else KPConnectionStats().to_dict()
+
+    def close(self):
+        if self._io_loop.is_running():
+            if self._session and not self._session.closed:
+                close_future = asyncio.run_coroutine_threadsafe(self._session.close(), self._io_loop)
+                try:
+                    close_future.result(timeout=5)
+                except Exception:
+                    pass
+            self._io_loop.call_soon_threadsafe(self._io_loop.stop)
+
+
+_client: Optional[KPHTTPClient] = None
+_client_lock = threading.Lock()
+
+
+def get_kp_http_client() -> KPHTTPClient:
+    # Sessions (and their sockets/threads) don't survive a fork, so each process gets its own client
+    global _client
+    with _client_lock:
+        if _client is None or _client.pid != os.getpid():
+            _client = KPHTTPClient()
+        return _client
+
+
+class _EventLoopHolder:
+    # Closes a thread's Expand event loop once that thread's local storage is torn down (i.e., the thread exits)
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+
+    def __del__(self):
+        if not self.loop.is_closed() and not self.loop.is_running():
+            self.loop.close()
+
+
+_thread_state = threading.local()
+
+
+def get_expand_event_loop() -> asyncio.AbstractEventLoop:
+    """
+    Returns a persistent event loop for the current thread that Expand can use to run its concurrent KP queries;
+    this avoids building a brand new event loop for every qedge.
+    """
+    holder = getattr(_thread_state, "loop_holder", None)
+    if holder is None or holder.loop.is_closed():
+        holder = _EventLoopHolder()
+        _thread_state.loop_holder = holder
+    asyncio.set_event_loop(holder.loop)
+    return holder.loop
+
+
+@atexit.register
+def _close_kp_http_client():
+    if _client is not None and _client.pid == os.getpid():
+        _client.close()
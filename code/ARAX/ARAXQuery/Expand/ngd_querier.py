@@ -32,6 +32,7 @@ class NGDQuerier:
         self.accepted_qedge_predicates = {"biolink:has_normalized_google_distance_with", "biolink:related_to"}
         self.ngd_edge_attribute_name = "normalized_google_distance"
         self.ngd_edge_attribute_type = "EDAM:data_2526"
+        self.ngd_threshold = 0.5  # Only node pairs with an NGD below this get edges
         self.decorator = ARAXDecorator()
 
     def answer_one_hop_query(self, query_graph: QueryGraph) -> QGOrganizedKnowledgeGraph:
@@ -68,12 +69,9 @@ class NGDQuerier:
         if log.status != 'OK':
             return final_kg
 
-        # Go through those answers from KG2 and calculate ngd for each edge
-        log.debug(f"Calculating NGD between each potential node pair")
+        # Figure out which node pairs those answers from KG2 give us
         kg2_answer_kg = kg2_message.knowledge_graph
-        cngd = ComputeNGD(log, kg2_message, None)
-        cngd.load_curie_to_pmids_data(kg2_answer_kg.nodes)
-        kg2_edge_ngd_map = dict()
+        kg2_edge_node_pairs = dict()
         for kg2_edge_key, kg2_edge in kg2_answer_kg.edges.items():
             kg2_node_1_key = kg2_edge.subject
             kg2_node_2_key = kg2_edge.object
@@ -81,23 +79,26 @@ class NGDQuerier:
             kg2_node_2 = kg2_answer_kg.nodes.get(kg2_node_2_key)
             # Figure out which node corresponds to source qnode (don't necessarily match b/c query was bidirectional)
             if source_qnode_key in kg2_node_1.qnode_keys and target_qnode_key in kg2_node_2.qnode_keys:
-                ngd_subject = kg2_node_1_key
-                ngd_object = kg2_node_2_key
+                kg2_edge_node_pairs[kg2_edge_key] = (kg2_node_1_key, kg2_node_2_key)
             else:
-                ngd_subject = kg2_node_2_key
-                ngd_object = kg2_node_1_key
-            ngd_value, pmid_set = cngd.calculate_ngd_fast(ngd_subject, ngd_object)
-            kg2_edge_ngd_map[kg2_edge_key] = {"ngd_value": ngd_value, "subject": ngd_subject, "object": ngd_object, "pmids": [f"PMID:{pmid}" for pmid in pmid_set]}
+                kg2_edge_node_pairs[kg2_edge_key] = (kg2_node_2_key, kg2_node_1_key)
+
+        # Only calculate NGD for node pairs whose PMID counts say they could possibly get under the threshold
+        cngd = ComputeNGD(log, kg2_message, None)
+        candidate_node_pairs = cngd.get_pairs_that_could_beat_threshold(list(kg2_edge_node_pairs.values()), self.ngd_threshold)
+        log.debug(f"Calculating NGD for {len(candidate_node_pairs)} node pairs (pruned "
+                  f"{len(set(kg2_edge_node_pairs.values())) - len(candidate_node_pairs)} that can't have an NGD below "
+                  f"{self.ngd_threshold})")
+        ngd_results_by_node_pair = dict(zip(candidate_node_pairs, cngd.calculate_ngd_batch(candidate_node_pairs)))
 
         # Create edges for those from KG2 found to have a low enough ngd value
-        threshold = 0.5
-        log.debug(f"Creating edges between node pairs with NGD below the threshold ({threshold})")
-        for kg2_edge_key, ngd_info_dict in kg2_edge_ngd_map.items():
-            ngd_value = ngd_info_dict['ngd_value']
-            if ngd_value is not None and ngd_value < threshold:  # TODO: Make determination of the threshold much more sophisticated
-                subject = ngd_info_dict["subject"]
-                object = ngd_info_dict["object"]
-                pmid_list = ngd_info_dict["pmids"]
+        log.debug(f"Creating edges between node pairs with NGD below the threshold ({self.ngd_threshold})")
+        for kg2_edge_key, (subject, object) in kg2_edge_node_pairs.items():
+            if (subject, object) not in ngd_results_by_node_pair:
+                continue
+            ngd_value, pmid_set = ngd_results_by_node_pair[(subject, object)]
+            if ngd_value is not None and ngd_value < self.ngd_threshold:  # TODO: Make determination of the threshold much more sophisticated
+                pmid_list = [f"PMID:{pmid}" for pmid in pmid_set]
                 ngd_edge_key, ngd_edge = self._create_ngd_edge(ngd_value, subject, object, pmid_list)
                 ngd_source_node_key, ngd_source_node = self._create_ngd_node(ngd_edge.subject, kg2_answer_kg.nodes.get(ngd_edge.subject))
                 ngd_target_node_key, ngd_target_node = self._create_ngd_node(ngd_edge.object, kg2_answer_kg.nodes.get(ngd_edge.object))
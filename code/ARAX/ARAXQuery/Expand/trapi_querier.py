@@ -1,27 +1,34 @@
 #!/bin/env python3
-import concurrent
+import asyncio
 import copy
 import json
 import sys
 import os
 import time
 
-import aiohttp
 import requests
-from typing import List, Dict, Set, Union, Optional
+from typing import IO, List, Dict, Set, Union, Optional
 
 import requests_cache
+try:
+    import ijson
+except ImportError:  # Fall back to loading KP responses all at once
+    ijson = None
+# Errors that mean a KP's response body wasn't valid (or complete) JSON; json.JSONDecodeError is a ValueError
+JSON_PARSE_ERRORS = (ijson.JSONError, ValueError) if ijson else (ValueError,)
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 import Expand.expand_utilities as eu
-from Expand.expand_utilities import QGOrganizedKnowledgeGraph
+from Expand.expand_utilities import QGOrganizedKnowledgeGraph, KGNode, KGEdge
 from Expand.kp_selector import KPSelector
+from Expand.kp_http_client import get_kp_http_client, KPConnectionStats
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../")  # ARAXQuery directory
 from ARAX_response import ARAXResponse
 from ARAX_messenger import ARAXMessenger
 from ARAX_query import ARAXQuery
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../UI/OpenAPI/python-flask-server/")
 from openapi_server.models.edge import Edge
+from openapi_server.models.node import Node
 from openapi_server.models.q_node import QNode
 from openapi_server.models.q_edge import QEdge
 from openapi_server.models.query_graph import QueryGraph
@@ -182,41 +189,50 @@ class TRAPIQuerier:
         waiting_message = f"Query with {num_input_curies} curies sent: waiting for response"
         self.log.update_query_plan(qedge_key, self.kp_name, "Waiting", waiting_message, query=query_sent)
         start = time.time()
+        query_connection_stats = KPConnectionStats()  # Covers only the requests sent for this query
         if self.force_local and self.kp_name == 'infores:rtx-kg2':
             json_response = self._answer_query_force_local(request_body)
+            wait_time = round(time.time() - start)
+            answer_kg = self._load_kp_json_response(json_response)
         # Otherwise send the query graph to the KP's TRAPI API
         else:
             self.log.debug(f"{self.kp_name}: Sending query to {self.kp_name} API ({self.kp_endpoint})")
-            async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(verify_ssl=False)) as session:
-                try:
-                    async with session.post(f"{self.kp_endpoint}/query",
-                                            json=request_body,
-                                            headers={'accept': 'application/json'},
-                                            timeout=query_timeout) as response:
-                        if response.status == 200:
-                            json_response = await response.json()
-                        else:
-                            wait_time = round(time.time() - start)
-                            http_error_message = f"Returned HTTP error {response.status} after {wait_time} seconds"
-                            self.log.warning(f"{self.kp_name}: {http_error_message}. Query sent to KP was: {request_body}")
-                            self.log.update_query_plan(qedge_key, self.kp_name, "Error", http_error_message)
-                            return QGOrganizedKnowledgeGraph()
-                except concurrent.futures._base.TimeoutError:
-                    timeout_message = f"Query timed out after {query_timeout} seconds"
-                    self.log.warning(f"{self.kp_name}: {timeout_message}")
-                    self.log.update_query_plan(qedge_key, self.kp_name, "Timed out", timeout_message)
-                    return QGOrganizedKnowledgeGraph()
-                except Exception as ex:
+            try:
+                status, response_body = await get_kp_http_client().post(self.kp_name,
+                                                                         f"{self.kp_endpoint}/query",
+                                                                         json_body=request_body,
+                                                                         timeout=query_timeout,
+                                                                         query_stats=query_connection_stats)
+                with response_body:
+                    if status != 200:
+                        wait_time = round(time.time() - start)
+                        http_error_message = f"Returned HTTP error {status} after {wait_time} seconds"
+                        self.log.warning(f"{self.kp_name}: {http_error_message}. Query sent to KP was: {request_body}")
+                        self.log.update_query_plan(qedge_key, self.kp_name, "Error", http_error_message)
+                        return QGOrganizedKnowledgeGraph()
                     wait_time = round(time.time() - start)
-                    exception_message = f"Request threw exception after {wait_time} seconds: {type(ex)}"
-                    self.log.warning(f"{self.kp_name}: {exception_message}")
-                    self.log.update_query_plan(qedge_key, self.kp_name, "Error", exception_message)
-                    return QGOrganizedKnowledgeGraph()
+                    answer_kg = self._load_kp_json_response_streaming(response_body)
+            except JSON_PARSE_ERRORS as ex:
+                wait_time = round(time.time() - start)
+                parse_error_message = f"Returned malformed JSON after {wait_time} seconds: {ex}"
+                self.log.warning(f"{self.kp_name}: {parse_error_message}")
+                self.log.update_query_plan(qedge_key, self.kp_name, "Error", parse_error_message)
+                return QGOrganizedKnowledgeGraph()
+            except asyncio.TimeoutError:
+                timeout_message = f"Query timed out after {query_timeout} seconds"
+                self.log.warning(f"{self.kp_name}: {timeout_message}")
+                self.log.update_query_plan(qedge_key, self.kp_name, "Timed out", timeout_message)
+                return QGOrganizedKnowledgeGraph()
+            except Exception as ex:
+                wait_time = round(time.time() - start)
+                exception_message = f"Request threw exception after {wait_time} seconds: {type(ex)}"
+                self.log.warning(f"{self.kp_name}: {exception_message}")
+                self.log.update_query_plan(qedge_key, self.kp_name, "Error", exception_message)
+                return QGOrganizedKnowledgeGraph()
 
-        wait_time = round(time.time() - start)
-        answer_kg = self._load_kp_json_response(json_response)
         done_message = f"Returned {len(answer_kg.edges_by_qg_id.get(qedge_key, dict()))} edges in {wait_time} seconds"
-        self.log.update_query_plan(qedge_key, self.kp_name, "Done", done_message)
+        connection_stats = None if self.force_local else query_connection_stats.to_dict()
+        self.log.update_query_plan(qedge_key, self.kp_name, "Done", done_message, connection_stats=connection_stats)
         return answer_kg
 
     def _answer_query_using_kp(self, query_graph: QueryGraph) -> QGOrganizedKnowledgeGraph:
@@ -303,47 +319,118 @@ class TRAPIQuerier:
         # Populate our final KG with the returned nodes and edges
         returned_edge_keys_missing_qg_bindings = set()
         for returned_edge_key, returned_edge in kp_message.knowledge_graph.edges.items():
-            arax_edge_key = self._get_arax_edge_key(returned_edge)  # Convert to an ID that's unique for us
-            if not returned_edge.attributes:
-                returned_edge.attributes = []
-            # Put in a placeholder for missing required attribute fields to try to keep our answer TRAPI-compliant
-            for attribute in returned_edge.attributes:
-                if not attribute.attribute_type_id:
-                    attribute.attribute_type_id = f"not provided (this attribute came from {self.kp_name})"
+            if not self._add_returned_edge(answer_kg, returned_edge_key, returned_edge, kg_to_qg_mappings):
+                returned_edge_keys_missing_qg_bindings.add(returned_edge_key)
+        returned_node_keys_missing_qg_bindings = set()
+        for returned_node_key, returned_node in kp_message.knowledge_graph.nodes.items():
+            if not self._add_returned_node(answer_kg, returned_node_key, returned_node, kg_to_qg_mappings):
+                returned_node_keys_missing_qg_bindings.add(returned_node_key)
+        self._warn_about_missing_qg_bindings(returned_edge_keys_missing_qg_bindings,
+                                             returned_node_keys_missing_qg_bindings)
 
-            # Check if KPs are properly indicating that these edges came from them (indicate it ourselves if not)
-            attribute_has_kp_name = lambda value, kp_name: (type(value) is list and kp_name in value) or (value == kp_name)
-            if not any(attribute_has_kp_name(attribute.value, self.kp_name) for attribute in returned_edge.attributes):
-                returned_edge.attributes.append(eu.get_kp_source_attribute(self.kp_name))
-            # Add an attribute to indicate that this edge passed through ARAX
-            returned_edge.attributes.append(eu.get_arax_source_attribute())
+        return answer_kg
 
-            if returned_edge_key in kg_to_qg_mappings['edges']:
-                for qedge_key in kg_to_qg_mappings['edges'][returned_edge_key]:
-                    answer_kg.add_edge(arax_edge_key, returned_edge, qedge_key)
+    def _load_kp_json_response_streaming(self, response_body: IO[bytes]) -> QGOrganizedKnowledgeGraph:
+        """
+        Incrementally parses a raw KP response body, adding nodes/edges to our KG as they're parsed rather than
+        first deserializing the whole TRAPI message. The body is read twice: first to gather the (small) result
+        bindings, then to stream through the knowledge graph (which TRAPI puts before the results).
+        """
+        if not ijson:
+            return self._load_kp_json_response(json.load(response_body))
+
+        # Build a map that indicates which qnodes/qedges a given node/edge fulfills, one result at a time
+        kg_to_qg_mappings = {"nodes": dict(), "edges": dict()}
+        num_results = 0
+        for result in ijson.items(response_body, "message.results.item", use_float=True):
+            self._add_result_to_kg_to_qg_mappings(result, kg_to_qg_mappings)
+            num_results += 1
+        if not num_results:
+            # Let the standard loader report what exactly is missing (a response like this is small anyway)
+            response_body.seek(0)
+            return self._load_kp_json_response(json.load(response_body))
+        self.log.debug(f"{self.kp_name}: Got results from {self.kp_name}.")
+
+        # Populate our final KG with the returned nodes and edges as they're parsed
+        answer_kg = QGOrganizedKnowledgeGraph()
+        response_body.seek(0)
+        returned_edge_keys_missing_qg_bindings = set()
+        for returned_edge_key, returned_edge_dict in ijson.kvitems(response_body, "message.knowledge_graph.edges",
+                                                                   use_float=True):
+            if returned_edge_key in kg_to_qg_mappings["edges"]:
+                returned_edge = KGEdge.from_dict(returned_edge_dict)
+                self._add_returned_edge(answer_kg, returned_edge_key, returned_edge, kg_to_qg_mappings)
             else:
                 returned_edge_keys_missing_qg_bindings.add(returned_edge_key)
-        if returned_edge_keys_missing_qg_bindings:
-            self.log.warning(f"{self.kp_name}: {len(returned_edge_keys_missing_qg_bindings)} edges in the KP's answer "
-                             f"KG have no bindings to the QG: {returned_edge_keys_missing_qg_bindings}")
-
+        response_body.seek(0)
         returned_node_keys_missing_qg_bindings = set()
-        for returned_node_key, returned_node in kp_message.knowledge_graph.nodes.items():
-            if returned_node_key not in kg_to_qg_mappings['nodes']:
+        for returned_node_key, returned_node_dict in ijson.kvitems(response_body, "message.knowledge_graph.nodes",
+                                                                   use_float=True):
+            returned_node = KGNode.from_dict(returned_node_dict)
+            if not self._add_returned_node(answer_kg, returned_node_key, returned_node, kg_to_qg_mappings):
                 returned_node_keys_missing_qg_bindings.add(returned_node_key)
-            else:
-                for qnode_key in kg_to_qg_mappings['nodes'][returned_node_key]:
-                    answer_kg.add_node(returned_node_key, returned_node, qnode_key)
-            if returned_node.attributes:
-                for attribute in returned_node.attributes:
-                    if not attribute.attribute_type_id:
-                        attribute.attribute_type_id = f"not provided (this attribute came from {self.kp_name})"
-        if returned_node_keys_missing_qg_bindings:
-            self.log.warning(f"{self.kp_name}: {len(returned_node_keys_missing_qg_bindings)} nodes in the KP's answer "
-                             f"KG have no bindings to the QG: {returned_node_keys_missing_qg_bindings}")
+        self._warn_about_missing_qg_bindings(returned_edge_keys_missing_qg_bindings,
+                                             returned_node_keys_missing_qg_bindings)
 
         return answer_kg
 
+    @staticmethod
+    def _add_result_to_kg_to_qg_mappings(result: Dict[str, any], kg_to_qg_mappings: Dict[str, Dict[str, Set[str]]]):
+        # Same as _get_kg_to_qg_mappings_from_results(), but works on a single raw (dict) result
+        for qnode_key, node_bindings in result.get("node_bindings", dict()).items():
+            for node_binding in node_bindings:
+                kg_to_qg_mappings["nodes"].setdefault(node_binding["id"], set()).add(qnode_key)
+        for qedge_key, edge_bindings in result.get("edge_bindings", dict()).items():
+            for edge_binding in edge_bindings:
+                kg_to_qg_mappings["edges"].setdefault(edge_binding["id"], set()).add(qedge_key)
+
+    def _add_returned_edge(self, answer_kg: QGOrganizedKnowledgeGraph, returned_edge_key: str,
+                           returned_edge: Union[Edge, KGEdge],
+                           kg_to_qg_mappings: Dict[str, Dict[str, Set[str]]]) -> bool:
+        arax_edge_key = self._get_arax_edge_key(returned_edge)  # Convert to an ID that's unique for us
+        if not returned_edge.attributes:
+            returned_edge.attributes = []
+        # Put in a placeholder for missing required attribute fields to try to keep our answer TRAPI-compliant
+        for attribute in returned_edge.attributes:
+            if not attribute.attribute_type_id:
+                attribute.attribute_type_id = f"not provided (this attribute came from {self.kp_name})"
+
+        # Check if KPs are properly indicating that these edges came from them (indicate it ourselves if not)
+        attribute_has_kp_name = lambda value, kp_name: (type(value) is list and kp_name in value) or (value == kp_name)
+        if not any(attribute_has_kp_name(attribute.value, self.kp_name) for attribute in returned_edge.attributes):
+            returned_edge.attributes.append(eu.get_kp_source_attribute(self.kp_name))
+        # Add an attribute to indicate that this edge passed through ARAX
+        returned_edge.attributes.append(eu.get_arax_source_attribute())
+
+        if returned_edge_key in kg_to_qg_mappings['edges']:
+            for qedge_key in kg_to_qg_mappings['edges'][returned_edge_key]:
+                answer_kg.add_edge(arax_edge_key, returned_edge, qedge_key)
+            return True
+        else:
+            return False
+
+    def _add_returned_node(self, answer_kg: QGOrganizedKnowledgeGraph, returned_node_key: str,
+                           returned_node: Union[Node, KGNode],
+                           kg_to_qg_mappings: Dict[str, Dict[str, Set[str]]]) -> bool:
+        if returned_node.attributes:
+            for attribute in returned_node.attributes:
+                if not attribute.attribute_type_id:
+                    attribute.attribute_type_id = f"not provided (this attribute came from {self.kp_name})"
+        if returned_node_key in kg_to_qg_mappings['nodes']:
+            for qnode_key in kg_to_qg_mappings['nodes'][returned_node_key]:
+                answer_kg.add_node(returned_node_key, returned_node, qnode_key)
+            return True
+        else:
+            return False
+
+    def _warn_about_missing_qg_bindings(self, edge_keys_missing_bindings: Set[str], node_keys_missing_bindings: Set[str]):
+        if edge_keys_missing_bindings:
+            self.log.warning(f"{self.kp_name}: {len(edge_keys_missing_bindings)} edges in the KP's answer "
+                             f"KG have no bindings to the QG: {edge_keys_missing_bindings}")
+        if node_keys_missing_bindings:
+            self.log.warning(f"{self.kp_name}: {len(node_keys_missing_bindings)} nodes in the KP's answer "
+                             f"KG have no bindings to the QG: {node_keys_missing_bindings}")
+
     @staticmethod
     def _strip_empty_properties(qnode_or_qedge: Union[QNode, QEdge]) -> Dict[str, any]:
         dict_version_of_object = qnode_or_qedge.to_dict()
@@ -351,7 +438,7 @@ class TRAPIQuerier:
                          if dict_version_of_object.get(property_name) not in [None, []]}
         return stripped_dict
 
-    def _get_arax_edge_key(self, edge: Edge) -> str:
+    def _get_arax_edge_key(self, edge: Union[Edge, KGEdge]) -> str:
         return f"{self.kp_name}:{edge.subject}-{edge.predicate}-{edge.object}"
 
     def _get_query_timeout_length(self) -> int:
@@ -9,7 +9,6 @@ import argparse
 import sqlite3
 import logging
 import pandas as pd
-import numpy as np
 import tqdm
 
 # import internal modules
@@ -22,6 +21,8 @@ from ARAX_database_manager import ARAXDatabaseManager
 
 
 DEBUG = True
+PREDICTION_SCORE_RANKED_TABLE = "PREDICTION_SCORE_RANKED_TABLE"
+PATH_RESULT_RANKED_TABLE = "PATH_RESULT_RANKED_TABLE"
 
 def get_logger(logname):
     """
@@ -38,6 +39,14 @@ def get_logger(logname):
 
     return logger
 
+def _get_disease_id_list(disease_ids):
+    if isinstance(disease_ids, str):
+        return [disease_ids]
+    elif isinstance(disease_ids, list):
+        return sorted(set(disease_ids))
+    else:
+        return None
+
 class ExplainableDTD(object):
 
     # Constructor
@@ -228,68 +237,102 @@ class ExplainableDTD(object):
 
             self.logger.info(f"INFO: Creating INDEXes is completed")
 
-    def get_top_drugs_for_disease(self, disease_ids):
+    def create_ranked_tables(self):
+        """
+        Creates copies of the score and path tables that are pre-ranked within each disease (drugs by tp_score, and each
+        drug's paths by path_score) and clustered by disease and rank, so that the top N drugs and top M paths for a
+        disease can be read straight off the primary key instead of sorting every prediction for that disease.
+        """
+
+        if self.success_con is True:
+            self.logger.info(f"Creating {PREDICTION_SCORE_RANKED_TABLE}")
+            self.connection.execute(f"DROP TABLE IF EXISTS {PREDICTION_SCORE_RANKED_TABLE}")
+            self.connection.execute(f"CREATE TABLE {PREDICTION_SCORE_RANKED_TABLE}( disease_id VARCHAR(255), drug_rank INTEGER, drug_id VARCHAR(255), drug_name VARCHAR(255), disease_name VARCHAR(255), tn_score FLOAT, tp_score FLOAT, unknown_score FLOAT, PRIMARY KEY (disease_id, drug_rank) ) WITHOUT ROWID")
+            self.connection.execute(f"INSERT INTO {PREDICTION_SCORE_RANKED_TABLE} SELECT disease_id, ROW_NUMBER() OVER (PARTITION BY disease_id ORDER BY tp_score DESC, drug_id), drug_id, drug_name, disease_name, tn_score, tp_score, unknown_score FROM PREDICTION_SCORE_TABLE")
+            self.connection.commit()
+
+            # Paths carry the rank of their drug, so the top paths of the top drugs are one contiguous range per disease
+            self.logger.info(f"Creating {PATH_RESULT_RANKED_TABLE}")
+            self.connection.execute(f"DROP TABLE IF EXISTS {PATH_RESULT_RANKED_TABLE}")
+            self.connection.execute(f"CREATE TABLE {PATH_RESULT_RANKED_TABLE}( disease_id VARCHAR(255), drug_rank INTEGER, path_rank INTEGER, drug_id VARCHAR(255), drug_name VARCHAR(255), disease_name VARCHAR(255), path VARCHAR(255), path_score FLOAT, PRIMARY KEY (disease_id, drug_rank, path_rank) ) WITHOUT ROWID")
+            self.connection.execute(f"INSERT INTO {PATH_RESULT_RANKED_TABLE} SELECT p.disease_id, d.drug_rank, ROW_NUMBER() OVER (PARTITION BY p.disease_id, p.drug_id ORDER BY p.path_score DESC, p.path), p.drug_id, p.drug_name, p.disease_name, p.path, p.path_score FROM PATH_RESULT_TABLE AS p JOIN {PREDICTION_SCORE_RANKED_TABLE} AS d ON d.disease_id = p.disease_id AND d.drug_id = p.drug_id")
+            self.connection.commit()
+
+            self.logger.info(f"Creating ranked tables is completed")
+
+    def _has_ranked_tables(self):
+        cursor = self.connection.execute(f"SELECT COUNT(*) FROM sqlite_master WHERE type='table' AND name IN ('{PREDICTION_SCORE_RANKED_TABLE}', '{PATH_RESULT_RANKED_TABLE}')")
+        has_ranked_tables = cursor.fetchone()[0] == 2
+        cursor.close()
+        return has_ranked_tables
+
+    def get_top_drugs_for_disease(self, disease_ids, top_n_drugs=None):
         """get top drugs predicted by DTD model for given disease ids
 
         Args:
             disease_ids (str|list): a string of disease curie id or a list of disease curies, e.g. "MONDO:0008753" or ["MONDO:0008753","MONDO:0005148","MONDO:0005155"]
+            top_n_drugs (int, optional): the number of top drugs to return for each disease (Defaults: all of them).
 
         Returns:
-            top_drugs (pd.DataFrame): the top drugs predicted by DTD model for given disease ids
+            top_drugs (pd.DataFrame): the top drugs predicted by DTD model for given disease ids, ordered by tp_score within each disease
         """
 
-        cursor = self.connection.cursor()
         columns = ["drug_id","drug_name","disease_id","disease_name","tn_score","tp_score","unknown_score"]
-        if isinstance(disease_ids, str):
-            cursor.execute(f"select drug_id,drug_name,disease_id,disease_name,tn_score,tp_score,unknown_score from PREDICTION_SCORE_TABLE where disease_id='{disease_ids}';")
-            res = cursor.fetchall()
-            top_drugs= pd.DataFrame(res, columns=columns)
-            return top_drugs
-        elif isinstance(disease_ids, list):
-            cursor.execute(f"select drug_id,drug_name,disease_id,disease_name,tn_score,tp_score,unknown_score from PREDICTION_SCORE_TABLE where disease_id in {tuple(set(disease_ids))};")
-            res = cursor.fetchall()
-            top_drugs = pd.DataFrame(res, columns=columns)
-            return top_drugs
-        else:
+        disease_ids = _get_disease_id_list(disease_ids)
+        if disease_ids is None:
             print("The 'dataset_id' in get_top_drugs_for_disease should be a string or a list", flush=True)
             top_drugs = pd.DataFrame([], columns=columns)
             return top_drugs
 
-    def get_top_paths_for_disease(self, disease_ids):
+        question_marks = ",".join("?" for _ in disease_ids)
+        max_rank = top_n_drugs if top_n_drugs is not None else -1
+        if self._has_ranked_tables():
+            sql = f"select drug_id,drug_name,disease_id,disease_name,tn_score,tp_score,unknown_score from {PREDICTION_SCORE_RANKED_TABLE} where disease_id in ({question_marks}) and (drug_rank <= ? or ? < 0) order by disease_id, drug_rank;"
+        else:
+            # Databases built before the ranked tables existed have to be ranked on the fly
+            sql = f"select drug_id,drug_name,disease_id,disease_name,tn_score,tp_score,unknown_score from (select *, ROW_NUMBER() OVER (PARTITION BY disease_id ORDER BY tp_score DESC, drug_id) as drug_rank from PREDICTION_SCORE_TABLE where disease_id in ({question_marks})) where (drug_rank <= ? or ? < 0) order by disease_id, drug_rank;"
+        cursor = self.connection.cursor()
+        cursor.execute(sql, disease_ids + [max_rank, max_rank])
+        res = cursor.fetchall()
+        cursor.close()
+        top_drugs = pd.DataFrame(res, columns=columns)
+        return top_drugs
+
+    def get_top_paths_for_disease(self, disease_ids, top_n_drugs=None, top_n_paths=None):
         """get top paths predicted by DTD model for given disease ids
 
         Args:
             disease_ids (str|list): a string of disease curie id or a list of disease curies, e.g. "MONDO:0008753" or ["MONDO:0008753","MONDO:0005148","MONDO:0005155"]
+            top_n_drugs (int, optional): only return paths for this many top drugs for each disease (Defaults: all of them).
+            top_n_paths (int, optional): the number of top paths to return for each drug (Defaults: all of them).
 
         Returns:
-            top_paths (dict): the top paths predicted by DTD model for given disease ids
+            top_paths (dict): the top paths predicted by DTD model for given disease ids, as [path, path_score] lists (ordered by path_score) keyed by (drug_id, disease_id)
         """
 
-        cursor = self.connection.cursor()
-        columns = ["drug_id","drug_name","disease_id","disease_name","path","path_score"]
         top_paths = dict()
-        if isinstance(disease_ids, str):
-            cursor.execute(f"select drug_id,drug_name,disease_id,disease_name,path,path_score from PATH_RESULT_TABLE where disease_id='{disease_ids}';")
-            res = cursor.fetchall()
-            temp_df = pd.DataFrame(res, columns=columns)
-            for drug_id, disease_id in temp_df[['drug_id','disease_id']].drop_duplicates().values:
-                temp = np.array(temp_df.loc[(temp_df['drug_id']==drug_id) & (temp_df['disease_id']==disease_id),['path','path_score']].values).tolist()
-                if len(temp) > 0:
-                    top_paths[(drug_id, disease_id)] = temp
-            return top_paths
-        elif isinstance(disease_ids, list):
-            cursor.execute(f"select drug_id,drug_name,disease_id,disease_name,path,path_score from PATH_RESULT_TABLE where disease_id in {tuple(set(disease_ids))};")
-            res = cursor.fetchall()
-            temp_df = pd.DataFrame(res, columns=columns)
-            for drug_id, disease_id in temp_df[['drug_id','disease_id']].drop_duplicates().values:
-                temp = np.array(temp_df.loc[(temp_df['drug_id']==drug_id) & (temp_df['disease_id']==disease_id),['path','path_score']].values).tolist()
-                if len(temp) > 0:
-                    top_paths[(drug_id, disease_id)] = temp
-            return top_paths
-        else:
+        disease_ids = _get_disease_id_list(disease_ids)
+        if disease_ids is None:
             print("The 'dataset_id' in get_top_drugs_for_disease should be a string or a list", flush=True)
             return top_paths
 
+        question_marks = ",".join("?" for _ in disease_ids)
+        max_drug_rank = top_n_drugs if top_n_drugs is not None else -1
+        max_path_rank = top_n_paths if top_n_paths is not None else -1
+        if self._has_ranked_tables():
+            sql = f"select drug_id,disease_id,path,path_score from {PATH_RESULT_RANKED_TABLE} where disease_id in ({question_marks}) and (drug_rank <= ? or ? < 0) and (path_rank <= ? or ? < 0) order by disease_id, drug_rank, path_rank;"
+        else:
+            # Databases built before the ranked tables existed have to be ranked on the fly
+            sql = f"select p.drug_id,p.disease_id,p.path,p.path_score from (select *, ROW_NUMBER() OVER (PARTITION BY disease_id ORDER BY tp_score DESC, drug_id) as drug_rank from PREDICTION_SCORE_TABLE where disease_id in ({question_marks})) as d join (select *, ROW_NUMBER() OVER (PARTITION BY disease_id, drug_id ORDER BY path_score DESC, path) as path_rank from PATH_RESULT_TABLE where disease_id in ({question_marks})) as p on p.disease_id = d.disease_id and p.drug_id = d.drug_id where (d.drug_rank <= ? or ? < 0) and (p.path_rank <= ? or ? < 0) order by p.disease_id, d.drug_rank, p.path_rank;"
+            disease_ids = disease_ids + disease_ids
+        cursor = self.connection.cursor()
+        cursor.execute(sql, disease_ids + [max_drug_rank, max_drug_rank, max_path_rank, max_path_rank])
+        # Rows come back grouped by drug, so the paths can be collected in a single pass
+        for drug_id, disease_id, path, path_score in cursor:
+            top_paths.setdefault((drug_id, disease_id), []).append([path, path_score])
+        cursor.close()
+        return top_paths
+
 ####################################################################################################
 
 def main():
@@ -314,6 +357,7 @@ def main():
         EDTDdb.create_tables()
         EDTDdb.populate_table()
         EDTDdb.create_indexes()
+        EDTDdb.create_ranked_tables()
 
     # Exit here if tests are not requested
     if not args.test:
@@ -321,10 +365,12 @@ def main():
 
     print("==== Testing for search for top drugs by disease id ====", flush=True)
     print(EDTDdb.get_top_drugs_for_disease('MONDO:0008753'))
+    print(EDTDdb.get_top_drugs_for_disease('MONDO:0008753', top_n_drugs=10))
     # print(EDTDdb.get_top_drugs_for_disease(["MONDO:0008753","MONDO:0005148","MONDO:0005155"]))
 
     print("==== Testing for search for top paths by disease id ====", flush=True)
     print(EDTDdb.get_top_paths_for_disease('MONDO:0008753'))
+    print(EDTDdb.get_top_paths_for_disease('MONDO:0008753', top_n_drugs=10, top_n_paths=5))
     # print(EDTDdb.get_top_paths_for_disease(["MONDO:0008753","MONDO:0005148","MONDO:0005155"]))
 
 ####################################################################################################
@@ -11,7 +11,6 @@ import pandas as pd
 import math
 from ARAX_response import ARAXResponse
 from ARAX_messenger import ARAXMessenger
-from ARAX_expander import ARAXExpander
 from ARAX_resultify import ARAXResultify
 from ARAX_decorator import ARAXDecorator
 from biolink_helper import BiolinkHelper
@@ -98,7 +97,6 @@ class InferUtilities:
                 self.response.error("qedge_id is None but QG is not empty")
                 raise Exception("qedge_id is None but QG is not empty")
 
-        expander = ARAXExpander()
         messenger = ARAXMessenger()
         synonymizer = NodeSynonymizer()
         decorator = ARAXDecorator()
@@ -111,6 +109,7 @@ class InferUtilities:
         node_names = set([y for paths in top_paths.values() for x in paths for y in x[0].split("->")[::2] if y != ''])
         node_info = synonymizer.get_canonical_curies(names=list(node_names))
         node_name_to_id = {k: v['preferred_curie'] for k, v in node_info.items() if v is not None}
+        drug_id_to_score = dict(zip(top_drugs['drug_id'], top_drugs['tp_score']))
         # If there are no paths, then just quit
         # FIXME: A more intelligent thing to do would be to then fall back on the traditional DTD database
         #if not top_paths.values():
@@ -196,7 +195,6 @@ class InferUtilities:
             node_ids = set(top_drugs['drug_id'])
             node_info = synonymizer.get_canonical_curies(curies=list(node_ids))
             node_id_to_canonical_id = {k: v['preferred_curie'] for k, v in node_info.items() if v is not None}
-            node_id_to_score = dict(zip(node_ids, top_drugs['tp_score']))
             # Add the drugs to the knowledge graph
             for node_id in node_ids:
                 drug_canonical_id = node_id_to_canonical_id[node_id]
@@ -204,7 +202,7 @@ class InferUtilities:
                 drug_categories.append('biolink:NamedThing')
                 # add the node to the knowledge graph
                 drug_name = node_info[node_id]['preferred_name']
-                essence_scores[drug_name] = node_id_to_score[node_id]
+                essence_scores[drug_name] = drug_id_to_score[node_id]
                 if drug_canonical_id not in knodes:
                     knodes[drug_canonical_id] = Node(name=drug_name, categories=drug_categories)
                     knodes[drug_canonical_id].qnode_keys = [drug_qnode_key]
@@ -212,7 +210,7 @@ class InferUtilities:
                     pass
                 # add the edge to the knowledge graph
                 if drug_canonical_id not in kedges:
-                    treat_score = node_id_to_score[node_id]
+                    treat_score = drug_id_to_score[node_id]
                     edge_attribute_list = [
                         EdgeAttribute(original_attribute_name="provided_by", value="infores:arax",
                                       attribute_type_id="biolink:aggregator_knowledge_source",
@@ -268,7 +266,12 @@ class InferUtilities:
                 self.option_global_iter += 1
 
         # FW: code that will add resulting paths to the query graph and knowledge graph goes here
-        essence_scores = {}
+        # The same nodes and edges show up in many paths, so first collect the distinct nodes/edges (and which qnodes/qedges
+        # they fulfill) across all paths, and then add each one to the knowledge graph just once
+        path_node_qnode_keys = dict()  # node curie -> qnode keys
+        path_node_names = dict()  # node curie -> node name
+        path_edge_qedge_keys = dict()  # (subject curie, predicate, object curie) -> qedge keys
+        treated_drugs = []
         for (drug, disease), paths in top_paths.items():
             path_added = False
             # Splits the paths which are encodes as strings into a list of nodes names and edge predicates
@@ -282,61 +285,66 @@ class InferUtilities:
                 # Creates edge tuples of the form (node name 1, edge predicate, node name 2)
                 edge_tuples = [(path[i],path[i+1],path[i+2]) for i in range(0,n_elements-2,2)]
                 path_idx = len(edge_tuples)-1
-                added_nodes = set()
                 for i in range(path_idx+1):
-                    subject_qnode_key = path_keys[path_idx]["qnode_pairs"][i][0]
-                    subject_name = edge_tuples[i][0]
-                    subject_curie = node_name_to_id[subject_name]
-                    subject_category = node_info[subject_name]['preferred_category']
-                    if subject_curie not in knodes:
-                        knodes[subject_curie] = Node(name=subject_name, categories=[subject_category, 'biolink:NamedThing'])
-                        knodes[subject_curie].qnode_keys = [subject_qnode_key]
-                    elif subject_qnode_key not in knodes[subject_curie].qnode_keys:
-                        knodes[subject_curie].qnode_keys.append(subject_qnode_key)
-                    object_qnode_key = path_keys[path_idx]["qnode_pairs"][i][1]
-                    object_name = edge_tuples[i][2]
-                    object_curie = node_name_to_id[object_name]
-                    object_category = node_info[object_name]['preferred_category']
-                    if object_curie not in knodes:
-                        knodes[object_curie] = Node(name=object_name, categories=[object_category, 'biolink:NamedThing'])
-                        knodes[object_curie].qnode_keys = [object_qnode_key]
-                    elif object_qnode_key not in knodes[object_curie].qnode_keys:
-                        knodes[object_curie].qnode_keys.append(object_qnode_key)
-                    predicate = edge_tuples[i][1]
-                    # Handle the self-loop relation
-                    if predicate == "SELF_LOOP_RELATION":
-                        self.response.warning(f"Self-loop relation detected: {subject_name} {predicate} {object_name}, replacing with placeholder 'biolink:self_loop_relation'")
-                        predicate = "biolink:self_loop_relation"
-                    new_edge = Edge(subject=subject_curie, object=object_curie, predicate=predicate, attributes=[])
-                    new_edge.attributes.append(EdgeAttribute(attribute_type_id="biolink:aggregator_knowledge_source",
-                                         value=kp,
-                                         value_type_id="biolink:InformationResource",
-                                         attribute_source=kp))
-                    new_edge_key = self.__get_formated_edge_key(edge=new_edge, kp=kp)
-                    kedges[new_edge_key] = new_edge
-                    kedges[new_edge_key].qedge_keys = [path_keys[path_idx]["qedge_keys"][i]]
+                    subject_name, predicate, object_name = edge_tuples[i]
+                    subject_qnode_key, object_qnode_key = path_keys[path_idx]["qnode_pairs"][i]
+                    for node_name, qnode_key in [(subject_name, subject_qnode_key), (object_name, object_qnode_key)]:
+                        node_curie = node_name_to_id[node_name]
+                        path_node_names.setdefault(node_curie, node_name)
+                        node_qnode_keys = path_node_qnode_keys.setdefault(node_curie, [])
+                        if qnode_key not in node_qnode_keys:
+                            node_qnode_keys.append(qnode_key)
+                    edge_qedge_keys = path_edge_qedge_keys.setdefault((node_name_to_id[subject_name], predicate, node_name_to_id[object_name]), [])
+                    qedge_key = path_keys[path_idx]["qedge_keys"][i]
+                    if qedge_key not in edge_qedge_keys:
+                        edge_qedge_keys.append(qedge_key)
                 path_added = True
             if path_added:
-                treat_score = top_drugs.loc[top_drugs['drug_id'] == drug]["tp_score"].iloc[0]
-                essence_scores[drug_name] = treat_score
-                edge_attribute_list = [
-                    # EdgeAttribute(original_attribute_name="defined_datetime", value=defined_datetime, attribute_type_id="metatype:Datetime"),
-                    EdgeAttribute(original_attribute_name="provided_by", value="infores:arax", attribute_type_id="biolink:aggregator_knowledge_source", attribute_source="infores:arax", value_type_id="biolink:InformationResource"),
-                    EdgeAttribute(original_attribute_name=None, value=True, attribute_type_id="biolink:computed_value", attribute_source="infores:arax-reasoner-ara", value_type_id="metatype:Boolean", value_url=None, description="This edge is a container for a computed value between two nodes that is not directly attachable to other edges."),
-                    EdgeAttribute(attribute_type_id="EDAM:data_0951", original_attribute_name="probability_treats", value=str(treat_score))
-                ]
-                #edge_predicate = qedge_id
-                edge_predicate = "biolink:probably_treats"
-                if hasattr(qedges[qedge_id], 'predicates') and qedges[qedge_id].predicates:
-                    edge_predicate = qedges[qedge_id].predicates[0]  # FIXME: better way to handle multiple predicates?
-                fixed_edge = Edge(predicate=edge_predicate, subject=node_name_to_id[drug_name], object=node_name_to_id[disease_name],
-                                attributes=edge_attribute_list)
-                #fixed_edge.qedge_keys = ["probably_treats"]
-                fixed_edge.qedge_keys = [qedge_id]
-                kedges[f"creative_DTD_prediction_{self.kedge_global_iter}"] = fixed_edge
-                self.kedge_global_iter += 1
+                treated_drugs.append((drug, drug_name))
             else:
                 self.response.warning(f"Something went wrong when adding the subgraph for the drug-disease pair ({drug},{disease}) to the knowledge graph. Skipping this result....")
+
+        for node_curie, node_qnode_keys in path_node_qnode_keys.items():
+            if node_curie not in knodes:
+                node_name = path_node_names[node_curie]
+                knodes[node_curie] = Node(name=node_name, categories=[node_info[node_name]['preferred_category'], 'biolink:NamedThing'])
+                knodes[node_curie].qnode_keys = node_qnode_keys
+            else:
+                knodes[node_curie].qnode_keys += [qnode_key for qnode_key in node_qnode_keys if qnode_key not in knodes[node_curie].qnode_keys]
+        for (subject_curie, predicate, object_curie), edge_qedge_keys in path_edge_qedge_keys.items():
+            # Handle the self-loop relation
+            if predicate == "SELF_LOOP_RELATION":
+                self.response.warning(f"Self-loop relation detected: {path_node_names[subject_curie]} {predicate} {path_node_names[object_curie]}, replacing with placeholder 'biolink:self_loop_relation'")
+                predicate = "biolink:self_loop_relation"
+            new_edge = Edge(subject=subject_curie, object=object_curie, predicate=predicate, attributes=[])
+            new_edge.attributes.append(EdgeAttribute(attribute_type_id="biolink:aggregator_knowledge_source",
+                                 value=kp,
+                                 value_type_id="biolink:InformationResource",
+                                 attribute_source=kp))
+            new_edge_key = self.__get_formated_edge_key(edge=new_edge, kp=kp)
+            kedges[new_edge_key] = new_edge
+            kedges[new_edge_key].qedge_keys = edge_qedge_keys
+
+        essence_scores = {}
+        for drug, drug_name in treated_drugs:
+            treat_score = drug_id_to_score[drug]
+            essence_scores[drug_name] = treat_score
+            edge_attribute_list = [
+                # EdgeAttribute(original_attribute_name="defined_datetime", value=defined_datetime, attribute_type_id="metatype:Datetime"),
+                EdgeAttribute(original_attribute_name="provided_by", value="infores:arax", attribute_type_id="biolink:aggregator_knowledge_source", attribute_source="infores:arax", value_type_id="biolink:InformationResource"),
+                EdgeAttribute(original_attribute_name=None, value=True, attribute_type_id="biolink:computed_value", attribute_source="infores:arax-reasoner-ara", value_type_id="metatype:Boolean", value_url=None, description="This edge is a container for a computed value between two nodes that is not directly attachable to other edges."),
+                EdgeAttribute(attribute_type_id="EDAM:data_0951", original_attribute_name="probability_treats", value=str(treat_score))
+            ]
+            #edge_predicate = qedge_id
+            edge_predicate = "biolink:probably_treats"
+            if hasattr(qedges[qedge_id], 'predicates') and qedges[qedge_id].predicates:
+                edge_predicate = qedges[qedge_id].predicates[0]  # FIXME: better way to handle multiple predicates?
+            fixed_edge = Edge(predicate=edge_predicate, subject=node_name_to_id[drug_name], object=node_name_to_id[disease_name],
+                            attributes=edge_attribute_list)
+            #fixed_edge.qedge_keys = ["probably_treats"]
+            fixed_edge.qedge_keys = [qedge_id]
+            kedges[f"creative_DTD_prediction_{self.kedge_global_iter}"] = fixed_edge
+            self.kedge_global_iter += 1
         self.response = decorator.decorate_nodes(self.response)
         if self.response.status != 'OK':
             return self.response
@@ -61,5 +61,6 @@ print(f"INFO: Populating tables is completed", flush=True)
 print(f"INFO: Creating INDEXes on DTD_PROBABILITY", flush=True)
 connection.execute(f"CREATE INDEX idx_DTD_PROBABILITY_disease ON DTD_PROBABILITY(disease)")
 connection.execute(f"CREATE INDEX idx_DTD_PROBABILITY_drug ON DTD_PROBABILITY(drug)")
+connection.execute(f"CREATE INDEX idx_DTD_PROBABILITY_disease_drug ON DTD_PROBABILITY(disease, drug)")
 
 print(f"INFO: Creating INDEXes is completed", flush=True)
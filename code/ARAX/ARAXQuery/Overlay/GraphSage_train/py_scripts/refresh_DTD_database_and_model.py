@@ -78,6 +78,7 @@ def main():
         print(f"INFO: Creating INDEXes on DTD_PROBABILITY", flush=True)
         con.execute(f"CREATE INDEX idx_DTD_PROBABILITY_disease ON DTD_PROBABILITY(disease)")
         con.execute(f"CREATE INDEX idx_DTD_PROBABILITY_drug ON DTD_PROBABILITY(drug)")
+        con.execute(f"CREATE INDEX idx_DTD_PROBABILITY_disease_drug ON DTD_PROBABILITY(disease, drug)")
         con.commit()
         con.close()
         print(f"INFO: Creating INDEXes is completed", flush=True)
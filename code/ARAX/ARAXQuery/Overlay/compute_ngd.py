@@ -1,6 +1,5 @@
 # This class will overlay the normalized google distance on a message (all edges)
 #!/bin/env python3
-import functools
 import json
 import math
 import subprocess
@@ -10,8 +9,8 @@ import sqlite3
 import traceback
 import numpy as np
 from datetime import datetime
-from typing import List
-import itertools
+from collections import defaultdict
+from typing import Dict, List, Set, Tuple
 import copy
 
 import random
@@ -27,6 +26,9 @@ from openapi_server.models.edge import Edge
 from openapi_server.models.q_edge import QEdge
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../NodeSynonymizer/")
 from node_synonymizer import NodeSynonymizer
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/ngd/")
+from curie_to_pmids_store import get_curie_to_pmids_store, get_curie_to_pmids_store_path
+from ngd_pair_cache import get_ngd_pair_cache
 
 pathlist = os.path.realpath(__file__).split(os.path.sep)
 RTXindex = pathlist.index("RTX")
@@ -48,7 +50,9 @@ class ComputeNGD:
         self.global_iter = 0
         self.ngd_database_name = RTXConfig.curie_to_pmids_path.split('/')[-1]
         self.connection, self.cursor = self._setup_ngd_database()
-        self.curie_to_pmids_map = dict()
+        self.curie_to_pmids_store = self._get_curie_to_pmids_store()
+        self.ngd_pair_cache = get_ngd_pair_cache(self.ngd_database_path)
+        self.curie_to_pmids_map = dict()  # Maps curies to sorted arrays of their PMIDs
         self.ngd_normalizer = 2.2e+7 * 20  # From PubMed home page there are 27 million articles; avg 20 MeSH terms per article
         self.first_ngd_log = True
 
@@ -98,18 +102,18 @@ class ComputeNGD:
                     # FW: Now add the edge for this qnode pair
                     # FW NOTE: If we decide to keep these changes we should really pull this out into a method as everything after this was copy pasted from below in the 'virtual_relation_label' in parameters section
                     node_pairs_to_evaluate = ou.get_node_pairs_to_overlay(subject_qnode_key, object_qnode_key, qg, kg, self.response)
-                    # Grab PMID lists for all involved nodes
+                    # Canonicalize all involved nodes (their PMID lists are grabbed as needed when NGD is calculated)
                     involved_curies = {curie for node_pair in node_pairs_to_evaluate for curie in node_pair}
                     canonicalized_curie_lookup = self._get_canonical_curies_map(list(involved_curies))
-                    self.load_curie_to_pmids_data(canonicalized_curie_lookup.values())
                     added_flag = False  # check to see if any edges where added
+                    overlay_edges = []  # (subject, object, edge key) of each virtual edge added, to bind into the results
                     self.response.debug(f"Looping through {len(node_pairs_to_evaluate)} node pairs and calculating NGD values")
                     # iterate over all pairs of these nodes, add the virtual edge, decorate with the correct attribute
-                    for (subject_curie, object_curie) in node_pairs_to_evaluate:
+                    ngd_results = self.calculate_ngd_batch([(canonicalized_curie_lookup.get(subject_curie, subject_curie),
+                                                              canonicalized_curie_lookup.get(object_curie, object_curie))
+                                                             for subject_curie, object_curie in node_pairs_to_evaluate])
+                    for (subject_curie, object_curie), (ngd_value, pmid_set) in zip(node_pairs_to_evaluate, ngd_results):
                         # create the edge attribute if it can be
-                        canonical_subject_curie = canonicalized_curie_lookup.get(subject_curie, subject_curie)
-                        canonical_object_curie = canonicalized_curie_lookup.get(object_curie, object_curie)
-                        ngd_value, pmid_set = self.calculate_ngd_fast(canonical_subject_curie, canonical_object_curie)
                         if np.isfinite(ngd_value):  # if ngd is finite, that's ok, otherwise, stay with default
                             edge_value = ngd_value
                         else:
@@ -169,9 +173,11 @@ class ComputeNGD:
                             edge.qedge_keys = qedge_keys
                             self.message.knowledge_graph.edges[id] = edge
 
-                            #FW: check if results exist then modify them with the ngd edge
-                            if self.message.results is not None and len(self.message.results) > 0:
-                                ou.update_results_with_overlay_edge(subject_knode_key=subject_key, object_knode_key=object_key, kedge_key=id, message=self.message, log=self.response)
+                            overlay_edges.append((subject_key, object_key, id))
+
+                    # If there are results, bind the new virtual edges into them
+                    if self.message.results is not None and len(self.message.results) > 0:
+                        ou.update_results_with_overlay_edges(overlay_edges, message=self.message, log=self.response)
 
                     # Now add a q_edge the query_graph since I've added an extra edge to the KG
                     if added_flag:
@@ -202,18 +208,18 @@ class ComputeNGD:
             subject_qnode_key = parameters['subject_qnode_key']
             object_qnode_key = parameters['object_qnode_key']
             node_pairs_to_evaluate = ou.get_node_pairs_to_overlay(subject_qnode_key, object_qnode_key, qg, kg, self.response)
-            # Grab PMID lists for all involved nodes
+            # Canonicalize all involved nodes (their PMID lists are grabbed as needed when NGD is calculated)
             involved_curies = {curie for node_pair in node_pairs_to_evaluate for curie in node_pair}
             canonicalized_curie_lookup = self._get_canonical_curies_map(list(involved_curies))
-            self.load_curie_to_pmids_data(canonicalized_curie_lookup.values())
             added_flag = False  # check to see if any edges where added
+            overlay_edges = []  # (subject, object, edge key) of each virtual edge added, to bind into the results
             self.response.debug(f"Looping through {len(node_pairs_to_evaluate)} node pairs and calculating NGD values")
             # iterate over all pairs of these nodes, add the virtual edge, decorate with the correct attribute
-            for (subject_curie, object_curie) in node_pairs_to_evaluate:
+            ngd_results = self.calculate_ngd_batch([(canonicalized_curie_lookup.get(subject_curie, subject_curie),
+                                                      canonicalized_curie_lookup.get(object_curie, object_curie))
+                                                     for subject_curie, object_curie in node_pairs_to_evaluate])
+            for (subject_curie, object_curie), (ngd_value, pmid_set) in zip(node_pairs_to_evaluate, ngd_results):
                 # create the edge attribute if it can be
-                canonical_subject_curie = canonicalized_curie_lookup.get(subject_curie, subject_curie)
-                canonical_object_curie = canonicalized_curie_lookup.get(object_curie, object_curie)
-                ngd_value, pmid_set = self.calculate_ngd_fast(canonical_subject_curie, canonical_object_curie)
                 if np.isfinite(ngd_value):  # if ngd is finite, that's ok, otherwise, stay with default
                     edge_value = ngd_value
                 else:
@@ -273,9 +279,11 @@ class ComputeNGD:
                     edge.qedge_keys = qedge_keys
                     self.message.knowledge_graph.edges[id] = edge
 
-                    #FW: check if results exist then modify them with the ngd edge
-                    if self.message.results is not None and len(self.message.results) > 0:
-                        ou.update_results_with_overlay_edge(subject_knode_key=subject_key, object_knode_key=object_key, kedge_key=id, message=self.message, log=self.response)
+                    overlay_edges.append((subject_key, object_key, id))
+
+            # If there are results, bind the new virtual edges into them
+            if self.message.results is not None and len(self.message.results) > 0:
+                ou.update_results_with_overlay_edges(overlay_edges, message=self.message, log=self.response)
 
             # Now add a q_edge the query_graph since I've added an extra edge to the KG
             if added_flag:
@@ -305,18 +313,15 @@ class ComputeNGD:
             try:
                 # Map all nodes to their canonicalized curies in one batch (need canonical IDs for the local NGD system)
                 canonicalized_curie_map = self._get_canonical_curies_map([key for key in self.message.knowledge_graph.nodes.keys()])
-                self.load_curie_to_pmids_data(canonicalized_curie_map.values())
                 self.response.debug(f"Looping through edges and calculating NGD values")
-                for edge in self.message.knowledge_graph.edges.values():
+                edges = list(self.message.knowledge_graph.edges.values())
+                ngd_results = self.calculate_ngd_batch([(canonicalized_curie_map.get(edge.subject, edge.subject),
+                                                         canonicalized_curie_map.get(edge.object, edge.object))
+                                                        for edge in edges])
+                for edge, (ngd_value, pmid_set) in zip(edges, ngd_results):
                     # Make sure the attributes are not None
                     if not edge.attributes:
                         edge.attributes = []  # should be an array, but why not a list?
-                    # now go and actually get the NGD
-                    subject_curie = edge.subject
-                    object_curie = edge.object
-                    canonical_subject_curie = canonicalized_curie_map.get(subject_curie, subject_curie)
-                    canonical_object_curie = canonicalized_curie_map.get(object_curie, object_curie)
-                    ngd_value, pmid_set = self.calculate_ngd_fast(canonical_subject_curie, canonical_object_curie)
                     if np.isfinite(ngd_value):  # if ngd is finite, that's ok, otherwise, stay with default
                         edge_value = ngd_value
                     else:
@@ -336,65 +341,120 @@ class ComputeNGD:
         return self.response
 
     def load_curie_to_pmids_data(self, canonicalized_curies):
-        self.response.debug(f"Extracting PMID lists from sqlite database for relevant nodes")
-        curies = list(set(canonicalized_curies))
-        chunk_size = 20000
-        num_chunks = len(curies) // chunk_size if len(curies) % chunk_size == 0 else (len(curies) // chunk_size) + 1
-        start_index = 0
-        stop_index = chunk_size
-        for num in range(num_chunks):
-            chunk = curies[start_index:stop_index] if stop_index <= len(curies) else curies[start_index:]
-            curie_list_str = ", ".join([f"'{curie}'" for curie in chunk if "'" not in curie])
-            self.cursor.execute(f"SELECT * FROM curie_to_pmids WHERE curie in ({curie_list_str})")
-            rows = self.cursor.fetchall()
-            for row in rows:
-                self.curie_to_pmids_map[row[0]] = json.loads(row[1])  # PMID list is stored as JSON string in sqlite db
-            start_index += chunk_size
-            stop_index += chunk_size
+        self.response.debug(f"Extracting PMID lists for relevant nodes")
+        curies = [curie for curie in set(canonicalized_curies) if curie not in self.curie_to_pmids_map]
+        if self.curie_to_pmids_store:
+            self.curie_to_pmids_map.update(self.curie_to_pmids_store.get_many(curies))
+        elif self.cursor:
+            self.response.debug(f"No current curie->PMIDs store is available; will use the sqlite database instead")
+            chunk_size = 20000
+            for start_index in range(0, len(curies), chunk_size):
+                chunk = curies[start_index:start_index + chunk_size]
+                self.cursor.execute("SELECT curie, pmids FROM curie_to_pmids WHERE curie IN (SELECT value FROM json_each(?))",
+                                    (json.dumps(chunk),))
+                for curie, pmids_json in self.cursor.fetchall():
+                    # PMID list is stored as JSON string in sqlite db; we keep PMIDs as sorted arrays (like the store does)
+                    self.curie_to_pmids_map[curie] = np.unique(np.array(json.loads(pmids_json), dtype=np.int64))
 
     def calculate_ngd_fast(self, subject_curie, object_curie):
-        if subject_curie in self.curie_to_pmids_map and object_curie in self.curie_to_pmids_map:
-            pubmed_ids_for_curies = [self.curie_to_pmids_map.get(subject_curie),
-                                     self.curie_to_pmids_map.get(object_curie)]
-            pubmed_id_set = set(self.curie_to_pmids_map.get(subject_curie)).intersection(set(self.curie_to_pmids_map.get(object_curie)))
-            n_pmids = len(pubmed_id_set)
-            if n_pmids > 30:
-                if self.first_ngd_log:
-                    #self.response.debug(f"{n_pmids} publications found for edge ({subject_curie})-[]-({object_curie}) limiting to 30...")
-                    self.response.debug(f"More than 30 publications found for some edges limiting to 30...")
-                    self.first_ngd_log = False
-                limited_pmids = set()
-                for i, val in enumerate(itertools.islice(pubmed_id_set, 30)):
-                    limited_pmids.add(val)
-                pubmed_id_set = limited_pmids
-            counts_res = self._compute_marginal_and_joint_counts(pubmed_ids_for_curies)
-            return self._compute_multiway_ngd_from_counts(*counts_res), pubmed_id_set
-        else:
-            return math.nan, {}
-
-    @staticmethod
-    def _compute_marginal_and_joint_counts(concept_pubmed_ids: List[List[int]]) -> list:
-        return [list(map(lambda pmid_list: len(set(pmid_list)), concept_pubmed_ids)),
-                len(functools.reduce(lambda pmids_intersec_cumul, pmids_next:
-                                     set(pmids_next).intersection(pmids_intersec_cumul),
-                                     concept_pubmed_ids))]
-
-    def _compute_multiway_ngd_from_counts(self, marginal_counts: List[int],
-                                          joint_count: int) -> float:
-        # Make sure that things are within the right domain for the logs
-        # Should also make sure things are not negative, but I'll just do this with a ValueError
-        if None in marginal_counts:
-            return math.nan
-        elif 0 in marginal_counts or 0. in marginal_counts:
-            return math.nan
-        elif joint_count == 0 or joint_count == 0.:
-            return math.nan
-        else:
-            try:
-                return (max([math.log(count) for count in marginal_counts]) - math.log(joint_count)) / \
-                   (math.log(self.ngd_normalizer) - min([math.log(count) for count in marginal_counts]))
-            except ValueError:
-                return math.nan
+        return self.calculate_ngd_batch([(subject_curie, object_curie)])[0]
+
+    def calculate_ngd_batch(self, curie_pairs: List[Tuple[str, str]]) -> List[Tuple[float, Set[int]]]:
+        """
+        Computes NGD for all of the given (canonical) curie pairs at once. Returns the NGD value (NaN if it can't be
+        computed) and a sample of up to 30 shared PMIDs for each pair, in the order given. Values are served from the
+        NGD pair cache where possible; PMID lists are loaded (if they haven't been already) only for the rest.
+        """
+        unique_pairs = list(dict.fromkeys(curie_pairs))
+        ngd_results_by_pair = self.ngd_pair_cache.get_many(unique_pairs)
+        uncached_pairs = [pair for pair in unique_pairs if pair not in ngd_results_by_pair]
+        if ngd_results_by_pair:
+            self.response.debug(f"Found NGD values for {len(ngd_results_by_pair)} of {len(unique_pairs)} node pairs in the NGD cache")
+        self.load_curie_to_pmids_data({curie for pair in uncached_pairs for curie in pair})
+        computable_pairs = [pair for pair in uncached_pairs
+                            if pair[0] in self.curie_to_pmids_map and pair[1] in self.curie_to_pmids_map]
+        joint_counts, shared_pmid_samples = self._compute_joint_counts(computable_pairs)
+        if any(joint_count > 30 for joint_count in joint_counts.tolist()) and self.first_ngd_log:
+            self.response.debug(f"More than 30 publications found for some edges limiting to 30...")
+            self.first_ngd_log = False
+        subject_counts = np.array([len(self.curie_to_pmids_map[subject_curie]) for subject_curie, _ in computable_pairs], dtype=np.int64)
+        object_counts = np.array([len(self.curie_to_pmids_map[object_curie]) for _, object_curie in computable_pairs], dtype=np.int64)
+        ngd_values = self._compute_ngd_from_counts(subject_counts, object_counts, joint_counts)
+        computed_ngd_results = dict(zip(computable_pairs, zip(ngd_values.tolist(), shared_pmid_samples)))
+        self.ngd_pair_cache.put_many(computed_ngd_results)
+        ngd_results_by_pair.update(computed_ngd_results)
+        return [ngd_results_by_pair.get(pair, (math.nan, {})) for pair in curie_pairs]
+
+    def get_marginal_counts(self, canonicalized_curies) -> Dict[str, int]:
+        """
+        Returns the number of PMIDs for each of the given curies (curies without any PMID list are left out). Counts
+        come from the curie->PMIDs store's precomputed counts, so no PMID lists need to be loaded.
+        """
+        curies = set(canonicalized_curies)
+        marginal_counts = {curie: len(self.curie_to_pmids_map[curie]) for curie in curies if curie in self.curie_to_pmids_map}
+        curies_to_look_up = [curie for curie in curies if curie not in marginal_counts]
+        if self.curie_to_pmids_store:
+            marginal_counts.update(self.curie_to_pmids_store.get_counts(curies_to_look_up))
+        elif self.cursor:
+            chunk_size = 20000
+            for start_index in range(0, len(curies_to_look_up), chunk_size):
+                chunk = curies_to_look_up[start_index:start_index + chunk_size]
+                self.cursor.execute("SELECT curie, json_array_length(pmids) FROM curie_to_pmids WHERE curie IN (SELECT value FROM json_each(?))",
+                                    (json.dumps(chunk),))
+                marginal_counts.update(self.cursor.fetchall())
+        return marginal_counts
+
+    def get_pairs_that_could_beat_threshold(self, curie_pairs: List[Tuple[str, str]], threshold: float) -> List[Tuple[str, str]]:
+        """
+        Filters the given (canonical) curie pairs down to those whose NGD could possibly be below the threshold, using
+        only the curies' marginal counts. NGD only goes down as the joint count goes up, and the joint count can't be
+        more than the smaller marginal count, so NGD computed with that joint count is a lower bound.
+        """
+        unique_pairs = list(dict.fromkeys(curie_pairs))
+        marginal_counts = self.get_marginal_counts({curie for pair in unique_pairs for curie in pair})
+        subject_counts = np.array([marginal_counts.get(subject_curie, 0) for subject_curie, _ in unique_pairs], dtype=np.int64)
+        object_counts = np.array([marginal_counts.get(object_curie, 0) for _, object_curie in unique_pairs], dtype=np.int64)
+        ngd_lower_bounds = self._compute_ngd_from_counts(subject_counts, object_counts, np.minimum(subject_counts, object_counts))
+        could_beat_threshold = ngd_lower_bounds < threshold  # (NaN bounds mean NGD can't be computed at all)
+        return [pair for pair, could_beat in zip(unique_pairs, could_beat_threshold.tolist()) if could_beat]
+
+    def _compute_joint_counts(self, curie_pairs: List[Tuple[str, str]]) -> Tuple[np.ndarray, List[Set[int]]]:
+        # Pairs are grouped by their curie with the longer PMID list; the (concatenated) shorter lists of all of that
+        # curie's partners are then looked up in its sorted list in one go
+        pairs_by_anchor_curie = defaultdict(list)
+        for pair_index, (subject_curie, object_curie) in enumerate(curie_pairs):
+            if len(self.curie_to_pmids_map[subject_curie]) >= len(self.curie_to_pmids_map[object_curie]):
+                pairs_by_anchor_curie[subject_curie].append((pair_index, object_curie))
+            else:
+                pairs_by_anchor_curie[object_curie].append((pair_index, subject_curie))
+        joint_counts = np.zeros(len(curie_pairs), dtype=np.int64)
+        shared_pmid_samples = [set() for _ in curie_pairs]
+        for anchor_curie, pairs in pairs_by_anchor_curie.items():
+            anchor_pmids = self.curie_to_pmids_map[anchor_curie]
+            if not len(anchor_pmids):
+                continue
+            partner_pmid_arrays = [self.curie_to_pmids_map[partner_curie] for _, partner_curie in pairs]
+            partner_pmids = np.concatenate(partner_pmid_arrays)
+            partner_labels = np.repeat(np.arange(len(pairs)), [len(pmids) for pmids in partner_pmid_arrays])
+            positions = np.minimum(np.searchsorted(anchor_pmids, partner_pmids), len(anchor_pmids) - 1)
+            is_shared = anchor_pmids[positions] == partner_pmids
+            pair_joint_counts = np.bincount(partner_labels[is_shared], minlength=len(pairs))
+            shared_pmids_by_pair = np.split(partner_pmids[is_shared], np.cumsum(pair_joint_counts)[:-1])
+            for (pair_index, _), joint_count, shared_pmids in zip(pairs, pair_joint_counts.tolist(), shared_pmids_by_pair):
+                joint_counts[pair_index] = joint_count
+                shared_pmid_samples[pair_index] = set(shared_pmids[:30].tolist())
+        return joint_counts, shared_pmid_samples
+
+    def _compute_ngd_from_counts(self, subject_counts: np.ndarray, object_counts: np.ndarray,
+                                 joint_counts: np.ndarray) -> np.ndarray:
+        # NGD is undefined (NaN) if either concept or the pair has no PMIDs. Logs are taken with math.log() (on each
+        # distinct count) so that values are exactly the same as when NGD was computed one pair at a time.
+        all_counts = np.concatenate([subject_counts, object_counts, joint_counts])
+        distinct_counts, inverse = np.unique(all_counts, return_inverse=True)
+        distinct_logs = np.array([math.log(count) if count > 0 else math.nan for count in distinct_counts.tolist()])
+        subject_logs, object_logs, joint_logs = np.split(distinct_logs[inverse], 3)
+        return (np.maximum(subject_logs, object_logs) - joint_logs) / \
+               (math.log(self.ngd_normalizer) - np.minimum(subject_logs, object_logs))
 
     def _get_canonical_curies_map(self, curies):
         self.response.debug(f"Canonicalizing curies of relevant nodes using NodeSynonymizer")
@@ -421,6 +481,7 @@ class ComputeNGD:
         #db_path_remote = f"/data/orangeboard/databases/KG2.3.4/{self.ngd_database_name}"
         ngd_filepath = os.path.sep.join([*pathlist[:(RTXindex + 1)], 'code', 'ARAX', 'KnowledgeSources', 'NormalizedGoogleDistance'])
         db_path_local = f"{ngd_filepath}{os.path.sep}{self.ngd_database_name}"
+        self.ngd_database_path = db_path_local
         db_path_remote = RTXConfig.curie_to_pmids_path
         # FW: Removed in favor of using the DBmanager but just commenting out in case there is some reason to keep this
         # if not os.path.exists(f"{db_path_local}"):
@@ -451,6 +512,13 @@ class ComputeNGD:
         else:
             return connection, cursor
 
+    def _get_curie_to_pmids_store(self):
+        # The memory-mapped store is only used if it was built from the current curie_to_pmids.sqlite
+        store = get_curie_to_pmids_store(get_curie_to_pmids_store_path(self.ngd_database_path))
+        if store and store.is_current(self.ngd_database_path):
+            return store
+        return None
+
     def _close_database(self):
         if self.cursor:
             self.cursor.close()
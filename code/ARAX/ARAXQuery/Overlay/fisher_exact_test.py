@@ -3,12 +3,11 @@
 # a list of source nodes with certain qnode_id in KG and each of the target nodes with specified type.
 
 # relative imports
-import scipy.stats as stats
+import numpy as np
 import traceback
 import sys
 import os
 import re
-import multiprocessing
 from datetime import datetime
 from neo4j import GraphDatabase, basic_auth
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../../")
@@ -22,10 +21,12 @@ from openapi_server.models.edge import Edge
 from openapi_server.models.q_edge import QEdge
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../NodeSynonymizer/")
 from node_synonymizer import NodeSynonymizer
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../BiolinkHelper/")
+from biolink_helper import BiolinkHelper
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 import overlay_utilities as ou
+from fisher_exact_utilities import fisher_exact_pvalues, get_neighbor_count_table
 import collections
-import sqlite3
 class ComputeFTEST:
 
     #### Constructor
@@ -77,9 +78,6 @@ class ComputeFTEST:
             os.system(f"scp {RTXConfig.db_username}@{RTXConfig.db_host}:{RTXConfig.kg2c_sqlite_path} {sqlite_file_path}")
         self.sqlite_file_path = sqlite_file_path
 
-        if rel_edge_key is not None:
-            self.response.warning(f"The 'rel_edge_key' option in FET is specified, it will cause slow for the calculation of FEST test.")
-
         # initialize some variables
         nodes_info = {}
         edge_expand_kp = []
@@ -355,40 +353,31 @@ class ComputeFTEST:
             size_of_query_sample = len(subject_node_list)
 
             self.response.debug(f"Computing Fisher's Exact Test P-value")
-            # calculate FET p-value for each target node in parallel
-
-            parameter_list = []
-            del_list = []
-            for node in object_node_dict:
-                temp = [len(object_node_dict[node]), size_of_object[node]-len(object_node_dict[node]), size_of_query_sample - len(object_node_dict[node]), (size_of_total - size_of_object[node]) - (size_of_query_sample - len(object_node_dict[node]))]
-                if any([value < 0 for value in temp]) is True:
-                    del_list.append(node)
-                    self.response.warning(f"Skipping node {node} to calculate FET p-value due to issue1438 (which causes negative value).")
 
-            for del_node in del_list:
-                del object_node_dict[del_node]
-            parameter_list = [(node, len(object_node_dict[node]), size_of_object[node]-len(object_node_dict[node]), size_of_query_sample - len(object_node_dict[node]), (size_of_total - size_of_object[node]) - (size_of_query_sample - len(object_node_dict[node]))) for node in object_node_dict]
+            nodes = list(object_node_dict)
+            in_sample_and_object = np.array([len(object_node_dict[node]) for node in nodes], dtype=np.int64)
+            object_sizes = np.array([size_of_object[node] for node in nodes], dtype=np.int64)
+            contingency_tables = np.stack([in_sample_and_object,
+                                           object_sizes - in_sample_and_object,
+                                           size_of_query_sample - in_sample_and_object,
+                                           (size_of_total - object_sizes) - (size_of_query_sample - in_sample_and_object)])
+            has_negative_count = (contingency_tables < 0).any(axis=0)
+            for node_index in np.flatnonzero(has_negative_count):
+                del object_node_dict[nodes[node_index]]
+                self.response.warning(f"Skipping node {nodes[node_index]} to calculate FET p-value due to issue1438 (which causes negative value).")
+            nodes = [node for node, is_skipped in zip(nodes, has_negative_count) if not is_skipped]
+            contingency_tables = contingency_tables[:, ~has_negative_count]
 
             try:
-                # with multiprocessing.Pool() as executor:
-                #     FETpvalue_list = [elem for elem in executor.map(self._calculate_FET_pvalue_parallel, parameter_list)]
-                FETpvalue_list = [elem for elem in map(self._calculate_FET_pvalue_parallel, parameter_list)]
+                # Compute the p-values for all object nodes' contingency tables at once
+                FETpvalue_list = fisher_exact_pvalues(*contingency_tables).tolist()
             except:
                 tb = traceback.format_exc()
                 error_type, error, _ = sys.exc_info()
                 self.response.error(tb, error_code=error_type.__name__)
                 self.response.error(f"Something went wrong with computing Fisher's Exact Test P-value")
                 return self.response
-
-            if any([type(elem) is list for elem in FETpvalue_list]):
-                for msg in [elem2 for elem1 in FETpvalue_list if type(elem1) is list for elem2 in elem1]:
-                    if type(msg) is tuple:
-                        self.response.error(msg[0], error_code=msg[1])
-                    else:
-                        self.response.error(msg)
-                return self.response
-            else:
-                output = dict(FETpvalue_list)
+            output = dict(zip(nodes, FETpvalue_list))
 
             # check if the results need to be filtered
             output = dict(sorted(output.items(), key=lambda x: x[1]))
@@ -404,6 +393,7 @@ class ComputeFTEST:
             # add the virtual edge with FET result to message KG
             self.response.debug(f"Adding virtual edge with FET result to message KG")
             count = 0
+            overlay_edges = []  # (subject, object, edge key) of each virtual edge added, to bind into the results
             for index, value in enumerate([(virtual_relation_label, output[adj], node, adj) for adj in object_node_dict if adj in output.keys() for node in object_node_dict[adj]], 1):
 
                 edge_attribute_list =  [
@@ -422,14 +412,15 @@ class ComputeFTEST:
                 edge.qedge_keys = [value[0]]
 
                 self.message.knowledge_graph.edges[edge_id] = edge
-
-                if self.message.results is not None and len(self.message.results) > 0:
-                    ou.update_results_with_overlay_edge(subject_knode_key=value[2], object_knode_key=value[3], kedge_key=edge_id, message=self.message, log=self.response)
+                overlay_edges.append((value[2], value[3], edge_id))
 
                 count = count + 1
 
             self.response.debug(f"{count} new virtual edges were added to message KG")
 
+            if self.message.results is not None and len(self.message.results) > 0:
+                ou.update_results_with_overlay_edges(overlay_edges, message=self.message, log=self.response)
+
             # add the virtual edge to message QG
             if count > 0:
                 self.response.debug(f"Adding virtual edge to message QG")
@@ -454,8 +445,8 @@ class ComputeFTEST:
         :param node_curie: (required) the curie id of query node. It accepts both single curie id or curie id list eg. "UniProtKB:P14136" or ['UniProtKB:P02675', 'UniProtKB:P01903', 'UniProtKB:P09601', 'UniProtKB:Q02878']
         :param source_type: (required) the type of source node, eg. "gene"
         :param adjacent_type: (required) the type of adjacent node, eg. "biological_process"
-        :param kp: (optional) the knowledge provider to use, eg. "infores:rtx-kg2"(default)
-        :param rel_type: (optional) edge type to consider, eg. "involved_in"
+        :param kp: (optional) the knowledge provider to use, eg. "infores:rtx-kg2"(default); note that when kg2c.sqlite has per-predicate neighbor counts, counts for a rel_type come from KG2c even for kp="ARAX/KG1"
+        :param rel_type: (optional) edge type to consider, eg. "involved_in"; edges with its descendant and inverse predicates are counted too (as expand does)
         :return a tuple with a dict containing the number of adjacent nodes for the query node and a list of removed nodes
         """
 
@@ -465,33 +456,28 @@ class ComputeFTEST:
         adjacent_type = ComputeFTEST.convert_string_to_snake_case(adjacent_type.replace('biolink:',''))
         adjacent_type = ComputeFTEST.convert_string_biolinkformat(adjacent_type)
 
-        if rel_type is None:
+        neighbor_count_table = get_neighbor_count_table(self.sqlite_file_path)
+        if rel_type is None or neighbor_count_table.has_predicate_neighbor_counts():
+            if rel_type is not None and kp == 'ARAX/KG1':
+                self.response.warning(f"Since the edge type '{rel_type}' is from KG1, we still use the neighbor counts from KG2c (rather than expand(kp=ARAX/KG1)) to query neighbor count. However, the total node count is based on KG2c from 'nodesynonymizer.get_total_entity_count'. So the FET result might not be accurate.")
             normalized_nodes = self.nodesynonymizer.get_canonical_curies(node_curie)
             failure_nodes = list()
             mapping = {node:normalized_nodes[node]['preferred_curie'] for node in normalized_nodes if normalized_nodes[node] is not None}
             failure_nodes += list(normalized_nodes.keys() - mapping.keys())
-            query_nodes = list(set(mapping.values()))
-            query_nodes = [curie_id.replace("'", "''") if "'" in curie_id else curie_id for curie_id in query_nodes]
-            # special_curie_ids = [curie_id for curie_id in query_nodes if "'" in curie_id]
-
-            # Get connected to kg2c sqlite
-            connection = sqlite3.connect(self.sqlite_file_path)
-            cursor = connection.cursor()
-
-            # Extract the neighbor count data
-            node_keys_str = "','".join(query_nodes)  # SQL wants ('node1', 'node2') format for string lists
-            sql_query = f"SELECT N.id, N.neighbor_counts " \
-                        f"FROM neighbors AS N " \
-                        f"WHERE N.id IN ('{node_keys_str}')"
-            cursor.execute(sql_query)
-            rows = cursor.fetchall()
-            rows = [curie_id.replace("\'","'").replace("''", "'") if "'" in curie_id else curie_id for curie_id in rows]
-            connection.close()
-
-            # Load the counts into a dictionary
-            neighbor_counts_dict = {row[0]:eval(row[1]) for row in rows}
-
-            res_dict = {node:neighbor_counts_dict[mapping[node]].get(adjacent_type) for node in mapping if mapping[node] in neighbor_counts_dict and neighbor_counts_dict[mapping[node]].get(adjacent_type) is not None}
+
+            # Look up the neighbor counts in the (process-wide) table preloaded from kg2c.sqlite, or for a specific
+            # predicate, in the per-predicate neighbor counts recorded by the KG2c build
+            if rel_type is None:
+                neighbor_counts_dict = neighbor_count_table.get_neighbor_counts(set(mapping.values()), adjacent_type)
+            else:
+                # Count edges with any predicate expand would match for rel_type; KG2c only uses canonical predicates, so
+                # the canonical forms of its descendants cover their inverses. A neighbor connected via several of these
+                # predicates is counted once per predicate, just as expand returns one edge per predicate.
+                bh = BiolinkHelper()
+                predicates = bh.get_canonical_predicates(bh.get_descendants(rel_type))
+                neighbor_counts_dict = neighbor_count_table.get_predicate_neighbor_counts(set(mapping.values()), predicates, adjacent_type)
+
+            res_dict = {node:neighbor_counts_dict[mapping[node]] for node in mapping if mapping[node] in neighbor_counts_dict}
             failure_nodes += list(mapping.keys() - res_dict.keys())
 
             if len(failure_nodes) != 0:
@@ -500,6 +486,8 @@ class ComputeFTEST:
                 return (res_dict, [])
 
         else:
+            # Older kg2c.sqlite files have no per-predicate neighbor counts, so count neighbors with a nested query
+            self.response.warning(f"No per-predicate neighbor counts were found in {self.sqlite_file_path}, so neighbors with edge type '{rel_type}' will be counted with a nested expand query. This will slow down the calculation of FET.")
             if kp == 'ARAX/KG1':
                 self.response.warning(f"Since the edge type '{rel_type}' is from KG1, we still use the DSL expand(kg=ARAX/KG1) to query neighbor count. However, the total node count is based on KG2c from 'nodesynonymizer.get_total_entity_count'. So the FET result might not be accurate.")
 
@@ -542,29 +530,18 @@ class ComputeFTEST:
                 else:
                     res_dict = dict()
                     message = araxq.response.envelope.message
-                    if type(node_curie) is str:
-                        tmplist = set([edge_key for edge_key in message.knowledge_graph.edges if message.knowledge_graph.edges[edge_key].subject == node_curie or message.knowledge_graph.edges[edge_key].object == node_curie])  ## edge has no direction
-                        if len(tmplist) == 0:
-                            self.response.warning(f"Fail to query adjacent nodes from {kp} for {node_curie} in FET probably because expander ignores node type. For more details, please see issue897.")
-                            return (res_dict,[node_curie])
-                        res_dict[node_curie] = len(tmplist)
-                        return (res_dict,[])
-                    else:
-                        check_empty = False
-                        failure_nodes = list()
-                        for node in node_curie:
-                            tmplist = set([edge_key for edge_key in message.knowledge_graph.edges if message.knowledge_graph.edges[edge_key].subject == node or message.knowledge_graph.edges[edge_key].object == node])  ## edge has no direction
-                            if len(tmplist) == 0:
-                                self.response.warning(f"Fail to query adjacent nodes from {kp} for {node} in FET probably because expander ignores node type. For more details, please see issue897.")
-                                failure_nodes.append(node)
-                                check_empty = True
-                                continue
-                            res_dict[node] = len(tmplist)
-
-                        if check_empty is True:
-                            return (res_dict,failure_nodes)
-                        else:
-                            return (res_dict,[])
+                    # Count the edges incident to each node in one pass over the KG (edge has no direction)
+                    edge_counts = collections.Counter()
+                    for edge in message.knowledge_graph.edges.values():
+                        edge_counts.update({edge.subject, edge.object})
+                    failure_nodes = list()
+                    for node in ([node_curie] if type(node_curie) is str else node_curie):
+                        if edge_counts[node] == 0:
+                            self.response.warning(f"Fail to query adjacent nodes from {kp} for {node} in FET probably because expander ignores node type. For more details, please see issue897.")
+                            failure_nodes.append(node)
+                            continue
+                        res_dict[node] = edge_counts[node]
+                    return (res_dict, failure_nodes)
             except:
                 tb = traceback.format_exc()
                 error_type, error, _ = sys.exc_info()
@@ -585,52 +562,11 @@ class ComputeFTEST:
         node_type = ComputeFTEST.convert_string_to_snake_case(node_type.replace('biolink:',''))
         node_type = ComputeFTEST.convert_string_biolinkformat(node_type)
 
-        # Get connected to kg2c sqlite
-        connection = sqlite3.connect(self.sqlite_file_path)
-        cursor = connection.cursor()
-
         # Extract total count of nodes with certain type in kg2c
-        sql_query = f"SELECT C.count " \
-                    f"FROM category_counts AS C " \
-                    f"WHERE C.category = '{node_type}'"
-
-        cursor.execute(sql_query)
-        rows = cursor.fetchall()
-        size_of_total = rows[0][0]
-        connection.close()
+        size_of_total = get_neighbor_count_table(self.sqlite_file_path).get_category_count(node_type)
 
         return size_of_total
 
-    def _calculate_FET_pvalue_parallel(self, this):
-        # *Note*: The arugment 'this' is a list containing five sub-arguments below since this function is exectued in parallel.
-        # This method is expected to be run within this class
-        """
-        Calculate Fisher Exact Test' p-value.
-        *param this is a list containing five sub-arguments below since this function is exectued in parallel.
-        :return a list of FET p-values
-        """
-        #:sub-argument node: (required) the curie name of node, eg. "UniProtKB:Q13330"
-        #:sub-argument a: (required) count of in_sample and in_pathway
-        #:sub-argument b: (required) count of not_in_sample but in_pathway
-        #:sub-argument c: (required) count of in_sample but not in_pathway
-        #:sub-argument d: (required) count of not in_sample and not in_pathway
-
-        # this should contain five variables and assign them to different variables
-        node, a, b, c, d = this
-        error_message = []
-
-        try:
-            contingency_table = [[a, b], [c, d]]
-            pvalue = stats.fisher_exact(contingency_table)[1]
-            return (node, pvalue)
-        except:
-            tb = traceback.format_exc()
-            error_type, error, _ = sys.exc_info()
-            error_message.append((tb, error_type.__name__))
-            error_message.append(f"Something went wrong for target node {node} to calculate FET p-value")
-            error_message.append(f"a, b, c, d are respectively {a}, {b}, {c}, {d} ")
-            return error_message
-
     @staticmethod
     def convert_string_to_snake_case(input_string: str) -> str:
         # Converts a string like 'ChemicalEntity' or 'chemicalEntity' to 'chemical_entity'
@@ -0,0 +1,237 @@
+#!/bin/env python3
+# This file contains the pieces Fisher's exact test (FET) is computed from: a vectorized two-sided FET that computes
+# the p-values for a whole batch of 2x2 tables at once, and a table of per-category neighbor counts for KG2c nodes.
+# The neighbor count table is loaded from kg2c.sqlite one category at a time (as compact int arrays keyed by node
+# index; newer builds store the counts that way, clustered by category) and is kept for the life of the process, so it
+# is shared by every query that runs FET. Neighbor counts for particular predicates are looked up directly in the
+# (node, predicate)-indexed table written by the KG2c build.
+import ast
+import json
+import os
+import sqlite3
+import sys
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+import numpy as np
+import scipy.stats as stats
+
+
+def eprint(*args, **kwargs): print(*args, file=sys.stderr, **kwargs)
+
+
+RELATIVE_TOLERANCE = 1e-14  # Same tolerance scipy.stats.fisher_exact uses when comparing point probabilities
+MAX_CACHED_CATEGORIES = 16
+LOOKUP_BATCH_SIZE = 5000
+
+
+def fisher_exact_pvalues(a: Iterable[int], b: Iterable[int], c: Iterable[int], d: Iterable[int]) -> np.ndarray:
+    """
+    Returns the two-sided Fisher's exact test p-value for each of the 2x2 tables [[a, b], [c, d]] (given as parallel
+    sequences). P-values are computed the same way scipy.stats.fisher_exact computes them, just for all tables at once.
+    """
+    a, b, c, d = (np.asarray(values, dtype=np.int64) for values in (a, b, c, d))
+    pvalues = np.ones(len(a))
+    # Tables with an empty row or column have a p-value of 1
+    computable = np.flatnonzero((a + b > 0) & (c + d > 0) & (a + c > 0) & (b + d > 0))
+    if not len(computable):
+        return pvalues
+    a = a[computable]
+    n1 = a + b[computable]
+    total = n1 + c[computable] + d[computable]
+    n = a + c[computable]
+    hypergeom = stats.hypergeom
+
+    def pmf(x: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        return hypergeom.pmf(x, total[rows], n1[rows], n[rows])
+
+    mode = ((n + 1) * (n1 + 1) / (total + 2)).astype(np.int64)
+    all_rows = np.arange(len(a))
+    pexact = pmf(a, all_rows)
+    pmode = pmf(mode, all_rows)
+    threshold = pexact * (1 + RELATIVE_TOLERANCE)
+    not_at_mode = np.abs(pexact - pmode) / np.maximum(pexact, pmode) > RELATIVE_TOLERANCE
+
+    # Below the mode: add the upper tail that starts past the last point (at/after the mode) as probable as the table
+    lower = np.flatnonzero(not_at_mode & (a < mode))
+    if len(lower):
+        guess = _find_last_true(lambda x, rows: pmf(x, lower[rows]) >= threshold[lower[rows]], mode[lower], n[lower])
+        pvalues[computable[lower]] = (hypergeom.cdf(a[lower], total[lower], n1[lower], n[lower]) +
+                                      hypergeom.sf(guess, total[lower], n1[lower], n[lower]))
+    # At/above the mode: add the lower tail that ends at the last point (up to the mode) no more probable than the table
+    upper = np.flatnonzero(not_at_mode & (a >= mode))
+    if len(upper):
+        guess = _find_last_true(lambda x, rows: pmf(x, upper[rows]) <= threshold[upper[rows]], np.zeros(len(upper), dtype=np.int64), mode[upper])
+        pvalues[computable[upper]] = (hypergeom.sf(a[upper] - 1, total[upper], n1[upper], n[upper]) +
+                                      hypergeom.cdf(guess, total[upper], n1[upper], n[upper]))
+    return np.minimum(pvalues, 1.0)
+
+
+def _find_last_true(condition: Callable[[np.ndarray, np.ndarray], np.ndarray], lows: np.ndarray,
+                    highs: np.ndarray) -> np.ndarray:
+    # Binary searches (for all rows at once) for the last x in [low, high] where the condition holds; the condition must
+    # hold up to some point and not after it. Rows where it never holds get low - 1.
+    last_true = lows - 1
+    first_false = highs + 1
+    while True:
+        rows = np.flatnonzero(first_false - last_true > 1)
+        if not len(rows):
+            return last_true
+        middle = (last_true[rows] + first_false[rows]) // 2
+        holds = condition(middle, rows)
+        last_true[rows[holds]] = middle[holds]
+        first_false[rows[~holds]] = middle[~holds]
+
+
+class NeighborCountTable:
+    """
+    Neighbor counts (by neighbor category) for the nodes in a kg2c.sqlite file. Use get_neighbor_count_table() to grab
+    the (process-wide) instance.
+    """
+
+    def __init__(self, sqlite_path: str, database_version: str):
+        self.sqlite_path = sqlite_path
+        self.database_version = database_version
+        self.category_tables = OrderedDict()  # category -> (sorted node indexes, neighbor counts)
+        self.lock = threading.Lock()
+        self._connection = None
+        self._pid = None
+
+    def get_neighbor_counts(self, node_ids: Iterable[str], neighbor_category: str) -> Dict[str, int]:
+        """
+        Returns the number of neighbors of the given category that each of the given nodes has; nodes without any such
+        neighbors (or that aren't in KG2c) are left out.
+        """
+        node_indexes = self.get_node_indexes(node_ids)
+        if not node_indexes:
+            return dict()
+        table_indexes, table_counts = self.get_category_table(neighbor_category)
+        if not len(table_indexes):
+            return dict()
+        query_indexes = np.fromiter(node_indexes.values(), dtype=np.int64, count=len(node_indexes))
+        positions = np.minimum(np.searchsorted(table_indexes, query_indexes), len(table_indexes) - 1)
+        found = table_indexes[positions] == query_indexes
+        return {node_id: count for node_id, count, is_found in zip(node_indexes, table_counts[positions].tolist(), found.tolist())
+                if is_found}
+
+    def has_predicate_neighbor_counts(self) -> bool:
+        """
+        Returns whether the kg2c.sqlite file has per-predicate neighbor counts (older builds don't).
+        """
+        return self._has_table("predicate_neighbors")
+
+    def get_predicate_neighbor_counts(self, node_ids: Iterable[str], predicates: Iterable[str],
+                                      neighbor_category: str) -> Dict[str, int]:
+        """
+        Returns the number of neighbors of the given category that each of the given nodes has via edges with any of the
+        given predicates (in either direction), summed over those predicates; nodes without any such neighbors (or that
+        aren't in KG2c) are left out.
+        """
+        node_ids = list(set(node_ids))
+        predicates = json.dumps(sorted(set(predicates)))
+        neighbor_counts = dict()
+        connection = self._get_connection()
+        for start in range(0, len(node_ids), LOOKUP_BATCH_SIZE):
+            batch = node_ids[start:start + LOOKUP_BATCH_SIZE]
+            rows = connection.execute("SELECT id, SUM(json_extract(neighbor_counts, ?)) FROM predicate_neighbors "
+                                      "WHERE predicate IN (SELECT value FROM json_each(?)) "
+                                      "AND id IN (SELECT value FROM json_each(?)) GROUP BY id",
+                                      (f'$."{neighbor_category}"', predicates, json.dumps(batch))).fetchall()
+            neighbor_counts.update({node_id: count for node_id, count in rows if count})
+        return neighbor_counts
+
+    def get_node_indexes(self, node_ids: Iterable[str]) -> Dict[str, int]:
+        # A node's index is its rowid in the neighbors table
+        node_ids = list(set(node_ids))
+        node_indexes = dict()
+        connection = self._get_connection()
+        for start in range(0, len(node_ids), LOOKUP_BATCH_SIZE):
+            batch = node_ids[start:start + LOOKUP_BATCH_SIZE]
+            rows = connection.execute("SELECT id, rowid FROM neighbors WHERE id IN (SELECT value FROM json_each(?))",
+                                      (json.dumps(batch),)).fetchall()
+            node_indexes.update(rows)
+        return node_indexes
+
+    def get_category_table(self, neighbor_category: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the indexes (sorted) of all nodes that have neighbors of the given category, along with how many such
+        neighbors each has. Tables are loaded the first time they're asked for and kept for later queries.
+        """
+        with self.lock:
+            category_table = self.category_tables.get(neighbor_category)
+            if category_table is not None:
+                self.category_tables.move_to_end(neighbor_category)
+                return category_table
+        category_table = self._load_category_table(neighbor_category)
+        with self.lock:
+            self.category_tables[neighbor_category] = category_table
+            while len(self.category_tables) > MAX_CACHED_CATEGORIES:
+                self.category_tables.popitem(last=False)
+        return category_table
+
+    def get_category_count(self, category: str) -> Optional[int]:
+        """
+        Returns the total number of KG2c nodes with the given category.
+        """
+        row = self._get_connection().execute("SELECT count FROM category_counts WHERE category = ?", (category,)).fetchone()
+        return row[0] if row else None
+
+    def _load_category_table(self, neighbor_category: str) -> Tuple[np.ndarray, np.ndarray]:
+        connection = self._get_connection()
+        if self._has_table("category_neighbor_counts"):
+            # Newer builds store counts clustered by category, so this is a single range scan (already in index order)
+            rows = connection.execute("SELECT node_index, count FROM category_neighbor_counts WHERE category_id = "
+                                      "(SELECT category_id FROM neighbor_categories WHERE category = ?)",
+                                      (neighbor_category,)).fetchall()
+            table = np.array(rows, dtype=np.int64).reshape(-1, 2)
+            return table[:, 0].astype(np.int32), table[:, 1].astype(np.int32)
+        try:
+            rows = connection.execute("SELECT rowid, neighbor_count FROM "
+                                      "(SELECT rowid, json_extract(neighbor_counts, ?) AS neighbor_count FROM neighbors) "
+                                      "WHERE neighbor_count IS NOT NULL",
+                                      (f'$."{neighbor_category}"',)).fetchall()
+        except sqlite3.OperationalError:
+            # Older kg2c.sqlite files store neighbor counts as Python dict literals rather than JSON
+            rows = []
+            for node_index, neighbor_counts in connection.execute("SELECT rowid, neighbor_counts FROM neighbors"):
+                neighbor_count = ast.literal_eval(neighbor_counts).get(neighbor_category)
+                if neighbor_count is not None:
+                    rows.append((node_index, neighbor_count))
+        table = np.array(rows, dtype=np.int64).reshape(-1, 2)
+        table = table[np.argsort(table[:, 0], kind="stable")]
+        return table[:, 0].astype(np.int32), table[:, 1].astype(np.int32)
+
+    def _has_table(self, table_name: str) -> bool:
+        row = self._get_connection().execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = ?",
+                                             (table_name,)).fetchone()
+        return row is not None
+
+    def _get_connection(self) -> sqlite3.Connection:
+        # Connections can't be shared with forked workers, so each process opens its own
+        if self._connection is None or self._pid != os.getpid():
+            self._connection = sqlite3.connect(f"file:{self.sqlite_path}?mode=ro", uri=True, check_same_thread=False)
+            self._pid = os.getpid()
+        return self._connection
+
+
+_tables: Dict[str, NeighborCountTable] = dict()
+_tables_lock = threading.Lock()
+
+
+def get_neighbor_count_table(sqlite_path: str) -> NeighborCountTable:
+    """
+    Returns the (process-wide) neighbor count table for the given kg2c.sqlite file; it's replaced if the file changes.
+    """
+    # The version is the file's size and modification time, so a replaced file counts as new
+    try:
+        stat = os.stat(sqlite_path)
+        database_version = f"{stat.st_size}:{int(stat.st_mtime)}"
+    except OSError:
+        database_version = ""
+    with _tables_lock:
+        table = _tables.get(sqlite_path)
+        if table is None or table.database_version != database_version:
+            table = NeighborCountTable(sqlite_path, database_version)
+            _tables[sqlite_path] = table
+        return table
@@ -38,6 +38,8 @@ NGD_DIR = os.path.dirname(os.path.abspath(__file__))
 
 sys.path.append(os.path.sep.join([*pathlist[:(RTXindex + 1)], 'code', 'ARAX', 'NodeSynonymizer']))
 from node_synonymizer import NodeSynonymizer
+sys.path.append(NGD_DIR)
+from curie_to_pmids_store import build_curie_to_pmids_store, get_curie_to_pmids_store_path
 sys.path.append(os.path.sep.join([*pathlist[:(RTXindex + 1)], 'code']))  # code directory
 from RTXConfiguration import RTXConfiguration
 
@@ -145,6 +147,8 @@ class NGDDatabaseBuilder:
         self._add_pmids_from_kg2_nodes(curie_to_pmids_map)
         logging.info(f"  In the end, found PMID lists for {len(curie_to_pmids_map)} (canonical) curies")
         self._save_data_in_sqlite_db(curie_to_pmids_map)
+        logging.info(f"  Building memory-mapped curie->PMIDs store from {self.curie_to_pmids_db_name}..")
+        build_curie_to_pmids_store(self.curie_to_pmids_db_path, get_curie_to_pmids_store_path(self.curie_to_pmids_db_path))
         logging.info(f"Done! Building {self.curie_to_pmids_db_name} took {round((time.time() - start) / 60)} minutes.")
 
     # Helper methods
@@ -0,0 +1,219 @@
+#!/bin/env python3
+# This file contains a read-only, memory-mapped store of the curie->PMIDs mappings that NGD is computed from. It is
+# derived from curie_to_pmids.sqlite (see build_curie_to_pmids_store()). Each curie's PMIDs are kept as a sorted list of
+# integers, delta-encoded and packed as varints, so even hub concepts with hundreds of thousands of PMIDs take up
+# little space; PMID lists for many curies are decoded all at once with NumPy. The number of PMIDs for each curie is
+# stored alongside its list, so marginal counts can be read without decoding anything.
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+
+def eprint(*args, **kwargs): print(*args, file=sys.stderr, **kwargs)
+
+
+MAGIC = b"NGDPMIDS"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<8sIQ")  # magic, format version, metadata length (metadata JSON follows the header)
+TABLE_ENTRY = struct.Struct("<QQQ")  # bucket array offset, number of buckets, number of records
+RECORD_HEADER = struct.Struct("<HII")  # curie length, number of PMIDs, encoded PMIDs length
+LOAD_FACTOR = 0.5
+
+
+def _hash_key(key: bytes) -> int:
+    # Must be stable across processes (so no builtin hash())
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "little")
+
+
+def encode_pmids(pmids: Iterable[int]) -> Tuple[int, bytes]:
+    """
+    Encodes a collection of PMIDs as varint-packed deltas of its sorted, de-duplicated values. Returns the number of
+    (unique) PMIDs along with the encoded bytes.
+    """
+    values = np.unique(np.fromiter(pmids, dtype=np.int64)).astype(np.uint64)
+    deltas = np.diff(values, prepend=np.uint64(0))
+    num_bytes = np.ones(len(deltas), dtype=np.int64)
+    remaining = deltas >> np.uint64(7)
+    while remaining.any():
+        num_bytes += remaining > 0
+        remaining >>= np.uint64(7)
+    byte_starts = np.cumsum(num_bytes) - num_bytes
+    byte_positions = np.arange(num_bytes.sum()) - np.repeat(byte_starts, num_bytes)
+    encoded = ((np.repeat(deltas, num_bytes) >> (np.uint64(7) * byte_positions.astype(np.uint64))) & np.uint64(0x7f)).astype(np.uint8)
+    encoded[byte_positions != np.repeat(num_bytes - 1, num_bytes)] |= 0x80  # Continuation bit on all but each last byte
+    return len(values), encoded.tobytes()
+
+
+def decode_pmids(encoded: bytes, counts: Iterable[int]) -> list:
+    """
+    Decodes the (concatenated) encoded PMID lists for several curies, given how many PMIDs each list holds. Returns
+    one sorted int64 array per list.
+    """
+    counts = np.fromiter(counts, dtype=np.int64)
+    encoded_bytes = np.frombuffer(encoded, dtype=np.uint8)
+    if not len(encoded_bytes):
+        return [np.empty(0, dtype=np.int64) for _ in counts]
+    value_ends = np.flatnonzero(encoded_bytes < 0x80)
+    value_starts = np.concatenate([[0], value_ends[:-1] + 1])
+    byte_positions = np.arange(len(encoded_bytes)) - np.repeat(value_starts, value_ends - value_starts + 1)
+    shifted = (encoded_bytes & 0x7f).astype(np.uint64) << (np.uint64(7) * byte_positions.astype(np.uint64))
+    deltas = np.add.reduceat(shifted, value_starts).astype(np.int64)
+    # Each list's first delta is relative to zero, so undo the running total carried over from the previous lists
+    running_totals = np.cumsum(deltas)
+    list_ends = np.cumsum(counts)
+    list_starts = list_ends - counts
+    carried_totals = np.where(list_starts > 0, running_totals[np.maximum(list_starts - 1, 0)], 0)
+    pmids = running_totals - np.repeat(carried_totals, counts)
+    return np.split(pmids, list_ends[:-1])
+
+
+class CurieToPmidsStore:
+    """
+    Read-only view of a curie->PMIDs store file. Use get_curie_to_pmids_store() to grab the (process-wide) instance.
+    """
+
+    def __init__(self, store_path: str):
+        self.store_path = store_path
+        with open(store_path, "rb") as store_file:
+            self._mmap = mmap.mmap(store_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, format_version, metadata_length = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or format_version != FORMAT_VERSION:
+            raise ValueError(f"{store_path} is not a version {FORMAT_VERSION} curie->PMIDs store")
+        table_entry_start = HEADER.size + metadata_length
+        self.metadata = json.loads(self._mmap[HEADER.size:table_entry_start])
+        bucket_offset, self._num_buckets, self.num_curies = TABLE_ENTRY.unpack_from(self._mmap, table_entry_start)
+        self._buckets = memoryview(self._mmap)[bucket_offset:bucket_offset + self._num_buckets * 8].cast("Q")
+
+    def is_current(self, sqlite_path: str) -> bool:
+        """
+        Returns whether this store was built from the given curie_to_pmids.sqlite file (as it is now).
+        """
+        try:
+            stat = os.stat(sqlite_path)
+        except OSError:
+            return False
+        return (self.metadata.get("source_size") == stat.st_size and
+                self.metadata.get("source_mtime") == int(stat.st_mtime))
+
+    def _find_records(self, curies: Iterable[str]) -> Dict[str, Tuple[int, int, int]]:
+        # Returns the PMID count, encoded PMIDs offset, and encoded PMIDs length for each curie that's in the store
+        found = dict()
+        if not self._num_buckets:
+            return found
+        mapped = self._mmap
+        buckets = self._buckets
+        num_buckets = self._num_buckets
+        for curie in curies:
+            curie_bytes = curie.encode()
+            bucket = _hash_key(curie_bytes) % num_buckets
+            while True:
+                record_offset = buckets[bucket]
+                if not record_offset:
+                    break
+                curie_length, count, encoded_length = RECORD_HEADER.unpack_from(mapped, record_offset)
+                curie_start = record_offset + RECORD_HEADER.size
+                if curie_length == len(curie_bytes) and mapped[curie_start:curie_start + curie_length] == curie_bytes:
+                    found[curie] = (count, curie_start + curie_length, encoded_length)
+                    break
+                bucket = (bucket + 1) % num_buckets
+        return found
+
+    def get_counts(self, curies: Iterable[str]) -> Dict[str, int]:
+        """
+        Returns the number of PMIDs for each of the given curies (without decoding any PMID lists); curies that aren't
+        in the store are left out.
+        """
+        return {curie: record[0] for curie, record in self._find_records(curies).items()}
+
+    def get_many(self, curies: Iterable[str]) -> Dict[str, np.ndarray]:
+        """
+        Returns a sorted array of PMIDs for each of the given curies; curies that aren't in the store are left out.
+        """
+        records = self._find_records(curies)
+        encoded = b"".join(self._mmap[offset:offset + length] for _, offset, length in records.values())
+        pmid_arrays = decode_pmids(encoded, [count for count, _, _ in records.values()])
+        return dict(zip(records, pmid_arrays))
+
+    def close(self):
+        self._buckets.release()
+        self._mmap.close()
+
+
+_stores: Dict[str, Tuple[int, CurieToPmidsStore]] = dict()
+
+
+def get_curie_to_pmids_store_path(sqlite_path: str) -> str:
+    return f"{os.path.splitext(sqlite_path)[0]}_pmids.store"
+
+
+def get_curie_to_pmids_store(store_path: str) -> Optional[CurieToPmidsStore]:
+    """
+    Returns the (process-wide, memory-mapped) store at the given path, or None if there isn't a valid one there. The
+    mapping survives forks, so workers forked after this is first called all share it.
+    """
+    try:
+        mtime = os.stat(store_path).st_mtime_ns
+    except OSError:
+        return None
+    if store_path not in _stores or _stores[store_path][0] != mtime:
+        try:
+            _stores[store_path] = (mtime, CurieToPmidsStore(store_path))
+        except (OSError, ValueError) as e:
+            eprint(f"WARNING: Couldn't open curie->PMIDs store {store_path}: {e}")
+            return None
+    return _stores[store_path][1]
+
+
+def build_curie_to_pmids_store(sqlite_path: str, store_path: str):
+    """
+    Builds a curie->PMIDs store from the given curie_to_pmids.sqlite file. The store is written to a temporary file
+    and moved into place at the end, so readers never see a partial store.
+    """
+    import sqlite3
+    stat = os.stat(sqlite_path)
+    metadata = json.dumps({"source_size": stat.st_size,
+                           "source_mtime": int(stat.st_mtime)}).encode()
+    records_start = HEADER.size + len(metadata) + TABLE_ENTRY.size
+
+    connection = sqlite3.connect(f"file:{sqlite_path}?mode=ro", uri=True)
+    temp_path = f"{store_path}.tmp{os.getpid()}"
+    with open(temp_path, "wb") as store_file:
+        store_file.write(b"\0" * records_start)
+        offset = records_start
+        hashes_and_offsets = []
+        for curie, pmids_json in connection.execute("SELECT curie, pmids FROM curie_to_pmids"):
+            curie_bytes = curie.encode()
+            count, encoded = encode_pmids(json.loads(pmids_json))
+            store_file.write(RECORD_HEADER.pack(len(curie_bytes), count, len(encoded)))
+            store_file.write(curie_bytes)
+            store_file.write(encoded)
+            hashes_and_offsets.append((_hash_key(curie_bytes), offset))
+            offset += RECORD_HEADER.size + len(curie_bytes) + len(encoded)
+        eprint(f"Wrote PMID lists for {len(hashes_and_offsets)} curies; writing hash table..")
+
+        # Then write the hash table (linear probing; 0 marks an empty bucket)
+        num_buckets = max(int(len(hashes_and_offsets) / LOAD_FACTOR), 1)
+        buckets = array("Q", bytes(8 * num_buckets))
+        for key_hash, record_offset in hashes_and_offsets:
+            bucket = key_hash % num_buckets
+            while buckets[bucket]:
+                bucket = (bucket + 1) % num_buckets
+            buckets[bucket] = record_offset
+        padding = (-offset) % 8  # Keep the bucket array 8-byte aligned
+        store_file.write(b"\0" * padding)
+        offset += padding
+        buckets.tofile(store_file)
+
+        store_file.seek(0)
+        store_file.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(metadata)))
+        store_file.write(metadata)
+        store_file.write(TABLE_ENTRY.pack(offset, num_buckets, len(hashes_and_offsets)))
+    connection.close()
+    os.replace(temp_path, store_path)
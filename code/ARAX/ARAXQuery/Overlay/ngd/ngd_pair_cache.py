@@ -0,0 +1,173 @@
+#!/bin/env python3
+# This file contains a persistent cache of computed NGD values (and their shared-PMID samples), keyed by canonical
+# curie pair. NGD is symmetric, so each pair is stored once regardless of the order its curies are given in. Entries
+# are kept in memory for the life of the process and in an on-disk SQLite store shared by all processes on the
+# machine; everything is keyed by the version of the curie->PMIDs database the values were computed from, so
+# swapping in a new database invalidates the cache. Both tiers are bounded: the least recently used entries are
+# dropped once the in-memory tier holds more than max_memory_entries or the on-disk store more than max_disk_entries.
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+
+def eprint(*args, **kwargs): print(*args, file=sys.stderr, **kwargs)
+
+
+DEFAULT_MAX_MEMORY_ENTRIES = 500000
+DEFAULT_MAX_DISK_ENTRIES = 2000000
+CACHE_PATH_ENV_VAR = "ARAX_NGD_PAIR_CACHE_PATH"  # Overrides where the on-disk store lives
+CACHE_MAX_ENTRIES_ENV_VAR = "ARAX_NGD_PAIR_CACHE_MAX_ENTRIES"  # Overrides how many entries the on-disk store holds
+LOOKUP_BATCH_SIZE = 5000
+PRUNE_CHECK_INTERVAL = 10000  # How many entries a process writes to the on-disk store between checks of its size
+PRUNE_TARGET_FRACTION = 0.9  # Pruning takes the on-disk store down to this fraction of its max size
+
+
+def get_pair_key(curie_a: str, curie_b: str) -> str:
+    return f"{curie_a}\t{curie_b}" if curie_a <= curie_b else f"{curie_b}\t{curie_a}"
+
+
+class NGDPairCache:
+
+    def __init__(self, database_version: str, disk_cache_path: Optional[str],
+                 max_memory_entries: int = DEFAULT_MAX_MEMORY_ENTRIES, max_disk_entries: int = DEFAULT_MAX_DISK_ENTRIES):
+        self.database_version = database_version
+        self.disk_cache_path = disk_cache_path
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self.num_disk_writes_since_prune_check = 0
+        self.entries = OrderedDict()  # pair key -> (NGD value, shared PMID sample)
+        self.lock = threading.Lock()
+        self._disk_connections = threading.local()
+        self._pid = os.getpid()
+
+    def get_many(self, curie_pairs: Iterable[Tuple[str, str]]) -> Dict[Tuple[str, str], Tuple[float, Set[int]]]:
+        """
+        Returns the cached NGD value and shared PMID sample for each of the given curie pairs; pairs that aren't cached
+        are left out.
+        """
+        pair_keys = {curie_pair: get_pair_key(*curie_pair) for curie_pair in curie_pairs}
+        found_by_key = dict()
+        with self.lock:
+            for pair_key in set(pair_keys.values()):
+                entry = self.entries.get(pair_key)
+                if entry is not None:
+                    self.entries.move_to_end(pair_key)
+                    found_by_key[pair_key] = entry
+        missing_keys = [pair_key for pair_key in set(pair_keys.values()) if pair_key not in found_by_key]
+        if missing_keys and self.disk_cache_path:
+            disk_found = self._get_many_from_disk(missing_keys)
+            self._put_many_in_memory(disk_found)
+            found_by_key.update(disk_found)
+        return {curie_pair: (found_by_key[pair_key][0], set(found_by_key[pair_key][1]))
+                for curie_pair, pair_key in pair_keys.items() if pair_key in found_by_key}
+
+    def put_many(self, ngd_results: Dict[Tuple[str, str], Tuple[float, Set[int]]]):
+        if not ngd_results:
+            return
+        entries = {get_pair_key(*curie_pair): (ngd_value, sorted(pmid_sample))
+                   for curie_pair, (ngd_value, pmid_sample) in ngd_results.items()}
+        self._put_many_in_memory(entries)
+        if self.disk_cache_path:
+            self._put_many_on_disk(entries)
+
+    def _put_many_in_memory(self, entries: Dict[str, Tuple[float, List[int]]]):
+        with self.lock:
+            for pair_key, entry in entries.items():
+                self.entries[pair_key] = entry
+                self.entries.move_to_end(pair_key)
+            while len(self.entries) > self.max_memory_entries:
+                self.entries.popitem(last=False)
+
+    # The on-disk store is written in WAL mode so many processes can share it
+    def _get_disk_connection(self) -> sqlite3.Connection:
+        connection = getattr(self._disk_connections, "connection", None)
+        if connection is None or self._pid != os.getpid():
+            connection = sqlite3.connect(self.disk_cache_path, timeout=5)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            # Stores from before entries recorded when they were last used can't be pruned, so they're started over
+            column_names = {row[1] for row in connection.execute("PRAGMA table_info(ngd_cache)")}
+            if column_names and "last_used" not in column_names:
+                connection.execute("DROP TABLE ngd_cache")
+            connection.execute("CREATE TABLE IF NOT EXISTS ngd_cache (pair TEXT PRIMARY KEY, version TEXT, value TEXT, "
+                               "last_used REAL)")
+            connection.execute("CREATE INDEX IF NOT EXISTS ngd_cache_last_used_index ON ngd_cache (last_used)")
+            # Throw out anything computed from a different curie->PMIDs database
+            connection.execute("DELETE FROM ngd_cache WHERE version != ?", (self.database_version,))
+            connection.commit()
+            self._disk_connections.connection = connection
+            self._pid = os.getpid()
+        return connection
+
+    def _get_many_from_disk(self, pair_keys: List[str]) -> Dict[str, Tuple[float, List[int]]]:
+        found = dict()
+        try:
+            connection = self._get_disk_connection()
+            for start in range(0, len(pair_keys), LOOKUP_BATCH_SIZE):
+                batch = pair_keys[start:start + LOOKUP_BATCH_SIZE]
+                rows = connection.execute("SELECT pair, value FROM ngd_cache WHERE version = ? AND "
+                                          "pair IN (SELECT value FROM json_each(?))",
+                                          (self.database_version, json.dumps(batch))).fetchall()
+                found.update({pair_key: tuple(json.loads(value)) for pair_key, value in rows})
+            if found:
+                # Mark these entries as recently used, so pruning keeps them around
+                connection.execute("UPDATE ngd_cache SET last_used = ? WHERE pair IN (SELECT value FROM json_each(?))",
+                                   (time.time(), json.dumps(list(found))))
+                connection.commit()
+        except sqlite3.Error as e:
+            eprint(f"WARNING: Unable to read from NGD pair cache {self.disk_cache_path}: {e}")
+        return found
+
+    def _put_many_on_disk(self, entries: Dict[str, Tuple[float, List[int]]]):
+        try:
+            connection = self._get_disk_connection()
+            now = time.time()
+            connection.executemany("INSERT OR REPLACE INTO ngd_cache (pair, version, value, last_used) "
+                                   "VALUES (?, ?, ?, ?)",
+                                   [(pair_key, self.database_version, json.dumps(entry), now)
+                                    for pair_key, entry in entries.items()])
+            connection.commit()
+            self.num_disk_writes_since_prune_check += len(entries)
+            if self.num_disk_writes_since_prune_check >= min(PRUNE_CHECK_INTERVAL, self.max_disk_entries):
+                self.num_disk_writes_since_prune_check = 0
+                self._prune_disk(connection)
+        except sqlite3.Error as e:
+            eprint(f"WARNING: Unable to write to NGD pair cache {self.disk_cache_path}: {e}")
+
+    def _prune_disk(self, connection: sqlite3.Connection):
+        num_entries = connection.execute("SELECT COUNT(*) FROM ngd_cache").fetchone()[0]
+        if num_entries > self.max_disk_entries:
+            num_to_delete = num_entries - int(self.max_disk_entries * PRUNE_TARGET_FRACTION)
+            connection.execute("DELETE FROM ngd_cache WHERE pair IN "
+                               "(SELECT pair FROM ngd_cache ORDER BY last_used LIMIT ?)", (num_to_delete,))
+            connection.commit()
+
+
+_caches: Dict[str, NGDPairCache] = dict()
+_caches_lock = threading.Lock()
+
+
+def get_ngd_pair_cache(curie_to_pmids_path: str) -> NGDPairCache:
+    """
+    Returns the (process-wide) NGD pair cache for the given curie_to_pmids.sqlite database. By default the on-disk
+    store lives next to that database and holds up to DEFAULT_MAX_DISK_ENTRIES entries.
+    """
+    # The version is the database file name plus its size and modification time, so a replaced file counts as new
+    try:
+        stat = os.stat(curie_to_pmids_path)
+        database_version = f"{os.path.basename(curie_to_pmids_path)}:{stat.st_size}:{int(stat.st_mtime)}"
+    except OSError:
+        database_version = os.path.basename(curie_to_pmids_path)
+    disk_cache_path = os.environ.get(CACHE_PATH_ENV_VAR, f"{os.path.splitext(curie_to_pmids_path)[0]}_ngd_cache.sqlite")
+    max_disk_entries = int(os.environ.get(CACHE_MAX_ENTRIES_ENV_VAR, DEFAULT_MAX_DISK_ENTRIES))
+    with _caches_lock:
+        cache = _caches.get(curie_to_pmids_path)
+        if cache is None or cache.database_version != database_version:
+            cache = NGDPairCache(database_version, disk_cache_path, max_disk_entries=max_disk_entries)
+            _caches[curie_to_pmids_path] = cache
+        return cache
@@ -20,6 +20,7 @@ from openapi_server.models.q_edge import QEdge
 # FIXME:^ this should be pulled from a YAML file pointing to the parser
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../KnowledgeSources/COHD_local/scripts/")
 from COHDIndex import COHDIndex
+from cohd_pair_store import get_cohd_pair_store, get_cohd_pair_store_path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/../../BiolinkHelper/")
 from biolink_helper import BiolinkHelper
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
@@ -48,6 +49,17 @@ class OverlayClinicalInfo:
             error_type, error, _ = sys.exc_info()
             self.response.error(tb, error_code=error_type.__name__)
             self.response.error(f"Internal Error encountered connecting to the local COHD database.")
+        self.cohd_pair_store = self._get_cohd_pair_store()
+
+    def _get_cohd_pair_store(self):
+        # The memory-mapped pair store is only used if it was built from the current COHD database
+        if not hasattr(self, 'cohdIndex'):
+            return None
+        database_path = f"{self.cohdIndex.databaseLocation}/{self.cohdIndex.databaseName}"
+        store = get_cohd_pair_store(get_cohd_pair_store_path(database_path))
+        if store and store.is_current(database_path):
+            return store
+        return None
 
     def decorate(self):
         """
@@ -113,149 +125,127 @@ class OverlayClinicalInfo:
         :default: default value of the edge attribute
         :name: name of the KP functionality you want to apply
         """
+        edge_attributes = self.make_edge_attributes_from_curie_pairs([(subject_curie, object_curie)], default=default, name=name)
+        if edge_attributes is not None:
+            return edge_attributes.get((subject_curie, object_curie))
+
+    def make_edge_attributes_from_curie_pairs(self, curie_pairs, default=0., name=""):
+        """
+        Makes the edge attribute for every given (subject, object) pair of node CURIEs at once, looking up the clinical
+        data for all of the pairs in one go
+        :curie_pairs: list of (subject CURIE, object CURIE) pairs for the edges under consideration
+        :default: default value of the edge attributes
+        :name: name of the KP functionality you want to apply
+        :return: dict mapping each pair a KP knows about to its edge attribute
+        """
         try:
             # edge attributes
-            name = name
             type = "EDAM:data_0951"
             url = "http://cohd.smart-api.info/"
-            value = default
-
-            node_curie_to_type = self.node_curie_to_type
-            subject_type = node_curie_to_type[subject_curie]
-            object_type = node_curie_to_type[object_curie]
-            # figure out which knowledge provider to use  # TODO: should handle this in a more structured fashion, does there exist a standardized KP API format?
-            KP_to_use = None
-            for KP in self.who_knows_about_what:
-                # see which KP's can label both subjects of information
-                if self.in_common(self.biolink_helper.get_descendants(subject_type, include_mixins=False), self.who_knows_about_what[KP]) and self.in_common(self.biolink_helper.get_descendants(object_type, include_mixins=False), self.who_knows_about_what[KP]):
-                    KP_to_use = KP
-
-            if KP_to_use == 'COHD':
-                self.response.debug(f"Querying Columbia Open Health data for info about {subject_name} and {object_name}")
-                # convert CURIE to OMOP identifiers
-                # subject_OMOPs = [str(x['omop_standard_concept_id']) for x in COHD.get_xref_to_OMOP(subject_curie, 1)]
-                res = self.mapping_curie_to_omop_ids.get(subject_curie,[])
-                if len(res) != 0:
-                    subject_OMOPs = res
-                else:
-                    subject_OMOPs = []
-                # object_OMOPs = [str(x['omop_standard_concept_id']) for x in COHD.get_xref_to_OMOP(object_curie, 1)]
-                res = self.mapping_curie_to_omop_ids.get(object_curie,[])
-                if len(res) != 0:
-                    object_OMOPs = res
-                else:
-                    object_OMOPs = []
-                # for domain in ["Condition", "Drug", "Procedure"]:
-                #     subject_OMOPs.update([str(x['concept_id']) for x in COHD.find_concept_ids(subject_name, domain=domain, dataset_id=3)])
-                #     object_OMOPs.update([str(x['concept_id']) for x in COHD.find_concept_ids(object_name, domain=domain, dataset_id=3)])
-                #################################################
-                # FIXME: this was the old way
-                # FIXME: Super hacky way to get around the fact that COHD can't map CHEMBL drugs
-                # if subject_curie.split('.')[0] == 'CHEMBL':
-                #     subject_OMOPs = [str(x['concept_id']) for x in
-                #                     COHD.find_concept_ids(subject_name, domain="Drug", dataset_id=3)]
-                # if object_curie.split('.')[0] == 'CHEMBL':
-                #     object_OMOPs = [str(x['concept_id']) for x in
-                #                     COHD.find_concept_ids(object_name, domain="Drug", dataset_id=3)]
-
-                # uniquify everything
-                # subject_OMOPs = list(set(subject_OMOPs))
-                # object_OMOPs = list(set(object_OMOPs))
-
-                # Decide how to handle the response from the KP
-                if name == 'paired_concept_frequency':
-                    # sum up all frequencies  #TODO check with COHD people to see if this is kosher
-                    frequency = default
-                    # for (omop1, omop2) in itertools.product(subject_OMOPs, object_OMOPs):
-                    #     freq_data_list = self.cohdIndex.get_paired_concept_freq(omop1, omop2, 3) # use the hierarchical dataset
-                    #     if len(freq_data_list) != 0:
-                    #         freq_data = freq_data_list[0]
-                    #         temp_value = freq_data['concept_frequency']
-                    #         if temp_value > frequency:
-                    #             frequency = temp_value
-                    omop_pairs = [f"{omop1}_{omop2}" for (omop1, omop2) in itertools.product(subject_OMOPs, object_OMOPs)]
-                    if len(omop_pairs) != 0:
-                        res = self.cohdIndex.get_paired_concept_freq(concept_id_pair=omop_pairs, dataset_id=3)  # use the hierarchical dataset
-                        if len(res) != 0:
-                            maximum_concept_frequency = res[0]['concept_frequency']  # the result returned from get_paired_concept_freq was sorted by decreasing order
-                            frequency = maximum_concept_frequency
-                    # decorate the edges
-                    value = frequency
-
-                elif name == 'observed_expected_ratio':
-                    # should probably take the largest obs/exp ratio  # TODO: check with COHD people to see if this is kosher
-                    # FIXME: the ln_ratio can be negative, so I should probably account for this, but the object model doesn't like -np.inf
-                    value = float("-inf")  # FIXME: unclear in object model if attribute type dictates value type, or if value always needs to be a string
-
-                    ###############################
-                    # The following code was an experiment to see if it would speed things up, leaving it out for now since it's difficult to quantify if it does speed things up given the cacheing
-                    #if len(subject_OMOPs) < len(object_OMOPs):
-                    #    for omop1 in subject_OMOPs:
-                    #        omop_to_ln_ratio = dict()
-                    #        response = COHD.get_obs_exp_ratio(omop1, domain="", dataset_id=3)  # use the hierarchical dataset
-                    #        if response:
-                    #            for res in response:
-                    #                omop_to_ln_ratio[str(res['concept_id_2'])] = res['ln_ratio']
-                    #        for omop2 in object_OMOPs:
-                    #            if omop2 in omop_to_ln_ratio:
-                    #                temp_value = omop_to_ln_ratio[omop2]
-                    #                if temp_value > value:
-                    #                    value = temp_value
-                    #else:
-                    #    for omop1 in object_OMOPs:
-                    #        omop_to_ln_ratio = dict()
-                    #        response = COHD.get_obs_exp_ratio(omop1, domain="", dataset_id=3)  # use the hierarchical dataset
-                    #        if response:
-                    #            for res in response:
-                    #                omop_to_ln_ratio[str(res['concept_id_2'])] = res['ln_ratio']
-                    #        for omop2 in subject_OMOPs:
-                    #            if omop2 in omop_to_ln_ratio:
-                    #                temp_value = omop_to_ln_ratio[omop2]
-                    #                if temp_value > value:
-                    #                    value = temp_value
-                    ###################################
-
-                    # for (omop1, omop2) in itertools.product(subject_OMOPs, object_OMOPs):
-                    #     #print(f"{omop1},{omop2}")
-                    #     response = self.cohdIndex.get_obs_exp_ratio(omop1, concept_id_2=omop2, domain="", dataset_id=3)  # use the hierarchical dataset
-                    #     # response is a list, since this function is overloaded and can omit concept_id_2, take the first element
-                    #     if response and 'ln_ratio' in response[0]:
-                    #         temp_val = response[0]['ln_ratio']
-                    #         if temp_val > value:
-                    #             value = temp_val
-                    omop_pairs = [f"{omop1}_{omop2}" for (omop1, omop2) in itertools.product(subject_OMOPs, object_OMOPs)]
-                    if len(omop_pairs) != 0:
-                        res = self.cohdIndex.get_obs_exp_ratio(concept_id_pair=omop_pairs, domain="", dataset_id=3)  # use the hierarchical dataset
-                        if len(res) != 0:
-                            maximum_ln_ratio = res[0]['ln_ratio']  # the result returned from get_paired_concept_freq was sorted by decreasing order
-                            value = maximum_ln_ratio
-
-                elif name == 'chi_square':
-                    value = float("inf")
-                    # for (omop1, omop2) in itertools.product(subject_OMOPs, object_OMOPs):
-                    #     response = self.cohdIndex.get_chi_square(omop1, concept_id_2=omop2, domain="", dataset_id=3)  # use the hierarchical dataset
-                    #     # response is a list, since this function is overloaded and can omit concept_id_2, take the first element
-                    #     if response and 'p-value' in response[0]:
-                    #         temp_val = response[0]['p-value']
-                    #         if temp_val < value:  # looking at p=values, so lower is better
-                    #             value = temp_val
-                    omop_pairs = [f"{omop1}_{omop2}" for (omop1, omop2) in itertools.product(subject_OMOPs, object_OMOPs)]
-                    if len(omop_pairs) != 0:
-                        res = self.cohdIndex.get_chi_square(concept_id_pair=omop_pairs, domain="", dataset_id=3)  # use the hierarchical dataset
-                        if len(res) != 0:
-                            minimum_pvalue = res[0]['p-value']  # the result returned from get_paired_concept_freq was sorted by decreasing order
-                            value = minimum_pvalue
-
-                # create the edge attribute
-                edge_attribute = EdgeAttribute(attribute_type_id=type, original_attribute_name=name, value=str(value), value_url=url)  # populate the edge attribute # FIXME: unclear in object model if attribute type dictates value type, or if value always needs to be a string
-                return edge_attribute
+
+            # figure out which knowledge provider to use for each node (and thus each pair)  # TODO: should handle this in a more structured fashion, does there exist a standardized KP API format?
+            node_to_KPs = dict()
+            for curie in {curie for curie_pair in curie_pairs for curie in curie_pair}:
+                node_descendants = self.biolink_helper.get_descendants(self.node_curie_to_type[curie], include_mixins=False)
+                node_to_KPs[curie] = {KP for KP in self.who_knows_about_what if self.in_common(node_descendants, self.who_knows_about_what[KP])}
+            cohd_curie_pairs = []
+            for (subject_curie, object_curie) in curie_pairs:
+                KP_to_use = None
+                for KP in self.who_knows_about_what:
+                    # see which KP's can label both subjects of information
+                    if KP in node_to_KPs[subject_curie] and KP in node_to_KPs[object_curie]:
+                        KP_to_use = KP
+                if KP_to_use == 'COHD':
+                    cohd_curie_pairs.append((subject_curie, object_curie))
+
+            edge_attributes = dict()
+            if len(cohd_curie_pairs) == 0:
+                return edge_attributes
+            self.response.debug(f"Querying Columbia Open Health data for info about {len(cohd_curie_pairs)} node pairs")
+            # Decide how to handle the response from the KP
+            if name == 'paired_concept_frequency':
+                # sum up all frequencies  #TODO check with COHD people to see if this is kosher
+                default_value = default
+            elif name == 'observed_expected_ratio':
+                # should probably take the largest obs/exp ratio  # TODO: check with COHD people to see if this is kosher
+                # FIXME: the ln_ratio can be negative, so I should probably account for this, but the object model doesn't like -np.inf
+                default_value = float("-inf")  # FIXME: unclear in object model if attribute type dictates value type, or if value always needs to be a string
+            elif name == 'chi_square':
+                default_value = float("inf")
             else:
-                return None
+                default_value = default
+            pair_values = self._get_cohd_values(cohd_curie_pairs, name) if name in ('paired_concept_frequency', 'observed_expected_ratio', 'chi_square') else dict()
+
+            # create the edge attributes
+            for curie_pair in cohd_curie_pairs:
+                value = pair_values.get(curie_pair, default_value)
+                edge_attributes[curie_pair] = EdgeAttribute(attribute_type_id=type, original_attribute_name=name, value=str(value), value_url=url)  # populate the edge attribute # FIXME: unclear in object model if attribute type dictates value type, or if value always needs to be a string
+            return edge_attributes
         except:
             tb = traceback.format_exc()
             error_type, error, _ = sys.exc_info()
             self.response.error(tb, error_code=error_type.__name__)
-            self.response.error(f"Something went wrong when adding the edge attribute from {KP_to_use}.")
+            self.response.error(f"Something went wrong when adding the edge attribute from COHD.")
+
+    def _get_cohd_values(self, curie_pairs, name):
+        """
+        Gets the COHD value (from the hierarchical dataset) for each of the given node pairs: the largest paired concept
+        frequency or ln ratio, or the chi-square p-value that goes with the largest chi-square statistic, over all of
+        the pairs of OMOP ids the two nodes map to. Pairs without any data are left out.
+        """
+        # Flatten all of the OMOP id pairs for all of the node pairs, remembering which node pair each one came from
+        pair_indexes, omop_ids_1, omop_ids_2 = [], [], []
+        for pair_index, (subject_curie, object_curie) in enumerate(curie_pairs):
+            for (omop1, omop2) in itertools.product(self.mapping_curie_to_omop_ids.get(subject_curie, []), self.mapping_curie_to_omop_ids.get(object_curie, [])):
+                pair_indexes.append(pair_index)
+                omop_ids_1.append(omop1)
+                omop_ids_2.append(omop2)
+        if len(pair_indexes) == 0:
+            return dict()
+        found, ranks, values = self._get_omop_pair_values(omop_ids_1, omop_ids_2, name)
+
+        # Then take the best-ranked OMOP pair for each node pair
+        pair_indexes = np.array(pair_indexes)[found]
+        ranks, values = ranks[found], values[found]
+        order = np.lexsort((-ranks, pair_indexes))
+        pair_indexes, values = pair_indexes[order], values[order]
+        is_best = np.concatenate([[True], pair_indexes[1:] != pair_indexes[:-1]]) if len(pair_indexes) else np.zeros(0, dtype=bool)
+        return {curie_pairs[pair_index]: float(value) for pair_index, value in zip(pair_indexes[is_best].tolist(), values[is_best].tolist())}
+
+    def _get_omop_pair_values(self, omop_ids_1, omop_ids_2, name):
+        """
+        Looks up the given OMOP id pairs (as parallel lists) in the hierarchical COHD dataset all at once. Returns arrays
+        saying which pairs were found, what to rank each pair by, and each pair's value.
+        """
+        statistics = {'paired_concept_frequency': ('concept_frequency', 'concept_frequency'),
+                      'observed_expected_ratio': ('ln_ratio', 'ln_ratio'),
+                      'chi_square': ('chi_square', 'chi_square_pvalue')}
+        rank_statistic, value_statistic = statistics[name]
+        if self.cohd_pair_store is not None:
+            found, pair_statistics = self.cohd_pair_store.get_pair_statistics(np.array(omop_ids_1, dtype=np.int64), np.array(omop_ids_2, dtype=np.int64), dataset_id=3)  # use the hierarchical dataset
+            return found, pair_statistics[rank_statistic], pair_statistics[value_statistic]
+
+        # Without the pair store, look everything up in the COHD database with a single query
+        omop_pairs = list({f"{omop1}_{omop2}" for (omop1, omop2) in zip(omop_ids_1, omop_ids_2)})
+        if name == 'paired_concept_frequency':
+            res = self.cohdIndex.get_paired_concept_freq(concept_id_pair=omop_pairs, dataset_id=3)  # use the hierarchical dataset
+            rows = [(row['concept_id_1'], row['concept_id_2'], row['concept_frequency'], row['concept_frequency']) for row in res]
+        elif name == 'observed_expected_ratio':
+            res = self.cohdIndex.get_obs_exp_ratio(concept_id_pair=omop_pairs, domain="", dataset_id=3)  # use the hierarchical dataset
+            rows = [(row['concept_id_1'], row['concept_id_2'], row['ln_ratio'], row['ln_ratio']) for row in res]
+        else:
+            res = self.cohdIndex.get_chi_square(concept_id_pair=omop_pairs, domain="", dataset_id=3)  # use the hierarchical dataset
+            rows = [(row['concept_id_1'], row['concept_id_2'], row['chi_square'], row['p-value']) for row in res]
+        best_rows = dict()
+        for (omop1, omop2, rank, value) in rows:
+            omop_pair = frozenset((str(omop1), str(omop2)))
+            if omop_pair not in best_rows or rank > best_rows[omop_pair][0]:
+                best_rows[omop_pair] = (rank, value)
+        pair_rows = [best_rows.get(frozenset((str(omop1), str(omop2)))) for (omop1, omop2) in zip(omop_ids_1, omop_ids_2)]
+        found = np.array([pair_row is not None for pair_row in pair_rows], dtype=bool)
+        ranks = np.array([pair_row[0] if pair_row is not None else np.nan for pair_row in pair_rows], dtype=float)
+        values = np.array([pair_row[1] if pair_row is not None else np.nan for pair_row in pair_rows], dtype=float)
+        return found, ranks, values
 
     def add_virtual_edge(self, name="", default=0.):
         """
@@ -265,17 +255,15 @@ class OverlayClinicalInfo:
         parameters = self.parameters
         subject_curies_to_decorate = set()
         object_curies_to_decorate = set()
-        curies_to_names = dict()  # FIXME: Super hacky way to get around the fact that COHD can't map CHEMBL drugs
         # identify the nodes that we should be adding virtual edges for
         for key, node in self.message.knowledge_graph.nodes.items():
             if hasattr(node, 'qnode_keys'):
                 if parameters['subject_qnode_key'] in node.qnode_keys:
                     subject_curies_to_decorate.add(key)
-                    curies_to_names[key] = node.name  # FIXME: Super hacky way to get around the fact that COHD can't map CHEMBL drugs
                 if parameters['object_qnode_key'] in node.qnode_keys:
                     object_curies_to_decorate.add(key)
-                    curies_to_names[key] = node.name  # FIXME: Super hacky way to get around the fact that COHD can't map CHEMBL drugs
         added_flag = False  # check to see if any edges where added
+        overlay_edges = []  # (subject, object, edge key) of each virtual edge added, to bind into the results
         # iterate over all pairs of these nodes, add the virtual edge, decorate with the correct attribute
 
         ## call COHD api one time to save time
@@ -283,13 +271,11 @@ class OverlayClinicalInfo:
         curies_to_decorate.update(subject_curies_to_decorate)
         curies_to_decorate.update(object_curies_to_decorate)
         self.mapping_curie_to_omop_ids = self.cohdIndex.get_concept_ids(curies_to_decorate)
-        for (subject_curie, object_curie) in itertools.product(subject_curies_to_decorate, object_curies_to_decorate):
-            # create the edge attribute if it can be
-            edge_attribute = self.make_edge_attribute_from_curies(subject_curie, object_curie,
-                                                                  subject_name=curies_to_names[subject_curie],
-                                                                  object_name=curies_to_names[object_curie],
-                                                                  default=default,
-                                                                  name=name)
+        # create the edge attributes for all pairs at once (if they can be)
+        curie_pairs = list(itertools.product(subject_curies_to_decorate, object_curies_to_decorate))
+        edge_attributes = self.make_edge_attributes_from_curie_pairs(curie_pairs, default=default, name=name) or dict()
+        for (subject_curie, object_curie) in curie_pairs:
+            edge_attribute = edge_attributes.get((subject_curie, object_curie))
             if edge_attribute:
                 added_flag = True
                 # make the edge, add the attribute
@@ -334,8 +320,11 @@ class OverlayClinicalInfo:
                                 attributes=edge_attribute_list)
                 edge.qedge_keys = qedge_keys
                 self.message.knowledge_graph.edges[id] = edge
-                if self.message.results is not None and len(self.message.results) > 0:
-                    ou.update_results_with_overlay_edge(subject_knode_key=subject_key, object_knode_key=object_key, kedge_key=id, message=self.message, log=self.response)
+                overlay_edges.append((subject_key, object_key, id))
+
+        # If there are results, bind the new virtual edges into them
+        if self.message.results is not None and len(self.message.results) > 0:
+            ou.update_results_with_overlay_edges(overlay_edges, message=self.message, log=self.response)
 
         # Now add a q_edge the query_graph since I've added an extra edge to the KG
         if added_flag:
@@ -356,24 +345,18 @@ class OverlayClinicalInfo:
             self.message.query_graph.edges[relation]=q_edge
 
     def add_all_edges(self, name="", default=0.):
-        curies_to_names = dict()
-        all_curie_set = set()
-        for key, node in self.message.knowledge_graph.nodes.items():
-            curies_to_names[key] = node.name
-            all_curie_set.add(key)
+        all_curie_set = set(self.message.knowledge_graph.nodes)
         self.mapping_curie_to_omop_ids = self.cohdIndex.get_concept_ids(all_curie_set)
+        # create the edge attributes for all edges at once
+        curie_pairs = list({(edge.subject, edge.object) for edge in self.message.knowledge_graph.edges.values()})
+        edge_attributes = self.make_edge_attributes_from_curie_pairs(curie_pairs, default=default, name=name) or dict()
         for edge in self.message.knowledge_graph.edges.values():
             if not edge.attributes:  # populate if not already there
                 edge.attributes = []
-            subject_curie = edge.subject
-            object_curie = edge.object
-            edge_attribute = self.make_edge_attribute_from_curies(subject_curie, object_curie,
-                                                                  subject_name=curies_to_names[subject_curie],
-                                                                  object_name=curies_to_names[object_curie],
-                                                                  default=default,
-                                                                  name=name)  # FIXME: Super hacky way to get around the fact that COHD can't map CHEMBL drugs
+            edge_attribute = edge_attributes.pop((edge.subject, edge.object), None)
             if edge_attribute:  # make sure an edge attribute was actually created
                 edge.attributes.append(edge_attribute)
+                edge_attributes[(edge.subject, edge.object)] = copy.deepcopy(edge_attribute)  # parallel edges each get their own copy
 
     def paired_concept_frequency(self, default=0):
         """
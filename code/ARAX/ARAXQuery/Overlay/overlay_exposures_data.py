@@ -64,6 +64,7 @@ class OverlayExposuresData:
         known_object_curies = {curie for curie in object_curies if self._get_accepted_synonyms(curie)}
 
         num_node_pairs_recognized = 0
+        overlay_edges = []  # (subject, object, edge key) of each virtual edge added, to bind into the results
         for subject_curie, object_curie in ou.get_node_pairs_to_overlay(subject_qnode_key, object_qnode_key, query_graph, knowledge_graph, log):
             # Query ICEES only for synonyms it 'knows' about
             if subject_curie in known_subject_curies and object_curie in known_object_curies:
@@ -86,8 +87,7 @@ class OverlayExposuresData:
                         while id in knowledge_graph.edges:
                             id = old_id+f".{random.randint(10**(9-1), (10**9)-1)}"
                         knowledge_graph.edges[id] = virtual_edge
-                        if self.message.results is not None and len(self.message.results) > 0:
-                            ou.update_results_with_overlay_edge(subject_knode_key=subject_curie, object_knode_key=object_curie, kedge_key=id, message=self.message, log=log)
+                        overlay_edges.append((subject_curie, object_curie, id))
                         break  # Don't worry about checking remaining synonym combos if we got results
             # Add an 'empty' virtual edge (p-value of None) if we couldn't find any results for this node pair #1009
             id, empty_virtual_edge = self._create_icees_virtual_edge(subject_curie, object_curie, None)
@@ -95,6 +95,10 @@ class OverlayExposuresData:
                 id = old_id+f".{random.randint(10**(9-1), (10**9)-1)}"
             knowledge_graph.edges[id] = empty_virtual_edge
 
+        # If there are results, bind the new virtual edges into them
+        if self.message.results is not None and len(self.message.results) > 0:
+            ou.update_results_with_overlay_edges(overlay_edges, message=self.message, log=log)
+
         # Add a qedge to the query graph that corresponds to our new virtual edges
         # new_qedge = QEdge(id=self.virtual_relation_label,
         #                   subject_key=subject_qnode_key,
@@ -4,6 +4,7 @@ import itertools
 import os
 import sys
 import traceback
+from collections import defaultdict
 from typing import Dict, Optional, Set, Tuple, List
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../../UI/OpenAPI/python-flask-server/")
@@ -99,22 +100,53 @@ def determine_virtual_qedge_option_group(subject_qnode_key: str, object_qnode_ke
     else:
         return None
 
-def update_results_with_overlay_edge(subject_knode_key: str, object_knode_key: str, kedge_key: str, message: Message, log: ARAXResponse):
+def update_results_with_overlay_edges(overlay_edges: List[Tuple[str, str, str]], message: Message, log: ARAXResponse):
+    """
+    Adds edge bindings for the given new virtual edges (each given as (subject_knode_key, object_knode_key, kedge_key))
+    to the results in one pass. A virtual edge gets bound under each of a result's qedges whose subject/object nodes
+    (in that result) include both of the virtual edge's nodes. Each node in the results is indexed to the
+    result/qedge bindings it appears in, so each virtual edge only has to look at the bindings its two nodes share.
+    """
+    if not overlay_edges or not message.results:
+        return
     try:
-        new_edge_binding = EdgeBinding(id=kedge_key)
+        # Index which result edge binding lists each KG node could get virtual edges bound in
+        binding_lists = []  # (edge binding list, IDs of edges already bound in that list)
+        binding_list_indexes_by_node_key = defaultdict(set)
+        num_unknown_qedge_bindings = 0
         for result in message.results:
-            for qedge_key in result.edge_bindings.keys():
-                if kedge_key not in set([x.id for x in result.edge_bindings[qedge_key]]):
-                    if qedge_key not in message.query_graph.edges:
-                        log.warning(f"Encountered a result edge binding which does not exist in the query graph")
-                        continue
-                    subject_nodes = [x.id for x in result.node_bindings[message.query_graph.edges[qedge_key].subject]]
-                    object_nodes = [x.id for x in result.node_bindings[message.query_graph.edges[qedge_key].object]]
-                    result_nodes = set(subject_nodes).union(set(object_nodes))
-                    if subject_knode_key in result_nodes and object_knode_key in result_nodes:
-                        result.edge_bindings[qedge_key].append(new_edge_binding)
+            for qedge_key, edge_binding_list in result.edge_bindings.items():
+                if qedge_key not in message.query_graph.edges:
+                    num_unknown_qedge_bindings += 1
+                    continue
+                qedge = message.query_graph.edges[qedge_key]
+                result_nodes = {node_binding.id for node_binding in result.node_bindings[qedge.subject]}.union(
+                    {node_binding.id for node_binding in result.node_bindings[qedge.object]})
+                binding_list_index = len(binding_lists)
+                binding_lists.append((edge_binding_list, {edge_binding.id for edge_binding in edge_binding_list}))
+                for node_key in result_nodes:
+                    binding_list_indexes_by_node_key[node_key].add(binding_list_index)
+        if num_unknown_qedge_bindings:
+            log.warning(f"Encountered {num_unknown_qedge_bindings} result edge bindings which do not exist in the query graph")
+
+        # Then bind each virtual edge to the result edge binding lists that contain both of its nodes
+        no_binding_lists = set()
+        for subject_knode_key, object_knode_key, kedge_key in overlay_edges:
+            shared_binding_list_indexes = binding_list_indexes_by_node_key.get(subject_knode_key, no_binding_lists).intersection(
+                binding_list_indexes_by_node_key.get(object_knode_key, no_binding_lists))
+            if shared_binding_list_indexes:
+                new_edge_binding = EdgeBinding(id=kedge_key)
+                for binding_list_index in sorted(shared_binding_list_indexes):
+                    edge_binding_list, bound_edge_keys = binding_lists[binding_list_index]
+                    if kedge_key not in bound_edge_keys:
+                        edge_binding_list.append(new_edge_binding)
+                        bound_edge_keys.add(kedge_key)
     except:
         tb = traceback.format_exc()
-        log.error(f"Error encountered when modifying results with overlay edge (subject_knode_key)-kedge_key-(object_knode_key):\n{tb}",
-                    error_code="UncaughtError")
+        log.error(f"Error encountered when modifying results with {len(overlay_edges)} overlay edges:\n{tb}",
+                  error_code="UncaughtError")
+
 
+def update_results_with_overlay_edge(subject_knode_key: str, object_knode_key: str, kedge_key: str, message: Message, log: ARAXResponse):
+    # Prefer update_results_with_overlay_edges() (which handles all of a virtual qedge's edges at once) where possible
+    update_results_with_overlay_edges([(subject_knode_key, object_knode_key, kedge_key)], message, log)
@@ -148,6 +148,74 @@ class PredictDrugTreatsDisease:
 
         return curies_in_model
 
+    def _get_canonical_nodes(self, curies):
+        """
+        Canonicalizes all of the given curies with one synonymizer call, and notes whether each is a drug and/or a disease
+        (based on all of its categories). Curies the synonymizer doesn't know are left out.
+        """
+        normalizer_result = self.synonymizer.get_canonical_curies(curies=list(curies), return_all_categories=True) if curies else dict()
+        drug_labels = set(self.drug_ancestor_label_list)
+        disease_labels = set(self.disease_ancestor_label_list)
+        canonical_nodes = dict()
+        for curie, normalized_node in normalizer_result.items():
+            if normalized_node is not None:
+                all_types = {item.replace('biolink:','').replace('_','').lower() for item in normalized_node['all_categories']}
+                canonical_nodes[curie] = {'preferred_curie': normalized_node['preferred_curie'],
+                                          'is_drug': len(drug_labels.intersection(all_types)) > 0,
+                                          'is_disease': len(disease_labels.intersection(all_types)) > 0}
+        return canonical_nodes
+
+    def _get_probabilities(self, drug_disease_pairs):
+        """
+        Gets the treatment probability of every given (drug, disease) pair of preferred curies at once, either from the
+        DTD database or from the DTD model. Pairs without a probability are left out.
+        """
+        probabilities = dict()
+        if len(drug_disease_pairs) == 0:
+            return probabilities
+        if self.use_prob_db is True:
+            probabilities = self.pred.get_probs_from_DTD_db_for_pairs(list(drug_disease_pairs))
+        else:
+            count, found_pairs, found_probabilities = self.pred.prob_all(list(drug_disease_pairs))
+            if count != 0:
+                if count == 1:
+                    self.response.warning(f"Total {count} curie was not found from DTD database")
+                else:
+                    self.response.warning(f"Total {count} curie were not found from DTD database")
+            if found_pairs is not None:
+                probabilities = dict(zip(found_pairs, found_probabilities))
+        return probabilities
+
+    def _get_virtual_edge_probabilities(self, source_curies, target_curies):
+        """
+        Gets the treatment probability for every (source, target) pair of the given nodes, canonicalizing all of the nodes
+        and fetching all of the probabilities at once. Only probabilities that pass the threshold are returned.
+        """
+        canonical_nodes = self._get_canonical_nodes(set(source_curies).union(target_curies))
+        pair_to_drug_disease = dict()
+        for (source_curie, target_curie) in itertools.product(source_curies, target_curies):
+            source_node, target_node = canonical_nodes.get(source_curie), canonical_nodes.get(target_curie)
+            if source_node is None or target_node is None:
+                continue
+            if self.use_prob_db is True:
+                # The DTD database is keyed by drug and disease, so the pair can be in either order
+                if source_node['is_drug']:
+                    if target_node['is_disease']:
+                        pair_to_drug_disease[(source_curie, target_curie)] = (source_node['preferred_curie'], target_node['preferred_curie'])
+                elif source_node['is_disease'] and target_node['is_drug']:
+                    pair_to_drug_disease[(source_curie, target_curie)] = (target_node['preferred_curie'], source_node['preferred_curie'])
+            else:
+                # *We don't check the type of input nodes here #issue1240
+                pair_to_drug_disease[(source_curie, target_curie)] = (source_node['preferred_curie'], target_node['preferred_curie'])
+
+        probabilities = self._get_probabilities(set(pair_to_drug_disease.values()))
+        virtual_edge_probabilities = dict()
+        for pair, drug_disease in pair_to_drug_disease.items():
+            probability = probabilities.get(drug_disease)
+            if probability is not None and np.isfinite(probability) and probability >= self.threshold:
+                virtual_edge_probabilities[pair] = probability
+        return virtual_edge_probabilities
+
     def predict_drug_treats_disease(self):
         """
         Iterate over all the edges in the knowledge graph, add the drug-disease treatment probability for appropriate edges
@@ -199,93 +267,13 @@ class PredictDrugTreatsDisease:
                                 curie_to_name[node_key] = node.name
 
                     added_flag = False  # check to see if any edges where added
-                    # iterate over all pairs of these nodes, add the virtual edge, decorate with the correct attribute
+                    overlay_edges = []  # (subject, object, edge key) of each virtual edge added, to bind into the results
+                    # compute the probabilities for all pairs of these nodes at once, then add the virtual edges, decorated with the correct attribute
+                    probabilities = self._get_virtual_edge_probabilities(source_curies_to_decorate, target_curies_to_decorate)
 
                     for (source_curie, target_curie) in itertools.product(source_curies_to_decorate, target_curies_to_decorate):
                         # self.response.debug(f"Predicting probability that {curie_to_name[source_curie]} treats {curie_to_name[target_curie]}")
-                        # create the edge attribute if it can be
-                        # loop over all equivalent curies and take the highest probability
-
-                        max_probability = 0
-                        if self.use_prob_db is True:
-
-                            converted_source_curie = self.convert_to_trained_curies(source_curie)
-                            if converted_source_curie is None:
-                                continue
-                            else:
-                                all_types = [item.replace('biolink:','').replace('_','').lower() for item in list(converted_source_curie['all_categories'].keys())]
-                                if (len(set(self.drug_ancestor_label_list).intersection(set(all_types))) > 0):
-                                    converted_source_curie = converted_source_curie['preferred_curie']
-                                    converted_target_curie = self.convert_to_trained_curies(target_curie)
-                                    if converted_target_curie is None:
-                                        continue
-                                    else:
-                                        all_types = [item.replace('biolink:','').replace('_','').lower() for item in list(converted_target_curie['all_categories'].keys())]
-                                        if (len(set(self.disease_ancestor_label_list).intersection(set(all_types))) > 0):
-                                            converted_target_curie = converted_target_curie['preferred_curie']
-                                        else:
-                                            continue
-                                elif (len(set(self.disease_ancestor_label_list).intersection(set(all_types))) > 0):
-                                    converted_target_curie = converted_source_curie['preferred_curie']
-                                    converted_source_curie = self.convert_to_trained_curies(target_curie)
-                                    if converted_source_curie is None:
-                                        continue
-                                    else:
-                                        all_types = [item.replace('biolink:','').replace('_','').lower() for item in list(converted_source_curie['all_categories'].keys())]
-                                        if (len(set(self.drug_ancestor_label_list).intersection(set(all_types))) > 0):
-                                            converted_source_curie = converted_source_curie['preferred_curie']
-                                        else:
-                                            continue
-                                else:
-                                    continue
-
-                            probability = self.pred.get_prob_from_DTD_db(converted_source_curie, converted_target_curie)
-
-                            if probability is not None:
-                                if np.isfinite(probability) and probability >= self.threshold:
-                                    max_probability = probability
-
-                        else:
-
-                            converted_source_curie = self.convert_to_trained_curies(source_curie)
-                            if converted_source_curie is None:
-                                continue
-                            else:
-                                # *The code below was commented because we don't need to check the type of input nodes #issue1240
-                                # preferred_type = converted_source_curie['preferred_type']
-                                # if preferred_type == "drug" or preferred_type == "chemical_substance" or preferred_type == "biolink:Drug" or preferred_type == "biolink:ChemicalSubstance":
-                                converted_source_curie = converted_source_curie['preferred_curie']
-                                # else:
-                                #     continue
-                            converted_target_curie = self.convert_to_trained_curies(target_curie)
-                            if converted_target_curie is None:
-                                continue
-                            else:
-                                # *The code below was commented because we don't need to check the type of input nodes #issue1240
-                                # preferred_type = converted_target_curie['preferred_type']
-                                # if preferred_type == "disease" or preferred_type == "phenotypic_feature" or preferred_type == "biolink:Disease" or preferred_type == "biolink:PhenotypicFeature":
-                                converted_target_curie = converted_target_curie['preferred_curie']
-                                # else:
-                                #     continue
-
-                            count, probability = self.pred.prob_single(converted_source_curie, converted_target_curie)
-
-                            if count != 0:
-                                if count == 1:
-                                    self.response.warning(f"Total {count} curie was not found from DTD database")
-                                else:
-                                    self.response.warning(f"Total {count} curie were not found from DTD database")
-
-                            if probability is not None:
-                                probability = probability[0]
-                                if np.isfinite(probability) and probability >= self.threshold:
-                                    max_probability = probability
-                        # if len(res) != 0:
-                        #     all_probabilities = self.pred.prob_all(res)
-                        #     if isinstance(all_probabilities, list):
-                        #         max_probability = max([value for value in all_probabilities if np.isfinite(value)])
-
-                        value = max_probability
+                        value = probabilities.get((source_curie, target_curie), 0)
 
                         #probability = self.pred.prob_single('ChEMBL:' + source_curie[22:], target_curie)  # FIXME: when this was trained, it was ChEMBL:123, not CHEMBL.COMPOUND:CHEMBL123
                         #if probability and np.isfinite(probability):  # finite, that's ok, otherwise, stay with default
@@ -325,8 +313,11 @@ class PredictDrugTreatsDisease:
                                         attributes=edge_attribute_list)
                             edge.qedge_keys = qedge_keys
                             self.message.knowledge_graph.edges[id] = edge
-                            if self.message.results is not None and len(self.message.results) > 0:
-                                ou.update_results_with_overlay_edge(subject_knode_key=subject_key, object_knode_key=object_key, kedge_key=id, message=self.message, log=self.response)
+                            overlay_edges.append((subject_key, object_key, id))
+
+                    # If there are results, bind the new virtual edges into them
+                    if self.message.results is not None and len(self.message.results) > 0:
+                        ou.update_results_with_overlay_edges(overlay_edges, message=self.message, log=self.response)
 
                     # Now add a q_edge the query_graph since I've added an extra edge to the KG
                     if added_flag:
@@ -359,93 +350,13 @@ class PredictDrugTreatsDisease:
                         curie_to_name[node_key] = node.name
 
             added_flag = False  # check to see if any edges where added
-            # iterate over all pairs of these nodes, add the virtual edge, decorate with the correct attribute
+            overlay_edges = []  # (subject, object, edge key) of each virtual edge added, to bind into the results
+            # compute the probabilities for all pairs of these nodes at once, then add the virtual edges, decorated with the correct attribute
+            probabilities = self._get_virtual_edge_probabilities(source_curies_to_decorate, target_curies_to_decorate)
 
             for (source_curie, target_curie) in itertools.product(source_curies_to_decorate, target_curies_to_decorate):
                 # self.response.debug(f"Predicting probability that {curie_to_name[source_curie]} treats {curie_to_name[target_curie]}")
-                # create the edge attribute if it can be
-                # loop over all equivalent curies and take the highest probability
-
-                max_probability = 0
-                if self.use_prob_db is True:
-
-                    converted_source_curie = self.convert_to_trained_curies(source_curie)
-                    if converted_source_curie is None:
-                        continue
-                    else:
-                        all_types = [item.replace('biolink:','').replace('_','').lower() for item in list(converted_source_curie['all_categories'].keys())]
-                        if (len(set(self.drug_ancestor_label_list).intersection(set(all_types))) > 0):
-                            converted_source_curie = converted_source_curie['preferred_curie']
-                            converted_target_curie = self.convert_to_trained_curies(target_curie)
-                            if converted_target_curie is None:
-                                continue
-                            else:
-                                all_types = [item.replace('biolink:','').replace('_','').lower() for item in list(converted_target_curie['all_categories'].keys())]
-                                if (len(set(self.disease_ancestor_label_list).intersection(set(all_types))) > 0):
-                                    converted_target_curie = converted_target_curie['preferred_curie']
-                                else:
-                                    continue
-                        elif (len(set(self.disease_ancestor_label_list).intersection(set(all_types))) > 0):
-                            converted_target_curie = converted_source_curie['preferred_curie']
-                            converted_source_curie = self.convert_to_trained_curies(target_curie)
-                            if converted_source_curie is None:
-                                continue
-                            else:
-                                all_types = [item.replace('biolink:','').replace('_','').lower() for item in list(converted_source_curie['all_categories'].keys())]
-                                if (len(set(self.drug_ancestor_label_list).intersection(set(all_types))) > 0):
-                                    converted_source_curie = converted_source_curie['preferred_curie']
-                                else:
-                                    continue
-                        else:
-                            continue
-
-                    probability = self.pred.get_prob_from_DTD_db(converted_source_curie, converted_target_curie)
-
-                    if probability is not None:
-                        if np.isfinite(probability) and probability >= self.threshold:
-                            max_probability = probability
-
-                else:
-
-                    converted_source_curie = self.convert_to_trained_curies(source_curie)
-                    if converted_source_curie is None:
-                        continue
-                    else:
-                        # *The code below was commented because we don't need to check the type of input nodes #issue1240
-                        # preferred_type = converted_source_curie['preferred_type']
-                        # if preferred_type == "drug" or preferred_type == "chemical_substance" or preferred_type == "biolink:Drug" or preferred_type == "biolink:ChemicalSubstance":
-                        converted_source_curie = converted_source_curie['preferred_curie']
-                        # else:
-                        #     continue
-                    converted_target_curie = self.convert_to_trained_curies(target_curie)
-                    if converted_target_curie is None:
-                        continue
-                    else:
-                        # *The code below was commented because we don't need to check the type of input nodes #issue1240
-                        # preferred_type = converted_target_curie['preferred_type']
-                        # if preferred_type == "disease" or preferred_type == "phenotypic_feature" or preferred_type == "biolink:Disease" or preferred_type == "biolink:PhenotypicFeature":
-                        converted_target_curie = converted_target_curie['preferred_curie']
-                        # else:
-                        #     continue
-
-                    count, probability = self.pred.prob_single(converted_source_curie, converted_target_curie)
-
-                    if count != 0:
-                        if count == 1:
-                            self.response.warning(f"Total {count} curie was not found from DTD database")
-                        else:
-                            self.response.warning(f"Total {count} curie were not found from DTD database")
-
-                    if probability is not None:
-                        probability = probability[0]
-                        if np.isfinite(probability) and probability >= self.threshold:
-                            max_probability = probability
-                # if len(res) != 0:
-                #     all_probabilities = self.pred.prob_all(res)
-                #     if isinstance(all_probabilities, list):
-                #         max_probability = max([value for value in all_probabilities if np.isfinite(value)])
-
-                value = max_probability
+                value = probabilities.get((source_curie, target_curie), 0)
 
                 #probability = self.pred.prob_single('ChEMBL:' + source_curie[22:], target_curie)  # FIXME: when this was trained, it was ChEMBL:123, not CHEMBL.COMPOUND:CHEMBL123
                 #if probability and np.isfinite(probability):  # finite, that's ok, otherwise, stay with default
@@ -485,8 +396,11 @@ class PredictDrugTreatsDisease:
                                 attributes=edge_attribute_list)
                     edge.qedge_keys = qedge_keys
                     self.message.knowledge_graph.edges[id] = edge
-                    if self.message.results is not None and len(self.message.results) > 0:
-                        ou.update_results_with_overlay_edge(subject_knode_key=subject_key, object_knode_key=object_key, kedge_key=id, message=self.message, log=self.response)
+                    overlay_edges.append((subject_key, object_key, id))
+
+            # If there are results, bind the new virtual edges into them
+            if self.message.results is not None and len(self.message.results) > 0:
+                ou.update_results_with_overlay_edges(overlay_edges, message=self.message, log=self.response)
 
             # Now add a q_edge the query_graph since I've added an extra edge to the KG
             if added_flag:
@@ -508,121 +422,38 @@ class PredictDrugTreatsDisease:
                 for node_key, node in self.message.knowledge_graph.nodes.items():
                     curie_to_type[node_key] = node.categories
                     curie_to_name[node_key] = node.name
-                # then iterate over the edges and decorate if appropriate
+                # then find the drug/disease edges whose probabilities need computing
+                drug_disease_edges = []  # (edge key, drug node key, disease node key)
                 for edge_key, edge in self.message.knowledge_graph.edges.items():
                     # Make sure the edge_attributes are not None
                     if not edge.attributes:
                         edge.attributes = []  # should be an array, but why not a list?
-                    # now go and actually get the probability
-                    source_curie = edge.subject
-                    target_curie = edge.object
-                    source_types = [item.replace('biolink:','').replace('_','').lower() for item in curie_to_type[source_curie]]
-                    target_types = [item.replace('biolink:','').replace('_','').lower() for item in curie_to_type[target_curie]]
-
+                    source_types = [item.replace('biolink:','').replace('_','').lower() for item in curie_to_type[edge.subject]]
+                    target_types = [item.replace('biolink:','').replace('_','').lower() for item in curie_to_type[edge.object]]
                     if len(set(source_types).intersection(set(self.drug_ancestor_label_list))) > 0 and len(set(target_types).intersection(set(self.disease_ancestor_label_list))) > 0:
-                        # loop over all pairs of equivalent curies and take the highest probability
-                        # self.response.debug(f"Predicting treatment probability between {curie_to_name[source_curie]} and {curie_to_name[target_curie]}")
-                        max_probability = 0
-                        converted_source_curie = self.convert_to_trained_curies(source_curie)
-                        if converted_source_curie is None:
-                            continue
-                        else:
-                            all_types = [item.replace('biolink:','').replace('_','').lower() for item in list(converted_source_curie['all_categories'].keys())]
-                            if (len(set(self.drug_ancestor_label_list).intersection(set(all_types))) > 0):
-                                converted_source_curie = converted_source_curie['preferred_curie']
-                            else:
-                                continue
-                        converted_target_curie = self.convert_to_trained_curies(target_curie)
-                        if converted_target_curie is None:
-                            continue
-                        else:
-                            all_types = [item.replace('biolink:','').replace('_','').lower() for item in list(converted_target_curie['all_categories'].keys())]
-                            if (len(set(self.disease_ancestor_label_list).intersection(set(all_types))) > 0):
-                                converted_target_curie = converted_target_curie['preferred_curie']
-                            else:
-                                continue
-                        if self.use_prob_db is True:
-                            probability = self.pred.get_prob_from_DTD_db(converted_source_curie, converted_target_curie)
-                            if probability is not None:
-                                if np.isfinite(probability):
-                                    max_probability = probability
-                        else:
-                            count, probability = self.pred.prob_single(converted_source_curie, converted_target_curie)
-
-                            if count != 0:
-                                if count == 1:
-                                    self.response.warning(f"Total {count} curie was not found from DTD database")
-                                else:
-                                    self.response.warning(f"Total {count} curie were not found from DTD database")
-
-                            if probability is not None:
-                                probability = probability[0]
-                                if np.isfinite(probability) and probability >= self.threshold:
-                                    max_probability = probability
-                        # res = list(itertools.product(converted_source_curie, converted_target_curie))
-                        # if len(res) != 0:
-                        #     all_probabilities = self.pred.prob_all(res)
-                        #     if isinstance(all_probabilities, list):
-                        #         max_probability = max([value for value in all_probabilities if np.isfinite(value)])
-
-                        value = max_probability
-
+                        drug_disease_edges.append((edge_key, edge.subject, edge.object))
                     elif len(set(target_types).intersection(set(self.drug_ancestor_label_list))) > 0 and len(set(source_types).intersection(set(self.disease_ancestor_label_list))) > 0:
-                        #probability = self.pred.prob_single('ChEMBL:' + target_curie[22:], source_curie)  # FIXME: when this was trained, it was ChEMBL:123, not CHEMBL.COMPOUND:CHEMBL123
-                        #if probability and np.isfinite(probability):  # finite, that's ok, otherwise, stay with default
-                        #    value = probability[0]
-                        # self.response.debug(f"Predicting treatment probability between {curie_to_name[source_curie]} and {curie_to_name[target_curie]}")
-                        max_probability = 0
-                        converted_source_curie = self.convert_to_trained_curies(source_curie)
-                        if converted_source_curie is None:
-                            continue
-                        else:
-                            all_types = [item.replace('biolink:','').replace('_','').lower() for item in list(converted_source_curie['all_categories'].keys())]
-                            if (len(set(self.disease_ancestor_label_list).intersection(set(all_types))) > 0):
-                                converted_source_curie = converted_source_curie['preferred_curie']
-                            else:
-                                continue
-                        converted_target_curie = self.convert_to_trained_curies(target_curie)
-                        if converted_target_curie is None:
-                            continue
-                        else:
-                            all_types = [item.replace('biolink:','').replace('_','').lower() for item in list(converted_target_curie['all_categories'].keys())]
-                            if (len(set(self.drug_ancestor_label_list).intersection(set(all_types))) > 0):
-                                converted_target_curie = converted_target_curie['preferred_curie']
-                            else:
-                                continue
-
-                        if self.use_prob_db is True:
-                            probability = self.pred.get_prob_from_DTD_db(converted_target_curie, converted_source_curie)
-                            if probability is not None:
-                                if np.isfinite(probability):
-                                    max_probability = probability
-                        else:
-                            count, probability = self.pred.prob_single(converted_target_curie, converted_source_curie)
-
-                            if count != 0:
-                                if count == 1:
-                                    self.response.warning(f"Total {count} curie was not found from DTD database")
-                                else:
-                                    self.response.warning(f"Total {count} curie were not found from DTD database")
-
-                            if probability is not None:
-                                probability = probability[0]
-                                if np.isfinite(probability) and probability >= self.threshold:
-                                    max_probability = probability
-                        # res = list(itertools.product(converted_target_curie, converted_source_curie))
-                        # if len(res) != 0:
-                        #     all_probabilities = self.pred.prob_all(res)
-                        #     if isinstance(all_probabilities, list):
-                        #         max_probability = max([value for value in all_probabilities if np.isfinite(value)])
-
-                        value = max_probability
-
-                    else:
-                        continue
+                        drug_disease_edges.append((edge_key, edge.object, edge.subject))
+
+                # canonicalize all of their nodes at once, and keep the edges whose canonical nodes are still a drug and a disease
+                canonical_nodes = self._get_canonical_nodes({node_key for _, drug_key, disease_key in drug_disease_edges for node_key in (drug_key, disease_key)})
+                edge_key_to_drug_disease = dict()
+                for edge_key, drug_key, disease_key in drug_disease_edges:
+                    drug_node, disease_node = canonical_nodes.get(drug_key), canonical_nodes.get(disease_key)
+                    if drug_node is not None and disease_node is not None and drug_node['is_drug'] and disease_node['is_disease']:
+                        edge_key_to_drug_disease[edge_key] = (drug_node['preferred_curie'], disease_node['preferred_curie'])
+
+                # then get all of their probabilities at once and decorate the edges
+                probabilities = self._get_probabilities(set(edge_key_to_drug_disease.values()))
+                for edge_key, drug_disease in edge_key_to_drug_disease.items():
+                    probability = probabilities.get(drug_disease)
+                    value = 0
+                    if probability is not None and np.isfinite(probability):
+                        if self.use_prob_db is True or probability >= self.threshold:
+                            value = probability
                     if value != 0:
                         edge_attribute = EdgeAttribute(attribute_type_id=attribute_type, original_attribute_name=attribute_name, value=str(value), value_url=url)  # populate the attribute
-                        edge.attributes.append(edge_attribute)  # append it to the list of attributes
+                        self.message.knowledge_graph.edges[edge_key].attributes.append(edge_attribute)  # append it to the list of attributes
             except:
                 tb = traceback.format_exc()
                 error_type, error, _ = sys.exc_info()
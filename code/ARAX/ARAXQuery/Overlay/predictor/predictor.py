@@ -1,4 +1,5 @@
 import os
+import json
 import pandas as pd
 import numpy as np
 import sqlite3
@@ -18,6 +19,8 @@ sys.path.append(os.path.sep.join([*pathlist[:(RTXindex + 1)], 'code']))
 from RTXConfiguration import RTXConfiguration
 RTXConfig = RTXConfiguration()
 
+LOOKUP_BATCH_SIZE = 5000
+
 
 class predictor():
     def __init__(self, DTD_prob_file=os.path.sep.join([*pathlist[:(RTXindex + 1)], 'code', 'ARAX', 'KnowledgeSources', 'Prediction', RTXConfig.dtd_prob_path.split('/')[-1]]), model_file=os.path.sep.join([*pathlist[:(RTXindex + 1)], 'code', 'ARAX', 'KnowledgeSources', 'Prediction', RTXConfig.log_model_path.split('/')[-1]]), use_prob_db=True, live = None):
@@ -60,7 +63,7 @@ class predictor():
             print(f"ERROR: The 'curie_name' has to be a str")
             return None
 
-        row = self.graph_cur.execute(f"select * from GRAPH where curie='{curie_name}'")
+        row = self.graph_cur.execute("select * from GRAPH where curie = ?", (curie_name,))
         res = row.fetchone()
         if res is None:
             # print(f"No curie named '{curie_name}' was found from database")
@@ -69,6 +72,25 @@ class predictor():
         res.pop(0)
         return res
 
+    def get_features(self, curie_names):
+        """
+        Retrieve the features of all the given curie ids from database at once
+
+        :param curie_names: a list of curie names
+        return a dict mapping each curie name found in the database to its row in the returned 2-D numpy array of features
+        """
+        curie_names = list(set(curie_names))
+        curie_to_row = dict()
+        feature_rows = []
+        for start in range(0, len(curie_names), LOOKUP_BATCH_SIZE):
+            batch = curie_names[start:start + LOOKUP_BATCH_SIZE]
+            rows = self.graph_cur.execute("select * from GRAPH where curie in (select value from json_each(?))", (json.dumps(batch),))
+            for row in rows:
+                if row[0] not in curie_to_row:
+                    curie_to_row[row[0]] = len(feature_rows)
+                    feature_rows.append(row[1:])
+        return curie_to_row, np.array(feature_rows, dtype=float)
+
     def import_file(self, file, graph_database=os.path.sep.join([*pathlist[:(RTXindex + 1)], 'code', 'ARAX', 'KnowledgeSources', 'Prediction', RTXConfig.graph_database_path.split('/')[-1]]), live = None):
         """
         Imports all necisary files to take curie ids and extract their feature vectors.
@@ -283,27 +305,15 @@ class predictor():
                 self.import_file(None)
 
             if isinstance(source_target_curie_list, list):
-
-                X_list = []
-                out_source_target_curie_list = list()
-                count = 0
-                for (equiv_source_curie, equiv_target_curie) in source_target_curie_list:
-
-                    source_feature = self.get_feature(equiv_source_curie)
-                    target_feature = self.get_feature(equiv_target_curie)
-
-                    if source_feature is None:
-                        count += 1
-                    if target_feature is None:
-                        count += 1
-
-                    if source_feature is not None and target_feature is not None:
-                        out_source_target_curie_list += [(equiv_source_curie, equiv_target_curie)]
-                        X_list += [[a * b for a, b in zip(source_feature, target_feature)]]
-                    else:
-                        continue
-                if len(X_list)!=0:
-                    X = np.array(X_list)
+                # Load the features of all curies at once, then score all pairs with a single predict_proba call
+                curie_to_row, features = self.get_features([curie for pair in source_target_curie_list for curie in pair])
+                source_rows = np.array([curie_to_row.get(source_curie, -1) for source_curie, _ in source_target_curie_list], dtype=int)
+                target_rows = np.array([curie_to_row.get(target_curie, -1) for _, target_curie in source_target_curie_list], dtype=int)
+                count = int((source_rows < 0).sum() + (target_rows < 0).sum())
+                found = (source_rows >= 0) & (target_rows >= 0)
+                if found.any():
+                    out_source_target_curie_list = [pair for pair, is_found in zip(source_target_curie_list, found) if is_found]
+                    X = features[source_rows[found]] * features[target_rows[found]]  # use 'Hadamard product' method instead of 'Concatenate' method
                     return [count, out_source_target_curie_list, list(self.prob(X)[:, 1])]
                 else:
                     return [count, None, None]
@@ -319,16 +329,29 @@ class predictor():
         """
 
         if self.use_prob_db is True:
-            cursor = self.connection.cursor()
-            drug = source_curie
-            disease = target_curie
+            return self.get_probs_from_DTD_db_for_pairs([(source_curie, target_curie)]).get((source_curie, target_curie))
 
-            row = cursor.execute(f"select * from DTD_PROBABILITY where disease = '{disease}' and drug = '{drug}'")
-            res = row.fetchone()
-            if res is None:
-                return None
-            else:
-                return res[2]
+    def get_probs_from_DTD_db_for_pairs(self, drug_disease_pairs):
+        """
+        Get the probabilities of many pairs of drug and disease curie ids from DTD probability database at once
+
+        :param drug_disease_pairs: A list containing tuples of the curie ids of a drug and a disease
+        return a dict mapping each pair found in the database to its probability
+        """
+
+        if self.use_prob_db is True:
+            drug_disease_pairs = list(set(drug_disease_pairs))
+            probabilities = dict()
+            for start in range(0, len(drug_disease_pairs), LOOKUP_BATCH_SIZE):
+                batch = drug_disease_pairs[start:start + LOOKUP_BATCH_SIZE]
+                # Each pair is looked up via the (disease, drug) index; if a pair appears more than once, the first row wins
+                rows = self.connection.execute("select D.drug, D.disease, D.probability from "
+                                               "(select json_extract(value, '$[0]') as drug, json_extract(value, '$[1]') as disease from json_each(?)) as P "
+                                               "join DTD_PROBABILITY as D on D.disease = P.disease and D.drug = P.drug "
+                                               "order by D.rowid", (json.dumps(batch),))
+                for drug, disease, probability in rows:
+                    probabilities.setdefault((drug, disease), probability)
+            return probabilities
 
     def get_probs_from_DTD_db_based_on_disease(self, disease_id_list):
         """
@@ -0,0 +1,112 @@
+#!/bin/env python3
+# The path search behind ARAXConnect. Rather than expanding a whole new query graph for each path length and qnode pair,
+# it grows frontiers out from both ends of a pair one hop at a time and joins them in the middle: paths of length k are
+# found by going ceil(k/2) hops out from the first qnode's nodes and the rest of the way out from the second's. Each
+# node's one-hop neighborhood is fetched only once, and each qnode's frontiers are grown only once, so nothing is
+# re-fetched as the path length goes up or when the same qnode is part of several pairs.
+import math
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+
+FORWARD = "forward"  # Hops out from the first qnode of a pair (whose nodes are the subjects of the hop's edges)
+BACKWARD = "backward"  # Hops out from the second qnode of a pair (whose nodes are the objects of the hop's edges)
+
+
+class ConnectPathSearch:
+    """
+    Finds the nodes and edges on paths between two sets of nodes. expand_hop(node_ids, direction) must return the
+    KG nodes and edges (as dicts keyed by id) one hop out from the given nodes, or None if the hop couldn't be expanded.
+    Frontiers with more than max_frontier_size nodes only have the best-connected of those nodes expanded further.
+    """
+
+    def __init__(self, expand_hop: Callable[[List[str], str], Optional[Tuple[Dict[str, any], Dict[str, any]]]],
+                 max_frontier_size: int):
+        self.expand_hop = expand_hop
+        self.max_frontier_size = max_frontier_size
+        self.nodes = dict()
+        self.edges = dict()
+        self.neighborhoods = {FORWARD: dict(), BACKWARD: dict()}  # direction -> node id -> [(edge key, neighbor id)]
+        self.frontiers = dict()  # (start node ids, direction) -> the set of nodes at each depth
+        self.num_hops_expanded = 0
+
+    def find_paths(self, start_ids: Iterable[str], end_ids: Iterable[str],
+                   path_length: int) -> Optional[Tuple[List[Set[str]], List[Set[str]]]]:
+        """
+        Returns the nodes at each position (0 through path_length) and the edges for each hop along the paths of exactly
+        path_length hops from the start nodes to the end nodes, or None if there are no such paths.
+        """
+        forward_depth = math.ceil(path_length / 2)
+        backward_depth = path_length - forward_depth
+        forward_frontiers = self._get_frontiers(start_ids, FORWARD, forward_depth)
+        backward_frontiers = self._get_frontiers(end_ids, BACKWARD, backward_depth)
+        middle_nodes = forward_frontiers[forward_depth].intersection(backward_frontiers[backward_depth])
+        if not middle_nodes:
+            return None
+
+        # Walk back from the middle to the start and on from the middle to the end, keeping only nodes/edges on paths
+        position_nodes = [set() for _ in range(path_length + 1)]
+        hop_edges = [set() for _ in range(path_length)]
+        position_nodes[forward_depth] = middle_nodes
+        for position in range(forward_depth, 0, -1):
+            self._add_hops_into(forward_frontiers[position - 1], FORWARD, position_nodes[position],
+                                position_nodes[position - 1], hop_edges[position - 1])
+        for position in range(forward_depth, path_length):
+            self._add_hops_into(backward_frontiers[path_length - position - 1], BACKWARD, position_nodes[position],
+                                position_nodes[position + 1], hop_edges[position])
+        return position_nodes, hop_edges
+
+    def _add_hops_into(self, frontier: Set[str], direction: str, target_nodes: Set[str], nodes_on_paths: Set[str],
+                       edges_on_paths: Set[str]):
+        neighborhoods = self.neighborhoods[direction]
+        for node_id in frontier:
+            for edge_key, neighbor_id in neighborhoods.get(node_id, []):
+                if neighbor_id in target_nodes:
+                    nodes_on_paths.add(node_id)
+                    edges_on_paths.add(edge_key)
+
+    def _get_frontiers(self, start_ids: Iterable[str], direction: str, depth: int) -> List[Set[str]]:
+        start_ids = frozenset(start_ids)
+        frontiers = self.frontiers.setdefault((start_ids, direction), [set(start_ids)])
+        while len(frontiers) <= depth:
+            node_ids_to_expand = self._choose_nodes_to_expand(frontiers, direction)
+            self._expand(node_ids_to_expand, direction)
+            neighborhoods = self.neighborhoods[direction]
+            frontiers.append({neighbor_id for node_id in node_ids_to_expand
+                              for _, neighbor_id in neighborhoods.get(node_id, [])})
+        return frontiers
+
+    def _choose_nodes_to_expand(self, frontiers: List[Set[str]], direction: str) -> List[str]:
+        frontier = frontiers[-1]
+        if len(frontier) <= self.max_frontier_size or len(frontiers) < 2:
+            return sorted(frontier)
+        # Prefer the nodes that the most edges from the previous frontier lead to
+        num_edges_to_node = dict.fromkeys(frontier, 0)
+        neighborhoods = self.neighborhoods[direction]
+        for node_id in frontiers[-2]:
+            for _, neighbor_id in neighborhoods.get(node_id, []):
+                if neighbor_id in num_edges_to_node:
+                    num_edges_to_node[neighbor_id] += 1
+        return sorted(frontier, key=lambda node_id: (-num_edges_to_node[node_id], node_id))[:self.max_frontier_size]
+
+    def _expand(self, node_ids: List[str], direction: str):
+        neighborhoods = self.neighborhoods[direction]
+        node_ids_to_expand = [node_id for node_id in node_ids if node_id not in neighborhoods]
+        if not node_ids_to_expand:
+            return
+        self.num_hops_expanded += 1
+        answer = self.expand_hop(node_ids_to_expand, direction)
+        if answer is None:
+            return  # These nodes may be retried later (e.g., as part of another frontier)
+        nodes, edges = answer
+        self.nodes.update(nodes)
+        self.edges.update(edges)
+        new_neighborhoods = {node_id: [] for node_id in node_ids_to_expand}
+        # Edges are taken in either direction, since KPs don't always stick to the direction they're asked for
+        for edge_key, edge in edges.items():
+            if edge.subject == edge.object:
+                continue
+            if edge.subject in new_neighborhoods:
+                new_neighborhoods[edge.subject].append((edge_key, edge.object))
+            if edge.object in new_neighborhoods:
+                new_neighborhoods[edge.object].append((edge_key, edge.subject))
+        neighborhoods.update(new_neighborhoods)
@@ -0,0 +1,247 @@
+#!/bin/env python3
+# This file contains a read-only, memory-mapped store of the KG2c node/edge properties that ARAXDecorator adds to
+# KGs. It is derived from kg2c.sqlite (see build_kg2c_property_store()). Lookups are simple hash table probes into
+# the mapped file, and values are stored already decoded (as JSON), so decorating a KG avoids both SQL and per-property
+# parsing. Because the file is only ever mapped read-only, all forked ARAX workers share the same page cache copy.
+import hashlib
+import mmap
+import os
+import struct
+import sys
+import zlib
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import ujson
+
+
+def eprint(*args, **kwargs): print(*args, file=sys.stderr, **kwargs)
+
+
+MAGIC = b"KG2CPROP"
+FORMAT_VERSION = 1
+SECTIONS = ["nodes", "triple", "node_pair"]  # Nodes are keyed by ID, edges by triple and by node pair
+HEADER = struct.Struct("<8sIQ")  # magic, format version, metadata length (metadata JSON follows the header)
+SECTION_ENTRY = struct.Struct("<QQQ")  # bucket array offset, number of buckets, number of records
+RECORD_HEADER = struct.Struct("<IIB")  # key length, value length, flags
+FLAG_COMPRESSED = 1
+COMPRESSION_THRESHOLD = 512  # Values (in bytes) longer than this are zlib-compressed
+LOAD_FACTOR = 0.5
+ARRAY_DELIMITER_CHAR = "ǂ"
+
+
+def _hash_key(key: bytes) -> int:
+    # Must be stable across processes (so no builtin hash())
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "little")
+
+
+def load_kg2c_property(value_type: type, raw_value: Optional[str]) -> any:
+    """
+    Decodes a property value as stored in kg2c.sqlite (lists are delimiter-joined strings, dicts are JSON).
+    """
+    if not raw_value:
+        return None
+    elif value_type is list:
+        return [item for item in raw_value.split(ARRAY_DELIMITER_CHAR) if item]
+    elif value_type is dict:
+        return ujson.loads(raw_value)
+    else:
+        return raw_value
+
+
+def merge_kg2c_properties(property_dicts: Iterable[Dict[str, any]]) -> Dict[str, any]:
+    """
+    Joins the (decoded) properties of several KG2c edges that share a search key; list values are unioned and dict
+    values are merged.
+    """
+    merged = dict()
+    for property_dict in property_dicts:
+        for property_name, value in property_dict.items():
+            if not value:
+                continue
+            elif property_name not in merged:
+                merged[property_name] = list(dict.fromkeys(value)) if isinstance(value, list) else value
+            elif isinstance(value, list):
+                merged[property_name] = list(dict.fromkeys(merged[property_name] + value))
+            elif isinstance(value, dict):
+                merged[property_name] = {**merged[property_name], **value}
+    return merged
+
+
+class KG2cPropertyStore:
+    """
+    Read-only view of a KG2c property store file. Use get_kg2c_property_store() to grab the (process-wide) instance.
+    """
+
+    def __init__(self, store_path: str):
+        self.store_path = store_path
+        with open(store_path, "rb") as store_file:
+            self._mmap = mmap.mmap(store_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, format_version, metadata_length = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or format_version != FORMAT_VERSION:
+            raise ValueError(f"{store_path} is not a version {FORMAT_VERSION} KG2c property store")
+        sections_start = HEADER.size + metadata_length
+        self.metadata = ujson.loads(self._mmap[HEADER.size:sections_start])
+        self._sections = dict()
+        for index, section_name in enumerate(SECTIONS):
+            bucket_offset, num_buckets, num_records = SECTION_ENTRY.unpack_from(self._mmap, sections_start + index * SECTION_ENTRY.size)
+            buckets = memoryview(self._mmap)[bucket_offset:bucket_offset + num_buckets * 8].cast("Q")
+            self._sections[section_name] = (buckets, num_buckets, num_records)
+
+    def is_current(self, sqlite_path: str, node_properties: List[str], edge_properties: List[str]) -> bool:
+        """
+        Returns whether this store was built from the given kg2c.sqlite file (as it is now) with the given properties.
+        """
+        try:
+            stat = os.stat(sqlite_path)
+        except OSError:
+            return False
+        return (self.metadata.get("source_size") == stat.st_size and
+                self.metadata.get("source_mtime") == int(stat.st_mtime) and
+                self.metadata.get("node_properties") == list(node_properties) and
+                self.metadata.get("edge_properties") == list(edge_properties))
+
+    def get_many(self, section_name: str, keys: Iterable[str]) -> Dict[str, Dict[str, any]]:
+        """
+        Returns the decoded properties for the given keys in the given section ("nodes", "triple", or "node_pair");
+        keys that aren't in the store are left out.
+        """
+        buckets, num_buckets, _ = self._sections[section_name]
+        found = dict()
+        if not num_buckets:
+            return found
+        mapped = self._mmap
+        for key in keys:
+            key_bytes = key.encode()
+            bucket = _hash_key(key_bytes) % num_buckets
+            while True:
+                record_offset = buckets[bucket]
+                if not record_offset:
+                    break
+                key_length, value_length, flags = RECORD_HEADER.unpack_from(mapped, record_offset)
+                key_start = record_offset + RECORD_HEADER.size
+                if key_length == len(key_bytes) and mapped[key_start:key_start + key_length] == key_bytes:
+                    value_bytes = mapped[key_start + key_length:key_start + key_length + value_length]
+                    if flags & FLAG_COMPRESSED:
+                        value_bytes = zlib.decompress(value_bytes)
+                    found[key] = ujson.loads(value_bytes)
+                    break
+                bucket = (bucket + 1) % num_buckets
+        return found
+
+    def close(self):
+        for buckets, _, _ in self._sections.values():
+            buckets.release()
+        self._sections = dict()
+        self._mmap.close()
+
+
+_stores: Dict[str, Tuple[int, KG2cPropertyStore]] = dict()
+
+
+def get_kg2c_property_store(store_path: str) -> Optional[KG2cPropertyStore]:
+    """
+    Returns the (process-wide, memory-mapped) store at the given path, or None if there isn't a valid one there. The
+    mapping survives forks, so workers forked after this is first called all share it.
+    """
+    try:
+        mtime = os.stat(store_path).st_mtime_ns
+    except OSError:
+        return None
+    if store_path not in _stores or _stores[store_path][0] != mtime:
+        try:
+            _stores[store_path] = (mtime, KG2cPropertyStore(store_path))
+        except (OSError, ValueError) as e:
+            eprint(f"WARNING: Couldn't open KG2c property store {store_path}: {e}")
+            return None
+    return _stores[store_path][1]
+
+
+def build_kg2c_property_store(sqlite_path: str, store_path: str, node_properties: Dict[str, type],
+                              edge_properties: Dict[str, type]):
+    """
+    Builds a property store containing the given node/edge properties from the given kg2c.sqlite file. The store is
+    written to a temporary file and moved into place at the end, so readers never see a partial store.
+    """
+    import sqlite3
+    stat = os.stat(sqlite_path)
+    metadata = ujson.dumps({"source_size": stat.st_size,
+                            "source_mtime": int(stat.st_mtime),
+                            "node_properties": list(node_properties),
+                            "edge_properties": list(edge_properties)}).encode()
+    sections_start = HEADER.size + len(metadata)
+    records_start = sections_start + len(SECTIONS) * SECTION_ENTRY.size
+
+    connection = sqlite3.connect(f"file:{sqlite_path}?mode=ro", uri=True)
+    node_cols_str = ", ".join(node_properties)
+    edge_cols_str = ", ".join(edge_properties)
+    node_rows = connection.execute(f"SELECT id, {node_cols_str} FROM nodes")
+    triple_rows = connection.execute(f"SELECT triple, {edge_cols_str} FROM edges")
+    node_pair_rows = connection.execute(f"SELECT node_pair, {edge_cols_str} FROM edges ORDER BY node_pair")
+
+    temp_path = f"{store_path}.tmp{os.getpid()}"
+    section_entries = []
+    with open(temp_path, "wb") as store_file:
+        store_file.write(b"\0" * records_start)
+        offset = records_start
+        for section_name, rows in [("nodes", node_rows), ("triple", triple_rows), ("node_pair", node_pair_rows)]:
+            eprint(f"Writing {section_name} section of KG2c property store..")
+            property_types = node_properties if section_name == "nodes" else edge_properties
+            hashes_and_offsets = []
+            for key, properties in _group_rows(rows, property_types, merge=section_name != "nodes"):
+                key_bytes = key.encode()
+                value_bytes = ujson.dumps(properties, ensure_ascii=False).encode()
+                flags = 0
+                if len(value_bytes) > COMPRESSION_THRESHOLD:
+                    value_bytes = zlib.compress(value_bytes)
+                    flags |= FLAG_COMPRESSED
+                store_file.write(RECORD_HEADER.pack(len(key_bytes), len(value_bytes), flags))
+                store_file.write(key_bytes)
+                store_file.write(value_bytes)
+                hashes_and_offsets.append((_hash_key(key_bytes), offset))
+                offset += RECORD_HEADER.size + len(key_bytes) + len(value_bytes)
+
+            # Then write this section's hash table (linear probing; 0 marks an empty bucket)
+            num_buckets = max(int(len(hashes_and_offsets) / LOAD_FACTOR), 1)
+            buckets = array("Q", bytes(8 * num_buckets))
+            for key_hash, record_offset in hashes_and_offsets:
+                bucket = key_hash % num_buckets
+                while buckets[bucket]:
+                    bucket = (bucket + 1) % num_buckets
+                buckets[bucket] = record_offset
+            padding = (-offset) % 8  # Keep the bucket array 8-byte aligned
+            store_file.write(b"\0" * padding)
+            offset += padding
+            section_entries.append(SECTION_ENTRY.pack(offset, num_buckets, len(hashes_and_offsets)))
+            buckets.tofile(store_file)
+            offset += 8 * num_buckets
+            del hashes_and_offsets, buckets
+
+        store_file.seek(0)
+        store_file.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(metadata)))
+        store_file.write(metadata)
+        store_file.write(b"".join(section_entries))
+    connection.close()
+    os.replace(temp_path, store_path)
+
+
+def _group_rows(rows: Iterable[tuple], property_types: Dict[str, type], merge: bool) -> Iterable[Tuple[str, Dict[str, any]]]:
+    # Rows must be sorted by key when merging (so that all rows for a key are adjacent)
+    property_names = list(property_types)
+    current_key = None
+    current_property_dicts = []
+    for row in rows:
+        properties = {property_name: load_kg2c_property(property_types[property_name], raw_value)
+                      for property_name, raw_value in zip(property_names, row[1:])}
+        properties = {property_name: value for property_name, value in properties.items() if value}
+        if not merge:
+            yield row[0], properties
+        elif row[0] == current_key:
+            current_property_dicts.append(properties)
+        else:
+            if current_key is not None:
+                yield current_key, merge_kg2c_properties(current_property_dicts)
+            current_key = row[0]
+            current_property_dicts = [properties]
+    if merge and current_key is not None:
+        yield current_key, merge_kg2c_properties(current_property_dicts)
@@ -0,0 +1,270 @@
+#!/bin/env python3
+# This file contains a cache of the messages produced by executing ARAXi processing plans, keyed by a canonical form of
+# the query (its query graph, with curies canonicalized, predicates and categories normalized and lists sorted, plus
+# the actions and query options it was run with). Entries expire after a configurable time and the least recently used
+# ones are evicted beyond a configurable number of entries. Entries are kept in memory for the life of the process and
+# in an on-disk SQLite store shared by all processes on the machine (the server answers each query in a forked child).
+# Everything is keyed by the versions of the databases the results were computed from (see
+# ARAXDatabaseManager.get_local_versions), so installing new KG2/synonymizer databases invalidates the cache.
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional
+
+
+def eprint(*args, **kwargs): print(*args, file=sys.stderr, **kwargs)
+
+
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+DEFAULT_MAX_ENTRIES = 1000
+DEFAULT_MAX_MEMORY_ENTRIES = 16
+MAX_ENTRY_BYTES = 64 * 1024 * 1024  # Compressed messages bigger than this aren't cached
+# Messages with more results plus knowledge graph nodes and edges than this would all but certainly be bigger than
+# MAX_ENTRY_BYTES compressed, so they aren't even serialized
+MAX_CACHED_MESSAGE_ELEMENTS = 1000000
+CACHE_PATH_ENV_VAR = "ARAX_QUERY_RESULT_CACHE_PATH"  # Overrides where the on-disk store lives; empty means no disk store
+TTL_ENV_VAR = "ARAX_QUERY_RESULT_CACHE_TTL_SECONDS"
+MAX_ENTRIES_ENV_VAR = "ARAX_QUERY_RESULT_CACHE_MAX_ENTRIES"  # 0 turns the cache off
+UNCACHEABLE_COMMANDS = {"fetch_message", "query_graph_reasoner"}  # Their results depend on more than the query itself
+IGNORED_QUERY_OPTIONS = {"actions", "query_plan"}
+
+
+def _normalize_biolink_term(term: str) -> str:
+    term = term.strip()
+    return term if term.startswith("biolink:") else f"biolink:{term}"
+
+
+def _sorted_unique(values: Optional[Iterable]) -> list:
+    return sorted(set(values)) if values else []
+
+
+def _sorted_constraints(constraints: Optional[list]) -> list:
+    return sorted(constraints, key=lambda constraint: json.dumps(constraint, sort_keys=True, default=str)) if constraints else []
+
+
+def get_canonical_query_graph(query_graph: Optional[dict],
+                              canonicalize_curies: Callable[[List[str]], Dict[str, str]]) -> dict:
+    """
+    Returns a canonical form of the given query graph (as a dict): each qnode's curies are replaced with their canonical
+    curies, predicates and categories are normalized, and lists whose order doesn't matter are sorted. The qnode and
+    qedge keys are kept as they are, since results refer to them.
+    """
+    if not query_graph:
+        return {"nodes": {}, "edges": {}}
+    nodes = query_graph.get("nodes") or {}
+    edges = query_graph.get("edges") or {}
+    all_curies = {curie for qnode in nodes.values() for curie in (qnode.get("ids") or [])}
+    canonical_curies = canonicalize_curies(sorted(all_curies)) if all_curies else {}
+    canonical_nodes = dict()
+    for qnode_key, qnode in nodes.items():
+        canonical_nodes[qnode_key] = {
+            "ids": _sorted_unique(canonical_curies.get(curie, curie) for curie in (qnode.get("ids") or [])),
+            "categories": _sorted_unique(_normalize_biolink_term(category) for category in (qnode.get("categories") or [])),
+            "is_set": bool(qnode.get("is_set")),
+            "option_group_id": qnode.get("option_group_id"),
+            "constraints": _sorted_constraints(qnode.get("constraints"))
+        }
+    canonical_edges = dict()
+    for qedge_key, qedge in edges.items():
+        canonical_edges[qedge_key] = {
+            "subject": qedge.get("subject"),
+            "object": qedge.get("object"),
+            "predicates": _sorted_unique(_normalize_biolink_term(predicate) for predicate in (qedge.get("predicates") or [])),
+            "exclude": bool(qedge.get("exclude")),
+            "option_group_id": qedge.get("option_group_id"),
+            "knowledge_type": qedge.get("knowledge_type"),
+            "constraints": _sorted_constraints(qedge.get("constraints"))
+        }
+    return {"nodes": canonical_nodes, "edges": canonical_edges}
+
+
+def get_query_key(query_graph: Optional[dict], actions: List[dict], query_options: Optional[dict], mode: str,
+                  canonicalize_curies: Callable[[List[str]], Dict[str, str]]) -> Optional[str]:
+    """
+    Returns the cache key for running the given (parsed) ARAXi actions on a message with the given query graph, or None
+    if the result of doing so can't be cached. Only the actions before the first return() count; return() just says
+    what to do with the result.
+    """
+    actions_to_run = []
+    for action in actions:
+        if action["command"] == "return":
+            break
+        if action["command"] in UNCACHEABLE_COMMANDS:
+            return None
+        actions_to_run.append({"command": action["command"], "parameters": action["parameters"]})
+    options = {option: value for option, value in (query_options or {}).items() if option not in IGNORED_QUERY_OPTIONS}
+    canonical_query = {"query_graph": get_canonical_query_graph(query_graph, canonicalize_curies),
+                       "actions": actions_to_run,
+                       "query_options": options,
+                       "mode": mode}
+    serialized_query = json.dumps(canonical_query, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(serialized_query.encode("utf-8")).hexdigest()
+
+
+def has_failed_kp_queries(query_plan: dict) -> bool:
+    """
+    Returns whether any KP query in the given query plan (see ARAXResponse.update_query_plan) timed out or errored, in
+    which case the results are incomplete and shouldn't be reused.
+    """
+    for providers in query_plan.get("qedge_keys", {}).values():
+        for provider, details in providers.items():
+            if provider != "edge_properties" and details.get("status") in ("Timed out", "Error"):
+                return True
+    return False
+
+
+def is_too_large_to_cache(num_results: int, num_knowledge_graph_nodes: int, num_knowledge_graph_edges: int) -> bool:
+    """
+    Returns whether a message of the given size is clearly too big to cache, without serializing it.
+    """
+    return num_results + num_knowledge_graph_nodes + num_knowledge_graph_edges > MAX_CACHED_MESSAGE_ELEMENTS
+
+
+def get_canonical_curies_from_synonymizer(curies: List[str]) -> Dict[str, str]:
+    """
+    Returns the canonical curie for each of the given curies that the NodeSynonymizer knows about.
+    """
+    sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/../NodeSynonymizer")
+    from node_synonymizer import NodeSynonymizer
+    synonymizer_results = NodeSynonymizer().get_canonical_curies(curies=curies)
+    return {curie: result["preferred_curie"] for curie, result in synonymizer_results.items()
+            if result and result.get("preferred_curie")}
+
+
+class QueryResultCache:
+
+    def __init__(self, database_version: str, disk_cache_path: Optional[str], ttl_seconds: float = DEFAULT_TTL_SECONDS,
+                 max_entries: int = DEFAULT_MAX_ENTRIES, max_memory_entries: int = DEFAULT_MAX_MEMORY_ENTRIES):
+        self.database_version = database_version
+        self.disk_cache_path = disk_cache_path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_memory_entries = min(max_memory_entries, max_entries)
+        self.entries = OrderedDict()  # query key -> (expiration time, compressed JSON of the cached result)
+        self.lock = threading.Lock()
+        self._disk_connections = threading.local()
+        self._pid = os.getpid()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def get(self, query_key: str) -> Optional[dict]:
+        """
+        Returns the cached result for the given query key, or None if there isn't an unexpired one.
+        """
+        if not self.enabled:
+            return None
+        now = time.time()
+        compressed_value = None
+        with self.lock:
+            entry = self.entries.get(query_key)
+            if entry is not None:
+                if entry[0] < now:
+                    del self.entries[query_key]
+                else:
+                    self.entries.move_to_end(query_key)
+                    compressed_value = entry[1]
+        if compressed_value is None and self.disk_cache_path:
+            disk_entry = self._get_from_disk(query_key, now)
+            if disk_entry is not None:
+                self._put_in_memory(query_key, disk_entry[0], disk_entry[1])
+                compressed_value = disk_entry[1]
+        if compressed_value is None:
+            return None
+        return json.loads(zlib.decompress(compressed_value))
+
+    def put(self, query_key: str, value: dict):
+        """
+        Caches the given (serializable) result for the given query key.
+        """
+        if not self.enabled:
+            return
+        compressed_value = zlib.compress(json.dumps(value, separators=(",", ":")).encode("utf-8"), 3)
+        if len(compressed_value) > MAX_ENTRY_BYTES:
+            eprint(f"INFO: Not caching query result {query_key}, since it is {len(compressed_value)} bytes compressed")
+            return
+        now = time.time()
+        self._put_in_memory(query_key, now + self.ttl_seconds, compressed_value)
+        if self.disk_cache_path:
+            self._put_on_disk(query_key, now, compressed_value)
+
+    def _put_in_memory(self, query_key: str, expiration: float, compressed_value: bytes):
+        with self.lock:
+            self.entries[query_key] = (expiration, compressed_value)
+            self.entries.move_to_end(query_key)
+            while len(self.entries) > self.max_memory_entries:
+                self.entries.popitem(last=False)
+
+    # The on-disk store is written in WAL mode so many processes can share it
+    def _get_disk_connection(self) -> sqlite3.Connection:
+        connection = getattr(self._disk_connections, "connection", None)
+        if connection is None or self._pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.disk_cache_path)), exist_ok=True)
+            connection = sqlite3.connect(self.disk_cache_path, timeout=5)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("CREATE TABLE IF NOT EXISTS query_results (query_key TEXT PRIMARY KEY, version TEXT, "
+                               "created REAL, last_used REAL, value BLOB)")
+            # Throw out anything computed from different databases, or that's expired
+            connection.execute("DELETE FROM query_results WHERE version != ? OR created < ?",
+                               (self.database_version, time.time() - self.ttl_seconds))
+            connection.commit()
+            self._disk_connections.connection = connection
+            self._pid = os.getpid()
+        return connection
+
+    def _get_from_disk(self, query_key: str, now: float):
+        try:
+            connection = self._get_disk_connection()
+            row = connection.execute("SELECT created, value FROM query_results WHERE query_key = ? AND version = ? AND "
+                                     "created >= ?", (query_key, self.database_version, now - self.ttl_seconds)).fetchone()
+            if row is None:
+                return None
+            connection.execute("UPDATE query_results SET last_used = ? WHERE query_key = ?", (now, query_key))
+            connection.commit()
+            return row[0] + self.ttl_seconds, row[1]
+        except sqlite3.Error as e:
+            eprint(f"WARNING: Unable to read from query result cache {self.disk_cache_path}: {e}")
+            return None
+
+    def _put_on_disk(self, query_key: str, now: float, compressed_value: bytes):
+        try:
+            connection = self._get_disk_connection()
+            connection.execute("INSERT OR REPLACE INTO query_results (query_key, version, created, last_used, value) "
+                               "VALUES (?, ?, ?, ?, ?)", (query_key, self.database_version, now, now, compressed_value))
+            # Evict the least recently used entries beyond the size bound
+            connection.execute("DELETE FROM query_results WHERE query_key IN (SELECT query_key FROM query_results "
+                               "ORDER BY last_used DESC LIMIT -1 OFFSET ?)", (self.max_entries,))
+            connection.commit()
+        except sqlite3.Error as e:
+            eprint(f"WARNING: Unable to write to query result cache {self.disk_cache_path}: {e}")
+
+
+_cache: Optional[QueryResultCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_query_result_cache(database_versions: dict) -> QueryResultCache:
+    """
+    Returns the (process-wide) query result cache for the given database versions; it's replaced (and the on-disk store
+    cleared of older entries) when they change. The on-disk store location, TTL and size bound can be set with the
+    ARAX_QUERY_RESULT_CACHE_* environment variables.
+    """
+    database_version = json.dumps(database_versions, sort_keys=True, default=str)
+    default_disk_cache_path = os.path.dirname(os.path.abspath(__file__)) + "/../../../data/query_result_cache.sqlite"
+    disk_cache_path = os.environ.get(CACHE_PATH_ENV_VAR, default_disk_cache_path) or None
+    ttl_seconds = float(os.environ.get(TTL_ENV_VAR, DEFAULT_TTL_SECONDS))
+    max_entries = int(os.environ.get(MAX_ENTRIES_ENV_VAR, DEFAULT_MAX_ENTRIES))
+    global _cache
+    with _cache_lock:
+        if (_cache is None or _cache.database_version != database_version or _cache.disk_cache_path != disk_cache_path
+                or _cache.ttl_seconds != ttl_seconds or _cache.max_entries != max_entries):
+            _cache = QueryResultCache(database_version, disk_cache_path, ttl_seconds=ttl_seconds, max_entries=max_entries)
+        return _cache
@@ -0,0 +1,180 @@
+#!/bin/env python3
+# This file contains a read-only, memory-mapped, columnar store of the paired concept statistics in the COHD database
+# (PAIRED_CONCEPT_COUNTS_ASSOCIATIONS). It is derived from the COHD database (see build_cohd_pair_store()). For each
+# dataset, concept pairs are keyed by their sorted concept ids and kept in a sorted array, with one array per statistic
+# alongside it, so the statistics for a whole batch of concept pairs are looked up at once with a binary search. COHD
+# pairs are unordered, so rows for either order of a pair are merged: a pair's frequency and ln ratio are the largest
+# of its rows, and its chi-square p-value is the one that goes with its largest chi-square statistic.
+import json
+import mmap
+import os
+import sqlite3
+import struct
+import sys
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+
+def eprint(*args, **kwargs): print(*args, file=sys.stderr, **kwargs)
+
+
+MAGIC = b"COHDPAIR"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<8sIQQ")  # magic, format version, metadata offset, metadata length (metadata JSON is at the end)
+STATISTICS = ["concept_frequency", "ln_ratio", "chi_square", "chi_square_pvalue"]
+DATASET_IDS = [1, 2, 3]
+FETCH_BATCH_SIZE = 1000000
+
+
+def get_pair_keys(concept_ids_1: Iterable[int], concept_ids_2: Iterable[int]) -> np.ndarray:
+    """
+    Returns the key for each of the given (unordered) concept pairs; OMOP concept ids fit in 32 bits, so the key packs
+    the smaller id into the high half and the larger into the low half.
+    """
+    concept_ids_1 = np.asarray(concept_ids_1, dtype=np.uint64)
+    concept_ids_2 = np.asarray(concept_ids_2, dtype=np.uint64)
+    return (np.minimum(concept_ids_1, concept_ids_2) << np.uint64(32)) | np.maximum(concept_ids_1, concept_ids_2)
+
+
+class COHDPairStore:
+    """
+    Read-only view of a COHD pair store file. Use get_cohd_pair_store() to grab the (process-wide) instance.
+    """
+
+    def __init__(self, store_path: str):
+        self.store_path = store_path
+        with open(store_path, "rb") as store_file:
+            self._mmap = mmap.mmap(store_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, format_version, metadata_offset, metadata_length = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or format_version != FORMAT_VERSION:
+            raise ValueError(f"{store_path} is not a version {FORMAT_VERSION} COHD pair store")
+        self.metadata = json.loads(self._mmap[metadata_offset:metadata_offset + metadata_length])
+        self._datasets = dict()  # dataset id -> (sorted pair keys, {statistic: values})
+        for dataset_id, dataset_info in self.metadata["datasets"].items():
+            num_pairs = dataset_info["num_pairs"]
+            offset = dataset_info["offset"]
+            keys = np.frombuffer(self._mmap, dtype=np.uint64, count=num_pairs, offset=offset)
+            columns = dict()
+            for column_number, statistic in enumerate(STATISTICS, start=1):
+                columns[statistic] = np.frombuffer(self._mmap, dtype=np.float64, count=num_pairs,
+                                                   offset=offset + column_number * 8 * num_pairs)
+            self._datasets[int(dataset_id)] = (keys, columns)
+
+    def is_current(self, database_path: str) -> bool:
+        """
+        Returns whether this store was built from the given COHD database (as it is now).
+        """
+        try:
+            stat = os.stat(database_path)
+        except OSError:
+            return False
+        return (self.metadata.get("source_size") == stat.st_size and
+                self.metadata.get("source_mtime") == int(stat.st_mtime))
+
+    def get_pair_statistics(self, concept_ids_1: Iterable[int], concept_ids_2: Iterable[int],
+                            dataset_id: int) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        """
+        Looks up the statistics of each of the given concept pairs (given as parallel sequences of concept ids; order
+        within a pair doesn't matter) in the given dataset. Returns an array saying which pairs were found, along with
+        an array of values for each statistic (values for pairs that weren't found are NaN).
+        """
+        query_keys = get_pair_keys(concept_ids_1, concept_ids_2)
+        keys, columns = self._datasets.get(dataset_id, (np.empty(0, dtype=np.uint64), dict()))
+        if not len(keys) or not len(query_keys):
+            return np.zeros(len(query_keys), dtype=bool), {statistic: np.full(len(query_keys), np.nan) for statistic in STATISTICS}
+        positions = np.minimum(np.searchsorted(keys, query_keys), len(keys) - 1)
+        found = keys[positions] == query_keys
+        return found, {statistic: np.where(found, columns[statistic][positions], np.nan) for statistic in STATISTICS}
+
+    def close(self):
+        self._datasets.clear()
+        self._mmap.close()
+
+
+_stores: Dict[str, Tuple[int, COHDPairStore]] = dict()
+
+
+def get_cohd_pair_store_path(database_path: str) -> str:
+    return f"{os.path.splitext(database_path)[0]}_pairs.store"
+
+
+def get_cohd_pair_store(store_path: str) -> Optional[COHDPairStore]:
+    """
+    Returns the (process-wide, memory-mapped) store at the given path, or None if there isn't a valid one there. The
+    mapping survives forks, so workers forked after this is first called all share it.
+    """
+    try:
+        mtime = os.stat(store_path).st_mtime_ns
+    except OSError:
+        return None
+    if store_path not in _stores or _stores[store_path][0] != mtime:
+        try:
+            _stores[store_path] = (mtime, COHDPairStore(store_path))
+        except (OSError, ValueError) as e:
+            eprint(f"WARNING: Couldn't open COHD pair store {store_path}: {e}")
+            return None
+    return _stores[store_path][1]
+
+
+def _load_dataset(connection: sqlite3.Connection, dataset_id: int) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    # Reads all of the dataset's rows (in batches, straight into arrays), then merges the rows for each pair
+    key_batches, frequency_batches, ln_ratio_batches, chi_square_batches, pvalue_batches = [], [], [], [], []
+    cursor = connection.execute("SELECT concept_id_1, concept_id_2, concept_prevalence, ln_ratio, chi_square_t, chi_square_p "
+                                "FROM PAIRED_CONCEPT_COUNTS_ASSOCIATIONS WHERE dataset_id = ?", (dataset_id,))
+    while True:
+        rows = cursor.fetchmany(FETCH_BATCH_SIZE)
+        if not rows:
+            break
+        columns = list(zip(*rows))
+        key_batches.append(get_pair_keys(columns[0], columns[1]))
+        for batches, values in zip((frequency_batches, ln_ratio_batches, chi_square_batches, pvalue_batches), columns[2:]):
+            batches.append(np.array(values, dtype=np.float64))  # NULLs become NaN
+    if not key_batches:
+        return np.empty(0, dtype=np.uint64), {statistic: np.empty(0) for statistic in STATISTICS}
+    keys = np.concatenate(key_batches)
+    frequencies, ln_ratios, chi_squares, pvalues = (np.concatenate(batches) for batches in
+                                                    (frequency_batches, ln_ratio_batches, chi_square_batches, pvalue_batches))
+
+    # Sort by key, with each pair's largest chi-square statistic first, so the first row of each pair has its p-value
+    order = np.lexsort((-np.nan_to_num(chi_squares, nan=-np.inf), keys))
+    keys = keys[order]
+    group_starts = np.flatnonzero(np.concatenate([[True], keys[1:] != keys[:-1]]))
+    return keys[group_starts], {"concept_frequency": np.fmax.reduceat(frequencies[order], group_starts),
+                                "ln_ratio": np.fmax.reduceat(ln_ratios[order], group_starts),
+                                "chi_square": chi_squares[order][group_starts],
+                                "chi_square_pvalue": pvalues[order][group_starts]}
+
+
+def build_cohd_pair_store(database_path: str, store_path: str, dataset_ids: Iterable[int] = DATASET_IDS):
+    """
+    Builds a COHD pair store from the given COHD database. The store is written to a temporary file and moved into
+    place at the end, so readers never see a partial store.
+    """
+    stat = os.stat(database_path)
+    metadata = {"source_size": stat.st_size,
+                "source_mtime": int(stat.st_mtime),
+                "datasets": dict()}
+    connection = sqlite3.connect(f"file:{database_path}?mode=ro", uri=True)
+    temp_path = f"{store_path}.tmp{os.getpid()}"
+    with open(temp_path, "wb") as store_file:
+        store_file.write(b"\0" * HEADER.size)
+        offset = HEADER.size
+        for dataset_id in dataset_ids:
+            keys, columns = _load_dataset(connection, dataset_id)
+            # Each dataset's key array is followed by its statistic columns (all 8-byte values, so all stay aligned)
+            padding = (-offset) % 8
+            store_file.write(b"\0" * padding)
+            offset += padding
+            metadata["datasets"][str(dataset_id)] = {"offset": offset, "num_pairs": len(keys)}
+            keys.astype(np.uint64).tofile(store_file)
+            for statistic in STATISTICS:
+                columns[statistic].astype(np.float64).tofile(store_file)
+            offset += 8 * len(keys) * (len(STATISTICS) + 1)
+            eprint(f"Wrote statistics for {len(keys)} concept pairs in dataset {dataset_id}")
+        encoded_metadata = json.dumps(metadata).encode()
+        store_file.write(encoded_metadata)
+        store_file.seek(0)
+        store_file.write(HEADER.pack(MAGIC, FORMAT_VERSION, offset, len(encoded_metadata)))
+    connection.close()
+    os.replace(temp_path, store_path)
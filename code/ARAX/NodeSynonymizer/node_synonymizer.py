@@ -13,13 +13,48 @@ import sqlite3
 import json
 import pickle
 import platform
+import threading
 
 from sri_node_normalizer import SriNodeNormalizer
 from category_manager import CategoryManager
+from synonymizer_cache import get_synonymizer_cache
 
 # Testing and debugging flags
 DEBUG = True
 
+# Number of curies or names sent to SQLite per lookup statement
+LOOKUP_BATCH_SIZE = 5000
+
+# Lookup statements. The input values are bound as a single JSON array parameter, so these are fixed strings
+# that SQLite can prepare once per connection and reuse
+LOOKUP_SQL = {
+    'equivalent_nodes_by_curie': """
+        SELECT C.curie,C.unique_concept_curie,N.curie,N.category,U.category
+          FROM curies AS C
+         INNER JOIN nodes AS N ON C.unique_concept_curie == N.unique_concept_curie
+         INNER JOIN unique_concepts AS U ON C.unique_concept_curie == U.uc_curie
+         WHERE C.uc_curie IN ( SELECT value FROM json_each(?) )""",
+    'canonical_curies_by_curie': """
+        SELECT C.curie,C.unique_concept_curie,U.curie,U.name,U.category
+          FROM curies AS C
+         INNER JOIN unique_concepts AS U ON C.unique_concept_curie == U.uc_curie
+         WHERE C.uc_curie IN ( SELECT value FROM json_each(?) )""",
+    'canonical_curies_by_name': """
+        SELECT S.name,S.unique_concept_curie,U.curie,U.name,U.category
+          FROM names AS S
+         INNER JOIN unique_concepts AS U ON S.unique_concept_curie == U.uc_curie
+         WHERE S.lc_name IN ( SELECT value FROM json_each(?) )""",
+    'categories_by_concept': """
+        SELECT curie,unique_concept_curie,category
+          FROM curies
+         WHERE unique_concept_curie IN ( SELECT value FROM json_each(?) )""",
+}
+
+# Per-thread lookup connections, and per-process memo of expanded categories
+_lookup_connections = threading.local()
+_expanded_categories = {}
+_category_manager = None
+
 
 pathlist = os.path.realpath(__file__).split(os.path.sep)
 RTXindex = pathlist.index("RTX")
@@ -1922,6 +1957,7 @@ class NodeSynonymizer:
 
 
     # ############################################################################################
+    # Look up canonical curies (or equivalent nodes), serving whatever we can from the cross-query cache
     def get_canonical_curies(self, curies=None, names=None, return_all_categories=False, return_type='canonical_curies'):
 
         # If the provided curies or names is just a string, turn it into a list
@@ -1930,81 +1966,123 @@ class NodeSynonymizer:
         if isinstance(names,str):
             names = [ names ]
 
+        # Build cache keys for all the inputs. Results depend on the return type and category flag too
+        cache = get_synonymizer_cache(f"{self.databaseLocation}/{self.databaseName}")
+        key_prefix = f"{return_type}|{int(bool(return_all_categories))}"
+        input_keys = []
+        if curies is not None:
+            input_keys += [ ('curie', curie, f"{key_prefix}|curie|{curie}") for curie in curies if curie is not None ]
+        if names is not None:
+            input_keys += [ ('name', name, f"{key_prefix}|name|{name}") for name in names if name is not None ]
+        cached_values = cache.get_many([ key for kind, entity, key in input_keys ])
+
+        # Look up anything that wasn't cached in the database, and cache it
+        if len(cached_values) < len(input_keys):
+            uncached_curies = [ entity for kind, entity, key in input_keys if kind == 'curie' and key not in cached_values ]
+            uncached_names = [ entity for kind, entity, key in input_keys if kind == 'name' and key not in cached_values ]
+            database_results = self._get_canonical_curies_from_database(curies=uncached_curies if uncached_curies else None,
+                                                                        names=uncached_names if uncached_names else None,
+                                                                        return_all_categories=return_all_categories,
+                                                                        return_type=return_type)
+            new_values = {}
+            for kind, entity, key in input_keys:
+                if key not in cached_values and entity in database_results:
+                    new_values[key] = json.dumps(database_results[entity])
+            cache.put_many(new_values)
+            cached_values.update(new_values)
+
+        # Assemble the results in the same order as the inputs
+        results = {}
+        for kind, entity, key in input_keys:
+            if key in cached_values:
+                results[entity] = json.loads(cached_values[key])
+        return results
+
+
+    # ############################################################################################
+    # Return hit/miss metrics for the cross-query canonicalization cache
+    def get_cache_stats(self):
+        return get_synonymizer_cache(f"{self.databaseLocation}/{self.databaseName}").get_stats()
+
+
+    # ############################################################################################
+    # Return a connection to the synonymizer database for lookups. sqlite3 connections can't be shared across
+    # threads, so each thread (in each process) keeps its own connection and reuses it, along with its cache of
+    # prepared statements, for all lookups against this database
+    def get_lookup_connection(self):
+        database_path = f"{self.databaseLocation}/{self.databaseName}"
+        if getattr(_lookup_connections, 'pid', None) != os.getpid():
+            _lookup_connections.pid = os.getpid()
+            _lookup_connections.connections = {}
+        connection = _lookup_connections.connections.get(database_path)
+        if connection is None:
+            connection = sqlite3.connect(database_path, cached_statements=len(LOOKUP_SQL) + 10)
+            _lookup_connections.connections[database_path] = connection
+        return connection
+
+
+    # ############################################################################################
+    # Compute the expanded categories only once per distinct category (per process)
+    def get_expanded_categories(self, category):
+        global _category_manager
+        if category not in _expanded_categories:
+            if _category_manager is None:
+                _category_manager = CategoryManager()
+            _expanded_categories[category] = _category_manager.get_expansive_categories(category)
+        expanded_categories = _expanded_categories[category]
+        return dict(expanded_categories) if expanded_categories is not None else None
+
+
+    # ############################################################################################
+    def _get_canonical_curies_from_database(self, curies=None, names=None, return_all_categories=False, return_type='canonical_curies'):
+
         # Set up containers for the batches and results
         batches = []
         results = {}
 
-        # Set up the category manager
-        category_manager = CategoryManager()
-
-        # Make sets of comma-separated list strings for the curies and set up the results dict with all the input values
-        uc_curies = []
+        # Make batches of upper-cased curies and set up the results dict with all the input values
+        # Each batch is passed to SQLite as a single JSON array parameter that the (fixed, prepared) statement
+        # unpacks with json_each(), so no SQL is ever built from the input values
         curie_map = {}
-        batch_size = 0
         if curies is not None:
+            uc_curies = []
             for curie in curies:
                 if curie is None:
                     continue
                 results[curie] = None
                 uc_curie = curie.upper()
                 curie_map[uc_curie] = curie
-                uc_curie = re.sub(r"'","''",uc_curie)   # Replace embedded ' characters with ''
                 uc_curies.append(uc_curie)
-                batch_size += 1
-                if batch_size > 5000:
-                    batches.append( { 'batch_type': 'curies', 'batch_str': "','".join(uc_curies) } )
-                    uc_curies = []
-                    batch_size = 0
-            if batch_size > 0:
-                batches.append( { 'batch_type': 'curies', 'batch_str': "','".join(uc_curies) } )
-
-        # Make sets of comma-separated list strings for the names
-        lc_names = []
+            for i in range(0, len(uc_curies), LOOKUP_BATCH_SIZE):
+                batches.append( { 'batch_type': 'curies', 'batch_values': uc_curies[i:i + LOOKUP_BATCH_SIZE] } )
+
+        # Make batches of lower-cased names
         name_map = {}
-        batch_size = 0
         if names is not None:
+            lc_names = []
             for name in names:
                 if name is None:
                     continue
                 results[name] = None
                 lc_name = name.lower()
                 name_map[lc_name] = name
-                lc_name = re.sub(r"'","''",lc_name)   # Replace embedded ' characters with ''
                 lc_names.append(lc_name)
-                batch_size += 1
-                if batch_size > 5000:
-                    batches.append( { 'batch_type': 'names', 'batch_str': "','".join(lc_names) } )
-                    lc_names = []
-                    batch_size = 0
-            if batch_size > 0:
-                batches.append( { 'batch_type': 'names', 'batch_str': "','".join(lc_names) } )
+            for i in range(0, len(lc_names), LOOKUP_BATCH_SIZE):
+                batches.append( { 'batch_type': 'names', 'batch_values': lc_names[i:i + LOOKUP_BATCH_SIZE] } )
+
+        if batches:
+            connection = self.get_lookup_connection()
 
         for batch in batches:
-            #print(f"INFO: Batch {i_batch} of {batch['batch_type']}")
-            #i_batch += 1
             if batch['batch_type'] == 'curies':
                 if return_type == 'equivalent_nodes':
-                    sql = f"""
-                        SELECT C.curie,C.unique_concept_curie,N.curie,N.category,U.category
-                          FROM curies AS C
-                         INNER JOIN nodes AS N ON C.unique_concept_curie == N.unique_concept_curie
-                         INNER JOIN unique_concepts AS U ON C.unique_concept_curie == U.uc_curie
-                         WHERE C.uc_curie in ( '{batch['batch_str']}' )"""
+                    sql = LOOKUP_SQL['equivalent_nodes_by_curie']
                 else:
-                    sql = f"""
-                        SELECT C.curie,C.unique_concept_curie,U.curie,U.name,U.category
-                          FROM curies AS C
-                         INNER JOIN unique_concepts AS U ON C.unique_concept_curie == U.uc_curie
-                         WHERE C.uc_curie in ( '{batch['batch_str']}' )"""
+                    sql = LOOKUP_SQL['canonical_curies_by_curie']
             else:
-                sql = f"""
-                    SELECT S.name,S.unique_concept_curie,U.curie,U.name,U.category
-                      FROM names AS S
-                     INNER JOIN unique_concepts AS U ON S.unique_concept_curie == U.uc_curie
-                     WHERE S.lc_name in ( '{batch['batch_str']}' )"""
-            #print(f"INFO: Processing {batch['batch_type']} batch: {batch['batch_str']}")
-            cursor = self.connection.cursor()
-            cursor.execute( sql )
+                sql = LOOKUP_SQL['canonical_curies_by_name']
+            cursor = connection.cursor()
+            cursor.execute( sql, ( json.dumps(batch['batch_values']), ) )
             rows = cursor.fetchall()
 
             # Loop through all rows, building the list
@@ -2044,7 +2122,7 @@ class NodeSynonymizer:
 
                     #### Also store tidy categories
                     if return_all_categories:
-                        results[entity]['expanded_categories'] = category_manager.get_expansive_categories(row[4])
+                        results[entity]['expanded_categories'] = self.get_expanded_categories(row[4])
 
                 else:
                     print(f"ERROR: Unable to find entity {entity}")
@@ -2052,20 +2130,9 @@ class NodeSynonymizer:
             # If all_categories were requested, do another query for those
             if return_all_categories:
 
-                # Create the SQL IN list
-                uc_curies_list = []
-                for uc_curie in batch_curie_map:
-                    uc_curie = re.sub(r"'","''",uc_curie)   # Replace embedded ' characters with ''
-                    uc_curies_list.append(uc_curie)
-                curies_list_str = "','".join(uc_curies_list)
-
                 # Get all the curies for these concepts and their categories
-                sql = f"""
-                    SELECT curie,unique_concept_curie,category
-                      FROM curies
-                     WHERE unique_concept_curie IN ( '{curies_list_str}' )"""
-                cursor = self.connection.cursor()
-                cursor.execute( sql )
+                cursor = connection.cursor()
+                cursor.execute( LOOKUP_SQL['categories_by_concept'], ( json.dumps(list(batch_curie_map)), ) )
                 rows = cursor.fetchall()
 
                 entity_all_categories = {}
@@ -2098,6 +2165,33 @@ class NodeSynonymizer:
         return results
 
 
+    # ############################################################################################
+    # Time canonical curie lookups (bypassing the cross-query cache) for a range of batch sizes
+    def run_lookup_benchmark(self, batch_sizes=(10, 1000, 50000), return_all_categories=True):
+
+        max_batch_size = max(batch_sizes)
+        cursor = self.get_lookup_connection().cursor()
+        cursor.execute( "SELECT curie FROM curies LIMIT ?", ( max_batch_size, ) )
+        all_curies = [ row[0] for row in cursor.fetchall() ]
+        if len(all_curies) < max_batch_size:
+            print(f"WARNING: Only {len(all_curies)} curies available for the benchmark")
+
+        # Warm up the connection, statement cache, and category expansions before timing anything
+        self._get_canonical_curies_from_database(all_curies[:10], return_all_categories=return_all_categories)
+
+        timings = {}
+        for batch_size in batch_sizes:
+            curies = all_curies[:batch_size]
+            for return_type in [ 'canonical_curies', 'equivalent_nodes' ]:
+                t0 = timeit.default_timer()
+                results = self._get_canonical_curies_from_database(curies, return_all_categories=return_all_categories, return_type=return_type)
+                t1 = timeit.default_timer()
+                n_found = len([ value for value in results.values() if value is not None ])
+                timings[f"{return_type}_{len(curies)}"] = t1 - t0
+                print(f"INFO: {return_type} for {len(curies)} curies ({n_found} found) took {t1-t0:.4f} sec ({(t1-t0)/max(len(curies),1)*1000:.4f} ms/curie)")
+        return timings
+
+
     # ############################################################################################
     # Return results in the Node Normalizer format, either from SRI or KG1 or KG2
     def get_normalizer_results(self, entities=None):
@@ -2604,9 +2698,11 @@ def main():
                         help="Get nodes for the specified list in the specified kg_name", default=None)
     parser.add_argument('-u', '--update', action="store_true",
                         help="If set, update the NodeSynonmizer with improved category information")
+    parser.add_argument('-m', '--benchmark', action="store_true",
+                        help="If set, time canonical curie lookups for batches of 10, 1000, and 50000 curies", default=False)
     args = parser.parse_args()
 
-    if not args.build and not args.test and not args.recollate and not args.lookup and not args.first_word_lookup and not args.node_list and not args.query and not args.get and not args.update:
+    if not args.build and not args.test and not args.recollate and not args.lookup and not args.first_word_lookup and not args.node_list and not args.query and not args.get and not args.update and not args.benchmark:
         parser.print_help()
         exit()
 
@@ -2627,6 +2723,11 @@ def main():
         synonymizer.update_categories()
         return
 
+    # If the user asks for the lookup benchmark, run it
+    if args.benchmark:
+        synonymizer.run_lookup_benchmark()
+        return
+
     # If the user asks to perform the SELECT statement, do it
     if args.get:
         t0 = timeit.default_timer()
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+#
+# Bounded LRU/TTL cache for NodeSynonymizer canonicalization lookups. Entries are kept in memory and shared by
+# every NodeSynonymizer in the process; optionally they are also kept in an on-disk SQLite store so that worker
+# processes on the same machine can share them. Everything is keyed by the synonymizer database version, so
+# swapping in a new synonymizer database invalidates the cache. The on-disk store is bounded too: expired entries and
+# then the least recently used ones are dropped before it can grow past max_disk_entries.
+#
+import sys
+def eprint(*args, **kwargs): print(*args, file=sys.stderr, **kwargs)
+
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_MAX_ENTRIES = 200000
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+DEFAULT_MAX_DISK_ENTRIES = 2000000
+DISK_CACHE_PATH_ENV_VAR = "ARAX_SYNONYMIZER_CACHE_PATH"   # Set this to enable the shared on-disk store
+DISK_CACHE_MAX_ENTRIES_ENV_VAR = "ARAX_SYNONYMIZER_CACHE_MAX_ENTRIES"   # Overrides how many entries the on-disk store holds
+PRUNE_CHECK_INTERVAL = 10000   # How many entries a process writes to the on-disk store between checks of its size
+PRUNE_TARGET_FRACTION = 0.9   # Pruning takes the on-disk store down to this fraction of its max size
+
+
+# ################################################################################################
+class SynonymizerCache:
+
+    # Constructor
+    def __init__(self, database_version, max_entries=DEFAULT_MAX_ENTRIES, ttl_seconds=DEFAULT_TTL_SECONDS,
+                 disk_cache_path=None, max_disk_entries=DEFAULT_MAX_DISK_ENTRIES):
+        self.database_version = database_version
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk_cache_path = disk_cache_path
+        self.max_disk_entries = max_disk_entries
+        self.num_disk_writes_since_prune_check = 0
+        self.entries = OrderedDict()   # key -> (expiration time, value); values are JSON strings
+        self.lock = threading.Lock()
+        self.stats = { 'hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0 }
+        self._disk_connections = threading.local()
+
+
+    # ############################################################################################
+    # Return the cached values for the given keys (as a dict); keys that aren't cached are left out
+    def get_many(self, keys):
+        found = {}
+        now = time.time()
+        with self.lock:
+            for key in keys:
+                entry = self.entries.get(key)
+                if entry is None:
+                    continue
+                if entry[0] < now:
+                    del self.entries[key]
+                    continue
+                self.entries.move_to_end(key)
+                found[key] = entry[1]
+            self.stats['hits'] += len(found)
+
+        missing_keys = [ key for key in keys if key not in found ]
+        if missing_keys and self.disk_cache_path:
+            disk_found = self._get_many_from_disk(missing_keys, now)
+            if disk_found:
+                self._put_many_in_memory(disk_found, now)
+                found.update(disk_found)
+                with self.lock:
+                    self.stats['disk_hits'] += len(disk_found)
+
+        with self.lock:
+            self.stats['misses'] += len(keys) - len(found)
+        return found
+
+
+    # ############################################################################################
+    # Store the given key -> value pairs
+    def put_many(self, values):
+        if not values:
+            return
+        now = time.time()
+        self._put_many_in_memory(values, now)
+        if self.disk_cache_path:
+            self._put_many_on_disk(values, now)
+
+
+    # ############################################################################################
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+    # ############################################################################################
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats['entries'] = len(self.entries)
+        lookups = stats['hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = round((stats['hits'] + stats['disk_hits']) / lookups, 4) if lookups else None
+        return stats
+
+
+    # ############################################################################################
+    def _put_many_in_memory(self, values, now):
+        expiration = now + self.ttl_seconds
+        with self.lock:
+            for key, value in values.items():
+                self.entries[key] = (expiration, value)
+                self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.stats['evictions'] += 1
+
+
+    # ############################################################################################
+    # The on-disk store is a small SQLite database; it is written in WAL mode so many processes can share it
+    def _get_disk_connection(self):
+        connection = getattr(self._disk_connections, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.disk_cache_path, timeout=5)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            # Stores from before entries recorded when they were last used can't be pruned, so they're started over
+            column_names = { row[1] for row in connection.execute("PRAGMA table_info(cache)") }
+            if column_names and 'last_used' not in column_names:
+                connection.execute("DROP TABLE cache")
+            connection.execute("CREATE TABLE IF NOT EXISTS cache ( key TEXT PRIMARY KEY, version TEXT, expiration REAL, value TEXT, last_used REAL )")
+            connection.execute("CREATE INDEX IF NOT EXISTS cache_last_used_index ON cache (last_used)")
+            # Throw out anything left over from a different synonymizer database version
+            connection.execute("DELETE FROM cache WHERE version != ?", (self.database_version,))
+            connection.commit()
+            self._disk_connections.connection = connection
+        return connection
+
+
+    def _get_many_from_disk(self, keys, now):
+        try:
+            connection = self._get_disk_connection()
+            found = {}
+            batch_size = 500
+            for i in range(0, len(keys), batch_size):
+                batch = keys[i:i + batch_size]
+                placeholders = ",".join("?" * len(batch))
+                rows = connection.execute(f"SELECT key,value FROM cache WHERE version = ? AND expiration > ? AND key IN ({placeholders})",
+                                          (self.database_version, now, *batch)).fetchall()
+                found.update(rows)
+            if found:
+                # Mark these entries as recently used, so pruning keeps them around
+                found_keys = list(found)
+                for i in range(0, len(found_keys), batch_size):
+                    batch = found_keys[i:i + batch_size]
+                    placeholders = ",".join("?" * len(batch))
+                    connection.execute(f"UPDATE cache SET last_used = ? WHERE key IN ({placeholders})", (now, *batch))
+                connection.commit()
+            return found
+        except sqlite3.Error as error:
+            eprint(f"WARNING: Unable to read from synonymizer disk cache {self.disk_cache_path}: {error}")
+            return {}
+
+
+    def _put_many_on_disk(self, values, now):
+        expiration = now + self.ttl_seconds
+        try:
+            connection = self._get_disk_connection()
+            connection.executemany("INSERT OR REPLACE INTO cache (key, version, expiration, value, last_used) VALUES (?,?,?,?,?)",
+                                   [ (key, self.database_version, expiration, value, now) for key, value in values.items() ])
+            connection.commit()
+            # Checks come often enough (and pruning goes far enough below the max) that this process's writes
+            # between checks can't take the store past max_disk_entries
+            target_entries = int(self.max_disk_entries * PRUNE_TARGET_FRACTION)
+            prune_check_interval = max(1, min(PRUNE_CHECK_INTERVAL, self.max_disk_entries - target_entries))
+            self.num_disk_writes_since_prune_check += len(values)
+            if self.num_disk_writes_since_prune_check >= prune_check_interval:
+                self.num_disk_writes_since_prune_check = 0
+                self._prune_disk(connection, now, self.max_disk_entries - prune_check_interval, target_entries)
+        except sqlite3.Error as error:
+            eprint(f"WARNING: Unable to write to synonymizer disk cache {self.disk_cache_path}: {error}")
+
+
+    def _prune_disk(self, connection, now, max_entries, target_entries):
+        connection.execute("DELETE FROM cache WHERE expiration <= ?", (now,))
+        num_entries = connection.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        if num_entries > max_entries:
+            connection.execute("DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY last_used LIMIT ?)",
+                               (num_entries - target_entries,))
+        connection.commit()
+
+
+# ################################################################################################
+# One cache per synonymizer database version per process
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_synonymizer_cache(database_path):
+    # The version is the database file name plus its size and modification time, so a replaced file counts as new
+    try:
+        stat = os.stat(database_path)
+        database_version = f"{os.path.basename(database_path)}:{stat.st_size}:{int(stat.st_mtime)}"
+    except OSError:
+        database_version = os.path.basename(database_path)
+    max_disk_entries = int(os.environ.get(DISK_CACHE_MAX_ENTRIES_ENV_VAR, DEFAULT_MAX_DISK_ENTRIES))
+    with _caches_lock:
+        cache = _caches.get(database_path)
+        if cache is None or cache.database_version != database_version:
+            cache = SynonymizerCache(database_version, disk_cache_path=os.environ.get(DISK_CACHE_PATH_ENV_VAR),
+                                     max_disk_entries=max_disk_entries)
+            _caches[database_path] = cache
+        return cache
@@ -20,7 +20,6 @@ import requests_cache
 from flask import Flask,redirect
 import copy
 
-import boto3
 import timeit
 
 import sqlalchemy
@@ -42,8 +41,13 @@ from ARAX_attribute_parser import ARAXAttributeParser
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../UI/OpenAPI/python-flask-server/")
 from openapi_server.models.response import Response as Envelope
 
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from response_storage import ResponseStorage, S3Backend, LocalDirectoryBackend
+
 trapi_version = '1.2.0'
 
+PENDING_WRITE_WAIT_SECONDS = 60  # How long after a response is created to wait for its (background) write to finish
+
 
 Base = declarative_base()
 
@@ -62,7 +66,7 @@ class Response(Base):
 class ResponseCache:
 
     #### Constructor
-    def __init__(self):
+    def __init__(self, storage=None):
         self.rtxConfig = RTXConfiguration()
         self.databaseName = "ResponseCache"
         self.engine_type = 'sqlite'
@@ -70,6 +74,15 @@ class ResponseCache:
             self.engine_type = 'mysql'
         self.connect()
 
+        #### Responses go to the S3 bucket, or to the local filesystem if the S3 write fails. Local files are read first
+        if storage is None:
+            response_dir = os.path.dirname(os.path.abspath(__file__)) + '/../../../data/responses_1_0'
+            s3_backend = S3Backend()
+            local_backend = LocalDirectoryBackend(response_dir)
+            storage = ResponseStorage([s3_backend, local_backend], read_backends=[local_backend, s3_backend])
+        self.storage = storage
+        self.stored_response_write = None
+
     #### Destructor
     def __del__(self):
         self.disconnect()
@@ -188,10 +201,10 @@ class ResponseCache:
             session.flush()
             session.commit()
             response_id = stored_response.response_id
-            response_filename = f"/responses/{response_id}.json"
+            response_key = response_id
         except:
             response.error(f"Unable to store response record in MySQL", error_code="InternalError")
-            response_filename = f"/responses/error.json"
+            response_key = "error"
             response_id = 0
 
         servername = 'localhost'
@@ -199,51 +212,27 @@ class ResponseCache:
             servername = 'arax.ncats.io'
         envelope.id = f"https://{servername}/api/arax/v1.2/response/{response_id}"
 
-        #### New system to store the responses in an S3 bucket
-        rtx_config = RTXConfiguration()
-        KEY_ID = rtx_config.config_secrets['s3']['access']
-        ACCESS_KEY = rtx_config.config_secrets['s3']['secret']
-        succeeded_to_s3 = False
-
-        try:
-            response.debug(f"Writing response JSON to S3 bucket")
-            s3 = boto3.resource(
-                's3',
-                region_name='us-west-2',
-                aws_access_key_id=KEY_ID,
-                aws_secret_access_key=ACCESS_KEY
-            )
-            serialized_query_graph = json.dumps(envelope.to_dict(), sort_keys=True, indent=2)
-            t0 = timeit.default_timer()
-            s3.Object('arax-response-storage', response_filename).put(Body=serialized_query_graph)
-            t1 = timeit.default_timer()
-            print("Elapsed time: "+str(t1-t0))
-            response.debug(f"Wrote {response_filename} in {t1-t0} seconds")
-            succeeded_to_s3 = True
-
-        except:
-            response.error(f"Unable to store response in S3 bucket as {response_filename}", error_code="InternalError")
+        #### Hand the response to the background writer, which compresses it and stores it in S3 (or locally if that fails)
+        response.debug(f"Queueing response JSON to be written to storage")
+        self.stored_response_write = self.storage.store(response_key, envelope.to_dict())
 
+        return response_id
 
-        #### if the S3 write failed, store it as a JSON file on the filesystem
-        if not succeeded_to_s3:
-            response_dir = os.path.dirname(os.path.abspath(__file__)) + '/../../../data/responses_1_0'
-            if not os.path.exists(response_dir):
-                try:
-                    os.mkdir(response_dir)
-                except:
-                    eprint(f"ERROR: Unable to create dir {response_dir}")
-
-            if os.path.exists(response_dir):
-                response_filename = f"{stored_response.response_id}.json"
-                response_path = f"{response_dir}/{response_filename}"
-                try:
-                    with open(response_path, 'w') as outfile:
-                        json.dump(envelope.to_dict(), outfile, sort_keys=True, indent=2)
-                except:
-                    eprint(f"ERROR: Unable to write response to file {response_path}")
 
-        return stored_response.response_id
+    ##################################################################################################
+    #### Report where the last stored response was written, if its background write has finished
+    def report_stored_response(self, response):
+        write = self.stored_response_write
+        if write is None:
+            return
+        if not write.done():
+            response.debug(f"Response is still being written to storage. Any write errors will be reported in the server log")
+            return
+        backend = write.result()
+        if backend is None:
+            response.error(f"Unable to store response in any storage location", error_code="InternalError")
+        elif backend is not self.storage.backends[0]:
+            response.warning(f"Unable to store response in {self.storage.backends[0]}, so it was stored in {backend} instead")
 
 
     ##################################################################################################
@@ -263,44 +252,17 @@ class ResponseCache:
             stored_response = session.query(Response).filter(Response.response_id==int(response_id)).first()
             if stored_response is not None:
 
-                found_response_locally = False
-                response_dir = os.path.dirname(os.path.abspath(__file__)) + '/../../../data/responses_1_0'
-                response_filename = f"{stored_response.response_id}.json"
-                response_path = f"{response_dir}/{response_filename}"
-                try:
-                    with open(response_path) as infile:
-                        envelope = json.load(infile)
-                    found_response_locally = True
-                except:
-                    eprint(f"ERROR: Unable to read response from file '{response_path}'. Will now try S3")
-
-                #### If the file wasn't local, try it in S3
-                if not found_response_locally:
-                    rtx_config = RTXConfiguration()
-                    KEY_ID = rtx_config.config_secrets['s3']['access']
-                    ACCESS_KEY = rtx_config.config_secrets['s3']['secret']
+                t0 = timeit.default_timer()
+                envelope = self.storage.get_response(stored_response.response_id)
 
-                    try:
-                        s3 = boto3.resource(
-                            's3',
-                            region_name='us-west-2',
-                            aws_access_key_id=KEY_ID,
-                            aws_secret_access_key=ACCESS_KEY
-                        )
-
-                        response_filename = f"/responses/{response_id}.json"
-                        eprint(f"INFO: Attempting to read {response_filename} from S3")
-                        t0 = timeit.default_timer()
-
-                        content = s3.Object('arax-response-storage', response_filename).get()["Body"].read()
-                        envelope = json.loads(content)
-                        t1 = timeit.default_timer()
-                        print("Elapsed time: "+str(t1-t0))
-                        eprint(f"INFO: Successfully read {response_filename} from S3 in {t1-t0} seconds")
-
-                    except:
-                        eprint(f"ERROR: Unable to read {response_filename} from S3")
-                        return( { "status": 404, "title": "Response not found", "detail": "There is no response corresponding to response_id="+str(response_id), "type": "about:blank" }, 404)
+                #### A new response may still be being written by the (other) process that created it
+                response_age = (datetime.now() - stored_response.response_datetime).total_seconds()
+                if envelope is None and response_age < PENDING_WRITE_WAIT_SECONDS:
+                    envelope = self.storage.wait_for_response(stored_response.response_id, PENDING_WRITE_WAIT_SECONDS - response_age)
+                if envelope is None:
+                    eprint(f"ERROR: Unable to read response {response_id} from storage")
+                    return( { "status": 404, "title": "Response not found", "detail": "There is no response corresponding to response_id="+str(response_id), "type": "about:blank" }, 404)
+                eprint(f"INFO: Read response {response_id} from storage in {timeit.default_timer()-t0} seconds")
 
 
                 #### Perform a validation on it
@@ -0,0 +1,332 @@
+#!/usr/bin/python3
+# Storage for the responses kept by the ResponseCache. Each response is serialized as compact JSON and streamed
+# through zstd (if the zstandard package is installed, otherwise gzip) into an object named by its response id.
+# Writes are handed to a background thread, so storing a response doesn't hold up the query that produced it; until a
+# response is written, reads of it are answered from the queued copy. (Other slow writes at the end of a query can be
+# handed to the same thread with write_in_background.) Where things are stored is pluggable: an S3 bucket (or anything
+# that speaks the S3 API) or a local directory.
+import sys
+def eprint(*args, **kwargs): print(*args, file=sys.stderr, **kwargs)
+
+import atexit
+import concurrent.futures
+import gzip
+import io
+import json
+import os
+import queue
+import tempfile
+import threading
+import time
+import timeit
+from typing import BinaryIO, Callable, Dict, List, Optional
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../..")
+from RTXConfiguration import RTXConfiguration
+
+
+SPOOL_MAX_BYTES = 64 * 1024 * 1024  # Serialized responses bigger than this are spooled to disk before being uploaded
+WRITE_CHUNK_BYTES = 1024 * 1024
+MAX_QUEUED_WRITES = 8  # Queueing more writes than this at once makes the caller wait for the writer to catch up
+PENDING_RESPONSE_POLL_SECONDS = 0.5
+# Responses written with the compression available here are the likeliest to be found; plain .json files are ones
+# stored before responses were compressed
+READ_EXTENSIONS = ['.zst', '.gz', ''] if zstandard is not None else ['.gz', '.zst', '']
+
+
+class LocalDirectoryBackend:
+    """
+    Stores objects as files under a local directory.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def _get_path(self, key: str) -> str:
+        return os.path.join(self.directory, *key.split('/'))
+
+    def put(self, key: str, fileobj: BinaryIO):
+        # Written to a temporary file and moved into place, so readers never see a partial object
+        path = self._get_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.tmp{os.getpid()}.{threading.get_ident()}"
+        with open(temp_path, 'wb') as outfile:
+            while True:
+                chunk = fileobj.read(WRITE_CHUNK_BYTES)
+                if not chunk:
+                    break
+                outfile.write(chunk)
+        os.replace(temp_path, path)
+
+    def open(self, key: str) -> Optional[BinaryIO]:
+        try:
+            return open(self._get_path(key), 'rb')
+        except FileNotFoundError:
+            return None
+
+    def __str__(self):
+        return f"directory {self.directory}"
+
+
+class S3Backend:
+    """
+    Stores objects in an S3 bucket. By default the bucket is reached with the credentials in the RTX configuration;
+    pass in an s3 resource (e.g., one pointed at a local S3 stand-in via endpoint_url) to use something else.
+    """
+
+    def __init__(self, bucket_name: str = 'arax-response-storage', key_prefix: str = '/responses/', s3=None):
+        self.bucket_name = bucket_name
+        self.key_prefix = key_prefix
+        self._s3 = s3
+
+    @property
+    def s3(self):
+        if self._s3 is None:
+            import boto3
+            rtx_config = RTXConfiguration()
+            self._s3 = boto3.resource(
+                's3',
+                region_name='us-west-2',
+                aws_access_key_id=rtx_config.config_secrets['s3']['access'],
+                aws_secret_access_key=rtx_config.config_secrets['s3']['secret']
+            )
+        return self._s3
+
+    def _get_object(self, key: str):
+        return self.s3.Object(self.bucket_name, f"{self.key_prefix}{key}")
+
+    @staticmethod
+    def _is_not_found(error) -> bool:
+        return error.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound')
+
+    def put(self, key: str, fileobj: BinaryIO):
+        # upload_fileobj streams big objects up in parts
+        self._get_object(key).upload_fileobj(fileobj)
+
+    def open(self, key: str) -> Optional[BinaryIO]:
+        from botocore.exceptions import ClientError
+        try:
+            return self._get_object(key).get()['Body']
+        except ClientError as error:
+            if self._is_not_found(error):
+                return None
+            raise
+
+    def __str__(self):
+        return f"S3 bucket {self.bucket_name}"
+
+
+class ResponseStorage:
+    """
+    Writes responses to the first of the given backends that works, and reads them from whichever backend has them
+    (trying the backends in the order given by read_backends, if given).
+    """
+
+    def __init__(self, backends: List, read_backends: Optional[List] = None):
+        self.backends = backends
+        self.read_backends = read_backends if read_backends is not None else backends
+        # Response id -> envelope queued to be written. Only single (atomic) dict operations are used on it, so the
+        # writer never waits on a lock the thread that queued the write might hold
+        self.pending_writes: Dict[str, dict] = dict()
+
+    def store(self, response_id, envelope_dict: dict) -> concurrent.futures.Future:
+        """
+        Queues the given (serializable) envelope to be written by the background writer and returns right away. The
+        envelope must not be changed afterward. The returned future resolves to the backend the envelope was written
+        to (or None if it couldn't be written).
+        """
+        self.pending_writes[str(response_id)] = envelope_dict
+        return write_in_background(self._write_queued, response_id, envelope_dict)
+
+    def _write_queued(self, response_id, envelope_dict: dict):
+        try:
+            return self.write(response_id, envelope_dict)
+        except Exception as error:
+            eprint(f"ERROR: Unable to write response {response_id}: {error}")
+            return None
+        finally:
+            self.pending_writes.pop(str(response_id), None)
+
+    def _get_pending_json(self, response_id) -> Optional[bytes]:
+        envelope_dict = self.pending_writes.get(str(response_id))
+        return json.dumps(envelope_dict).encode('utf-8') if envelope_dict is not None else None
+
+    def write(self, response_id, envelope_dict: dict):
+        """
+        Writes the given envelope right away. Returns the backend it was written to, or None if it couldn't be written.
+        """
+        t0 = timeit.default_timer()
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES) as content_file:
+            extension = _serialize_envelope(envelope_dict, content_file)
+            for backend in self.backends:
+                try:
+                    content_file.seek(0)
+                    backend.put(f"{response_id}.json{extension}", content_file)
+                    eprint(f"INFO: Wrote response {response_id} to {backend} in {timeit.default_timer() - t0:.2f} seconds")
+                    return backend
+                except Exception as error:
+                    eprint(f"ERROR: Unable to write response {response_id} to {backend}: {error}")
+        return None
+
+    def open_response(self, response_id) -> Optional[BinaryIO]:
+        """
+        Returns a stream of the (decompressed) JSON of the given response, or None if it isn't stored anywhere.
+        """
+        pending_json = self._get_pending_json(response_id)
+        if pending_json is not None:
+            return io.BytesIO(pending_json)
+        for backend in self.read_backends:
+            try:
+                for extension in READ_EXTENSIONS:
+                    stream = backend.open(f"{response_id}.json{extension}")
+                    if stream is not None:
+                        return _get_decompressing_stream(stream, extension)
+            except Exception as error:
+                eprint(f"ERROR: Unable to read response {response_id} from {backend}: {error}")
+        return None
+
+    def get_response(self, response_id) -> Optional[dict]:
+        """
+        Returns the given response as a dict, or None if it isn't stored anywhere.
+        """
+        stream = self.open_response(response_id)
+        if stream is None:
+            return None
+        try:
+            return json.loads(stream.read())
+        finally:
+            stream.close()
+
+    def wait_for_response(self, response_id, timeout: float) -> Optional[dict]:
+        """
+        Like get_response(), but keeps looking for up to timeout seconds, for responses that another process is still
+        writing.
+        """
+        deadline = timeit.default_timer() + timeout
+        while True:
+            envelope_dict = self.get_response(response_id)
+            if envelope_dict is not None or timeit.default_timer() >= deadline:
+                return envelope_dict
+            time.sleep(PENDING_RESPONSE_POLL_SECONDS)
+
+
+def _serialize_envelope(envelope_dict: dict, outfile: BinaryIO) -> str:
+    # Streams compact JSON through the compressor into outfile; returns the extension for the compression used
+    if zstandard is not None:
+        compressed_file = zstandard.ZstdCompressor(level=3).stream_writer(outfile, closefd=False)
+        extension = '.zst'
+    else:
+        compressed_file = gzip.GzipFile(fileobj=outfile, mode='wb', compresslevel=6, mtime=0)
+        extension = '.gz'
+    chunks = []
+    buffered_length = 0
+    for chunk in json.JSONEncoder(separators=(',', ':')).iterencode(envelope_dict):
+        chunks.append(chunk)
+        buffered_length += len(chunk)
+        if buffered_length >= WRITE_CHUNK_BYTES:
+            compressed_file.write(''.join(chunks).encode('utf-8'))
+            chunks = []
+            buffered_length = 0
+    compressed_file.write(''.join(chunks).encode('utf-8'))
+    compressed_file.close()
+    return extension
+
+
+def _get_decompressing_stream(stream: BinaryIO, extension: str) -> BinaryIO:
+    if extension == '.zst':
+        if zstandard is None:
+            stream.close()
+            raise ValueError(f"Response is zstd-compressed, but the zstandard package isn't installed")
+        return zstandard.ZstdDecompressor().stream_reader(stream, closefd=True)
+    if extension == '.gz':
+        return _ClosingGzipFile(fileobj=stream, mode='rb')
+    return stream
+
+
+class _ClosingGzipFile(gzip.GzipFile):
+    # A GzipFile that also closes the stream it reads from
+    def close(self):
+        source = self.fileobj
+        try:
+            super().close()
+        finally:
+            if source is not None:
+                source.close()
+
+
+# The background writer: one thread per process, working through a queue of writes. Each queued write has an event in
+# _unfinished_writes that is set once the write is done.
+_write_queue = None
+_writer_pid = None
+_writer_lock = threading.Lock()
+_unfinished_writes: List[threading.Event] = []
+
+
+def _get_write_queue() -> queue.Queue:
+    global _write_queue, _writer_pid, _unfinished_writes
+    with _writer_lock:
+        # Threads don't survive a fork, so a forked child starts its own writer
+        if _write_queue is None or _writer_pid != os.getpid():
+            _write_queue = queue.Queue(maxsize=MAX_QUEUED_WRITES)
+            _unfinished_writes = []
+            _writer_pid = os.getpid()
+            threading.Thread(target=_run_writer, args=(_write_queue,), name='ResponseStorageWriter', daemon=True).start()
+        return _write_queue
+
+
+def write_in_background(function: Callable, *args) -> concurrent.futures.Future:
+    """
+    Queues function(*args) to be run by this process's background writer and returns a future for its result. The
+    arguments must not be changed afterward. wait_for_pending_writes() waits for these writes too.
+    """
+    future = concurrent.futures.Future()
+    write_queue = _get_write_queue()
+    written = threading.Event()
+    _unfinished_writes.append(written)
+    write_queue.put((function, args, future, written))
+    return future
+
+
+def _run_writer(write_queue: queue.Queue):
+    while True:
+        function, args, future, written = write_queue.get()
+        result = None
+        error = None
+        try:
+            result = function(*args)
+        except Exception as write_error:
+            eprint(f"ERROR: Background write {getattr(function, '__qualname__', function)} failed: {write_error}")
+            error = write_error
+        finally:
+            written.set()
+            _unfinished_writes.remove(written)
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+            write_queue.task_done()
+
+
+def wait_for_pending_writes(timeout: Optional[float] = None) -> bool:
+    """
+    Blocks until every response queued for writing in this process has been written, or until timeout seconds have
+    passed; returns whether they were all written. Processes that end with os._exit() must call this first, since it
+    skips the normal exit handlers. It only waits on each write's own event, so it is safe to call from a signal
+    handler.
+    """
+    if _writer_pid != os.getpid():
+        return True
+    deadline = timeit.default_timer() + timeout if timeout is not None else None
+    for written in list(_unfinished_writes):
+        remaining = max(0.0, deadline - timeit.default_timer()) if deadline is not None else None
+        if not written.wait(remaining):
+            return False
+    return True
+
+
+atexit.register(wait_for_pending_writes)
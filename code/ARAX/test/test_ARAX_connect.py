@@ -173,5 +173,38 @@ def test_none_object():
     assert len(message.results) > 0
 
 
+def test_connect_path_search_meets_in_the_middle():
+    from connect_path_search import ConnectPathSearch, FORWARD, BACKWARD
+
+    class FakeEdge:
+        def __init__(self, subject, object):
+            self.subject = subject
+            self.object = object
+
+    # a-b-c-d-e plus a shortcut b-d and a dead end c-x
+    edges = {"ab": FakeEdge("a", "b"), "bc": FakeEdge("b", "c"), "cd": FakeEdge("c", "d"), "de": FakeEdge("d", "e"),
+             "bd": FakeEdge("b", "d"), "xc": FakeEdge("x", "c")}
+    expanded = {FORWARD: [], BACKWARD: []}
+
+    def expand_hop(node_ids, direction):
+        expanded[direction] += node_ids
+        hop_edges = {key: edge for key, edge in edges.items() if edge.subject in node_ids or edge.object in node_ids}
+        hop_nodes = {node_id: node_id for edge in hop_edges.values() for node_id in (edge.subject, edge.object)}
+        return hop_nodes, hop_edges
+
+    path_search = ConnectPathSearch(expand_hop, max_frontier_size=500)
+    assert path_search.find_paths(["a"], ["e"], 1) is None
+    assert path_search.find_paths(["a"], ["e"], 2) is None
+    position_nodes, hop_edges = path_search.find_paths(["a"], ["e"], 3)
+    assert position_nodes == [{"a"}, {"b"}, {"d"}, {"e"}]
+    assert hop_edges == [{"ab"}, {"bd"}, {"de"}]
+    position_nodes, hop_edges = path_search.find_paths(["a"], ["e"], 4)
+    assert position_nodes == [{"a"}, {"b"}, {"c"}, {"d"}, {"e"}]
+    assert hop_edges == [{"ab"}, {"bc"}, {"cd"}, {"de"}]
+    # No node's neighborhood is fetched more than once in either direction, even as the path length goes up
+    for direction in (FORWARD, BACKWARD):
+        assert len(expanded[direction]) == len(set(expanded[direction]))
+
+
 if __name__ == "__main__":
     pytest.main(['-v'])
\ No newline at end of file
@@ -185,3 +185,32 @@ def test_with_only_qg():
     assert len(message.results) > 0
 
 
+
+
+def test_explainable_dtd_top_n_lookups(tmp_path):
+    sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../ARAXQuery/Infer/scripts")
+    from ExplianableDTD_db import ExplainableDTD
+    (tmp_path / "test.db").touch()
+    edtd = ExplainableDTD(database_name="test.db", outdir=str(tmp_path))
+    edtd.create_tables()
+    scores = [(f"drug:{drug}", f"drug {drug}", "disease:1", "disease 1", 0.1, score, 0.1)
+              for drug, score in [(1, 0.2), (2, 0.9), (3, 0.5)]]
+    paths = [(f"drug:{drug}", f"drug {drug}", "disease:1", "disease 1", f"drug {drug}->treats->disease 1 ({path})", score)
+             for drug in [1, 2, 3] for path, score in [(1, 0.3), (2, 0.7), (3, 0.5)]]
+    edtd.connection.executemany("INSERT INTO PREDICTION_SCORE_TABLE VALUES (?,?,?,?,?,?,?)", scores)
+    edtd.connection.executemany("INSERT INTO PATH_RESULT_TABLE VALUES (?,?,?,?,?,?)", paths)
+    edtd.create_indexes()
+
+    def check_lookups():
+        top_drugs = edtd.get_top_drugs_for_disease("disease:1", top_n_drugs=2)
+        assert top_drugs['drug_id'].tolist() == ["drug:2", "drug:3"]
+        top_paths = edtd.get_top_paths_for_disease(["disease:1"], top_n_drugs=2, top_n_paths=2)
+        assert list(top_paths) == [("drug:2", "disease:1"), ("drug:3", "disease:1")]
+        assert [path_score for _, path_score in top_paths[("drug:2", "disease:1")]] == [0.7, 0.5]
+        assert len(edtd.get_top_drugs_for_disease("disease:1")) == 3
+
+    # Databases without the pre-ranked tables are ranked on the fly, and should give the same answers
+    check_lookups()
+    edtd.create_ranked_tables()
+    check_lookups()
+    edtd.disconnect()
@@ -346,6 +346,73 @@ def test_FET_ex2():
         assert query_edge.object in query_node_keys
 
 
+def test_FET_pvalues_match_scipy():
+    sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../ARAXQuery/Overlay")
+    import scipy.stats as stats
+    from fisher_exact_utilities import fisher_exact_pvalues
+    tables = [(0, 0, 0, 0), (3, 0, 0, 0), (5, 5, 5, 5), (3, 1, 1, 3), (1, 9, 11, 3), (7, 17, 15, 5),
+              (12, 88, 188, 299712), (0, 2500, 200, 297300), (40, 10, 160, 299790), (2, 3, 198, 299797)]
+    pvalues = fisher_exact_pvalues(*zip(*tables))
+    for (a, b, c, d), pvalue in zip(tables, pvalues):
+        assert pvalue == stats.fisher_exact([[a, b], [c, d]])[1]
+
+
+def test_FET_neighbor_count_table_layouts(tmp_path):
+    sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../ARAXQuery/Overlay")
+    import sqlite3
+    from fisher_exact_utilities import NeighborCountTable
+    neighbor_counts = {"CHEBI:1": {"biolink:Gene": 5, "biolink:Disease": 2}, "CHEBI:2": {"biolink:Disease": 7},
+                       "CHEBI:3": {"biolink:Gene": 1}}
+    categories = ["biolink:Disease", "biolink:Gene"]
+    for layout in ["json", "compact"]:
+        connection = sqlite3.connect(tmp_path / f"{layout}.sqlite")
+        connection.execute("CREATE TABLE neighbors (id TEXT, neighbor_counts TEXT)")
+        connection.executemany("INSERT INTO neighbors (rowid, id, neighbor_counts) VALUES (?, ?, ?)",
+                               [(index, node_id, json.dumps(counts)) for index, (node_id, counts) in enumerate(neighbor_counts.items(), start=1)])
+        if layout == "compact":
+            connection.execute("CREATE TABLE neighbor_categories (category_id INTEGER PRIMARY KEY, category TEXT)")
+            connection.execute("CREATE TABLE category_neighbor_counts (category_id INTEGER, node_index INTEGER, count INTEGER, "
+                               "PRIMARY KEY (category_id, node_index)) WITHOUT ROWID")
+            connection.executemany("INSERT INTO neighbor_categories VALUES (?, ?)", enumerate(categories))
+            connection.executemany("INSERT INTO category_neighbor_counts VALUES (?, ?, ?)",
+                                   [(categories.index(category), index, count) for index, counts in enumerate(neighbor_counts.values(), start=1)
+                                    for category, count in counts.items()])
+        connection.commit()
+        connection.close()
+        table = NeighborCountTable(str(tmp_path / f"{layout}.sqlite"), layout)
+        assert table.get_neighbor_counts(["CHEBI:1", "CHEBI:2", "CHEBI:3", "CHEBI:4"], "biolink:Gene") == {"CHEBI:1": 5, "CHEBI:3": 1}
+        assert table.get_neighbor_counts(["CHEBI:2"], "biolink:Disease") == {"CHEBI:2": 7}
+        assert table.get_neighbor_counts(["CHEBI:1"], "biolink:Protein") == {}
+
+
+def test_cohd_pair_store(tmp_path):
+    sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../KnowledgeSources/COHD_local/scripts")
+    import sqlite3
+    from cohd_pair_store import build_cohd_pair_store, get_cohd_pair_store
+    database_path = str(tmp_path / "cohd.db")
+    connection = sqlite3.connect(database_path)
+    connection.execute("CREATE TABLE PAIRED_CONCEPT_COUNTS_ASSOCIATIONS( concept_pair_id VARCHAR(255), dataset_id TINYINT, concept_id_1 INT, concept_id_2 INT, concept_count INT, concept_prevalence FLOAT, chi_square_t FLOAT, chi_square_p FLOAT, expected_count FLOAT, ln_ratio FLOAT, rel_freq_1 FLOAT, rel_freq_2 FLOAT)")
+    connection.executemany("INSERT INTO PAIRED_CONCEPT_COUNTS_ASSOCIATIONS VALUES (?,?,?,?,?,?,?,?,?,?,?,?)",
+                           [("192855_2008271", 3, 192855, 2008271, 10, 0.2, 5.0, 0.03, 4.0, 0.9, 0.1, 0.1),
+                            ("2008271_192855", 3, 2008271, 192855, 12, 0.1, 8.0, 0.01, 4.0, 1.1, 0.1, 0.1),
+                            ("8507_939259", 3, 8507, 939259, 3, 0.4, 1.0, 0.3, 2.0, -0.5, 0.1, 0.1),
+                            ("8507_939259", 1, 8507, 939259, 3, 0.7, 1.0, 0.3, 2.0, -0.5, 0.1, 0.1)])
+    connection.commit()
+    connection.close()
+    store_path = str(tmp_path / "cohd_pairs.store")
+    build_cohd_pair_store(database_path, store_path)
+    store = get_cohd_pair_store(store_path)
+    assert store.is_current(database_path)
+    found, statistics = store.get_pair_statistics([2008271, 939259, 8507, 192855], [192855, 8507, 1, 2008271], dataset_id=3)
+    assert list(found) == [True, True, False, True]
+    assert list(statistics['concept_frequency'][[0, 1, 3]]) == [0.2, 0.4, 0.2]
+    assert list(statistics['ln_ratio'][[0, 1, 3]]) == [1.1, -0.5, 1.1]
+    assert list(statistics['chi_square'][[0, 1, 3]]) == [8.0, 1.0, 8.0]
+    assert list(statistics['chi_square_pvalue'][[0, 1, 3]]) == [0.01, 0.3, 0.01]
+    found, statistics = store.get_pair_statistics([8507], [939259], dataset_id=1)
+    assert found[0] and statistics['concept_frequency'][0] == 0.7
+
+
 @pytest.mark.slow
 def test_paired_concept_frequency_virtual():
     query = {"operations": {"actions": [
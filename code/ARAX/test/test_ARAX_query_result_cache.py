@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+
+# Usage:
+# run all: pytest -v test_ARAX_query_result_cache.py
+# run just certain tests: pytest -v test_ARAX_query_result_cache.py -k test_query_key_is_canonical
+
+import sys
+import os
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../ARAXQuery")
+from query_result_cache import QueryResultCache, get_query_key, is_too_large_to_cache, MAX_CACHED_MESSAGE_ELEMENTS
+
+
+CANONICAL_CURIES = {"CHEMBL.COMPOUND:CHEMBL112": "PUBCHEM.COMPOUND:1983", "DRUGBANK:DB00316": "PUBCHEM.COMPOUND:1983"}
+ACTIONS = [{"command": "expand", "parameters": {"kp": "infores:rtx-kg2"}},
+           {"command": "resultify", "parameters": {}},
+           {"command": "return", "parameters": {"store": "true"}}]
+
+
+def _canonicalize(curies):
+    return {curie: CANONICAL_CURIES[curie] for curie in curies if curie in CANONICAL_CURIES}
+
+
+def _make_query_graph(ids, predicates, categories):
+    return {"nodes": {"n0": {"ids": ids, "categories": ["biolink:ChemicalEntity"]},
+                      "n1": {"categories": categories}},
+            "edges": {"e0": {"subject": "n0", "object": "n1", "predicates": predicates}}}
+
+
+def test_query_key_is_canonical():
+    key = get_query_key(_make_query_graph(["CHEMBL.COMPOUND:CHEMBL112"], ["biolink:interacts_with", "biolink:affects"],
+                                          ["biolink:Protein"]), ACTIONS, {}, "ARAX", _canonicalize)
+    # Synonymous curies, unordered/unprefixed predicates and categories, and return() parameters don't matter
+    same_key = get_query_key(_make_query_graph(["DRUGBANK:DB00316"], ["affects", " biolink:interacts_with"], ["Protein"]),
+                             ACTIONS[:2] + [{"command": "return", "parameters": {"store": "false"}}], {}, "ARAX", _canonicalize)
+    assert key == same_key
+    assert key != get_query_key(_make_query_graph(["DRUGBANK:DB00316"], ["biolink:affects"], ["biolink:Protein"]),
+                                ACTIONS, {}, "ARAX", _canonicalize)
+    assert key != get_query_key(_make_query_graph(["CHEMBL.COMPOUND:CHEMBL112"], ["biolink:interacts_with", "biolink:affects"],
+                                                  ["biolink:Protein"]), ACTIONS, {"kp_timeout": 30}, "ARAX", _canonicalize)
+    assert get_query_key(None, [{"command": "fetch_message", "parameters": {}}], {}, "ARAX", _canonicalize) is None
+
+
+def test_lru_eviction_and_ttl(tmp_path):
+    cache = QueryResultCache("v1", str(tmp_path / "cache.sqlite"), ttl_seconds=60, max_entries=2, max_memory_entries=1)
+    for number in range(3):
+        cache.put(f"query{number}", {"message": {"results": [number]}})
+    assert cache.get("query0") is None
+    assert cache.get("query1") == {"message": {"results": [1]}}
+    assert cache.get("query2") == {"message": {"results": [2]}}
+    expired_cache = QueryResultCache("v1", str(tmp_path / "cache.sqlite"), ttl_seconds=0.01)
+    expired_cache.put("query3", {"message": {}})
+    time.sleep(0.05)
+    assert expired_cache.get("query3") is None
+
+
+def test_new_database_versions_invalidate(tmp_path):
+    QueryResultCache("v1", str(tmp_path / "cache.sqlite")).put("query", {"message": {}})
+    assert QueryResultCache("v1", str(tmp_path / "cache.sqlite")).get("query") == {"message": {}}
+    assert QueryResultCache("v2", str(tmp_path / "cache.sqlite")).get("query") is None
+
+
+def test_too_large_to_cache():
+    assert not is_too_large_to_cache(100, 5000, 20000)
+    assert is_too_large_to_cache(0, MAX_CACHED_MESSAGE_ELEMENTS, 1)
+
+
+if __name__ == "__main__":
+    import pytest
+    pytest.main(['-v', 'test_ARAX_query_result_cache.py'])
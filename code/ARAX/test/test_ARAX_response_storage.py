@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+
+# Usage:
+# run all: pytest -v test_ARAX_response_storage.py
+# run just certain tests: pytest -v test_ARAX_response_storage.py -k test_write_and_read
+
+import sys
+import os
+import json
+import threading
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../ResponseCache")
+from response_storage import ResponseStorage, LocalDirectoryBackend, wait_for_pending_writes, write_in_background, zstandard
+
+extension = '.zst' if zstandard is not None else '.gz'
+
+
+def _make_envelope(n_results: int) -> dict:
+    return {"status": "Success", "description": f"{n_results} results",
+            "message": {"results": [{"essence": f"result {i}", "score": i / 10} for i in range(n_results)]}}
+
+
+def test_write_and_read(tmp_path):
+    storage = ResponseStorage([LocalDirectoryBackend(str(tmp_path))])
+    envelope = _make_envelope(1000)
+    assert storage.write(1, envelope) is not None
+    assert storage.get_response(1) == envelope
+    with storage.open_response(1) as stream:
+        assert json.loads(stream.read()) == envelope
+    assert storage.get_response(2) is None
+
+
+def test_one_object_per_response(tmp_path):
+    storage = ResponseStorage([LocalDirectoryBackend(str(tmp_path))])
+    storage.write(1, _make_envelope(10))
+    storage.write(2, _make_envelope(10))
+    assert sorted(os.listdir(tmp_path)) == [f"1.json{extension}", f"2.json{extension}"]
+    assert storage.get_response(2) == _make_envelope(10)
+
+
+def test_fallback_and_legacy_responses(tmp_path):
+    broken_backend = LocalDirectoryBackend(str(tmp_path / "not_a_directory"))
+    (tmp_path / "not_a_directory").write_text("")
+    local_backend = LocalDirectoryBackend(str(tmp_path / "local"))
+    storage = ResponseStorage([broken_backend, local_backend])
+    assert storage.write(1, _make_envelope(5)) is local_backend
+    assert storage.get_response(1) == _make_envelope(5)
+    # Responses stored as plain JSON files before responses were compressed can still be read
+    (tmp_path / "local" / "7.json").write_text(json.dumps(_make_envelope(3), indent=2))
+    assert storage.get_response(7) == _make_envelope(3)
+
+
+def test_background_writes(tmp_path):
+    storage = ResponseStorage([LocalDirectoryBackend(str(tmp_path))])
+    for response_id in range(20):
+        storage.store(response_id, _make_envelope(response_id))
+    wait_for_pending_writes()
+    for response_id in range(20):
+        assert storage.get_response(response_id) == _make_envelope(response_id)
+
+
+def test_pending_writes(tmp_path):
+    class SlowBackend(LocalDirectoryBackend):
+        def put(self, key, fileobj):
+            write_allowed.wait()
+            super().put(key, fileobj)
+    write_allowed = threading.Event()
+    storage = ResponseStorage([SlowBackend(str(tmp_path))])
+    write = storage.store(1, _make_envelope(5))
+    # A response that's still being written is read from the queued copy
+    assert storage.get_response(1) == _make_envelope(5)
+    assert not write.done()
+    assert not wait_for_pending_writes(timeout=0.1)
+    write_allowed.set()
+    assert wait_for_pending_writes(timeout=10)
+    assert write.result(timeout=10) is storage.backends[0]
+    assert storage.pending_writes == {}
+    assert storage.wait_for_response(1, timeout=1) == _make_envelope(5)
+    assert storage.wait_for_response(2, timeout=0) is None
+
+
+def test_write_in_background():
+    written = []
+    write = write_in_background(written.append, "result")
+    failed_write = write_in_background(int, "not a number")
+    assert wait_for_pending_writes(timeout=10)
+    assert written == ["result"]
+    assert write.result() is None
+    assert isinstance(failed_write.exception(), ValueError)
+
+
+if __name__ == "__main__":
+    import pytest
+    pytest.main(['-v', 'test_ARAX_response_storage.py'])
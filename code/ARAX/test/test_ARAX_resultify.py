@@ -2,6 +2,7 @@
 # Usage:  python3 ARAX_resultify_testcases.py
 #         python3 ARAX_resultify_testcases.py test_issue692
 
+import copy
 import os
 import sys
 import pytest
@@ -9,7 +10,7 @@ import pytest
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../ARAXQuery")
 from ARAX_response import ARAXResponse
 from ARAX_messenger import ARAXMessenger
-from typing import List, Union, Dict, Tuple, Set, Iterable
+from typing import List, Union, Dict, Tuple, Set, Iterable, DefaultDict, Optional
 
 import ARAX_resultify
 from ARAX_resultify import ARAXResultify
@@ -193,6 +194,190 @@ def _get_kg_edge_keys_using_node(node_key: str, kg: KnowledgeGraph) -> Set[str]:
     return {edge_key for edge_key, edge in kg.edges.items() if node_key in {edge.subject, edge.object}}
 
 
+# ---------------------------------------------------------------------------------------------------------------------
+# Differential testing: every test below that creates result graphs also runs the original (qnode-by-qnode fan-out)
+# result graph construction and checks that the join-based engine in ARAX_resultify produces identical result graphs
+
+def _get_canonical_result_graphs(result_graphs: List[dict]) -> List[str]:
+    return sorted(str((sorted((qnode_key, sorted(node_keys)) for qnode_key, node_keys in result_graph["nodes"].items()),
+                       sorted((qedge_key, sorted(edge_keys)) for qedge_key, edge_keys in result_graph["edges"].items())))
+                  for result_graph in result_graphs)
+
+
+@pytest.fixture(autouse=True)
+def compare_to_legacy_result_graph_construction(monkeypatch):
+    create_result_graphs = ARAX_resultify._create_result_graphs
+
+    def _create_result_graphs_and_compare(*args, **kwargs):
+        base_result_graphs = kwargs.get("base_result_graphs")
+        legacy_kwargs = dict(kwargs, base_result_graphs=copy.deepcopy(base_result_graphs))
+        legacy_result_graphs = _legacy_create_result_graphs(*args, **legacy_kwargs)
+        original_base_result_graphs = _get_canonical_result_graphs(base_result_graphs) if base_result_graphs else None
+        result_graphs = create_result_graphs(*args, **kwargs)
+        assert _get_canonical_result_graphs(result_graphs) == _get_canonical_result_graphs(legacy_result_graphs)
+        if base_result_graphs:
+            assert _get_canonical_result_graphs(base_result_graphs) == original_base_result_graphs
+        return result_graphs
+
+    monkeypatch.setattr(ARAX_resultify, "_create_result_graphs", _create_result_graphs_and_compare)
+
+
+def _legacy_clean_up_dead_ends(result_graph: Dict[str, Dict[str, Set[str]]],
+                               sub_qg_adj_map: Dict[str, Set[str]],
+                               kg_node_adj_map_by_qg_key: Dict[str, Dict[str, Dict[str, Set[str]]]]) -> Dict[str, Dict[str, Set[str]]]:
+    """
+    This function iteratively removes "dead ends" from a result graph until no more dead ends can be found. Dead ends
+    can be thought of as intermediate nodes (typically for is_set=True qnodes) that connect to only a subset of the
+    nodes they should be connected to according to the query graph. Only the part of the result graph that has been
+    "fulfilled" so far during the result construction process is evaluated here: the sub_qg_adj_map must contain only
+    info for qnodes fulfilled thus far.
+    """
+    fulfilled_qnode_keys = set(sub_qg_adj_map)
+    found_dead_ends = True
+    while found_dead_ends:
+        found_dead_ends = False
+        nodes_to_remove = dict()
+        # Go through each qnode "role" in our result graph, and check the nodes corresponding to that qnode
+        for qnode_key in fulfilled_qnode_keys:
+            corresponding_node_keys = result_graph["nodes"][qnode_key]
+            required_neighbor_qnode_keys = sub_qg_adj_map[qnode_key]
+            # Make sure each node for this qnode ID is connected to at LEAST one node fulfilling each neighbor qnode ID
+            for corresponding_node_key in corresponding_node_keys:
+                for neighbor_qnode_key in required_neighbor_qnode_keys:
+                    # Look for at least one node in the result graph in this neighbor spot that this node is linked to
+                    neighbors_in_kg = kg_node_adj_map_by_qg_key[qnode_key][corresponding_node_key][neighbor_qnode_key]
+                    if not neighbors_in_kg.intersection(result_graph["nodes"][neighbor_qnode_key]):
+                        # Mark this node for removal from this result graph since it's lacking a neighbor here
+                        found_dead_ends = True
+                        if qnode_key not in nodes_to_remove:
+                            nodes_to_remove[qnode_key] = set()
+                        nodes_to_remove[qnode_key].add(corresponding_node_key)
+        # Actually go through and remove our nodes marked for removal
+        for qnode_key, node_keys in nodes_to_remove.items():
+            result_graph["nodes"][qnode_key] = result_graph["nodes"][qnode_key].difference(node_keys)
+    return result_graph
+
+
+def _legacy_create_result_graphs(kg: KnowledgeGraph,
+                                 qg: QueryGraph,
+                                 kg_node_keys_by_qg_key: Dict[str, Set[str]],
+                                 edge_keys_by_subject: DefaultDict[str, DefaultDict[str, set]],
+                                 edge_keys_by_object: DefaultDict[str, DefaultDict[str, set]],
+                                 edge_keys_by_node_pair: DefaultDict[str, DefaultDict[str, set]],
+                                 ignore_edge_direction: bool = True,
+                                 log: ARAXResponse = ARAXResponse(),
+                                 base_result_graphs: Optional[List[dict]] = None) -> List[dict]:
+    kg_node_adj_map_by_qg_key = ARAX_resultify._get_kg_node_adj_map_by_qg_key(kg_node_keys_by_qg_key, kg, qg)
+    qg_adj_map = ARAX_resultify._get_qg_adj_map_undirected(qg)
+
+    # Iteratively construct "result graphs" (initially containing only nodes, not edges) by walking through all qnodes
+    log.debug(f"Constructing result graphs qnode by qnode")
+    if base_result_graphs:
+        # We'll build off of the 'base' result graphs rather than start anew
+        result_graphs = base_result_graphs
+        qnode_keys_already_handled = set(result_graphs[0]["nodes"])
+        qnode_keys_remaining = set(qg.nodes).difference(qnode_keys_already_handled)
+    else:
+        result_graphs = []
+        qnode_keys_already_handled = set()
+        qnode_keys_remaining = set(qg.nodes)
+    while qnode_keys_remaining:
+        # Start with a random qnode if this is our first iteration
+        if not qnode_keys_already_handled:
+            current_qnode_key = list(qnode_keys_remaining)[0]
+            prior_qnode_connections = set()
+        # Otherwise find a yet unhandled qnode ID that connects somehow to the part of the QG we've already handled
+        else:
+            current_qnode_key, prior_qnode_connections = ARAX_resultify._find_qnode_connected_to_sub_qg(qnode_keys_already_handled, qnode_keys_remaining, qg)
+        current_qnode = qg.nodes[current_qnode_key]
+
+        # Initialize our result graphs if this is our first iteration
+        if not result_graphs:
+            log.debug(f"Initiating result graphs with nodes for {current_qnode_key} (is_set={current_qnode.is_set})")
+            all_node_keys_in_kg_for_this_qnode_key = kg_node_keys_by_qg_key.get(current_qnode_key)
+            # We'll start with one result graph with ALL corresponding nodes in the KG in this spot if is_set=True
+            if current_qnode.is_set:
+                log.debug(f"Starting with one result graph because is_set=True for {current_qnode_key}")
+                new_result_graph = ARAX_resultify._create_new_empty_result_graph()
+                new_result_graph["nodes"][current_qnode_key] = all_node_keys_in_kg_for_this_qnode_key
+                result_graphs.append(new_result_graph)
+            # Otherwise, we'll start with a result graph for EACH corresponding node in the KG
+            else:
+                for node_key in all_node_keys_in_kg_for_this_qnode_key:
+                    new_result_graph = ARAX_resultify._create_new_empty_result_graph()
+                    new_result_graph["nodes"][current_qnode_key] = {node_key}
+                    result_graphs.append(new_result_graph)
+        # Otherwise fan out our existing result graphs, filling out this qnode spot in them based on prior contents
+        else:
+            log.debug(f"Adding a layer to each result graph for qnode {current_qnode_key} (is_set={current_qnode.is_set})")
+            new_result_graphs = []
+            sub_qg_adj_map = ARAX_resultify._extract_sub_qg_adj_map(qg_adj_map, qnode_keys_already_handled.union({current_qnode_key}))
+            for result_graph in result_graphs:
+                # Figure out which KG nodes could fulfill the current qnode in this result
+                prior_qnodes_kg_nodes = {prior_qnode_key: result_graph["nodes"][prior_qnode_key] for prior_qnode_key in prior_qnode_connections}
+                current_kg_node_possibilities = [ARAX_resultify._get_all_adjacent_nodes(corresponding_kg_nodes, prior_qnode_key, current_qnode_key, kg_node_adj_map_by_qg_key)
+                                                 for prior_qnode_key, corresponding_kg_nodes in prior_qnodes_kg_nodes.items()]
+                # Only keep connections that have links to KG nodes in ALL prior connected qnode roles
+                final_connected_kg_nodes = set.intersection(*current_kg_node_possibilities)
+                if final_connected_kg_nodes:
+                    if current_qnode.is_set:
+                        # Replace this result graph with a new one with all valid connections listed under this qnode
+                        new_result_graph = ARAX_resultify._copy_result_graph(result_graph)
+                        new_result_graph["nodes"][current_qnode_key] = final_connected_kg_nodes
+                        pruned_result_graph = _legacy_clean_up_dead_ends(result_graph=new_result_graph,
+                                                                         sub_qg_adj_map=sub_qg_adj_map,
+                                                                         kg_node_adj_map_by_qg_key=kg_node_adj_map_by_qg_key)
+                        new_result_graphs.append(pruned_result_graph)
+                    else:
+                        # Create a new result graph for each new valid connected node
+                        for connected_node_key in final_connected_kg_nodes:
+                            new_result_graph = ARAX_resultify._copy_result_graph(result_graph)
+                            new_result_graph["nodes"][current_qnode_key] = {connected_node_key}
+                            pruned_result_graph = _legacy_clean_up_dead_ends(result_graph=new_result_graph,
+                                                                             sub_qg_adj_map=sub_qg_adj_map,
+                                                                             kg_node_adj_map_by_qg_key=kg_node_adj_map_by_qg_key)
+                            new_result_graphs.append(pruned_result_graph)
+            result_graphs = new_result_graphs
+        log.debug(f"Current count of result graphs is {len(result_graphs)}")
+
+        # Update our records about which qnodes we've already processed
+        qnode_keys_remaining.remove(current_qnode_key)
+        qnode_keys_already_handled.add(current_qnode_key)
+    log.debug(f"Done assigning nodes to result graphs")
+
+    # Then add edges to our result graphs as appropriate
+    log.debug(f"Adding edges to result graphs")
+    for result_graph in result_graphs:
+        qedge_keys = set(qg.edges)
+        for qedge_key in qedge_keys:
+            qedge = qg.edges[qedge_key]
+            qedge_source_node_ids = result_graph['nodes'][qedge.subject]
+            qedge_target_node_ids = result_graph['nodes'][qedge.object]
+            # Pick the more efficient method for edge-finding depending on the number of nodes for this result/qedge
+            if len(qedge_source_node_ids) < 10 or len(qedge_target_node_ids) < 10:
+                possible_node_pairs = {f"{node_1}--{node_2}" for node_1 in qedge_source_node_ids
+                                       for node_2 in qedge_target_node_ids}
+                for node_pair in possible_node_pairs:
+                    ids_of_matching_edges = edge_keys_by_node_pair[qedge_key].get(node_pair, set())
+                    result_graph['edges'][qedge_key].update(ids_of_matching_edges)
+            else:
+                # This technique is more efficient when there are large numbers of both subject and object nodes
+                edges_with_matching_subject = {edge_key for source_node in qedge_source_node_ids
+                                               for edge_key in edge_keys_by_subject[qedge_key][source_node]}
+                edges_with_matching_object = {edge_key for target_node in qedge_target_node_ids
+                                              for edge_key in edge_keys_by_object[qedge_key][target_node]}
+                result_graph['edges'][qedge_key] = edges_with_matching_subject.intersection(edges_with_matching_object)
+                if ignore_edge_direction:
+                    edges_with_reverse_subject = {edge_key for target_node in qedge_target_node_ids
+                                                  for edge_key in edge_keys_by_subject[qedge_key][target_node]}
+                    edges_with_reverse_object = {edge_key for source_node in qedge_source_node_ids
+                                                 for edge_key in edge_keys_by_object[qedge_key][source_node]}
+                    result_graph['edges'][qedge_key].update(edges_with_reverse_subject.intersection(edges_with_reverse_object))
+
+    final_result_graphs = [result_graph for result_graph in result_graphs if ARAX_resultify._result_graph_is_fulfilled(result_graph, qg)]
+    return final_result_graphs
+
+
 def test01():
     kg_node_info = ({'node_key': 'UniProtKB:12345',
                      'categories': 'protein',
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+
+# Usage:
+# run all: pytest -v test_ARAX_synonymizer_cache.py
+# run just certain tests: pytest -v test_ARAX_synonymizer_cache.py -k test_disk_store_is_bounded
+
+import sys
+import os
+import sqlite3
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../NodeSynonymizer")
+from synonymizer_cache import SynonymizerCache
+
+
+def _count_disk_entries(disk_cache_path: str) -> int:
+    with sqlite3.connect(disk_cache_path) as connection:
+        return connection.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+
+def test_disk_store_is_bounded(tmp_path):
+    disk_cache_path = str(tmp_path / "synonymizer_cache.sqlite")
+    cache = SynonymizerCache("test_version", disk_cache_path=disk_cache_path, max_disk_entries=100)
+    for batch_start in range(0, 1000, 7):
+        cache.put_many({f"CURIE:{i}": f'"value {i}"' for i in range(batch_start, batch_start + 7)})
+        # Keep using the first entry, so it's never the least recently used one
+        cache.clear()
+        assert cache.get_many(["CURIE:0"]) == {"CURIE:0": '"value 0"'}
+        assert _count_disk_entries(disk_cache_path) <= 100
+    # The most recently written entries are still there
+    cache.clear()
+    assert cache.get_many(["CURIE:1000"]) == {"CURIE:1000": '"value 1000"'}
+
+
+def test_disk_store_drops_expired_entries(tmp_path):
+    disk_cache_path = str(tmp_path / "synonymizer_cache.sqlite")
+    cache = SynonymizerCache("test_version", ttl_seconds=-1, disk_cache_path=disk_cache_path, max_disk_entries=100)
+    for batch_start in range(0, 100, 10):
+        cache.put_many({f"CURIE:{i}": f'"value {i}"' for i in range(batch_start, batch_start + 10)})
+    cache.clear()
+    assert cache.get_many(["CURIE:5"]) == {}
+    assert _count_disk_entries(disk_cache_path) == 0
+
+
+if __name__ == "__main__":
+    import pytest
+    pytest.main(['-v', 'test_ARAX_synonymizer_cache.py'])
@@ -7,9 +7,12 @@ import traceback
 from typing import Iterable, Callable
 
 rlimit_child_process_bytes = 34359738368  # 32 GiB
+sigpipe_pending_writes_timeout_seconds = 300  # how long a child whose client hung up waits for its stored response to be written
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/../../../../../ARAX/ARAXQuery")
 import ARAX_query
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/../../../../../ARAX/ResponseCache")
+from response_storage import wait_for_pending_writes
 
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)) + "/../models")
 import response
@@ -18,6 +21,10 @@ import response
 def child_receive_sigpipe(signal_number, frame):
     if signal_number == signal.SIGPIPE:
         logging.info("[query_controller]: child process detected a SIGPIPE; exiting python")
+        # the client hung up, but any response the query stored should still be saved; this runs in a signal handler,
+        # so wait a bounded time rather than risk hanging on something the interrupted code was in the middle of
+        if not wait_for_pending_writes(timeout=sigpipe_pending_writes_timeout_seconds):
+            logging.error("[query_controller]: child process gave up waiting for its stored response to be written")
         os._exit(0)
 
 def run_query_dict_in_child_process(query_dict: dict,
@@ -46,7 +53,9 @@ def run_query_dict_in_child_process(query_dict: dict,
                     write_fo.flush()
         except BaseException as e:
             print(f"Exception in query_controller.run_query_dict_in_child_process: {type(e)}\n{traceback.print_exc()}", file=sys.stderr)
+            wait_for_pending_writes()
             os._exit(1)
+        wait_for_pending_writes()  # the client already has its response; finish storing it before exiting
         os._exit(0)
     elif pid > 0: # I am the parent process
         os.close(write_fd)  # the parent does not write to the pipe, it reads from it
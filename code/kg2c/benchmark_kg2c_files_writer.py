@@ -0,0 +1,61 @@
+#!/bin/env python3
+"""
+This script benchmarks writing the KG2c output files (JSON, lite JSON, TSVs, and the sqlite database) from an
+existing KG2c JSON file (by default, the test KG2c built by 'build_kg2c.py --test'). It times encoding everything in a
+single process (the way these files used to be written) against encoding with parallel worker processes, and checks
+that both produce the same files. Files are written to a temporary directory, so existing build artifacts are untouched.
+Usage: python3 benchmark_kg2c_files_writer.py [--kg kg2c_test.json] [--workers N]
+"""
+import argparse
+import filecmp
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from create_kg2c_files import KG2cFilesWriter, KG2C_DIR
+
+
+def _write_kg2c_files(kg2c: dict, biolink_version: str, num_workers: int, output_directory: str) -> float:
+    start = time.time()
+    meta_info_dict = {key: value for key, value in kg2c.items() if key not in {"nodes", "edges"}}
+    kg2c_files_writer = KG2cFilesWriter(biolink_version, meta_info_dict, False, num_workers=num_workers,
+                                        output_directory=output_directory)
+    kg2c_files_writer.write_nodes(kg2c["nodes"])
+    kg2c_files_writer.write_edges(kg2c["edges"])
+    kg2c_files_writer.close()
+    return time.time() - start
+
+
+def main():
+    logging.basicConfig(level=logging.WARNING,
+                        format='%(asctime)s %(levelname)s: %(message)s')
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--kg", dest="kg", default=f"{KG2C_DIR}/kg2c_test.json")
+    arg_parser.add_argument("--workers", dest="workers", type=int, default=os.cpu_count())
+    args = arg_parser.parse_args()
+
+    with open(args.kg) as kg2c_file:
+        kg2c = json.load(kg2c_file)
+    biolink_version = kg2c.get("biolink_version")
+    print(f"Loaded {args.kg}: {len(kg2c['nodes'])} nodes, {len(kg2c['edges'])} edges")
+
+    with tempfile.TemporaryDirectory() as serial_directory, tempfile.TemporaryDirectory() as parallel_directory:
+        serial_seconds = _write_kg2c_files(kg2c, biolink_version, 1, serial_directory)
+        print(f"Single process: {round(serial_seconds, 1)} seconds")
+        parallel_seconds = _write_kg2c_files(kg2c, biolink_version, args.workers, parallel_directory)
+        print(f"{args.workers} workers: {round(parallel_seconds, 1)} seconds "
+              f"({round(serial_seconds / parallel_seconds, 2)}x)")
+        file_names = sorted(os.listdir(serial_directory))
+        _, mismatches, errors = filecmp.cmpfiles(serial_directory, parallel_directory, file_names, shallow=False)
+        if mismatches or errors:
+            print(f"WARNING: These files differ between the two runs: {mismatches + errors}")
+        else:
+            print(f"All {len(file_names)} output files are identical")
+
+
+if __name__ == "__main__":
+    main()
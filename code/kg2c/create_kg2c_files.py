@@ -8,20 +8,24 @@ import argparse
 import ast
 import csv
 import gc
+import heapq
+import io
 import json
 import logging
 import os
 import pathlib
+import math
 import pickle
-import sqlite3
+import shutil
 import subprocess
 import sys
+import tempfile
 import time
-from collections import defaultdict
+from collections import defaultdict, deque
 
 from datetime import datetime
 from multiprocessing import Pool
-from typing import List, Dict, Tuple, Union, Optional, Set
+from typing import List, Dict, Iterable, Iterator, Tuple, Union, Optional, Set
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from utils import select_best_description
@@ -29,11 +33,17 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../ARAX/NodeSynonym
 from node_synonymizer import NodeSynonymizer
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../ARAX/BiolinkHelper/")
 from biolink_helper import BiolinkHelper
+from sqlite_bulk_load import connect_for_bulk_load, insert_rows, finish_bulk_load
 
 KG2C_ARRAY_DELIMITER = "ǂ"  # Need to use a delimiter that does not appear in any list items (strings)
 KG2PRE_ARRAY_DELIMITER = ";"
 KG2C_DIR = os.path.dirname(os.path.abspath(__file__))
 csv.field_size_limit(sys.maxsize)  # Required because some KG2pre fields are massive
+TSV_CHUNK_SIZE = 100000  # Number of KG2pre TSV rows read (and canonicalized) at a time
+WRITE_BATCH_SIZE = 10000  # Number of nodes/edges encoded for the output files at a time (by one worker)
+MAX_SPILL_PARTITIONS = 256
+NODE_MERGED_LIST_PROPERTIES = ["publications", "all_names", "descriptions_list", "equivalent_curies"]
+EDGE_MERGED_LIST_PROPERTIES = ["knowledge_source", "publications"]
 
 
 PROPERTIES_LOOKUP = {
@@ -86,9 +96,20 @@ def _prep_for_sqlite(item: Union[str, List[str], Dict[str, any]]) -> str:
                          f"value is: {item}")
 
 
-def _merge_two_lists(list_a: List[any], list_b: List[any]) -> List[any]:
-    unique_items = list(set(list_a + list_b))
-    return [item for item in unique_items if item]
+def _merge_into_set(item: Dict[str, any], property_name: str, values: Iterable[any]):
+    # Merged list properties are accumulated in an insertion-ordered set (a dict), so merging many items into one (e.g.,
+    # KG2pre edges into a hub edge) doesn't rebuild the whole list each time; _finalize_merged_lists() makes them lists
+    merged_values = item[property_name]
+    if isinstance(merged_values, list):
+        merged_values = dict.fromkeys(merged_values)
+        item[property_name] = merged_values
+    merged_values.update(dict.fromkeys(values))
+
+
+def _finalize_merged_lists(item: Dict[str, any], property_names: Iterable[str]):
+    for property_name in property_names:
+        if isinstance(item[property_name], dict):
+            item[property_name] = [value for value in item[property_name] if value]
 
 
 def _get_edge_key(subject: str, object: str, predicate: str) -> str:
@@ -202,27 +223,31 @@ def _load_publications_info(raw_publications_info: Union[str, dict], kg2_edge_id
     return publications_info
 
 
-def _load_kg2pre_tsv(local_tsv_dir_path: str, nodes_or_edges: str, is_test: bool) -> List[Dict[str, any]]:
+def _read_kg2pre_tsv_in_chunks(local_tsv_dir_path: str, nodes_or_edges: str, is_test: bool,
+                               chunk_size: int = TSV_CHUNK_SIZE) -> Iterator[Tuple[List[Dict[str, any]], float]]:
+    # Streams the KG2pre nodes/edges in chunks, yielding each chunk along with the fraction of the TSV read so far
     tsv_path = f"{local_tsv_dir_path}/{nodes_or_edges}.tsv"
     tsv_header_path = f"{local_tsv_dir_path}/{nodes_or_edges}_header.tsv"
-    kg2pre_objects = []
-    logging.info(f"Loading {nodes_or_edges} from KG2pre TSV ({tsv_path})..")
+    logging.info(f"Streaming {nodes_or_edges} from KG2pre TSV ({tsv_path})..")
     headers = _get_kg2pre_headers(tsv_header_path)
-    kg2pre_property_names = _get_kg2pre_properties(nodes_or_edges)
+    property_columns = [(property_name, headers.index(property_name), PROPERTIES_LOOKUP[nodes_or_edges][property_name]["type"])
+                        for property_name in _get_kg2pre_properties(nodes_or_edges)]
+    tsv_size = max(os.path.getsize(tsv_path), 1)
     counter = 0
-    with open(tsv_path) as kg2pre_file:
-        reader = csv.reader(kg2pre_file, delimiter="\t")
+    chunk = []
+    with open(tsv_path, "rb") as raw_kg2pre_file:
+        reader = csv.reader(io.TextIOWrapper(raw_kg2pre_file), delimiter="\t")
         for row in reader:
             counter += 1
-            new_object = dict()
-            for property_name in kg2pre_property_names:
-                property_info = PROPERTIES_LOOKUP[nodes_or_edges][property_name]
-                raw_property_value = row[headers.index(property_name)]
-                new_object[property_name] = _load_property(raw_property_value, property_info["type"])
-            kg2pre_objects.append(new_object)
+            chunk.append({property_name: _load_property(row[column_index], property_type)
+                          for property_name, column_index, property_type in property_columns})
+            if len(chunk) >= chunk_size:
+                yield chunk, raw_kg2pre_file.tell() / tsv_size
+                chunk = []
             if is_test and counter > 100000:
                 break
-    return kg2pre_objects
+    if chunk:
+        yield chunk, 1.0
 
 
 def _modify_column_headers_for_neo4j(plain_column_headers: List[str], file_name_root: str) -> List[str]:
@@ -294,132 +319,246 @@ def _create_edge(subject: str, object: str, predicate: str, knowledge_source: Li
     }
 
 
-def _write_list_to_neo4j_ready_tsv(input_list: List[Dict[str, any]], file_name_root: str, is_test: bool):
-    # Converts a list into the specific format Neo4j wants (string with delimiter)
-    logging.info(f"  Creating {file_name_root} header file..")
-    column_headers = list(input_list[0].keys())
-    modified_headers = _modify_column_headers_for_neo4j(column_headers, file_name_root)
-    with open(f"{KG2C_DIR}/{'test_' if is_test else ''}{file_name_root}_header.tsv", "w+") as header_file:
-        dict_writer = csv.DictWriter(header_file, modified_headers, delimiter='\t')
-        dict_writer.writeheader()
-    logging.info(f"  Creating {file_name_root} file..")
-    with open(f"{KG2C_DIR}/{'test_' if is_test else ''}{file_name_root}.tsv", "w+") as data_file:
-        dict_writer = csv.DictWriter(data_file, column_headers, delimiter='\t')
-        dict_writer.writerows(input_list)
-
-
-def create_kg2c_json_file(canonicalized_nodes_dict: Dict[str, Dict[str, any]],
-                          canonicalized_edges_dict: Dict[str, Dict[str, any]],
-                          meta_info_dict: Dict[str, str], is_test: bool):
-    logging.info(f" Creating KG2c JSON file..")
-    kgx_format_json = {"nodes": list(canonicalized_nodes_dict.values()),
-                       "edges": list(canonicalized_edges_dict.values())}
-    kgx_format_json.update(meta_info_dict)
-    with open(f"{KG2C_DIR}/kg2c{'_test' if is_test else ''}.json", "w+") as output_file:
-        json.dump(kgx_format_json, output_file)
-
-
-def create_kg2c_lite_json_file(canonicalized_nodes_dict: Dict[str, Dict[str, any]],
-                               canonicalized_edges_dict: Dict[str, Dict[str, any]],
-                               meta_info_dict: Dict[str, str], is_test: bool):
-    logging.info(f" Creating KG2c lite JSON file..")
-    # Filter out all except these properties so we create a lightweight KG
-    node_lite_properties = _get_lite_properties("node")
-    edge_lite_properties = _get_lite_properties("edge")
-    lite_kg = {"nodes": [], "edges": []}
-    for node in canonicalized_nodes_dict.values():
-        lite_node = dict()
-        for lite_property in node_lite_properties:
-            lite_node[lite_property] = node[lite_property]
-        lite_kg["nodes"].append(lite_node)
-    for edge in canonicalized_edges_dict.values():
-        lite_edge = dict()
-        for lite_property in edge_lite_properties:
-            lite_edge[lite_property] = edge[lite_property]
-        lite_kg["edges"].append(lite_edge)
-    lite_kg.update(meta_info_dict)
-
-    # Save this lite KG to a JSON file
-    logging.info(f"  Saving lite json...")
-    with open(f"{KG2C_DIR}/kg2c_lite{'_test' if is_test else ''}.json", "w+") as output_file:
-        json.dump(lite_kg, output_file)
-
-
-def create_kg2c_tsv_files(canonicalized_nodes_dict: Dict[str, Dict[str, any]],
-                          canonicalized_edges_dict: Dict[str, Dict[str, any]],
-                          biolink_version: str, is_test: bool):
-    bh = BiolinkHelper(biolink_version)
-    # Convert array fields into the format neo4j wants and do some final processing
-    array_node_columns = _get_array_properties("node").union({"node_labels"})
-    array_edge_columns = _get_array_properties("edge")
-    node_labels_property = _get_node_labels_property()
-    for canonicalized_node in canonicalized_nodes_dict.values():
-        canonicalized_node['node_labels'] = bh.get_ancestors(canonicalized_node[node_labels_property], include_mixins=True)
-        for list_node_property in array_node_columns:
-            canonicalized_node[list_node_property] = _convert_list_to_string_encoded_format(canonicalized_node[list_node_property])
-    for canonicalized_edge in canonicalized_edges_dict.values():
-        if not is_test:  # Make sure we don't have any orphan edges
-            assert canonicalized_edge['subject'] in canonicalized_nodes_dict
-            assert canonicalized_edge['object'] in canonicalized_nodes_dict
-        for list_edge_property in array_edge_columns:
-            canonicalized_edge[list_edge_property] = _convert_list_to_string_encoded_format(canonicalized_edge[list_edge_property])
-        canonicalized_edge['predicate_for_conversion'] = canonicalized_edge['predicate']
-        canonicalized_edge['subject_for_conversion'] = canonicalized_edge['subject']
-        canonicalized_edge['object_for_conversion'] = canonicalized_edge['object']
-
-    # Finally dump all our nodes/edges into TSVs (formatted for neo4j)
-    logging.info(f" Creating TSVs for Neo4j..")
-    _write_list_to_neo4j_ready_tsv(list(canonicalized_nodes_dict.values()), "nodes_c", is_test)
-    _write_list_to_neo4j_ready_tsv(list(canonicalized_edges_dict.values()), "edges_c", is_test)
-
-
-def create_kg2c_sqlite_db(canonicalized_nodes_dict: Dict[str, Dict[str, any]],
-                          canonicalized_edges_dict: Dict[str, Dict[str, any]], is_test: bool):
-    logging.info(" Creating KG2c sqlite database..")
-    db_name = f"kg2c{'_test' if is_test else ''}.sqlite"
-    # Remove any preexisting version of this database
-    if os.path.exists(db_name):
-        os.remove(db_name)
-    connection = sqlite3.connect(db_name)
-
-    # Add all nodes (node object is dumped into a JSON string)
-    logging.info(f"  Creating nodes table..")
-    sqlite_node_properties = list(set(PROPERTIES_LOOKUP["nodes"]).difference(_get_lite_properties("nodes")).union({"id", _get_node_labels_property()}))
-    logging.info(f"   Node properties to store in sqlite db are: {sqlite_node_properties}")
-    cols_with_types_string = ", ".join([f"{property_name} TEXT" for property_name in sqlite_node_properties])
-    question_marks_string = ", ".join(["?" for _ in range(len(sqlite_node_properties))])
-    cols_string = ", ".join(sqlite_node_properties)
-    connection.execute(f"CREATE TABLE nodes ({cols_with_types_string})")
-    node_rows = [[_prep_for_sqlite(node[property_name]) for property_name in sqlite_node_properties]
-                 for node in canonicalized_nodes_dict.values()]
-    connection.executemany(f"INSERT INTO nodes ({cols_string}) VALUES ({question_marks_string})", node_rows)
-    connection.execute("CREATE UNIQUE INDEX node_id_index ON nodes (id)")
-    connection.commit()
-    cursor = connection.execute(f"SELECT COUNT(*) FROM nodes")
-    logging.info(f"  Done creating nodes table; contains {cursor.fetchone()[0]} rows.")
-    cursor.close()
-
-    # Add all edges (edge object is dumped into a JSON string)
-    logging.info(f"  Creating edges table..")
-    sqlite_edge_properties = list(set(PROPERTIES_LOOKUP["edges"]).difference(_get_lite_properties("edges")).union({"knowledge_source"}))
-    logging.info(f"   Edge properties to store in sqlite db are: {sqlite_edge_properties}")
-    cols_with_types_string = ", ".join([f"{property_name} TEXT" for property_name in sqlite_edge_properties])
-    question_marks_string = ", ".join(["?" for _ in range(len(sqlite_edge_properties))])
-    cols_string = ", ".join(sqlite_edge_properties)
-    connection.execute(f"CREATE TABLE edges (triple TEXT, node_pair TEXT, {cols_with_types_string})")
-    edge_rows = [[f"{edge['subject']}--{edge['predicate']}--{edge['object']}",
-                  f"{edge['subject']}--{edge['object']}"] + [_prep_for_sqlite(edge[property_name])
-                                                             for property_name in sqlite_edge_properties]
-                 for edge in canonicalized_edges_dict.values()]
-    connection.executemany(f"INSERT INTO edges (triple, node_pair, {cols_string}) VALUES (?, ?, {question_marks_string})", edge_rows)
-    connection.execute("CREATE UNIQUE INDEX triple_index ON edges (triple)")
-    connection.execute("CREATE INDEX node_pair_index ON edges (node_pair)")
-    connection.commit()
-    cursor = connection.execute(f"SELECT COUNT(*) FROM edges")
-    logging.info(f"  Done creating edges table; contains {cursor.fetchone()[0]} rows.")
-    cursor.close()
-
-    connection.close()
+class _KG2cRowEncoder:
+    """
+    Turns batches of nodes/edges into what goes into each KG2c output file: JSON text, lite JSON text, TSV text, and
+    sqlite rows. This is the bulk of the work of writing KG2c, so KG2cFilesWriter runs it in worker processes.
+    """
+
+    def __init__(self, biolink_version: str, sqlite_node_properties: List[str], sqlite_edge_properties: List[str]):
+        self.biolink_version = biolink_version
+        # Property lists (rather than sets) keep key order the same in every process
+        self.node_lite_properties = [property_name for property_name in PROPERTIES_LOOKUP["nodes"]
+                                     if property_name in _get_lite_properties("node")]
+        self.edge_lite_properties = [property_name for property_name in PROPERTIES_LOOKUP["edges"]
+                                     if property_name in _get_lite_properties("edge")]
+        self.array_node_columns = _get_array_properties("node").union({"node_labels"})
+        self.array_edge_columns = _get_array_properties("edge")
+        self.node_labels_property = _get_node_labels_property()
+        self.sqlite_node_properties = sqlite_node_properties
+        self.sqlite_edge_properties = sqlite_edge_properties
+        self._bh = None
+
+    @property
+    def bh(self) -> BiolinkHelper:
+        # Each worker process loads its own BiolinkHelper, the first time it needs one
+        if self._bh is None:
+            self._bh = BiolinkHelper(self.biolink_version)
+        return self._bh
+
+    def get_tsv_node(self, node: Dict[str, any]) -> Dict[str, any]:
+        # Convert array fields into the format neo4j wants
+        tsv_node = dict(node)
+        tsv_node["node_labels"] = self.bh.get_ancestors(node[self.node_labels_property], include_mixins=True)
+        for list_node_property in self.array_node_columns:
+            tsv_node[list_node_property] = _convert_list_to_string_encoded_format(tsv_node[list_node_property])
+        return tsv_node
+
+    def get_tsv_edge(self, edge: Dict[str, any]) -> Dict[str, any]:
+        tsv_edge = dict(edge)
+        for list_edge_property in self.array_edge_columns:
+            tsv_edge[list_edge_property] = _convert_list_to_string_encoded_format(tsv_edge[list_edge_property])
+        tsv_edge['predicate_for_conversion'] = tsv_edge['predicate']
+        tsv_edge['subject_for_conversion'] = tsv_edge['subject']
+        tsv_edge['object_for_conversion'] = tsv_edge['object']
+        return tsv_edge
+
+    def encode_nodes(self, nodes: List[Dict[str, any]], tsv_columns: List[str]) -> Tuple[str, str, str, List[tuple]]:
+        tsv_nodes = [self.get_tsv_node(node) for node in nodes]
+        sqlite_rows = [tuple(_prep_for_sqlite(tsv_node[property_name]) for property_name in self.sqlite_node_properties)
+                       for tsv_node in tsv_nodes]
+        return self._encode_json(nodes, self.node_lite_properties) + (self._encode_tsv(tsv_nodes, tsv_columns), sqlite_rows)
+
+    def encode_edges(self, edges: List[Dict[str, any]], tsv_columns: List[str]) -> Tuple[str, str, str, List[tuple]]:
+        tsv_edges = [self.get_tsv_edge(edge) for edge in edges]
+        sqlite_rows = [(f"{edge['subject']}--{edge['predicate']}--{edge['object']}",
+                        f"{edge['subject']}--{edge['object']}") +
+                       tuple(_prep_for_sqlite(tsv_edge[property_name]) for property_name in self.sqlite_edge_properties)
+                       for edge, tsv_edge in zip(edges, tsv_edges)]
+        return self._encode_json(edges, self.edge_lite_properties) + (self._encode_tsv(tsv_edges, tsv_columns), sqlite_rows)
+
+    @staticmethod
+    def _encode_json(items: List[Dict[str, any]], lite_properties: List[str]) -> Tuple[str, str]:
+        # Filter out all except the lite properties for the lightweight KG
+        json_text = ", ".join(json.dumps(item) for item in items)
+        lite_json_text = ", ".join(json.dumps({lite_property: item[lite_property] for lite_property in lite_properties})
+                                   for item in items)
+        return json_text, lite_json_text
+
+    @staticmethod
+    def _encode_tsv(rows: List[Dict[str, any]], tsv_columns: List[str]) -> str:
+        tsv_text = io.StringIO()
+        csv.DictWriter(tsv_text, tsv_columns, delimiter='\t').writerows(rows)
+        return tsv_text.getvalue()
+
+
+# The encoder used by KG2cFilesWriter's worker processes (set when each worker starts)
+_worker_row_encoder = None
+
+
+def _initialize_row_encoder_worker(row_encoder: _KG2cRowEncoder):
+    global _worker_row_encoder
+    _worker_row_encoder = row_encoder
+
+
+def _encode_batch_in_worker(nodes_or_edges: str, batch: List[Dict[str, any]], tsv_columns: List[str]) -> Tuple[str, str, str, List[tuple]]:
+    if nodes_or_edges == "nodes":
+        return _worker_row_encoder.encode_nodes(batch, tsv_columns)
+    else:
+        return _worker_row_encoder.encode_edges(batch, tsv_columns)
+
+
+class KG2cFilesWriter:
+    """
+    Writes KG2c to all of its output files (the JSON file, the lite JSON file, the TSVs for Neo4j, and the sqlite
+    database) in one pass, as nodes and then edges are streamed through it. All nodes must be written before any edges.
+    Nodes/edges are encoded for the output files in batches, in parallel by num_workers worker processes (all cpus by
+    default; 1 means encode in this process), and written out in their original order. Rows are bulk-loaded into
+    sqlite (see sqlite_bulk_load.py), and its indexes are created at the end.
+    """
+
+    def __init__(self, biolink_version: str, meta_info_dict: Dict[str, str], is_test: bool,
+                 num_workers: Optional[int] = None, output_directory: Optional[str] = None):
+        self.meta_info_dict = meta_info_dict
+        self.is_test = is_test
+        self.output_directory = output_directory if output_directory else KG2C_DIR
+        self.node_ids = set()
+        self.num_edges = 0
+        self.num_batches_written = {"nodes": 0, "edges": 0}
+        self.writing_edges = False
+
+        logging.info(f" Creating KG2c JSON and lite JSON files..")
+        self.json_file = open(f"{self.output_directory}/kg2c{'_test' if is_test else ''}.json", "w+")
+        self.lite_json_file = open(f"{self.output_directory}/kg2c_lite{'_test' if is_test else ''}.json", "w+")
+        for output_file in (self.json_file, self.lite_json_file):
+            output_file.write('{"nodes": [')
+        self.tsv_files = dict()  # file name root -> (data file, columns)
+
+        logging.info(" Creating KG2c sqlite database..")
+        db_name = f"kg2c{'_test' if is_test else ''}.sqlite"
+        if output_directory:
+            db_name = f"{output_directory}/{db_name}"
+        # Remove any preexisting version of this database
+        if os.path.exists(db_name):
+            os.remove(db_name)
+        self.connection = connect_for_bulk_load(db_name)
+        self.sqlite_node_properties = list(set(PROPERTIES_LOOKUP["nodes"]).difference(_get_lite_properties("nodes")).union({"id", _get_node_labels_property()}))
+        logging.info(f"  Node properties to store in sqlite db are: {self.sqlite_node_properties}")
+        cols_with_types_string = ", ".join([f"{property_name} TEXT" for property_name in self.sqlite_node_properties])
+        self.connection.execute(f"CREATE TABLE nodes ({cols_with_types_string})")
+        self.sqlite_edge_properties = list(set(PROPERTIES_LOOKUP["edges"]).difference(_get_lite_properties("edges")).union({"knowledge_source"}))
+        logging.info(f"  Edge properties to store in sqlite db are: {self.sqlite_edge_properties}")
+        cols_with_types_string = ", ".join([f"{property_name} TEXT" for property_name in self.sqlite_edge_properties])
+        self.connection.execute(f"CREATE TABLE edges (triple TEXT, node_pair TEXT, {cols_with_types_string})")
+
+        self.row_encoder = _KG2cRowEncoder(biolink_version, self.sqlite_node_properties, self.sqlite_edge_properties)
+        self.num_workers = num_workers if num_workers else os.cpu_count()
+        if self.num_workers > 1:
+            logging.info(f"  Will use {self.num_workers} worker processes to encode nodes/edges")
+            self.pool = Pool(self.num_workers, initializer=_initialize_row_encoder_worker, initargs=(self.row_encoder,))
+        else:
+            self.pool = None
+
+    def write_nodes(self, nodes: Iterable[Dict[str, any]]):
+        self._write_batches("nodes", nodes)
+
+    def write_edges(self, edges: Iterable[Dict[str, any]]):
+        if not self.writing_edges:
+            for output_file in (self.json_file, self.lite_json_file):
+                output_file.write('], "edges": [')
+            self.writing_edges = True
+        self._write_batches("edges", edges)
+
+    def close(self):
+        if not self.writing_edges:
+            self.write_edges([])
+        if self.pool:
+            self.pool.close()
+            self.pool.join()
+        # Finish off the JSON files; these match what json.dump() writes for the whole KG
+        for output_file in (self.json_file, self.lite_json_file):
+            output_file.write("]")
+            for meta_key, meta_value in self.meta_info_dict.items():
+                output_file.write(f", {json.dumps(meta_key)}: {json.dumps(meta_value)}")
+            output_file.write("}")
+            output_file.close()
+        for data_file, _ in self.tsv_files.values():
+            data_file.close()
+
+        logging.info(f"  Indexing sqlite nodes and edges tables..")
+        finish_bulk_load(self.connection,
+                         ["CREATE UNIQUE INDEX node_id_index ON nodes (id)",
+                          "CREATE UNIQUE INDEX triple_index ON edges (triple)",
+                          "CREATE INDEX node_pair_index ON edges (node_pair)"],
+                         ["nodes", "edges"])
+        logging.info(f"Done saving KG2c: it has {len(self.node_ids)} nodes and {self.num_edges} edges")
+
+    def _get_batches(self, nodes_or_edges: str, items: Iterable[Dict[str, any]]) -> Iterator[List[Dict[str, any]]]:
+        batch = []
+        for item in items:
+            if nodes_or_edges == "nodes":
+                self.node_ids.add(item["id"])
+            else:
+                if not self.is_test:  # Make sure we don't have any orphan edges
+                    assert item['subject'] in self.node_ids
+                    assert item['object'] in self.node_ids
+                self.num_edges += 1
+            batch.append(item)
+            if len(batch) >= WRITE_BATCH_SIZE:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def _write_batches(self, nodes_or_edges: str, items: Iterable[Dict[str, any]]):
+        if self.pool:
+            # Only a few batches per worker are in flight at once, so items are still streamed rather than all loaded
+            pending_results = deque()
+            for batch in self._get_batches(nodes_or_edges, items):
+                tsv_columns = self._get_tsv_columns(nodes_or_edges, batch[0])
+                pending_results.append(self.pool.apply_async(_encode_batch_in_worker, (nodes_or_edges, batch, tsv_columns)))
+                if len(pending_results) >= 2 * self.num_workers:
+                    self._write_encoded_batch(nodes_or_edges, pending_results.popleft().get())
+            while pending_results:
+                self._write_encoded_batch(nodes_or_edges, pending_results.popleft().get())
+        else:
+            for batch in self._get_batches(nodes_or_edges, items):
+                tsv_columns = self._get_tsv_columns(nodes_or_edges, batch[0])
+                if nodes_or_edges == "nodes":
+                    self._write_encoded_batch(nodes_or_edges, self.row_encoder.encode_nodes(batch, tsv_columns))
+                else:
+                    self._write_encoded_batch(nodes_or_edges, self.row_encoder.encode_edges(batch, tsv_columns))
+
+    def _get_tsv_columns(self, nodes_or_edges: str, first_item: Dict[str, any]) -> List[str]:
+        # The columns (and the header file) come from the first row written to each TSV
+        file_name_root = f"{nodes_or_edges}_c"
+        if file_name_root not in self.tsv_files:
+            if nodes_or_edges == "nodes":
+                column_headers = list(self.row_encoder.get_tsv_node(first_item).keys())
+            else:
+                column_headers = list(self.row_encoder.get_tsv_edge(first_item).keys())
+            logging.info(f"  Creating {file_name_root} header file..")
+            modified_headers = _modify_column_headers_for_neo4j(column_headers, file_name_root)
+            with open(f"{self.output_directory}/{'test_' if self.is_test else ''}{file_name_root}_header.tsv", "w+") as header_file:
+                dict_writer = csv.DictWriter(header_file, modified_headers, delimiter='\t')
+                dict_writer.writeheader()
+            logging.info(f"  Creating {file_name_root} file..")
+            data_file = open(f"{self.output_directory}/{'test_' if self.is_test else ''}{file_name_root}.tsv", "w+")
+            self.tsv_files[file_name_root] = (data_file, column_headers)
+        return self.tsv_files[file_name_root][1]
+
+    def _write_encoded_batch(self, nodes_or_edges: str, encoded_batch: Tuple[str, str, str, List[tuple]]):
+        json_text, lite_json_text, tsv_text, sqlite_rows = encoded_batch
+        # Batches after the first (of nodes or of edges) need a separator before them
+        separator = ", " if self.num_batches_written[nodes_or_edges] else ""
+        self.num_batches_written[nodes_or_edges] += 1
+        self.json_file.write(f"{separator}{json_text}")
+        self.lite_json_file.write(f"{separator}{lite_json_text}")
+        self.tsv_files[f"{nodes_or_edges}_c"][0].write(tsv_text)
+        if nodes_or_edges == "nodes":
+            insert_rows(self.connection, "nodes", self.sqlite_node_properties, sqlite_rows)
+        else:
+            insert_rows(self.connection, "edges", ["triple", "node_pair"] + self.sqlite_edge_properties, sqlite_rows)
 
 
 def _create_build_node(kg2_version: str, biolink_version: str) -> Dict[str, any]:
@@ -441,98 +580,234 @@ def _create_build_node(kg2_version: str, biolink_version: str) -> Dict[str, any]
     return kg2c_build_node
 
 
-def _canonicalize_nodes(kg2pre_nodes: List[Dict[str, any]]) -> Tuple[Dict[str, Dict[str, any]], Dict[str, str]]:
+def _canonicalize_nodes(kg2pre_node_chunks: Iterable[Tuple[List[Dict[str, any]], float]]) -> Tuple[Dict[str, Dict[str, any]], Dict[str, str]]:
     logging.info(f"Canonicalizing nodes..")
     synonymizer = NodeSynonymizer()
-    node_ids = [node.get('id') for node in kg2pre_nodes if node.get('id')]
-    logging.info(f"  Sending NodeSynonymizer.get_canonical_curies() {len(node_ids)} curies..")
-    canonicalized_info = synonymizer.get_canonical_curies(curies=node_ids, return_all_categories=True)
-    all_canonical_curies = {canonical_info['preferred_curie'] for canonical_info in canonicalized_info.values() if canonical_info}
-    logging.info(f"  Sending NodeSynonymizer.get_equivalent_nodes() {len(all_canonical_curies)} curies..")
-    equivalent_curies_info = synonymizer.get_equivalent_nodes(all_canonical_curies)
-    recognized_curies = {curie for curie in equivalent_curies_info if equivalent_curies_info.get(curie)}
-    equivalent_curies_dict = {curie: list(equivalent_curies_info.get(curie)) for curie in recognized_curies}
-    with open(f"{KG2C_DIR}/equivalent_curies.pickle", "wb") as equiv_curies_dump:  # Save these for use by downstream script
-        pickle.dump(equivalent_curies_dict, equiv_curies_dump, protocol=pickle.HIGHEST_PROTOCOL)
-    logging.info(f"  Creating canonicalized nodes..")
     curie_map = dict()
     canonicalized_nodes = dict()
-    for kg2pre_node in kg2pre_nodes:
-        # Grab relevant info for this node and its canonical version
-        canonical_info = canonicalized_info.get(kg2pre_node['id'])
-        canonicalized_curie = canonical_info.get('preferred_curie', kg2pre_node['id']) if canonical_info else kg2pre_node['id']
-        publications = kg2pre_node['publications'] if kg2pre_node.get('publications') else []
-        descriptions_list = [kg2pre_node['description']] if kg2pre_node.get('description') else []
-        if canonicalized_curie in canonicalized_nodes:
-            # Merge this node into its corresponding canonical node
-            existing_canonical_node = canonicalized_nodes[canonicalized_curie]
-            existing_canonical_node['publications'] = _merge_two_lists(existing_canonical_node['publications'], publications)
-            existing_canonical_node['all_names'] = _merge_two_lists(existing_canonical_node['all_names'], [kg2pre_node['name']])
-            existing_canonical_node['descriptions_list'] = _merge_two_lists(existing_canonical_node['descriptions_list'], descriptions_list)
-            # Make sure any nodes subject to #1074-like problems still appear in equivalent curies
-            existing_canonical_node['equivalent_curies'] = _merge_two_lists(existing_canonical_node['equivalent_curies'], [kg2pre_node['id']])
-            # Add the IRI for the 'preferred' curie, if we've found that node
-            if kg2pre_node['id'] == canonicalized_curie:
-                existing_canonical_node['iri'] = kg2pre_node.get('iri')
-        else:
-            # Initiate the canonical node for this synonym group
-            name = canonical_info['preferred_name'] if canonical_info else kg2pre_node['name']
-            category = canonical_info['preferred_category'] if canonical_info else kg2pre_node['category']
-            all_categories = list(canonical_info['all_categories']) if canonical_info else [kg2pre_node['category']]
-            iri = kg2pre_node['iri'] if kg2pre_node['id'] == canonicalized_curie else None
-            all_names = [kg2pre_node['name']]
-            canonicalized_node = _create_node(preferred_curie=canonicalized_curie,
-                                              name=name,
-                                              category=category,
-                                              all_categories=all_categories,
-                                              publications=publications,
-                                              equivalent_curies=equivalent_curies_dict.get(canonicalized_curie, [canonicalized_curie]),
-                                              iri=iri,
-                                              description=None,
-                                              descriptions_list=descriptions_list,
-                                              all_names=all_names)
-            canonicalized_nodes[canonicalized_node['id']] = canonicalized_node
-        curie_map[kg2pre_node['id']] = canonicalized_curie  # Record this mapping for easy lookup later
+    recognized_canonical_curies = set()
+    num_kg2pre_nodes = 0
+    for kg2pre_nodes, _ in kg2pre_node_chunks:
+        num_kg2pre_nodes += len(kg2pre_nodes)
+        node_ids = [node.get('id') for node in kg2pre_nodes if node.get('id')]
+        logging.info(f"  Sending NodeSynonymizer.get_canonical_curies() {len(node_ids)} curies..")
+        canonicalized_info = synonymizer.get_canonical_curies(curies=node_ids, return_all_categories=True)
+        for kg2pre_node in kg2pre_nodes:
+            # Grab relevant info for this node and its canonical version
+            canonical_info = canonicalized_info.get(kg2pre_node['id'])
+            canonicalized_curie = canonical_info.get('preferred_curie', kg2pre_node['id']) if canonical_info else kg2pre_node['id']
+            if canonical_info:
+                recognized_canonical_curies.add(canonical_info['preferred_curie'])
+            publications = kg2pre_node['publications'] if kg2pre_node.get('publications') else []
+            descriptions_list = [kg2pre_node['description']] if kg2pre_node.get('description') else []
+            if canonicalized_curie in canonicalized_nodes:
+                # Merge this node into its corresponding canonical node
+                existing_canonical_node = canonicalized_nodes[canonicalized_curie]
+                _merge_into_set(existing_canonical_node, 'publications', publications)
+                _merge_into_set(existing_canonical_node, 'all_names', [kg2pre_node['name']])
+                _merge_into_set(existing_canonical_node, 'descriptions_list', descriptions_list)
+                # Make sure any nodes subject to #1074-like problems still appear in equivalent curies
+                _merge_into_set(existing_canonical_node, 'equivalent_curies', [kg2pre_node['id']])
+                # Add the IRI for the 'preferred' curie, if we've found that node
+                if kg2pre_node['id'] == canonicalized_curie:
+                    existing_canonical_node['iri'] = kg2pre_node.get('iri')
+            else:
+                # Initiate the canonical node for this synonym group (its equivalent curies are filled in at the end)
+                name = canonical_info['preferred_name'] if canonical_info else kg2pre_node['name']
+                category = canonical_info['preferred_category'] if canonical_info else kg2pre_node['category']
+                all_categories = list(canonical_info['all_categories']) if canonical_info else [kg2pre_node['category']]
+                iri = kg2pre_node['iri'] if kg2pre_node['id'] == canonicalized_curie else None
+                all_names = [kg2pre_node['name']]
+                canonicalized_node = _create_node(preferred_curie=canonicalized_curie,
+                                                  name=name,
+                                                  category=category,
+                                                  all_categories=all_categories,
+                                                  publications=publications,
+                                                  equivalent_curies=[],
+                                                  iri=iri,
+                                                  description=None,
+                                                  descriptions_list=descriptions_list,
+                                                  all_names=all_names)
+                canonicalized_nodes[canonicalized_node['id']] = canonicalized_node
+            curie_map[kg2pre_node['id']] = canonicalized_curie  # Record this mapping for easy lookup later
+
+    all_canonical_curies = list(recognized_canonical_curies)
+    equivalent_curies_dict = dict()
+    for start in range(0, len(all_canonical_curies), TSV_CHUNK_SIZE):
+        batch = all_canonical_curies[start:start + TSV_CHUNK_SIZE]
+        logging.info(f"  Sending NodeSynonymizer.get_equivalent_nodes() {len(batch)} curies..")
+        equivalent_curies_info = synonymizer.get_equivalent_nodes(batch)
+        equivalent_curies_dict.update({curie: list(equivalent_curies) for curie, equivalent_curies in equivalent_curies_info.items()
+                                       if equivalent_curies})
+    with open(f"{KG2C_DIR}/equivalent_curies.pickle", "wb") as equiv_curies_dump:  # Save these for use by downstream script
+        pickle.dump(equivalent_curies_dict, equiv_curies_dump, protocol=pickle.HIGHEST_PROTOCOL)
+    for canonicalized_curie, canonicalized_node in canonicalized_nodes.items():
+        merged_curies = canonicalized_node['equivalent_curies']
+        canonicalized_node['equivalent_curies'] = equivalent_curies_dict.get(canonicalized_curie, [canonicalized_curie])
+        if merged_curies:
+            _merge_into_set(canonicalized_node, 'equivalent_curies', merged_curies)
+        _finalize_merged_lists(canonicalized_node, NODE_MERGED_LIST_PROPERTIES)
     logging.info(f"Number of KG2pre nodes was reduced to {len(canonicalized_nodes)} "
-                 f"({round((len(canonicalized_nodes) / len(kg2pre_nodes)) * 100)}%)")
+                 f"({round((len(canonicalized_nodes) / max(num_kg2pre_nodes, 1)) * 100)}%)")
     return canonicalized_nodes, curie_map
 
 
-def _canonicalize_edges(kg2pre_edges: List[Dict[str, any]], curie_map: Dict[str, str], is_test: bool) -> Dict[str, Dict[str, any]]:
+def _merge_edge(canonicalized_edge: Dict[str, any], knowledge_source: List[str], publications: List[str],
+                publications_info: Dict[str, any], kg2_ids: List[str]):
+    _merge_into_set(canonicalized_edge, 'knowledge_source', knowledge_source)
+    _merge_into_set(canonicalized_edge, 'publications', publications)
+    canonicalized_edge['publications_info'].update(publications_info)
+    canonicalized_edge['kg2_ids'].extend(kg2_ids)
+
+
+class _EdgeSpill:
+    """
+    Merged edges spilled to disk when there are too many to hold in memory. Edges are partitioned by edge key, so each
+    partition can be merged on its own; the merged partitions are then streamed back out in the order their edges were
+    first seen (which is the order the edges would have had if they'd all been merged in memory).
+    """
+
+    def __init__(self, num_partitions: int, spill_directory: Optional[str]):
+        self.num_partitions = num_partitions
+        self.directory = tempfile.mkdtemp(prefix="kg2c_edge_spill_", dir=spill_directory or KG2C_DIR)
+        self.num_spills = 0
+        logging.info(f"  Spilling merged edges to {num_partitions} partitions in {self.directory}")
+
+    def _get_path(self, kind: str, partition: int) -> str:
+        return f"{self.directory}/{kind}_{partition}.pickle"
+
+    def spill(self, canonicalized_edges: Dict[str, Dict[str, any]]):
+        # Each edge is tagged with its position in the order edges were first seen: (spill number, position in spill)
+        partitioned_records = [[] for _ in range(self.num_partitions)]
+        for position, (edge_key, edge) in enumerate(canonicalized_edges.items()):
+            _finalize_merged_lists(edge, EDGE_MERGED_LIST_PROPERTIES)
+            partitioned_records[hash(edge_key) % self.num_partitions].append(((self.num_spills, position), edge_key, edge))
+        for partition, records in enumerate(partitioned_records):
+            if records:
+                with open(self._get_path("spill", partition), "ab") as spill_file:
+                    pickle.dump(records, spill_file, protocol=pickle.HIGHEST_PROTOCOL)
+        logging.info(f"  Spilled {len(canonicalized_edges)} merged edges to disk (spill #{self.num_spills + 1})")
+        self.num_spills += 1
+
+    def get_merged_edges(self, merge_batch_size: int) -> Iterator[Dict[str, any]]:
+        try:
+            run_paths = []
+            for partition in range(self.num_partitions):
+                spill_path = self._get_path("spill", partition)
+                if not os.path.exists(spill_path):
+                    continue
+                # Records for each edge are in spill order, so the first one has the edge's place in the overall order
+                merged_edges = dict()
+                for records in self._read_batches(spill_path):
+                    for order, edge_key, edge in records:
+                        merged_record = merged_edges.get(edge_key)
+                        if merged_record is None:
+                            merged_edges[edge_key] = (order, edge)
+                        else:
+                            _merge_edge(merged_record[1], edge['knowledge_source'], edge['publications'],
+                                        edge['publications_info'], edge['kg2_ids'])
+                os.remove(spill_path)
+                sorted_records = sorted(merged_edges.values(), key=lambda record: record[0])
+                del merged_edges
+                run_path = self._get_path("run", partition)
+                with open(run_path, "wb") as run_file:
+                    for start in range(0, len(sorted_records), merge_batch_size):
+                        batch = sorted_records[start:start + merge_batch_size]
+                        for _, edge in batch:
+                            _finalize_merged_lists(edge, EDGE_MERGED_LIST_PROPERTIES)
+                        pickle.dump(batch, run_file, protocol=pickle.HIGHEST_PROTOCOL)
+                run_paths.append(run_path)
+                del sorted_records
+                gc.collect()
+            logging.info(f"  Merged {len(run_paths)} spilled partitions; streaming merged edges back in order..")
+            runs = [self._iterate_run(run_path) for run_path in run_paths]
+            for _, edge in heapq.merge(*runs, key=lambda record: record[0]):
+                yield edge
+        finally:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _iterate_run(self, run_path: str) -> Iterator[Tuple[Tuple[int, int], Dict[str, any]]]:
+        for batch in self._read_batches(run_path):
+            yield from batch
+
+    @staticmethod
+    def _read_batches(path: str) -> Iterator[list]:
+        with open(path, "rb") as pickle_file:
+            while True:
+                try:
+                    yield pickle.load(pickle_file)
+                except EOFError:
+                    return
+
+
+def _canonicalize_edges(kg2pre_edge_chunks: Iterable[Tuple[List[Dict[str, any]], float]], curie_map: Dict[str, str],
+                        max_edges_in_memory: Optional[int], spill_directory: Optional[str],
+                        is_test: bool) -> Iterator[Dict[str, any]]:
+    """
+    Canonicalizes and merges the streamed KG2pre edges, yielding merged edges in the order their first KG2pre edge
+    appears. At most about max_edges_in_memory merged edges are held in memory (if it's set); beyond that, they're
+    spilled to disk and merged one partition at a time.
+    """
     logging.info(f"Canonicalizing edges..")
     canonicalized_edges = dict()
-    for kg2pre_edge in kg2pre_edges:
-        kg2_edge_id = kg2pre_edge['id']
-        original_subject = kg2pre_edge['subject']
-        original_object = kg2pre_edge['object']
-        if not is_test:  # Make sure we have the mappings we expect
-            assert original_subject in curie_map
-            assert original_object in curie_map
-        canonicalized_subject = curie_map.get(original_subject, original_subject)
-        canonicalized_object = curie_map.get(original_object, original_object)
-        edge_publications = kg2pre_edge['publications'] if kg2pre_edge.get('publications') else []
-        edge_knowledge_source = kg2pre_edge['knowledge_source'] if kg2pre_edge.get('knowledge_source') else []
-        edge_publications_info = _load_publications_info(kg2pre_edge['publications_info'], kg2_edge_id) if kg2pre_edge.get('publications_info') else dict()
-        if canonicalized_subject != canonicalized_object:  # Don't allow self-edges
-            canonicalized_edge_key = _get_edge_key(canonicalized_subject, canonicalized_object, kg2pre_edge['predicate'])
-            if canonicalized_edge_key in canonicalized_edges:
-                canonicalized_edge = canonicalized_edges[canonicalized_edge_key]
-                canonicalized_edge['knowledge_source'] = _merge_two_lists(canonicalized_edge['knowledge_source'], edge_knowledge_source)
-                canonicalized_edge['publications'] = _merge_two_lists(canonicalized_edge['publications'], edge_publications)
-                canonicalized_edge['publications_info'].update(edge_publications_info)
-                canonicalized_edge['kg2_ids'].append(kg2_edge_id)
-            else:
-                new_canonicalized_edge = _create_edge(subject=canonicalized_subject,
-                                                      object=canonicalized_object,
-                                                      predicate=kg2pre_edge['predicate'],
-                                                      knowledge_source=edge_knowledge_source,
-                                                      publications=edge_publications,
-                                                      publications_info=edge_publications_info,
-                                                      kg2_ids=[kg2_edge_id])
-                canonicalized_edges[canonicalized_edge_key] = new_canonicalized_edge
-    logging.info(f"Number of KG2pre edges was reduced to {len(canonicalized_edges)} "
-                 f"({round((len(canonicalized_edges) / len(kg2pre_edges)) * 100)}%)")
-    return canonicalized_edges
+    spill = None
+    num_kg2pre_edges = 0
+    for kg2pre_edges, fraction_read in kg2pre_edge_chunks:
+        num_kg2pre_edges += len(kg2pre_edges)
+        for kg2pre_edge in kg2pre_edges:
+            kg2_edge_id = kg2pre_edge['id']
+            original_subject = kg2pre_edge['subject']
+            original_object = kg2pre_edge['object']
+            if not is_test:  # Make sure we have the mappings we expect
+                assert original_subject in curie_map
+                assert original_object in curie_map
+            canonicalized_subject = curie_map.get(original_subject, original_subject)
+            canonicalized_object = curie_map.get(original_object, original_object)
+            edge_publications = kg2pre_edge['publications'] if kg2pre_edge.get('publications') else []
+            edge_knowledge_source = kg2pre_edge['knowledge_source'] if kg2pre_edge.get('knowledge_source') else []
+            edge_publications_info = _load_publications_info(kg2pre_edge['publications_info'], kg2_edge_id) if kg2pre_edge.get('publications_info') else dict()
+            if canonicalized_subject != canonicalized_object:  # Don't allow self-edges
+                canonicalized_edge_key = _get_edge_key(canonicalized_subject, canonicalized_object, kg2pre_edge['predicate'])
+                if canonicalized_edge_key in canonicalized_edges:
+                    _merge_edge(canonicalized_edges[canonicalized_edge_key], edge_knowledge_source, edge_publications,
+                                edge_publications_info, [kg2_edge_id])
+                else:
+                    new_canonicalized_edge = _create_edge(subject=canonicalized_subject,
+                                                          object=canonicalized_object,
+                                                          predicate=kg2pre_edge['predicate'],
+                                                          knowledge_source=edge_knowledge_source,
+                                                          publications=edge_publications,
+                                                          publications_info=edge_publications_info,
+                                                          kg2_ids=[kg2_edge_id])
+                    canonicalized_edges[canonicalized_edge_key] = new_canonicalized_edge
+        if max_edges_in_memory and len(canonicalized_edges) > max_edges_in_memory:
+            if spill is None:
+                # Use enough partitions that each one's merged edges (estimated from how much of the TSV it took to
+                # get this many) fit comfortably in memory
+                estimated_num_edges = len(canonicalized_edges) / max(fraction_read, 1e-6)
+                num_partitions = min(MAX_SPILL_PARTITIONS, max(2, math.ceil(1.5 * estimated_num_edges / max_edges_in_memory)))
+                spill = _EdgeSpill(num_partitions, spill_directory)
+            spill.spill(canonicalized_edges)
+            canonicalized_edges = dict()
+            gc.collect()
+
+    num_canonicalized_edges = 0
+    if spill is None:
+        for canonicalized_edge in canonicalized_edges.values():
+            _finalize_merged_lists(canonicalized_edge, EDGE_MERGED_LIST_PROPERTIES)
+            num_canonicalized_edges += 1
+            yield canonicalized_edge
+    else:
+        spill.spill(canonicalized_edges)
+        del canonicalized_edges
+        gc.collect()
+        # Only one record per partition is held in memory while the partitions are merged back together
+        merge_batch_size = max(1, max_edges_in_memory // (4 * spill.num_partitions))
+        for canonicalized_edge in spill.get_merged_edges(merge_batch_size):
+            num_canonicalized_edges += 1
+            yield canonicalized_edge
+    logging.info(f"Number of KG2pre edges was reduced to {num_canonicalized_edges} "
+                 f"({round((num_canonicalized_edges / max(num_kg2pre_edges, 1)) * 100)}%)")
 
 
 def _post_process_nodes(canonicalized_nodes_dict: Dict[str, Dict[str, any]], kg2c_config_info: Dict[str, any]) -> Dict[str, Dict[str, any]]:
@@ -570,11 +845,13 @@ def _post_process_nodes(canonicalized_nodes_dict: Dict[str, Dict[str, any]], kg2
     return canonicalized_nodes_dict
 
 
-def _post_process_edges(canonicalized_edges_dict: Dict[str, Dict[str, any]]) -> Dict[str, Dict[str, any]]:
+def _post_process_edges(canonicalized_edges: Iterable[Dict[str, any]], canonicalized_nodes_dict: Dict[str, Dict[str, any]],
+                        is_test: bool) -> Iterator[Dict[str, any]]:
     logging.info(f"Doing final clean-up/formatting of edges")
     # Convert our edge IDs to integers (to save space downstream) and add them as actual properties on the edges
     edge_num = 1
-    for edge_id, edge in canonicalized_edges_dict.items():
+    num_orphaned_edges = 0
+    for edge in canonicalized_edges:
         edge["id"] = edge_num
         edge_num += 1
         edge["publications"] = edge["publications"][:20]  # We don't need a ton of publications, so truncate them
@@ -582,13 +859,16 @@ def _post_process_edges(canonicalized_edges_dict: Dict[str, Dict[str, any]]) ->
             pubs_info_to_remove = list(edge["publications_info"])[20:]
             for pmid in pubs_info_to_remove:
                 del edge["publications_info"][pmid]
-    return canonicalized_edges_dict
+        # Delete any edges orphaned by removing overly general nodes
+        if not is_test and (edge["subject"] not in canonicalized_nodes_dict or edge["object"] not in canonicalized_nodes_dict):
+            num_orphaned_edges += 1
+            continue
+        yield edge
+    logging.info(f"  Deleted {num_orphaned_edges} edges that were orphaned by removing overly general nodes")
 
 
 def remove_overly_general_nodes(canonicalized_nodes_dict: Dict[str, Dict[str, any]],
-                                canonicalized_edges_dict: Dict[str, Dict[str, any]],
-                                biolink_version: str,
-                                is_test: bool) -> Tuple[Dict[str, Dict[str, any]], Dict[str, Dict[str, any]]]:
+                                biolink_version: str) -> Dict[str, Dict[str, any]]:
     logging.info(f"Removing overly general nodes from the graph..")
     bh = BiolinkHelper(biolink_version)
     # Remove all nodes that have a biolink category as an equivalent identifier, as well as a few others
@@ -604,26 +884,18 @@ def remove_overly_general_nodes(canonicalized_nodes_dict: Dict[str, Dict[str, an
     logging.info(f" Identified {len(node_ids_to_remove)} nodes to remove: {node_ids_to_remove}")
     for node_id in node_ids_to_remove:
         canonicalized_nodes_dict.pop(node_id, None)
+    # (Edges orphaned by this are dropped as they're streamed through _post_process_edges())
 
-    # Delete any now orphaned edges
-    if not is_test:
-        orphaned_edge_ids = {edge_id for edge_id, edge in canonicalized_edges_dict.items()
-                             if edge["subject"] not in canonicalized_nodes_dict or
-                             edge["object"] not in canonicalized_nodes_dict}
-        logging.info(f"  Deleting {len(orphaned_edge_ids)} edges that were orphaned by the above steps..")
-        for edge_id in orphaned_edge_ids:
-            canonicalized_edges_dict.pop(edge_id, None)
-
-    logging.info(f"Done removing overly general nodes: resulting KG2c now has {len(canonicalized_nodes_dict)} nodes "
-                 f"and {len(canonicalized_edges_dict)} edges")
-    return canonicalized_nodes_dict, canonicalized_edges_dict
+    logging.info(f"Done removing overly general nodes: resulting KG2c now has {len(canonicalized_nodes_dict)} nodes")
+    return canonicalized_nodes_dict
 
 
 def create_kg2c_files(is_test=False):
     """
-    This function extracts all nodes/edges from the KG2pre TSVs, canonicalizes the nodes, merges edges
+    This function streams all nodes/edges from the KG2pre TSVs, canonicalizes the nodes, merges edges
     (based on subject, object, predicate), and saves the resulting canonicalized graph in multiple file formats: JSON,
-    sqlite, and TSV (ready for import into Neo4j).
+    sqlite, and TSV (ready for import into Neo4j). Merged edges beyond the 'max_edges_in_memory' setting in
+    kg2c_config.json are spilled to disk, which bounds how much memory edge processing takes.
     """
     with open(f"{KG2C_DIR}/kg2c_config.json") as config_file:
         kg2c_config_info = json.load(config_file)
@@ -631,6 +903,8 @@ def create_kg2c_files(is_test=False):
     biolink_version = kg2c_config_info.get("biolink_version")
     start_from_kg2c_json = kg2c_config_info["kg2c"].get("start_from_kg2c_json")
     use_local_kg2pre_tsvs = kg2c_config_info["kg2c"].get("use_local_kg2pre_tsvs")
+    max_edges_in_memory = kg2c_config_info["kg2c"].get("max_edges_in_memory")
+    spill_directory = kg2c_config_info["kg2c"].get("spill_directory")
 
     # Start with the pre-existing kg2c.json, if directed to in the config file (allows partial builds)
     if start_from_kg2c_json:
@@ -640,6 +914,7 @@ def create_kg2c_files(is_test=False):
         canonicalized_nodes_dict = {node["id"]: node for node in kg2c["nodes"]}
         canonicalized_edges_dict = {edge["id"]: edge for edge in kg2c["edges"]}
         logging.info(f"Loaded KG2c has {len(canonicalized_nodes_dict)} nodes and {len(canonicalized_edges_dict)} edges")
+        canonicalized_edges = canonicalized_edges_dict.values()
     # Otherwise do a full build, starting with the KG2pre TSVs
     else:
         # First make sure the KG2pre TSV directory exists as it should
@@ -662,8 +937,8 @@ def create_kg2c_files(is_test=False):
             subprocess.check_call(["tar", "-xvzf", kg2pre_tarball_name, "-C", local_tsv_dir_path])
 
         # Canonicalize nodes
-        kg2pre_nodes = _load_kg2pre_tsv(local_tsv_dir_path, "nodes", is_test)
-        canonicalized_nodes_dict, curie_map = _canonicalize_nodes(kg2pre_nodes)
+        kg2pre_node_chunks = _read_kg2pre_tsv_in_chunks(local_tsv_dir_path, "nodes", is_test)
+        canonicalized_nodes_dict, curie_map = _canonicalize_nodes(kg2pre_node_chunks)
         # Make sure that the KG2pre version matches the version we're supposed to be building a KG2c off of
         if not is_test:
             kg2pre_build_node = canonicalized_nodes_dict.get("RTX:KG2")
@@ -682,28 +957,23 @@ def create_kg2c_files(is_test=False):
         build_node = _create_build_node(kg2_version, biolink_version)
         canonicalized_nodes_dict[build_node['id']] = build_node
         canonicalized_nodes_dict = _post_process_nodes(canonicalized_nodes_dict, kg2c_config_info)
-        del kg2pre_nodes  # Try to free up as much memory as possible for edge processing
-        gc.collect()
-
-        # Canonicalize edges
-        kg2pre_edges = _load_kg2pre_tsv(local_tsv_dir_path, "edges", is_test)
-        canonicalized_edges_dict = _canonicalize_edges(kg2pre_edges, curie_map, is_test)
-        del kg2pre_edges
-        gc.collect()
-        canonicalized_edges_dict = _post_process_edges(canonicalized_edges_dict)
+        gc.collect()  # Try to free up as much memory as possible for edge processing
 
         # Remove overly general nodes (e.g., 'Genes', 'Disease or disorder'..)
-        canonicalized_nodes_dict, canonicalized_edges_dict = remove_overly_general_nodes(canonicalized_nodes_dict,
-                                                                                         canonicalized_edges_dict,
-                                                                                         biolink_version, is_test)
+        canonicalized_nodes_dict = remove_overly_general_nodes(canonicalized_nodes_dict, biolink_version)
+
+        # Canonicalize edges; they're streamed from the KG2pre TSV, merged, and written out without all being loaded
+        kg2pre_edge_chunks = _read_kg2pre_tsv_in_chunks(local_tsv_dir_path, "edges", is_test)
+        canonicalized_edges = _canonicalize_edges(kg2pre_edge_chunks, curie_map, max_edges_in_memory, spill_directory, is_test)
+        canonicalized_edges = _post_process_edges(canonicalized_edges, canonicalized_nodes_dict, is_test)
 
-    # Actually create all of our output files (different formats for storing KG2c)
+    # Actually create all of our output files (different formats for storing KG2c), all in one pass
     meta_info_dict = {"kg2_version": kg2_version, "biolink_version": biolink_version}
     logging.info(f"Saving KG2c in various file formats..")
-    create_kg2c_lite_json_file(canonicalized_nodes_dict, canonicalized_edges_dict, meta_info_dict, is_test)
-    create_kg2c_json_file(canonicalized_nodes_dict, canonicalized_edges_dict, meta_info_dict, is_test)
-    create_kg2c_tsv_files(canonicalized_nodes_dict, canonicalized_edges_dict, biolink_version, is_test)
-    create_kg2c_sqlite_db(canonicalized_nodes_dict, canonicalized_edges_dict, is_test)
+    kg2c_files_writer = KG2cFilesWriter(biolink_version, meta_info_dict, is_test)
+    kg2c_files_writer.write_nodes(canonicalized_nodes_dict.values())
+    kg2c_files_writer.write_edges(canonicalized_edges)
+    kg2c_files_writer.close()
 
 
 def main():
@@ -1,7 +1,8 @@
 #!/bin/env python3
 """
-This script creates a 'meta knowledge graph' (per TRAPI) and records node neighbor counts by category (in the
-kg2c.sqlite file generated by create_kg2c_files.py). It uses the 'lite' KG2c JSON file to derive this meta info.
+This script creates a 'meta knowledge graph' (per TRAPI) and records node neighbor counts by category, both overall
+and per predicate (in the kg2c.sqlite file generated by create_kg2c_files.py). It uses the 'lite' KG2c JSON file to
+derive this meta info.
 Usage: python3 record_kg2c_meta_info.py [--test]
 """
 import argparse
@@ -10,14 +11,15 @@ import json
 import logging
 import os
 import pickle
-import sqlite3
 import sys
 import time
 from collections import defaultdict
-from typing import Dict, Set
+from typing import Dict, Iterator, Set
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../ARAX/BiolinkHelper/")
 from biolink_helper import BiolinkHelper
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from sqlite_bulk_load import connect_for_load, insert_rows, finish_bulk_load
 
 
 KG2C_DIR = f"{os.path.dirname(os.path.abspath(__file__))}"
@@ -100,19 +102,32 @@ def add_neighbor_counts_to_sqlite(nodes_by_id: Dict[str, Dict[str, any]], edges_
         for label, neighbor_ids in neighbors_dict.items():
             neighbor_counts[node_id][label] = len(neighbor_ids)
 
-    # Then write these counts to the sqlite file
+    # Then write these counts to the sqlite file; a node's index is its rowid in the neighbors table
     logging.info(f" Saving neighbor counts (for {len(neighbor_counts)} nodes) to sqlite..")
-    connection = sqlite3.connect(sqlite_file_name)
-    connection.execute("DROP TABLE IF EXISTS neighbors")
+    connection = connect_for_load(sqlite_file_name)
+    for table_name in ["neighbors", "neighbor_categories", "category_neighbor_counts"]:
+        connection.execute(f"DROP TABLE IF EXISTS {table_name}")
     connection.execute("CREATE TABLE neighbors (id TEXT, neighbor_counts TEXT)")
-    rows = [(node_id, json.dumps(neighbor_counts)) for node_id, neighbor_counts in neighbor_counts.items()]
-    connection.executemany(f"INSERT INTO neighbors (id, neighbor_counts) VALUES (?, ?)", rows)
-    connection.execute("CREATE UNIQUE INDEX node_neighbor_index ON neighbors (id)")
-    connection.commit()
-    cursor = connection.execute(f"SELECT COUNT(*) FROM neighbors")
-    logging.info(f" Done adding neighbor counts to sqlite; neighbors table contains {cursor.fetchone()[0]} rows")
-    cursor.close()
-    connection.close()
+    insert_rows(connection, "neighbors", ["rowid", "id", "neighbor_counts"],
+                ((node_index, node_id, json.dumps(counts))
+                 for node_index, (node_id, counts) in enumerate(neighbor_counts.items(), start=1)))
+    # Counts are also stored one row per category/node, clustered by category so that all of the counts for a category
+    # can be read (or any one looked up) directly, without parsing every node's JSON
+    counts_by_category = defaultdict(list)
+    for node_index, counts in enumerate(neighbor_counts.values(), start=1):
+        for label, count in counts.items():
+            counts_by_category[label].append((node_index, count))
+    connection.execute("CREATE TABLE neighbor_categories (category_id INTEGER PRIMARY KEY, category TEXT)")
+    connection.execute("CREATE TABLE category_neighbor_counts (category_id INTEGER, node_index INTEGER, count INTEGER, "
+                       "PRIMARY KEY (category_id, node_index)) WITHOUT ROWID")
+    categories = sorted(counts_by_category)
+    insert_rows(connection, "neighbor_categories", ["category_id", "category"], enumerate(categories))
+    insert_rows(connection, "category_neighbor_counts", ["category_id", "node_index", "count"],
+                ((category_id, node_index, count) for category_id, category in enumerate(categories)
+                 for node_index, count in counts_by_category[category]))
+    finish_bulk_load(connection, ["CREATE UNIQUE INDEX node_neighbor_index ON neighbors (id)",
+                                  "CREATE UNIQUE INDEX neighbor_category_index ON neighbor_categories (category)"],
+                     ["neighbors", "category_neighbor_counts"])
 
     # Additionally record top node degrees (used for dev purposes)
     neighbors_tsv_name = "neighbor_counts.tsv"
@@ -125,6 +140,41 @@ def add_neighbor_counts_to_sqlite(nodes_by_id: Dict[str, Dict[str, any]], edges_
             writer.writerow([node_id, len(neighbor_ids), node.get("name"), node.get(label_property_name)])
 
 
+def add_predicate_neighbor_counts_to_sqlite(nodes_by_id: Dict[str, Dict[str, any]],
+                                            edges_by_id: Dict[str, Dict[str, any]], sqlite_file_name: str,
+                                            label_property_name: str, is_test: bool):
+    logging.info("Counting up node neighbors by predicate and category..")
+    # First gather neighbors of each node by predicate (edge direction is ignored, as it is for overall counts)
+    neighbors_by_predicate = defaultdict(lambda: defaultdict(set))
+    for edge in edges_by_id.values():
+        subject_node_id = edge["subject"]
+        object_node_id = edge["object"]
+        if not is_test or (subject_node_id in nodes_by_id and object_node_id in nodes_by_id):
+            neighbors_by_predicate[subject_node_id][edge["predicate"]].add(object_node_id)
+            neighbors_by_predicate[object_node_id][edge["predicate"]].add(subject_node_id)
+
+    # Then write the counts of neighbors per label/category for each node/predicate to the sqlite file
+    logging.info(f" Saving predicate neighbor counts (for {len(neighbors_by_predicate)} nodes) to sqlite..")
+    connection = connect_for_load(sqlite_file_name)
+    connection.execute("DROP TABLE IF EXISTS predicate_neighbors")
+    connection.execute("CREATE TABLE predicate_neighbors (id TEXT, predicate TEXT, neighbor_counts TEXT)")
+    insert_rows(connection, "predicate_neighbors", ["id", "predicate", "neighbor_counts"],
+                _get_predicate_neighbor_count_rows(neighbors_by_predicate, nodes_by_id, label_property_name))
+    finish_bulk_load(connection, ["CREATE UNIQUE INDEX node_predicate_neighbor_index ON predicate_neighbors (id, predicate)"],
+                     ["predicate_neighbors"])
+
+
+def _get_predicate_neighbor_count_rows(neighbors_by_predicate: Dict[str, Dict[str, Set[str]]],
+                                       nodes_by_id: Dict[str, Dict[str, any]], label_property_name: str) -> Iterator[tuple]:
+    for node_id, neighbors_dict in neighbors_by_predicate.items():
+        for predicate, neighbor_ids in neighbors_dict.items():
+            neighbor_counts = defaultdict(int)
+            for neighbor_id in neighbor_ids:
+                for label in nodes_by_id[neighbor_id][label_property_name]:
+                    neighbor_counts[label] += 1
+            yield node_id, predicate, json.dumps(neighbor_counts)
+
+
 def add_category_counts_to_sqlite(nodes_by_id: Dict[str, Dict[str, any]], sqlite_file_name: str,
                                   label_property_name: str):
     logging.info("Counting up nodes by category..")
@@ -136,18 +186,12 @@ def add_category_counts_to_sqlite(nodes_by_id: Dict[str, Dict[str, any]], sqlite
 
     # Then write these counts to the sqlite file
     logging.info(f" Saving category counts (for {len(nodes_by_label)} categories) to sqlite..")
-    connection = sqlite3.connect(sqlite_file_name)
+    connection = connect_for_load(sqlite_file_name)
     connection.execute("DROP TABLE IF EXISTS category_counts")
     connection.execute("CREATE TABLE category_counts (category TEXT, count INTEGER)")
-    rows = [(category, len(node_ids)) for category, node_ids in nodes_by_label.items()]
-    connection.executemany(f"INSERT INTO category_counts (category, count) VALUES (?, ?)", rows)
-    connection.execute("CREATE UNIQUE INDEX category_index ON category_counts (category)")
-    connection.commit()
-    cursor = connection.execute(f"SELECT COUNT(*) FROM category_counts")
-    logging.info(f" Done adding category counts to sqlite; category_counts table contains "
-                 f"{cursor.fetchone()[0]} rows")
-    cursor.close()
-    connection.close()
+    insert_rows(connection, "category_counts", ["category", "count"],
+                [(category, len(node_ids)) for category, node_ids in nodes_by_label.items()])
+    finish_bulk_load(connection, ["CREATE UNIQUE INDEX category_index ON category_counts (category)"], ["category_counts"])
 
 
 def generate_fda_approved_drugs_pickle(edges_by_id: Dict[str, Dict[str, any]], fda_approved_file_name: str):
@@ -189,6 +233,8 @@ def record_meta_kg_info(is_test: bool):
 
     build_meta_kg(nodes_by_id, edges_by_id, meta_kg_file_name, bh, is_test)
     add_neighbor_counts_to_sqlite(nodes_by_id, edges_by_id, sqlite_file_name, expanded_labels_property_name, is_test)
+    add_predicate_neighbor_counts_to_sqlite(nodes_by_id, edges_by_id, sqlite_file_name, expanded_labels_property_name,
+                                            is_test)
     add_category_counts_to_sqlite(nodes_by_id, sqlite_file_name, expanded_labels_property_name)
     generate_fda_approved_drugs_pickle(edges_by_id, fda_approved_file_name)
 
@@ -0,0 +1,63 @@
+#!/bin/env python3
+"""
+Helpers for bulk-loading the KG2c sqlite database. While a build is loading rows into a database it has just
+created, sqlite is told to skip its journal and fsyncs (a build that dies partway through simply recreates that
+database); rows loaded into an existing database keep sqlite's journal, so that a crash can't corrupt the tables
+already in it. Either way sqlite gets a large page cache, all rows go in as one transaction, and indexes are created
+only once all rows are in, which is much faster than keeping them up to date row by row.
+"""
+import logging
+import os
+import sqlite3
+from typing import Iterable, List
+
+
+LOAD_PRAGMAS = ["PRAGMA cache_size = -1048576"]  # Negative means KiB, so this is 1GB
+BULK_LOAD_PRAGMAS = ["PRAGMA journal_mode = OFF",
+                     "PRAGMA synchronous = OFF",
+                     "PRAGMA locking_mode = EXCLUSIVE"] + LOAD_PRAGMAS
+BULK_LOAD_BATCH_SIZE = 100000
+
+
+def connect_for_bulk_load(db_name: str) -> sqlite3.Connection:
+    # Only for databases created by the current step; use connect_for_load() to add tables to an existing database
+    if os.path.exists(db_name):
+        raise ValueError(f"{db_name} already exists; bulk-loading it without a journal could corrupt its existing tables")
+    connection = sqlite3.connect(db_name)
+    for pragma in BULK_LOAD_PRAGMAS:
+        connection.execute(pragma)
+    return connection
+
+
+def connect_for_load(db_name: str) -> sqlite3.Connection:
+    connection = sqlite3.connect(db_name)
+    for pragma in LOAD_PRAGMAS:
+        connection.execute(pragma)
+    return connection
+
+
+def insert_rows(connection: sqlite3.Connection, table_name: str, column_names: List[str], rows: Iterable[tuple],
+                batch_size: int = BULK_LOAD_BATCH_SIZE):
+    # Rows may be a generator; they're inserted batch by batch so they never all have to be in memory at once
+    question_marks_string = ", ".join(["?" for _ in column_names])
+    sql = f"INSERT INTO {table_name} ({', '.join(column_names)}) VALUES ({question_marks_string})"
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            connection.executemany(sql, batch)
+            batch = []
+    if batch:
+        connection.executemany(sql, batch)
+
+
+def finish_bulk_load(connection: sqlite3.Connection, index_statements: List[str], table_names: List[str]):
+    for index_statement in index_statements:
+        logging.info(f"  {index_statement}..")
+        connection.execute(index_statement)
+    connection.commit()
+    for table_name in table_names:
+        cursor = connection.execute(f"SELECT COUNT(*) FROM {table_name}")
+        logging.info(f"  Done creating {table_name} table; contains {cursor.fetchone()[0]} rows.")
+        cursor.close()
+    connection.close()